@@ -0,0 +1,162 @@
+"""
+Storage and read-throughput benchmark for the plan storage codec.
+
+Builds synthetic learning paths shaped like real ones (30 days of ~150-word
+notes, generated or fallback quizzes, standard assignments) and compares raw
+documents with codec-encoded ones: BSON size per document, encode throughput,
+full-decode throughput and lazy single-day reads. With --mongo-uri it also
+inserts both variants into scratch collections and reports MongoDB's own
+data and storage sizes and find() throughput.
+
+Usage:
+    PYTHONPATH=. python benchmarks/plan_storage.py --plans 200 --days 30
+    PYTHONPATH=. python benchmarks/plan_storage.py --mongo-uri mongodb://localhost:27017
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+import bson
+
+from common import config, plan_codec
+from common.quiz_templates import assignment_templates, fallback_quizzes
+
+WORDS = (
+    "the a of to and in is for with on as by this that it be are from or an at which data function "
+    "value model variable loop list class object method return type error example result input output "
+    "process state memory index key string number system network request response cache query table "
+    "concept define explain apply compare structure pattern performance design test learn practice"
+).split()
+
+
+def synthetic_notes(rng, words=150):
+    sentences, remaining = [], words
+    while remaining > 0:
+        n = min(remaining, rng.randint(8, 18))
+        sentence = ' '.join(rng.choice(WORDS) for _ in range(n))
+        sentences.append(sentence.capitalize() + '.')
+        remaining -= n
+    return ' '.join(sentences)
+
+
+def synthetic_quizzes(rng, subtopic, count=5):
+    return [{
+        'question': f"Which statement about {subtopic} is correct? {' '.join(rng.choice(WORDS) for _ in range(10))}?",
+        'options': [' '.join(rng.choice(WORDS) for _ in range(5)) for _ in range(4)],
+        'correct_answer': rng.randrange(4),
+        'explanation': ' '.join(rng.choice(WORDS) for _ in range(20)),
+    } for _ in range(count)]
+
+
+def synthetic_plan(rng, index, days, fallback_share):
+    start = datetime(2026, 1, 1) + timedelta(days=index % 365)
+    plan = {}
+    for day in range(days):
+        subtopic = f"Subtopic {index}-{day} {rng.choice(WORDS).title()}"
+        fallback = rng.random() < fallback_share
+        plan[(start + timedelta(days=day)).strftime('%Y-%m-%d')] = {
+            'subtopic': subtopic,
+            'youtube_link': f"https://youtube.com/watch?v={rng.getrandbits(40):011x}",
+            'timestamp': '00:00:00-full',
+            'notes': synthetic_notes(rng),
+            'quizzes': fallback_quizzes(subtopic) if fallback else synthetic_quizzes(rng, subtopic),
+            'assignments': assignment_templates(subtopic),
+        }
+    return {
+        'status': 'success', 'topic_name': f"Topic {index}", 'no_of_days': days,
+        'start_date': start.strftime('%Y-%m-%d'), 'daily_hours': 2, 'plan': plan,
+        'request_id': f"{index:08x}", 'generated_at': datetime.now().isoformat(),
+    }
+
+
+def timed(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return time.perf_counter() - start
+
+
+def bench_codec(name, docs, codec):
+    encoded = [plan_codec.encode_document(doc, codec) for doc in docs] if codec else docs
+    size = sum(len(bson.encode(doc)) for doc in encoded)
+    encode_s = timed(lambda: [plan_codec.encode_document(doc, codec) for doc in docs], 1) if codec else 0.0
+    decode_s = timed(lambda: [plan_codec.decode_document(doc) for doc in encoded], 1)
+    first_day = next(iter(docs[0]['plan']))
+
+    def lazy_reads():
+        for doc in encoded:
+            plan = plan_codec.decode_plan(doc['plan'])
+            if first_day in plan:
+                plan[first_day]
+
+    lazy_s = timed(lazy_reads, 1)
+    return {
+        'name': name,
+        'encoded': encoded,
+        'bytes_per_doc': size / len(docs),
+        'total_mb': size / 1e6,
+        'encode_docs_s': len(docs) / encode_s if encode_s else None,
+        'decode_docs_s': len(docs) / decode_s if decode_s else None,
+        'lazy_day_reads_s': len(docs) / lazy_s if lazy_s else None,
+    }
+
+
+def bench_mongo(uri, results):
+    from pymongo import MongoClient
+    client = MongoClient(uri, serverSelectionTimeoutMS=5000)
+    db = client['plan_storage_benchmark']
+    print("\nMongoDB (scratch database plan_storage_benchmark, dropped afterwards)")
+    print(f"{'variant':<10} {'dataSize MB':>12} {'storage MB':>11} {'find docs/s':>12}")
+    try:
+        for result in results:
+            collection = db[result['name']]
+            collection.drop()
+            collection.insert_many([dict(doc) for doc in result['encoded']])
+            stats = db.command('collStats', result['name'])
+            start = time.perf_counter()
+            count = sum(1 for doc in collection.find())
+            elapsed = time.perf_counter() - start
+            for doc in collection.find():
+                plan_codec.decode_document(doc)
+            print(f"{result['name']:<10} {stats['size'] / 1e6:>12.2f} {stats['storageSize'] / 1e6:>11.2f} "
+                  f"{count / elapsed:>12.0f}")
+    finally:
+        client.drop_database('plan_storage_benchmark')
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the plan storage codec")
+    parser.add_argument('--plans', type=int, default=200, help="Synthetic plans to generate")
+    parser.add_argument('--days', type=int, default=30, help="Days per plan")
+    parser.add_argument('--fallback-share', type=float, default=0.2,
+                        help="Share of days with template (fallback) quizzes")
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--mongo-uri', help="Also measure real MongoDB storage and find() throughput")
+    args = parser.parse_args()
+
+    config.STORAGE_CODEC_ENABLED = True
+    rng = random.Random(args.seed)
+    docs = [synthetic_plan(rng, i, args.days, args.fallback_share) for i in range(args.plans)]
+
+    variants = [('raw', None), ('zlib', 'zlib')]
+    if plan_codec.zstandard is not None:
+        variants.append(('zstd', 'zstd'))
+    else:
+        print("zstandard not installed; skipping zstd")
+    results = [bench_codec(name, docs, codec) for name, codec in variants]
+
+    raw = results[0]['bytes_per_doc']
+    print(f"{args.plans} plans x {args.days} days, min compressed field {config.STORAGE_COMPRESS_MIN_BYTES} B")
+    print(f"{'variant':<10} {'KB/doc':>8} {'ratio':>6} {'total MB':>9} {'encode/s':>9} {'decode/s':>9} {'1-day/s':>9}")
+    for r in results:
+        fmt = lambda v: f"{v:>9.0f}" if v else f"{'-':>9}"
+        print(f"{r['name']:<10} {r['bytes_per_doc'] / 1024:>8.1f} {raw / r['bytes_per_doc']:>6.2f} "
+              f"{r['total_mb']:>9.2f} {fmt(r['encode_docs_s'])} {fmt(r['decode_docs_s'])} {fmt(r['lazy_day_reads_s'])}")
+
+    if args.mongo_uri:
+        bench_mongo(args.mongo_uri, results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+"""
+Per-hop latency and CPU benchmark for internal service calls.
+
+Starts a BaseService with a quiz-shaped route in this process, served both
+over HTTP (werkzeug's threaded server, as `app.run` uses) and over the
+binary RPC transport, and calls it through ServiceClient the way the MCP
+server calls the Quiz Generator:
+
+- http-new-conn: a fresh HTTP connection per call (plain requests.post)
+- http: ServiceClient over a keep-alive requests.Session
+- rpc: ServiceClient over persistent, multiplexed msgpack connections
+
+It reports sequential latency (p50/p95), throughput with concurrent callers,
+process CPU time per call (client and server share this process, so it is
+the whole hop) and the payload size on the wire.
+
+Usage:
+    PYTHONPATH=. python benchmarks/rpc_transport.py --calls 2000 --concurrency 16
+"""
+import argparse
+import json
+import logging
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from flask import request
+from werkzeug.serving import make_server
+
+from common import rpc
+from common.base_service import BaseService
+from common.quiz_templates import assignment_templates
+from common.service_client import ServiceClient
+
+PAYLOAD = {
+    'subtopic': 'Binary search trees',
+    'timestamp': '00:12:30-00:41:05',
+    'youtube_link': 'https://youtube.com/watch?v=abcdefghijk',
+    'study_notes': ' '.join(['A binary search tree keeps keys ordered so lookups halve the search space.'] * 12),
+}
+
+
+class EchoQuizService(BaseService):
+    def __init__(self):
+        super().__init__('rpc_benchmark', 0)
+        self.logger.setLevel(logging.WARNING)
+
+        @self.route('/generate_quiz_and_assignments', methods=['POST'])
+        def generate_quiz_and_assignments():
+            data = request.get_json()
+            subtopic = data['subtopic']
+            quizzes = [{
+                'question': f"Question {i} about {subtopic}?",
+                'options': [f"Option {j} for {subtopic}" for j in range(4)],
+                'correct_answer': i % 4,
+                'explanation': data['study_notes'][:200],
+            } for i in range(5)]
+            return self.success_response({'quizzes': quizzes, 'assignments': assignment_templates(subtopic)})
+
+
+def start_http(app):
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def measure(name, call, calls, concurrency):
+    for _ in range(50):  # warm up connections and code paths
+        call()
+    latencies = []
+    cpu = time.process_time()
+    for _ in range(calls):
+        start = time.perf_counter()
+        call()
+        latencies.append(time.perf_counter() - start)
+    cpu_per_call = (time.process_time() - cpu) / calls
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(lambda _: call(), range(calls)))
+    throughput = calls / (time.perf_counter() - start)
+
+    latencies.sort()
+    return {
+        'name': name,
+        'p50_ms': statistics.median(latencies) * 1000,
+        'p95_ms': latencies[int(len(latencies) * 0.95) - 1] * 1000,
+        'cpu_ms': cpu_per_call * 1000,
+        'calls_s': throughput,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark HTTP/JSON against the binary RPC transport")
+    parser.add_argument('--calls', type=int, default=2000, help="Calls per measurement")
+    parser.add_argument('--concurrency', type=int, default=16, help="Concurrent callers for the throughput run")
+    args = parser.parse_args()
+    if not rpc.available():
+        raise SystemExit("The RPC transport needs the msgpack package (pip install msgpack)")
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+
+    service = EchoQuizService()
+    http_server = start_http(service.app)
+    rpc_server = service.start_rpc('127.0.0.1', 0)
+    url = f"http://127.0.0.1:{http_server.server_port}"
+    path = '/generate_quiz_and_assignments'
+
+    http_client = ServiceClient('bench-http', url)
+    rpc_client = ServiceClient('bench-rpc', url, rpc_address=f"127.0.0.1:{rpc_server.port}",
+                               rpc_connections=2)
+    results = [
+        measure('http-new-conn', lambda: requests.post(url + path, json=PAYLOAD, timeout=10).json(),
+                args.calls, args.concurrency),
+        measure('http', lambda: http_client.post(path, PAYLOAD), args.calls, args.concurrency),
+        measure('rpc', lambda: rpc_client.post(path, PAYLOAD), args.calls, args.concurrency),
+    ]
+
+    response = http_client.post(path, PAYLOAD)
+    json_bytes = len(json.dumps(PAYLOAD)) + len(json.dumps(response))
+    msgpack_bytes = len(rpc.encode_frame({'body': PAYLOAD})) + len(rpc.encode_frame({'body': response}))
+    print(f"{args.calls} calls per run, {args.concurrency} concurrent callers for calls/s")
+    print(f"request+response body: JSON {json_bytes} B, msgpack {msgpack_bytes} B (HTTP headers not counted)")
+    print(f"{'transport':<14} {'p50 ms':>7} {'p95 ms':>7} {'CPU ms':>7} {'calls/s':>8}")
+    for r in results:
+        print(f"{r['name']:<14} {r['p50_ms']:>7.2f} {r['p95_ms']:>7.2f} {r['cpu_ms']:>7.2f} {r['calls_s']:>8.0f}")
+
+    http_server.shutdown()
+    rpc_server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,173 @@
+"""
+Cache hit rates of several MCP nodes with and without topic-affinity sharding.
+
+Simulation (default): N nodes, each with its own curriculum cache (the MCP
+server's TTLCache), receive a Zipf-distributed stream of topics from a
+random load balancer. "random" serves every request where it lands;
+"affinity" relays it to the topic's owner on the consistent hash ring
+(common.topic_sharding), as the MCP nodes do. Every miss is one curriculum
+LLM call. Halfway through the affinity run a node leaves, and later a new
+one joins; the report shows how much of the key space moved and that hit
+rates recover.
+
+Live (--nodes): sends /generate_plan requests for Zipf-distributed topics to
+random nodes of a running cluster (python run_all.py --nodes 3; needs an LLM
+API key), then prints each node's /cluster counters and cache hit rates.
+
+Usage:
+    PYTHONPATH=. python benchmarks/topic_sharding.py --nodes-sim 4 --topics 400 --requests 20000
+    PYTHONPATH=. python benchmarks/topic_sharding.py --nodes http://localhost:5101,http://localhost:5111 --requests 60
+"""
+import argparse
+import random
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from common.topic_sharding import HashRing
+from common.ttl_cache import TTLCache
+
+SUBJECTS = (
+    "python java rust go sql docker kubernetes linux git react statistics calculus algebra physics chemistry "
+    "biology economics accounting marketing photography guitar spanish french japanese drawing writing"
+).split()
+LEVELS = ["intro to", "advanced", "practical", "fundamentals of", "mastering", "applied", "modern", "hands-on"]
+
+
+def make_topics(count, seed):
+    rng = random.Random(seed)
+    topics = set()
+    while len(topics) < count:
+        topics.add(f"{rng.choice(LEVELS)} {rng.choice(SUBJECTS)} {rng.randint(1, 99)}")
+    return sorted(topics)
+
+
+def zipf_stream(topics, count, s, seed):
+    rng = random.Random(seed)
+    weights = [1 / (rank + 1) ** s for rank in range(len(topics))]
+    return rng.choices(topics, weights=weights, k=count)
+
+
+class SimNode:
+    def __init__(self, name, cache_size):
+        self.name = name
+        self.cache = TTLCache(maxsize=cache_size, ttl=86400)
+        self.served = 0
+
+    def serve(self, topic):
+        self.served += 1
+        if self.cache.get(topic) is None:
+            self.cache.set(topic, True)  # a curriculum LLM call
+
+
+def simulate(policy, stream, node_names, cache_size, vnodes, seed, membership=()):
+    """
+    Run the stream through the nodes under `policy`; `membership` lists (request index,
+    'leave'|'join', node) changes applied during the run.
+    Returns per-phase results.
+    """
+    rng = random.Random(seed)
+    nodes = {name: SimNode(name, cache_size) for name in node_names}
+    ring = HashRing(node_names, vnodes)
+    changes = dict((index, (action, name)) for index, action, name in membership)
+    phases, phase = [], {'label': f"{len(ring)} nodes", 'hits': 0, 'requests': 0, 'relayed': 0, 'moved': None}
+    for i, topic in enumerate(stream):
+        if i in changes:
+            action, name = changes[i]
+            before = ring
+            if action == 'leave':
+                ring = ring.without_node(name)
+                del nodes[name]
+            else:
+                ring = ring.with_node(name)
+                nodes[name] = SimNode(name, cache_size)
+            phases.append(phase)
+            phase = {'label': f"{action} {name}: {len(ring)} nodes", 'hits': 0, 'requests': 0, 'relayed': 0,
+                     'moved': before.moved_fraction(ring)}
+        landed = rng.choice(sorted(nodes))
+        target = ring.owner(topic) if policy == 'affinity' else landed
+        node = nodes[target]
+        hits = node.cache.hits
+        node.serve(topic)
+        phase['hits'] += node.cache.hits - hits
+        phase['requests'] += 1
+        phase['relayed'] += target != landed
+    phases.append(phase)
+    per_node = {name: node.cache.stats() for name, node in sorted(nodes.items())}
+    return phases, per_node
+
+
+def print_run(policy, phases, per_node):
+    total = sum(p['requests'] for p in phases)
+    hits = sum(p['hits'] for p in phases)
+    print(f"\n{policy}: fleet hit rate {hits / total:.1%}, curriculum LLM calls {total - hits}")
+    for p in phases:
+        moved = f", {p['moved']:.1%} of topics moved" if p['moved'] is not None else ''
+        print(f"  {p['label']:<22} hit rate {p['hits'] / max(p['requests'], 1):6.1%}  "
+              f"relayed {p['relayed'] / max(p['requests'], 1):5.1%}{moved}")
+    for name, stats in per_node.items():
+        print(f"  {name:<10} hit rate {stats['hit_rate'] or 0:6.1%}  cached topics {stats['entries']}")
+
+
+def run_simulation(args):
+    topics = make_topics(args.topics, args.seed)
+    stream = zipf_stream(topics, args.requests, args.zipf, args.seed)
+    names = [f"node-{i + 1}" for i in range(args.nodes_sim)]
+    print(f"{args.requests} requests over {args.topics} topics (zipf s={args.zipf}), {len(names)} nodes, "
+          f"{args.cache_size} cached curricula per node")
+    for policy in ('random', 'affinity'):
+        membership = [] if policy == 'random' else [
+            (args.requests // 2, 'leave', names[-1]),
+            (args.requests * 3 // 4, 'join', f"node-{len(names) + 1}"),
+        ]
+        phases, per_node = simulate(policy, stream, names, args.cache_size, args.vnodes, args.seed, membership)
+        print_run(policy, phases, per_node)
+
+
+def run_live(args):
+    nodes = [url.strip().rstrip('/') for url in args.nodes.split(',') if url.strip()]
+    topics = make_topics(args.topics, args.seed)
+    stream = zipf_stream(topics, args.requests, args.zipf, args.seed)
+    rng = random.Random(args.seed)
+
+    def send(topic):
+        node = rng.choice(nodes)
+        resp = requests.post(f"{node}/generate_plan", timeout=300, json={
+            'topic_name': topic, 'no_of_days': args.days, 'daily_hours': 1,
+        })
+        return node, resp.headers.get('X-Served-By'), resp.status_code
+
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        results = list(pool.map(send, stream))
+    failed = sum(1 for _, _, status in results if status != 200)
+    print(f"{len(results)} requests to {len(nodes)} nodes, {failed} failed")
+    for node in nodes:
+        stats = requests.get(f"{node}/cluster", timeout=5).json()
+        curriculum = stats['caches']['curriculum_cache']
+        notes = stats['caches']['notes_index']
+        print(f"{node}: {stats['requests']} requests, {stats['owned']} owned, relayed {stats['relayed']}, "
+              f"received {stats['received']}; curriculum hit rate {curriculum['hit_rate']}, "
+              f"notes hit rate {notes['hit_rate']}; ring share {stats['ring_share'].get(node)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cache hit rates with and without topic-affinity sharding")
+    parser.add_argument('--nodes', help="Comma-separated URLs of running MCP nodes (live mode)")
+    parser.add_argument('--nodes-sim', type=int, default=4, help="Simulated nodes")
+    parser.add_argument('--topics', type=int, default=400)
+    parser.add_argument('--requests', type=int, default=20000)
+    parser.add_argument('--zipf', type=float, default=1.0, help="Zipf exponent of topic popularity")
+    parser.add_argument('--cache-size', type=int, default=100, help="Cached curricula per simulated node")
+    parser.add_argument('--vnodes', type=int, default=128)
+    parser.add_argument('--days', type=int, default=3, help="Plan length in live mode")
+    parser.add_argument('--concurrency', type=int, default=4, help="Concurrent requests in live mode")
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+    if args.nodes:
+        run_live(args)
+    else:
+        run_simulation(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,242 @@
+"""
+Admission control and load shedding for Flask services.
+
+Every route gets a bounded number of requests in flight and a bounded FIFO
+queue in front of them. A request that finds the queue full, or that cannot
+start before its queue timeout (or the caller's deadline), is shed at once
+with 503 and a Retry-After derived from how fast the route is currently
+draining. Shedding early keeps the work that was admitted fast: under
+overload, admitted requests wait at most the queue timeout instead of
+piling up until every thread times out together.
+
+Health and metrics endpoints and CORS preflights are never queued. A request
+the app only hands on elsewhere (a relay to another node) can be deferred:
+it is admitted by the view only if it ends up being served locally.
+"""
+import json
+import logging
+import math
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Iterable, Optional
+
+from flask import g, jsonify, request
+
+from . import config
+from .deadline import deadline_from_headers
+
+logger = logging.getLogger(__name__)
+
+EXEMPT_PATHS = ('/health', '/metrics')
+
+
+class Overloaded(Exception):
+    """Raised when a request is shed; carries the suggested Retry-After in seconds."""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    def __init__(self, name: str, max_in_flight: int, max_queue: int, queue_timeout: float,
+                 window: float = 60.0):
+        """
+        Args:
+            name: Route the controller guards, for logs and stats
+            max_in_flight: Requests processed at once
+            max_queue: Requests allowed to wait for a free slot
+            queue_timeout: Longest a request may wait before it is shed
+            window: Seconds of completions the drain rate is measured over
+        """
+        self.name = name
+        self.max_in_flight = max(1, max_in_flight)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout
+        self.window = window
+        self._cond = threading.Condition()
+        self._in_flight = 0
+        self._queue = deque()
+        self._completions = deque()
+        self.admitted = 0
+        self.shed_full = 0
+        self.shed_timeout = 0
+        self.wait_total = 0.0
+
+    def _drain_rate(self, now: float) -> float:
+        """Completions per second over the recent window. Caller holds the lock."""
+        while self._completions and self._completions[0] < now - self.window:
+            self._completions.popleft()
+        if not self._completions:
+            return 0.0
+        span = max(now - self._completions[0], 1.0)
+        return len(self._completions) / span
+
+    def retry_after(self) -> int:
+        """Seconds until the current backlog should have drained, between 1 and 60."""
+        with self._cond:
+            return self._retry_after(time.monotonic())
+
+    def _retry_after(self, now: float) -> int:
+        rate = self._drain_rate(now)
+        backlog = len(self._queue) + self._in_flight + 1
+        if not rate:
+            return max(1, min(60, math.ceil(self.queue_timeout)))
+        return max(1, min(60, math.ceil(backlog / rate)))
+
+    def acquire(self, timeout: Optional[float] = None):
+        """
+        Take an in-flight slot, queueing (FIFO) for at most `timeout` seconds
+        (default: the queue timeout).
+
+        Raises:
+            Overloaded: If the queue is full or no slot freed up in time.
+        """
+        timeout = self.queue_timeout if timeout is None else min(timeout, self.queue_timeout)
+        enqueued = time.monotonic()
+        with self._cond:
+            if self._in_flight < self.max_in_flight and not self._queue:
+                self._in_flight += 1
+                self.admitted += 1
+                return
+            if len(self._queue) >= self.max_queue:
+                self.shed_full += 1
+                raise Overloaded(f"{self.name} is overloaded", self._retry_after(enqueued))
+
+            ticket = object()
+            self._queue.append(ticket)
+            try:
+                while not (self._queue[0] is ticket and self._in_flight < self.max_in_flight):
+                    remaining = enqueued + timeout - time.monotonic()
+                    if remaining <= 0:
+                        self.shed_timeout += 1
+                        raise Overloaded(f"{self.name} is overloaded", self._retry_after(time.monotonic()))
+                    self._cond.wait(remaining)
+            finally:
+                self._queue.remove(ticket)
+                # The next ticket in line may be able to proceed now
+                self._cond.notify_all()
+            self._in_flight += 1
+            self.admitted += 1
+            self.wait_total += time.monotonic() - enqueued
+
+    def release(self):
+        with self._cond:
+            self._in_flight -= 1
+            self._completions.append(time.monotonic())
+            self._cond.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            now = time.monotonic()
+            return {
+                'max_in_flight': self.max_in_flight,
+                'max_queue': self.max_queue,
+                'in_flight': self._in_flight,
+                'queued': len(self._queue),
+                'admitted': self.admitted,
+                'shed_queue_full': self.shed_full,
+                'shed_queue_timeout': self.shed_timeout,
+                'avg_queue_wait_ms': round(self.wait_total / self.admitted * 1000, 1) if self.admitted else None,
+                'drain_rate_per_s': round(self._drain_rate(now), 3),
+            }
+
+
+def _parse_route_limits(value: str) -> Dict[str, Dict[str, Any]]:
+    if not value:
+        return {}
+    try:
+        limits = json.loads(value)
+        return {str(route): dict(limit) for route, limit in limits.items()}
+    except (ValueError, TypeError, AttributeError):
+        logger.warning("Ignoring malformed ADMISSION_ROUTE_LIMITS")
+        return {}
+
+
+class Admission:
+    def __init__(self, limits: Optional[Dict[str, Dict[str, Any]]] = None, exempt: Iterable[str] = EXEMPT_PATHS):
+        """
+        Per-route admission controllers for one Flask app, created on first use.
+
+        Args:
+            limits: Route rule -> {'max_in_flight', 'max_queue', 'queue_timeout'} overrides
+                of the ADMISSION_* defaults
+            exempt: Paths that are never queued or shed
+        """
+        self.limits = limits if limits is not None else _parse_route_limits(config.ADMISSION_ROUTE_LIMITS)
+        self.exempt = set(exempt)
+        self.shed_response = _default_shed_response
+        self._controllers: Dict[str, AdmissionController] = {}
+        self._lock = threading.Lock()
+
+    def controller(self, rule: str) -> AdmissionController:
+        with self._lock:
+            controller = self._controllers.get(rule)
+            if controller is None:
+                limit = self.limits.get(rule, {})
+                controller = self._controllers[rule] = AdmissionController(
+                    rule,
+                    max_in_flight=int(limit.get('max_in_flight', config.ADMISSION_MAX_IN_FLIGHT)),
+                    max_queue=int(limit.get('max_queue', config.ADMISSION_MAX_QUEUE)),
+                    queue_timeout=float(limit.get('queue_timeout', config.ADMISSION_QUEUE_TIMEOUT))
+                )
+            return controller
+
+    def install(self, app, shed_response=None, defer=None):
+        """
+        Guard every route of `app` except the exempt ones.
+
+        Args:
+            app: Flask application
+            shed_response: Callable(Overloaded) -> (response, status) for shed requests;
+                defaults to a JSON error body
+            defer: Callable() -> bool; True leaves the current request unadmitted, for its
+                view to call `admit()` only if it serves the request itself
+        """
+        if shed_response is not None:
+            self.shed_response = shed_response
+
+        @app.before_request
+        def admit():
+            if request.method == 'OPTIONS' or request.url_rule is None or request.path in self.exempt:
+                return None
+            if defer is not None and defer():
+                return None
+            return self.admit()
+
+        @app.teardown_request
+        def leave(_exc=None):
+            controller = g.pop('admission_controller', None)
+            if controller is not None:
+                controller.release()
+
+    def admit(self):
+        """
+        Admit the current request to its route's controller, if it is not admitted yet.
+
+        Returns:
+            None once admitted, or the (response, status) shedding it
+        """
+        if 'admission_controller' in g:
+            return None
+        controller = self.controller(request.url_rule.rule)
+        try:
+            # A caller's deadline caps how long it is worth queueing
+            controller.acquire(deadline_from_headers(request.headers))
+        except Overloaded as e:
+            logger.warning(f"Shedding {request.method} {request.path}: {str(e)}")
+            response, status = self.shed_response(e)
+            response.headers['Retry-After'] = str(e.retry_after)
+            return response, status
+        g.admission_controller = controller
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            controllers = dict(self._controllers)
+        return {rule: controller.stats() for rule, controller in controllers.items()}
+
+
+def _default_shed_response(e: Overloaded):
+    return jsonify({'error': str(e), 'retry_after': e.retry_after}), 503
@@ -1,6 +1,20 @@
 import requests
+import json
+import logging
 import os
-from tenacity import retry, stop_after_attempt, wait_exponential
+import re
+import threading
+import time
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from tenacity import retry, retry_if_not_exception_type, stop_after_attempt, wait_exponential
+from .deadline import DeadlineExceeded, request_timeout, stop_on_deadline, wait_within_deadline
+from .fair_scheduler import llm_slots
+from .tenancy import DEFAULT_TENANT, current_tenant
+
+logger = logging.getLogger(__name__)
 
 # Provider-specific API endpoints
 PROVIDER_ENDPOINTS = {
@@ -12,7 +26,9 @@ PROVIDER_ENDPOINTS = {
             "contents": [{"parts": [{"text": prompt}]}],
             "generationConfig": {"response_mime_type": "application/json"}
         },
-        'extract_response': lambda response: response.json()['candidates'][0]['content']['parts'][0]['text']
+        'extract_response': lambda response: response.json()['candidates'][0]['content']['parts'][0]['text'],
+        'extract_usage': lambda body: (body['usageMetadata']['promptTokenCount'],
+                                       body['usageMetadata'].get('candidatesTokenCount', 0))
     },
     'openai': {
         'url_template': 'https://api.openai.com/v1/chat/completions',
@@ -22,43 +38,522 @@ PROVIDER_ENDPOINTS = {
             "messages": [{"role": "user", "content": prompt}],
             "response_format": {"type": "json_object"}
         },
-        'extract_response': lambda response: response.json()['choices'][0]['message']['content']
+        'extract_response': lambda response: response.json()['choices'][0]['message']['content'],
+        'extract_usage': lambda body: (body['usage']['prompt_tokens'], body['usage']['completion_tokens'])
     },
     # Add more providers as needed
 }
 
-# Retry logic with exponential backoff
-@retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
-def call_ai(prompt, model="gpt-4", provider="openai", api_key=None, **kwargs):
-    """
-    Calls the specified AI provider's API to generate content based on the provided prompt.
+# Candidate (provider, model) routes for provider="auto", fastest healthy first.
+# Override with AI_ROUTES="gemini:gemini-1.5-flash,openai:gpt-4o-mini".
+DEFAULT_ROUTES = [
+    ('gemini', 'gemini-1.5-pro-latest'),
+    ('openai', 'gpt-3.5-turbo'),
+]
+
+
+def _parse_routes(value):
+    routes = []
+    for item in value.split(','):
+        if ':' in item:
+            provider, model = item.strip().split(':', 1)
+            routes.append((provider.lower(), model))
+    return routes or list(DEFAULT_ROUTES)
+
+
+# Model tiers, smallest first. A task runs on its tier and may escalate up to its max_tier
+# when the response fails validation. Override a tier with e.g.
+# AI_TIER_SMALL="gemini:gemini-1.5-flash,openai:gpt-4o-mini" (same format as AI_ROUTES).
+TIER_ORDER = ['small', 'medium', 'large']
+DEFAULT_MODEL_TIERS = {
+    'small': [('gemini', 'gemini-1.5-flash'), ('openai', 'gpt-4o-mini')],
+    'medium': [('gemini', 'gemini-1.5-pro-latest'), ('openai', 'gpt-3.5-turbo')],
+    'large': [('gemini', 'gemini-2.5-pro'), ('openai', 'gpt-4o')],
+}
+MODEL_TIERS = {
+    tier: _parse_routes(os.getenv(f'AI_TIER_{tier.upper()}', '')) if os.getenv(f'AI_TIER_{tier.upper()}') else routes
+    for tier, routes in DEFAULT_MODEL_TIERS.items()
+}
+
+# Declarative task routing: which tier each task type starts on and how far it may escalate
+TASK_ROUTES = {
+    'plan_outline': {'tier': 'medium', 'max_tier': 'large'},
+    'curriculum': {'tier': 'medium', 'max_tier': 'large'},
+    'notes': {'tier': 'small', 'max_tier': 'medium'},
+    'material_section': {'tier': 'small', 'max_tier': 'medium'},
+    'quiz': {'tier': 'small', 'max_tier': 'medium'},
+    'assignment': {'tier': 'small', 'max_tier': 'medium'},
+    'json_fix': {'tier': 'small', 'max_tier': 'small'},
+}
+DEFAULT_TASK_ROUTE = {'tier': 'medium', 'max_tier': 'medium'}
+
+# Per-tenant overrides, e.g. AI_TENANT_ROUTES='{"acme": {"quiz": "medium"}, "free": {"*": {"max_tier": "small"}}}'.
+# A string sets the starting tier; a dict overrides tier and/or max_tier; "*" applies to every task.
+TENANT_ROUTES = {}
+
+
+def task_route(task, tenant=None):
+    """Effective {'tier', 'max_tier'} for a task, after the tenant's overrides."""
+    route = dict(TASK_ROUTES.get(task, DEFAULT_TASK_ROUTE))
+    overrides = TENANT_ROUTES.get(tenant or current_tenant(), {})
+    capped = False
+    for key in ('*', task):
+        override = overrides.get(key) or {}
+        if isinstance(override, str):
+            override = {'tier': override}
+        override = {k: v for k, v in override.items() if k in ('tier', 'max_tier') and v in TIER_ORDER}
+        capped = capped or 'max_tier' in override
+        route.update(override)
+    if TIER_ORDER.index(route['max_tier']) < TIER_ORDER.index(route['tier']):
+        # An explicit cap wins over the starting tier; otherwise the cap rises to meet it
+        if capped:
+            route['tier'] = route['max_tier']
+        else:
+            route['max_tier'] = route['tier']
+    return route
+
+
+def task_tiers(task, tenant=None):
+    """Tiers a task may use, in escalation order."""
+    route = task_route(task, tenant)
+    return TIER_ORDER[TIER_ORDER.index(route['tier']):TIER_ORDER.index(route['max_tier']) + 1]
+
+
+def model_for(task, provider):
+    """The provider's model on the task's starting tier, e.g. for provider-pinned callers."""
+    for tier in task_tiers(task):
+        for route_provider, model in MODEL_TIERS[tier]:
+            if route_provider == provider:
+                return model
+    return next((m for p, m in DEFAULT_ROUTES if p == provider), None)
+
+
+def routing_table():
+    """Effective routing configuration, for /health."""
+    return {
+        'tiers': {tier: [f"{p}:{m}" for p, m in routes] for tier, routes in MODEL_TIERS.items()},
+        'tasks': {task: task_route(task, tenant=DEFAULT_TENANT) for task in TASK_ROUTES},
+        'tenant_overrides': TENANT_ROUTES,
+    }
+
+
+class ProviderStats:
+    """Live latency and error-rate statistics for one provider/model route."""
+
+    def __init__(self, window=50, alpha=0.3):
+        self.latencies = deque(maxlen=window)
+        self.alpha = alpha
+        self.ewma_latency = None
+        self.error_rate = 0.0
+        self.calls = 0
+        self.errors = 0
+        self.last_failure = 0.0
+        self.lock = threading.Lock()
+
+    def record(self, latency, ok):
+        with self.lock:
+            self.calls += 1
+            if ok:
+                self.latencies.append(latency)
+                if self.ewma_latency is None:
+                    self.ewma_latency = latency
+                else:
+                    self.ewma_latency = self.alpha * latency + (1 - self.alpha) * self.ewma_latency
+            else:
+                self.errors += 1
+                self.last_failure = time.monotonic()
+            self.error_rate = self.alpha * (0.0 if ok else 1.0) + (1 - self.alpha) * self.error_rate
+
+    def p95(self):
+        with self.lock:
+            if not self.latencies:
+                return None
+            ordered = sorted(self.latencies)
+            return ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))]
+
+    def snapshot(self):
+        p95 = self.p95()
+        with self.lock:
+            return {
+                'calls': self.calls,
+                'errors': self.errors,
+                'error_rate': round(self.error_rate, 3),
+                'ewma_latency': round(self.ewma_latency, 3) if self.ewma_latency is not None else None,
+                'p95_latency': round(p95, 3) if p95 is not None else None,
+            }
+
+
+class ProviderRouter:
+    def __init__(self, routes, max_error_rate=0.5, recovery_seconds=60.0,
+                 default_hedge_delay=2.0, min_hedge_delay=0.25):
+        """
+        Rank provider/model routes by observed latency and health.
+
+        Args:
+            routes: List of (provider, model) tuples eligible for provider="auto"
+            max_error_rate: Error-rate EWMA above which a route counts as unhealthy
+            recovery_seconds: Seconds after the last failure before an unhealthy route is tried again
+            default_hedge_delay: Hedge delay used before any latency has been observed
+            min_hedge_delay: Lower bound for the p95-based hedge delay
+        """
+        self.routes = list(routes)
+        self.max_error_rate = max_error_rate
+        self.recovery_seconds = recovery_seconds
+        self.default_hedge_delay = default_hedge_delay
+        self.min_hedge_delay = min_hedge_delay
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def stats_for(self, provider, model):
+        with self._lock:
+            key = (provider, model)
+            if key not in self._stats:
+                self._stats[key] = ProviderStats()
+            return self._stats[key]
+
+    def record(self, provider, model, latency, ok):
+        self.stats_for(provider, model).record(latency, ok)
+
+    def is_healthy(self, provider, model):
+        stats = self.stats_for(provider, model)
+        if stats.error_rate < self.max_error_rate:
+            return True
+        return time.monotonic() - stats.last_failure >= self.recovery_seconds
+
+    def rank(self, candidates):
+        """Order candidates healthy-first, then by latency. Unmeasured routes go first so they get sampled."""
+        def score(route):
+            stats = self.stats_for(*route)
+            latency = stats.ewma_latency if stats.ewma_latency is not None else 0.0
+            return (0 if self.is_healthy(*route) else 1, latency)
+        return sorted(candidates, key=score)
+
+    def hedge_delay(self, provider, model):
+        p95 = self.stats_for(provider, model).p95()
+        if p95 is None:
+            return self.default_hedge_delay
+        return max(self.min_hedge_delay, p95)
+
+    def adaptive_timeout(self, provider, model, default=60.0, floor=10.0):
+        """Per-attempt timeout of 3x the route's observed p95, bounded by floor and default."""
+        p95 = self.stats_for(provider, model).p95()
+        if p95 is None:
+            return default
+        return min(default, max(floor, p95 * 3))
+
+    def snapshot(self):
+        with self._lock:
+            keys = list(self._stats)
+        return {f"{provider}:{model}": self.stats_for(provider, model).snapshot() for provider, model in keys}
+
+
+router = ProviderRouter(_parse_routes(os.getenv('AI_ROUTES', '')))
+
+
+# Prompt token budgets per task type. Context beyond the budget is compressed, then trimmed.
+# Override with AI_TOKEN_BUDGETS="notes:300,quiz:1200".
+DEFAULT_TOKEN_BUDGETS = {
+    'curriculum': 600,
+    'plan_outline': 600,
+    'notes': 400,
+    'quiz': 1500,
+    'json_fix': 2500,
+}
+
+
+def _parse_budgets(value):
+    budgets = dict(DEFAULT_TOKEN_BUDGETS)
+    for item in value.split(','):
+        if ':' in item:
+            task, budget = item.strip().split(':', 1)
+            try:
+                budgets[task.strip()] = int(budget)
+            except ValueError:
+                pass
+    return budgets
+
+
+def estimate_tokens(text):
+    """Local token estimate without a tokenizer: ~4 characters or ~0.75 words per token."""
+    if not text:
+        return 0
+    return max(1, int(max(len(text) / 4, len(text.split()) * 1.3)))
+
+
+# Approximate list prices in USD per 1M (input, output) tokens, for relative cost reporting.
+# Override or extend with AI_MODEL_PRICES='{"gemini-1.5-flash": [0.075, 0.3]}'.
+DEFAULT_MODEL_PRICES = {
+    'gemini-1.5-flash': (0.075, 0.30),
+    'gemini-1.5-pro-latest': (1.25, 5.00),
+    'gemini-2.5-pro': (1.25, 10.00),
+    'gpt-4o-mini': (0.15, 0.60),
+    'gpt-3.5-turbo': (0.50, 1.50),
+    'gpt-4o': (2.50, 10.00),
+    'gpt-4': (30.00, 60.00),
+}
+
+
+def _parse_json_env(name, default):
+    try:
+        return json.loads(os.getenv(name, '') or 'null') or default
+    except ValueError:
+        logger.warning(f"Ignoring invalid JSON in {name}")
+        return default
+
+
+TENANT_ROUTES.update(_parse_json_env('AI_TENANT_ROUTES', {}))
+
+MODEL_PRICES = {**DEFAULT_MODEL_PRICES,
+                **{model: tuple(price) for model, price in _parse_json_env('AI_MODEL_PRICES', {}).items()}}
+
+
+def model_cost(model, prompt_tokens, response_tokens):
+    price_in, price_out = MODEL_PRICES.get(model, (0.0, 0.0))
+    return (prompt_tokens * price_in + response_tokens * price_out) / 1_000_000
+
+
+class TaskUsage:
+    """Token and latency totals for one task type (notes, quiz, curriculum, ...)."""
+
+    def __init__(self, window=100):
+        self.calls = 0
+        self.errors = 0
+        self.prompt_tokens = 0
+        self.response_tokens = 0
+        self.reported_calls = 0
+        self.compressed = 0
+        self.trimmed = 0
+        self.escalations = 0
+        self.cost_usd = 0.0
+        self.by_model = {}
+        self.latencies = deque(maxlen=window)
+        self.lock = threading.Lock()
+
+    def snapshot(self):
+        with self.lock:
+            ordered = sorted(self.latencies)
+            ok_calls = self.calls - self.errors
+            return {
+                'calls': self.calls,
+                'errors': self.errors,
+                'prompt_tokens': self.prompt_tokens,
+                'response_tokens': self.response_tokens,
+                'avg_prompt_tokens': round(self.prompt_tokens / ok_calls) if ok_calls else None,
+                'avg_response_tokens': round(self.response_tokens / ok_calls) if ok_calls else None,
+                # Calls whose counts came from the provider rather than the local estimate
+                'reported_calls': self.reported_calls,
+                'compressed_prompts': self.compressed,
+                'trimmed_prompts': self.trimmed,
+                'escalations': self.escalations,
+                'cost_usd': round(self.cost_usd, 6),
+                'avg_cost_usd': round(self.cost_usd / ok_calls, 6) if ok_calls else None,
+                'by_model': dict(self.by_model),
+                'avg_latency': round(sum(ordered) / len(ordered), 3) if ordered else None,
+                'p95_latency': round(ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))], 3) if ordered else None,
+            }
+
+
+class TokenLedger:
+    def __init__(self, budgets):
+        """
+        Per-task accounting of LLM prompt/response tokens and latency.
+
+        Args:
+            budgets: Prompt token budget per task type; tasks not listed are unbudgeted
+        """
+        self.budgets = dict(budgets)
+        self._usage = {}
+        self._listeners = []
+        self._lock = threading.Lock()
+
+    def add_listener(self, listener):
+        """Call listener(tokens) in the calling context after every successful record, e.g. to charge a budget."""
+        if listener not in self._listeners:
+            self._listeners.append(listener)
+
+    def usage_for(self, task):
+        with self._lock:
+            if task not in self._usage:
+                self._usage[task] = TaskUsage()
+            return self._usage[task]
+
+    def budget(self, task):
+        return self.budgets.get(task)
+
+    def record(self, task, prompt, response=None, latency=None, usage=None, ok=True, model=None):
+        """
+        Record one call. Provider-reported (prompt, response) token counts are used when
+        available, local estimates otherwise; cost uses MODEL_PRICES for `model`.
+        """
+        stats = self.usage_for(task or 'untagged')
+        with stats.lock:
+            stats.calls += 1
+            if not ok:
+                stats.errors += 1
+                return
+            if usage:
+                stats.reported_calls += 1
+                prompt_tokens, response_tokens = usage
+            else:
+                prompt_tokens, response_tokens = estimate_tokens(prompt), estimate_tokens(response)
+            stats.prompt_tokens += prompt_tokens
+            stats.response_tokens += response_tokens
+            stats.cost_usd += model_cost(model, prompt_tokens, response_tokens)
+            if model:
+                stats.by_model[model] = stats.by_model.get(model, 0) + 1
+            if latency is not None:
+                stats.latencies.append(latency)
+        for listener in self._listeners:
+            listener(prompt_tokens + response_tokens)
+
+    def note_escalation(self, task):
+        stats = self.usage_for(task or 'untagged')
+        with stats.lock:
+            stats.escalations += 1
+
+    def note_fitted(self, task, compressed, trimmed):
+        stats = self.usage_for(task or 'untagged')
+        with stats.lock:
+            stats.compressed += int(compressed)
+            stats.trimmed += int(trimmed)
+
+    def snapshot(self):
+        with self._lock:
+            tasks = list(self._usage)
+        return {
+            task: dict(self.usage_for(task).snapshot(), prompt_budget=self.budget(task))
+            for task in tasks
+        }
+
+
+token_ledger = TokenLedger(_parse_budgets(os.getenv('AI_TOKEN_BUDGETS', '')))
+
+
+def compress_text(text):
+    """Lossless compression of prompt context: collapses whitespace and drops repeated sentences."""
+    text = re.sub(r'\s+', ' ', text or '').strip()
+    seen, sentences = set(), []
+    for sentence in re.split(r'(?<=[.!?])\s+', text):
+        key = sentence.lower().strip()
+        if key and key not in seen:
+            seen.add(key)
+            sentences.append(sentence)
+    return ' '.join(sentences)
+
+
+def trim_to_tokens(text, max_tokens):
+    """Keep whole leading sentences that fit in max_tokens; cut the first one if none do."""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    kept, used = [], 0
+    for sentence in re.split(r'(?<=[.!?])\s+', text):
+        used += estimate_tokens(sentence)
+        if used > max_tokens:
+            break
+        kept.append(sentence)
+    if kept:
+        return ' '.join(kept) + ' …'
+    return text[:max(0, max_tokens * 4)].rsplit(' ', 1)[0] + ' …'
 
-    Args:
-        prompt (str): The input prompt for the AI.
-        model (str): The model to use (default: "gpt-4").
-        provider (str): The AI provider to use (default: "openai").
-        api_key (str, optional): The API key to use. If not provided, falls back to environment variable.
-        **kwargs: Additional provider-specific parameters.
+
+def fit_prompt(task, template, context, placeholder='{context}'):
+    """
+    Fill `placeholder` in a prompt template with context, keeping the whole prompt within the
+    task's token budget: the context is compressed first, then trimmed at sentence boundaries.
+    The instructions in the template are never cut.
 
     Returns:
-        str: The generated content from the AI API.
+        str: The prompt to send
+    """
+    budget = token_ledger.budget(task)
+    context = context or ''
+    if budget is None or estimate_tokens(template.replace(placeholder, context)) <= budget:
+        return template.replace(placeholder, context)
+    room = max(0, budget - estimate_tokens(template.replace(placeholder, '')))
+    compressed = compress_text(context)
+    trimmed = trim_to_tokens(compressed, room)
+    token_ledger.note_fitted(task, compressed=True, trimmed=trimmed != compressed)
+    return template.replace(placeholder, trimmed)
 
-    Raises:
-        ValueError: If the provider is not supported or API key is missing.
-        Exception: If the API call fails or returns an error.
+
+def _resolve_api_key(provider, api_key=None, api_keys=None):
+    return api_key or (api_keys or {}).get(provider) or os.getenv(f'{provider.upper()}_API_KEY')
+
+
+def reported_usage(provider, body):
+    """(prompt_tokens, response_tokens) as reported by the provider, or None if absent."""
+    try:
+        return PROVIDER_ENDPOINTS[provider]['extract_usage'](body)
+    except (KeyError, TypeError, IndexError):
+        return None
+
+
+class HedgeAttempt:
+    """
+    One request of a hedged pair. Once the other request wins, this one is abandoned:
+    its LLM slot is released at once and its outcome is not recorded. Its HTTP request
+    is not aborted; closing the session only drops the connection once it returns.
+    """
+
+    def __init__(self):
+        self.session = requests.Session()
+        self.abandoned = False
+        self._waiter = None
+        self._lock = threading.Lock()
+
+    def hold(self, waiter) -> bool:
+        """Keep the slot the attempt was granted; False if it was abandoned while queueing."""
+        with self._lock:
+            if self.abandoned:
+                return False
+            self._waiter = waiter
+            return True
+
+    def release(self):
+        with self._lock:
+            waiter, self._waiter = self._waiter, None
+        if waiter is not None:
+            llm_slots.release(waiter)
+
+    def abandon(self):
+        with self._lock:
+            self.abandoned = True
+        self.release()
+        self.session.close()
+
+
+class HedgeAbandoned(Exception):
+    """Raised by an attempt whose hedged twin won before it got an LLM slot."""
+
+
+@contextmanager
+def _llm_slot(cost, attempt=None):
+    """Hold an LLM slot for the block; a hedged attempt gives it up early when it is abandoned."""
+    if attempt is None:
+        with llm_slots.slot(cost=cost):
+            yield
+        return
+    waiter = llm_slots.acquire(cost=cost)
+    if not attempt.hold(waiter):
+        llm_slots.release(waiter)
+        raise HedgeAbandoned("The other hedged request already answered")
+    try:
+        yield
+    finally:
+        attempt.release()
+
+
+def _request_provider(prompt, model, provider, api_key, attempt=None, timeout=None, task=None, **kwargs):
+    """
+    Single, un-retried request to one provider. Waits for a fair-scheduled LLM slot for
+    the current tenant, then records latency/error stats on the router and token usage
+    for `task` on the token ledger (unless `attempt` is a hedged request that lost).
+
+    The timeout (the route's adaptive timeout unless given) is clamped to the request
+    deadline only once the slot is acquired, so time spent queueing is not granted twice.
     """
-    provider = provider.lower()
-    if provider not in PROVIDER_ENDPOINTS:
-        raise ValueError(f"Unsupported AI provider: {provider}")
-    
-    # Get provider configuration
     config = PROVIDER_ENDPOINTS[provider]
-    
-    # Get API key from kwargs or environment variable
-    api_key = api_key or os.getenv(f'{provider.upper()}_API_KEY')
-    if not api_key:
-        raise ValueError(f"No API key provided for {provider} and {provider.upper()}_API_KEY environment variable is not set")
-    
+
     # Prepare request
     url = config['url_template'].format(model) if '{}' in config['url_template'] else config['url_template']
     headers = {k: v.format(api_key) if isinstance(v, str) and '{}' in v else v 
@@ -70,27 +565,198 @@ def call_ai(prompt, model="gpt-4", provider="openai", api_key=None, **kwargs):
     # Add API key to params if needed (e.g., for Gemini)
     params = {config['params_key']: api_key} if 'params_key' in config else {}
     
-    # Make the API request
+    # Make the API request; queueing for a slot does not count towards the route's latency
     try:
-        response = requests.post(
-            url,
-            headers=headers,
-            json=payload,
-            params=params,
-            timeout=60
-        )
+        with _llm_slot(1 + estimate_tokens(prompt) / 1000, attempt):
+            timeout = request_timeout(timeout if timeout is not None else router.adaptive_timeout(provider, model))
+            start = time.monotonic()
+            response = (attempt.session if attempt is not None else requests).post(
+                url,
+                headers=headers,
+                json=payload,
+                params=params,
+                timeout=timeout
+            )
         response.raise_for_status()
-        return config['extract_response'](response)
+        text = config['extract_response'](response)
     except requests.exceptions.RequestException as e:
+        # A hedged request that lost the race is not a provider failure
+        if attempt is None or not attempt.abandoned:
+            router.record(provider, model, time.monotonic() - start, ok=False)
+            token_ledger.record(task, prompt, ok=False, model=model)
         error_msg = f"Error calling {provider} API: {str(e)}"
         if hasattr(e, 'response') and e.response is not None:
             error_msg += f"\nResponse: {e.response.text}"
         raise Exception(error_msg) from e
+    latency = time.monotonic() - start
+    if attempt is not None and attempt.abandoned:
+        return text
+    router.record(provider, model, latency, ok=True)
+    token_ledger.record(task, prompt, text, latency=latency, usage=reported_usage(provider, response.json()),
+                        model=model)
+    return text
+
+
+def _hedged_call(prompt, primary, secondary, api_keys, validate=None, task=None, **kwargs):
+    """
+    Send to the primary route; if it has not answered after its p95 latency, send the same
+    prompt to the secondary route. The first valid response wins; the other request is
+    abandoned (see HedgeAttempt) and its slot goes back to the pool straight away.
+    """
+    routes = [primary, secondary]
+    attempts = [HedgeAttempt(), HedgeAttempt()]
+    executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='ai-hedge')
+
+    def attempt(i):
+        provider, model = routes[i]
+        text = _request_provider(prompt, model, provider, api_keys[i], attempt=attempts[i], task=task, **kwargs)
+        if validate is not None and not validate(text):
+            raise ValueError(f"Invalid response from {provider}:{model}")
+        return text
+
+    # Attempts run in the caller's context so they queue for slots as the caller's tenant
+    def submit(i):
+        return executor.submit(contextvars.copy_context().run, attempt, i)
+
+    futures = {submit(0): 0}
+    errors = []
+    try:
+        done, _ = wait(futures, timeout=router.hedge_delay(*primary))
+        if not done or next(iter(done)).exception() is not None:
+            futures[submit(1)] = 1
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    winner = futures[future]
+                    attempts[1 - winner].abandon()
+                    return future.result()
+                errors.append(future.exception())
+                # The primary failed before its hedge fired; start the secondary now
+                if len(futures) == 1:
+                    future_2 = submit(1)
+                    futures[future_2] = 1
+                    pending.add(future_2)
+        raise Exception(f"All hedged requests failed: {'; '.join(str(e) for e in errors)}")
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+# Retry logic with exponential backoff, bounded by the request deadline and its shared retry budget
+@retry(
+    stop=stop_after_attempt(3) | stop_on_deadline,
+    wait=wait_within_deadline(wait_exponential(multiplier=1, min=4, max=10)),
+    retry=retry_if_not_exception_type(DeadlineExceeded)
+)
+def call_ai(prompt, model="gpt-4", provider="openai", api_key=None, hedge=False,
+            api_keys=None, validate=None, task=None, routes=None, **kwargs):
+    """
+    Calls the specified AI provider's API to generate content based on the provided prompt.
+
+    Args:
+        prompt (str): The input prompt for the AI.
+        model (str): The model to use (default: "gpt-4"). Ignored when provider is "auto".
+        provider (str): The AI provider to use (default: "openai"). "auto" routes to the
+            currently fastest healthy route in `router` that has an API key.
+        api_key (str, optional): The API key to use. If not provided, falls back to environment variable.
+            Only applies to an explicit provider.
+        hedge (bool): For latency-critical prompts, issue a second request after the primary
+            route's p95 latency and return whichever valid response arrives first.
+        api_keys (dict, optional): Per-provider API keys, used by provider="auto".
+        validate (callable, optional): Returns False for responses that should not win a hedge.
+        task (str, optional): Task type ("notes", "quiz", ...) the call's tokens and latency are
+            accounted under in `token_ledger`.
+        routes (list, optional): (provider, model) candidates for provider="auto" instead of
+            `router.routes`; call_task passes the routes of one model tier.
+        **kwargs: Additional provider-specific parameters.
+
+    Returns:
+        str: The generated content from the AI API.
+
+    Raises:
+        ValueError: If the provider is not supported or API key is missing.
+        DeadlineExceeded: If the current request deadline has no time left.
+        Exception: If the API call fails or returns an error.
+    """
+    provider = provider.lower()
+    if provider == 'auto':
+        candidates = [(p, m) for p, m in (routes or router.routes)
+                      if p in PROVIDER_ENDPOINTS and _resolve_api_key(p, api_keys=api_keys)]
+        if not candidates:
+            raise ValueError("No API key available for any configured AI route")
+        ranked = router.rank(candidates)
+    else:
+        if provider not in PROVIDER_ENDPOINTS:
+            raise ValueError(f"Unsupported AI provider: {provider}")
+        ranked = [(provider, model)]
+
+    keys = [_resolve_api_key(p, api_key if provider != 'auto' else None, api_keys) for p, _ in ranked]
+    if not keys[0]:
+        raise ValueError(f"No API key provided for {provider} and {provider.upper()}_API_KEY environment variable is not set")
+
+    if hedge:
+        # Hedge to the runner-up route, or to the same route when there is only one
+        secondary = 1 if len(ranked) > 1 else 0
+        return _hedged_call(prompt, ranked[0], ranked[secondary], [keys[0], keys[secondary]],
+                            validate=validate, task=task, **kwargs)
+
+    primary_provider, primary_model = ranked[0]
+    # Timeouts adapt to the route's observed latency and never outlive the request deadline
+    return _request_provider(prompt, primary_model, primary_provider, keys[0], task=task, **kwargs)
+
+def call_task(task, prompt, api_keys=None, providers=None, tenant=None, hedge=False, validate=None, **kwargs):
+    """
+    Run a prompt on the model tier that TASK_ROUTES (plus the tenant's overrides) assigns
+    to `task`, picking the fastest healthy route within the tier.
+
+    If `validate` rejects the response, the prompt is re-run one tier up, up to the
+    task's max_tier; routes already tried are skipped, so a tier that offers no model
+    the call has not already run on is no escalation at all. The last response is returned
+    even if it never validated, so callers can still repair it.
+
+    Args:
+        task (str): Task type, a key of TASK_ROUTES.
+        prompt (str): The input prompt for the AI.
+        api_keys (dict, optional): Per-provider API keys; environment variables otherwise.
+        providers (list, optional): Restrict routing to these providers, e.g. the one the
+            caller has a key for.
+        tenant (str, optional): Tenant whose overrides apply; defaults to the current tenant.
+        hedge (bool): Hedge across the two fastest routes of each tier.
+        validate (callable, optional): Returns False for responses that should escalate.
+        **kwargs: Additional provider-specific parameters.
+
+    Returns:
+        str: The generated content from the AI API.
+
+    Raises:
+        ValueError: If no route on any of the task's tiers has an API key.
+    """
+    tried = set()
+    response = None
+    for tier in task_tiers(task, tenant):
+        candidates = [(p, m) for p, m in MODEL_TIERS[tier]
+                      if (p, m) not in tried and (providers is None or p in providers)
+                      and p in PROVIDER_ENDPOINTS and _resolve_api_key(p, api_keys=api_keys)]
+        if not candidates:
+            continue
+        if response is not None:
+            logger.info(f"Escalating {task} to the {tier} tier after a response failed validation")
+            token_ledger.note_escalation(task)
+        tried.update(candidates)
+        response = call_ai(prompt, provider='auto', routes=candidates, hedge=hedge, api_keys=api_keys,
+                           validate=validate if hedge else None, task=task, **kwargs)
+        if validate is None or validate(response):
+            return response
+    if response is None:
+        raise ValueError(f"No API key available for any model routed to task {task}")
+    return response
+
 
 # Backward compatibility
-def call_gemini(prompt, model="gemini-1.5-pro-latest", api_key=None):
+def call_gemini(prompt, model=None, api_key=None, task=None):
     """Legacy function for backward compatibility"""
-    return call_ai(prompt, model=model, provider='gemini', api_key=api_key)
+    return call_ai(prompt, model=model or model_for(task, 'gemini'), provider='gemini', api_key=api_key, task=task)
 
 # Example usage
 if __name__ == "__main__":
@@ -6,6 +6,17 @@ import time
 from datetime import datetime
 import json
 from typing import Dict, Any, Callable, Optional
+from . import config, rpc
+from .admission import Admission
+from .deadline import deadline_from_headers, deadline_scope
+from .tenancy import priority_from_headers, priority_scope, request_tenant, tenant_scope
+
+def reloader_parent(debug: bool) -> bool:
+    """
+    True in the process Flask's debug reloader keeps watching files from. It never serves
+    requests, so background threads, listeners and shutdown hooks belong in its child.
+    """
+    return debug and os.environ.get('WERKZEUG_RUN_MAIN') != 'true'
 
 class BaseService:
     def __init__(self, service_name: str, default_port: int):
@@ -20,7 +31,12 @@ class BaseService:
         self.service_name = service_name
         self.default_port = default_port
         self.logger = self._setup_logging()
+        self.rpc_server: Optional[rpc.RPCServer] = None
         self._register_health_check()
+        # Bound in-flight and queued requests per route; excess is shed with 503 + Retry-After
+        self.admission = Admission()
+        self.admission.install(self.app, shed_response=lambda e: self.error_response(
+            str(e), 503, retry_after=e.retry_after))
         
         # Enable CORS for all routes
         from flask_cors import CORS
@@ -58,8 +74,15 @@ class BaseService:
             return jsonify({
                 'status': 'healthy',
                 'service': self.service_name,
-                'timestamp': datetime.utcnow().isoformat()
+                'timestamp': datetime.utcnow().isoformat(),
+                'admission': self.admission.stats(),
+                'rpc': self.rpc_server.stats() if self.rpc_server else None,
+                **self.health_details()
             }), 200
+
+    def health_details(self) -> Dict[str, Any]:
+        """Extra fields for the /health response; override in subclasses to report service stats."""
+        return {}
     
     def validate_required_fields(self, data: Dict, required_fields: list) -> tuple[bool, Optional[str]]:
         """
@@ -124,8 +147,12 @@ class BaseService:
                     }
                     self.logger.debug(f"[{request_id}] Request details: {json.dumps(log_data, default=str)}")
                     
-                    # Process the request
-                    response = f(*args, **kwargs)
+                    # Process the request under the caller's deadline, tenant and priority class,
+                    # if propagated; direct callers are attributed by user id or API key
+                    with deadline_scope(deadline_from_headers(request.headers)), \
+                            tenant_scope(request_tenant(request.headers, request.get_json(silent=True))), \
+                            priority_scope(priority_from_headers(request.headers)):
+                        response = f(*args, **kwargs)
                     
                     # Calculate response time
                     response_time = time.time() - start_time
@@ -143,10 +170,23 @@ class BaseService:
             
         return decorator
     
+    def start_rpc(self, host: str = '0.0.0.0', port: int = None) -> Optional[rpc.RPCServer]:
+        """Serve this service's routes over the binary RPC transport, alongside HTTP."""
+        if not rpc.available():
+            self.logger.warning("INTERNAL_TRANSPORT=rpc needs the msgpack package; serving HTTP only")
+            return None
+        if port is None:
+            port = self.default_port + config.RPC_PORT_OFFSET
+        self.rpc_server = rpc.RPCServer(self.app, host=host, port=port, threads=config.RPC_SERVER_THREADS).start()
+        self.logger.info(f"Serving {self.service_name} over RPC on {host}:{port}")
+        return self.rpc_server
+
     def run(self, host: str = '0.0.0.0', port: int = None, **kwargs):
-        """Run the Flask application."""
+        """Run the Flask application, plus the RPC listener when INTERNAL_TRANSPORT=rpc."""
         if port is None:
             port = self.default_port
+        if config.INTERNAL_TRANSPORT == 'rpc' and self.rpc_server is None and not reloader_parent(kwargs.get('debug')):
+            self.start_rpc(host, port + config.RPC_PORT_OFFSET)
             
         self.logger.info(f"Starting {self.service_name} service on {host}:{port}")
         self.app.run(host=host, port=port, **kwargs)
@@ -0,0 +1,253 @@
+"""
+Popularity-driven background cache warmer.
+
+Mines `learning_paths` for the most requested (topic, days, daily_hours)
+combinations and regenerates them off-peak, so the plan, notes, quiz and
+video caches are hot before the day's first live request. A per-run plan
+quota, a daily token budget, an off-peak window and a busy check keep
+warming from competing with live traffic. The budget is checked before every
+LLM call a warming run makes, so one large plan cannot overrun it. Calls made
+by other services on the run's behalf carry the remaining allowance in the
+X-Warm-Token-Allowance header and report what they spent in their response.
+"""
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+WARM_ALLOWANCE_HEADER = 'X-Warm-Token-Allowance'
+
+# [tokens spent, tokens allowed, calls refused] for the active warming run; spending is
+# what ai_utils.token_ledger records for the run's calls (provider-reported where available)
+_token_tally: ContextVar[Optional[List[int]]] = ContextVar('warm_token_tally', default=None)
+
+
+class WarmBudgetExhausted(Exception):
+    """Raised before an LLM call of a warming run that has spent its token allowance."""
+
+
+def record_tokens(tokens: int):
+    """Token ledger listener: count an LLM call's tokens against the active warming run, if any."""
+    tally = _token_tally.get()
+    if tally is not None:
+        tally[0] += tokens
+
+
+def check_warm_budget():
+    """
+    Call before each LLM call; outside a warming run it does nothing.
+
+    Raises:
+        WarmBudgetExhausted: If the active warming run has no token allowance left.
+    """
+    tally = _token_tally.get()
+    if tally is not None and tally[0] >= tally[1]:
+        tally[2] += 1
+        raise WarmBudgetExhausted(f"Warming token allowance of {tally[1]} spent")
+
+
+def warm_headers() -> dict:
+    """Headers that hand the active warming run's remaining allowance to a downstream service."""
+    tally = _token_tally.get()
+    if tally is None:
+        return {}
+    return {WARM_ALLOWANCE_HEADER: str(max(0, tally[1] - tally[0]))}
+
+
+def warm_allowance_from_headers(headers) -> Optional[int]:
+    try:
+        return max(0, int(headers.get(WARM_ALLOWANCE_HEADER)))
+    except (TypeError, ValueError):
+        return None
+
+
+@contextmanager
+def warm_budget_scope(allowance: Optional[int]):
+    """
+    Run a downstream service's share of a warming run against `allowance` tokens
+    (None: not part of a warming run). Yields the scope's usage report, filled in
+    on exit, for the service to return to the caller; see charge_reported_usage.
+    """
+    if allowance is None:
+        yield None
+        return
+    tally = [0, allowance, 0]
+    usage = {}
+    token = _token_tally.set(tally)
+    try:
+        yield usage
+    finally:
+        _token_tally.reset(token)
+        usage.update(tokens=tally[0], refused=tally[2])
+
+
+def charge_reported_usage(usage: Optional[Dict[str, int]]):
+    """Count the usage a downstream service reported for its share against the active warming run."""
+    tally = _token_tally.get()
+    if tally is None or not usage:
+        return
+    tally[0] += int(usage.get('tokens') or 0)
+    tally[2] += int(usage.get('refused') or 0)
+
+
+def parse_hours(spec: str) -> set:
+    """Parse an hour window such as "1-6" or "22-4" (wrapping past midnight) into a set of hours."""
+    start, _, end = spec.partition('-')
+    start, end = int(start), int(end or start)
+    if start <= end:
+        return set(range(start, end + 1))
+    return set(range(start, 24)) | set(range(0, end + 1))
+
+
+class CacheWarmer:
+    def __init__(self, collection, warm_fn: Callable[[str, int, float], None],
+                 is_busy: Callable[[], bool] = lambda: False, top_n: int = 20,
+                 max_plans_per_run: int = 5, token_budget: int = 200000,
+                 off_peak_hours: str = '1-6', interval: float = 900.0,
+                 lookback_days: int = 30, refresh_after: float = 86400.0,
+                 owns: Callable[[str], bool] = lambda topic: True):
+        """
+        Args:
+            collection: The `learning_paths` Mongo collection to mine
+            warm_fn: Regenerates one (topic, days, daily_hours) combination into the caches
+            is_busy: Returns True while live requests are in flight; warming pauses meanwhile
+            top_n: How many of the most popular combinations to consider
+            max_plans_per_run: Quota of combinations warmed per run
+            token_budget: Estimated LLM tokens warming may spend per calendar day
+            off_peak_hours: Local hours during which warming may run, e.g. "1-6"
+            interval: Seconds between runs
+            lookback_days: Only requests from this many days back count towards popularity
+            refresh_after: Seconds after which a warmed combination is regenerated again
+            owns: Returns False for topics another node warms (topic sharding), which are skipped
+        """
+        self.collection = collection
+        self.warm_fn = warm_fn
+        self.is_busy = is_busy
+        self.top_n = top_n
+        self.max_plans_per_run = max_plans_per_run
+        self.token_budget = token_budget
+        self.off_peak_hours = parse_hours(off_peak_hours)
+        self.interval = interval
+        self.lookback_days = lookback_days
+        self.refresh_after = refresh_after
+        self.owns = owns
+        self._warmed_at: Dict[tuple, float] = {}
+        self._budget_day = None
+        self.tokens_spent_today = 0
+        self.runs = 0
+        self.plans_warmed = 0
+        self.last_run: Optional[str] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def popular_combinations(self) -> List[Dict[str, Any]]:
+        """Most frequently requested (topic, days, daily_hours) combinations, most popular first."""
+        since = (datetime.now() - timedelta(days=self.lookback_days)).isoformat()
+        pipeline = [
+            {'$match': {'created_at': {'$gte': since}}},
+            {'$group': {
+                '_id': {
+                    'topic': {'$toLower': {'$trim': {'input': '$topic_name'}}},
+                    'days': '$no_of_days',
+                    'hours': '$daily_hours'
+                },
+                'count': {'$sum': 1}
+            }},
+            {'$sort': {'count': -1}},
+            {'$limit': self.top_n}
+        ]
+        return [
+            {'topic': doc['_id']['topic'], 'days': doc['_id']['days'],
+             'daily_hours': doc['_id']['hours'], 'count': doc['count']}
+            for doc in self.collection.aggregate(pipeline)
+        ]
+
+    def _budget_left(self) -> int:
+        today = datetime.now().date()
+        if self._budget_day != today:
+            self._budget_day = today
+            self.tokens_spent_today = 0
+        return self.token_budget - self.tokens_spent_today
+
+    def run_once(self, force: bool = False) -> int:
+        """
+        Warm up to `max_plans_per_run` stale popular combinations.
+
+        Args:
+            force: Ignore the off-peak window (budget, quota and busy checks still apply)
+
+        Returns:
+            int: Number of combinations warmed
+        """
+        if not force and datetime.now().hour not in self.off_peak_hours:
+            return 0
+        warmed = 0
+        for combo in self.popular_combinations():
+            if warmed >= self.max_plans_per_run or self._stop.is_set():
+                break
+            if self._budget_left() <= 0:
+                logger.info("Cache warmer token budget exhausted for today")
+                break
+            if self.is_busy():
+                logger.info("Live traffic in flight; pausing cache warming")
+                break
+            key = (combo['topic'], combo['days'], combo['daily_hours'])
+            if not self.owns(combo['topic']):
+                continue
+            if time.time() - self._warmed_at.get(key, 0) < self.refresh_after:
+                continue
+
+            tally = [0, self._budget_left(), 0]
+            token = _token_tally.set(tally)
+            try:
+                self.warm_fn(combo['topic'], combo['days'], combo['daily_hours'])
+                if not tally[2]:
+                    self._warmed_at[key] = time.time()
+                    warmed += 1
+                    logger.info(f"Warmed {key} (requested {combo['count']}x, ~{tally[0]} tokens)")
+            except Exception as e:
+                if not tally[2]:
+                    logger.warning(f"Cache warming failed for {key}: {str(e)}")
+            finally:
+                _token_tally.reset(token)
+                self.tokens_spent_today += tally[0]
+            # Callers may swallow the refusal and fall back; the combination is then only partly warm
+            if tally[2]:
+                logger.info(f"Cache warmer token budget exhausted for today while warming {key}")
+                break
+
+        self.runs += 1
+        self.plans_warmed += warmed
+        self.last_run = datetime.now().isoformat()
+        return warmed
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='cache-warmer', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception:
+                logger.exception("Cache warmer run failed")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'runs': self.runs,
+            'plans_warmed': self.plans_warmed,
+            'last_run': self.last_run,
+            'tokens_spent_today': self.tokens_spent_today,
+            'token_budget': self.token_budget,
+        }
@@ -6,3 +6,141 @@ load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '../.env'))
 KAFKA_BOOTSTRAP_SERVERS = os.getenv('KAFKA_BOOTSTRAP_SERVERS', 'localhost:9092')
 GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
 YOUTUBE_API_KEY = os.getenv('YOUTUBE_API_KEY')
+MONGO_URI = os.getenv('MONGO_URI', 'mongodb://localhost:27017/WhipLash')
+MONGO_DB = os.getenv('MONGO_DB', 'WhipLash')
+
+# Internal service endpoints
+VIDEO_FETCHER_URL = os.getenv('VIDEO_FETCHER_URL', 'http://localhost:5103')
+MATERIAL_GENERATOR_URL = os.getenv('MATERIAL_GENERATOR_URL', 'http://localhost:5102')
+QUIZ_GENERATOR_URL = os.getenv('QUIZ_GENERATOR_URL', 'http://localhost:5104')
+
+# Transport for internal calls: "http" (JSON over HTTP) or "rpc" (msgpack frames over persistent,
+# multiplexed TCP connections; needs msgpack). Services listen for RPC on their port + RPC_PORT_OFFSET
+INTERNAL_TRANSPORT = os.getenv('INTERNAL_TRANSPORT', 'http').lower()
+RPC_PORT_OFFSET = int(os.getenv('RPC_PORT_OFFSET', '1000'))
+VIDEO_FETCHER_RPC = os.getenv('VIDEO_FETCHER_RPC', 'localhost:6103')
+QUIZ_GENERATOR_RPC = os.getenv('QUIZ_GENERATOR_RPC', 'localhost:6104')
+RPC_CONNECTIONS = int(os.getenv('RPC_CONNECTIONS', '2'))
+RPC_SERVER_THREADS = int(os.getenv('RPC_SERVER_THREADS', '16'))
+
+# Circuit breaker / health monitor tuning for internal calls
+SERVICE_FAILURE_THRESHOLD = int(os.getenv('SERVICE_FAILURE_THRESHOLD', '3'))
+SERVICE_RESET_TIMEOUT = float(os.getenv('SERVICE_RESET_TIMEOUT', '30'))
+HEALTH_CHECK_INTERVAL = float(os.getenv('HEALTH_CHECK_INTERVAL', '10'))
+
+# Topic-affinity sharding across MCP nodes: every node hashes the normalized topic onto a consistent
+# hash ring of MCP_NODE_URL plus MCP_PEERS (comma-separated URLs) and relays /generate_plan requests
+# for topics it does not own to the owning node, so each topic's caches stay warm on one node.
+# Unhealthy peers leave the ring until they recover. Relays carry the caller's api_key, so join/leave
+# must carry SHARD_CLUSTER_TOKEN when it is set; without it, only peers in MCP_PEERS may join or leave
+MCP_PORT = int(os.getenv('MCP_PORT', '5101'))
+MCP_NODE_URL = os.getenv('MCP_NODE_URL', f'http://localhost:{MCP_PORT}')
+MCP_PEERS = [url.strip().rstrip('/') for url in os.getenv('MCP_PEERS', '').split(',') if url.strip()]
+SHARD_ROUTING = os.getenv('SHARD_ROUTING', 'true').lower() == 'true'
+SHARD_VNODES = int(os.getenv('SHARD_VNODES', '128'))
+SHARD_HEALTH_INTERVAL = float(os.getenv('SHARD_HEALTH_INTERVAL', '5'))
+SHARD_CLUSTER_TOKEN = os.getenv('SHARD_CLUSTER_TOKEN', '')
+
+# "fixed" sends every LLM call to the caller's provider; "auto" lets ai_utils route by live latency
+AI_ROUTING = os.getenv('AI_ROUTING', 'fixed').lower()
+
+# End-to-end SLO for one /generate_plan request and the retries it may spend in total. The deadline
+# is PLAN_DEADLINE_SECONDS for the curriculum and videos plus PLAN_DAY_DEADLINE_SECONDS per day,
+# and each day's notes and quizzes are bounded by their own PLAN_DAY_DEADLINE_SECONDS, so a long
+# plan gets the time it needs and one slow day cannot starve the days after it
+PLAN_DEADLINE_SECONDS = float(os.getenv('PLAN_DEADLINE_SECONDS', '180'))
+PLAN_DAY_DEADLINE_SECONDS = float(os.getenv('PLAN_DAY_DEADLINE_SECONDS', '20'))
+PLAN_RETRY_BUDGET = int(os.getenv('PLAN_RETRY_BUDGET', '6'))
+# How long an in-progress plan stays claimed by the request generating it; a retry with the
+# same idempotency key resumes from its per-day checkpoints once the claim has lapsed
+PLAN_CHECKPOINT_LEASE_SECONDS = float(os.getenv('PLAN_CHECKPOINT_LEASE_SECONDS', str(PLAN_DEADLINE_SECONDS + 30)))
+
+# Fair scheduling of outbound LLM and YouTube calls across tenants: total slots per process,
+# slots one tenant may hold, slots background work (cache warmer, catalog) may hold, and
+# per-tenant weights as JSON, e.g. FAIR_TENANT_WEIGHTS='{"acme": 3}'
+FAIR_LLM_SLOTS = int(os.getenv('FAIR_LLM_SLOTS', '8'))
+FAIR_YOUTUBE_SLOTS = int(os.getenv('FAIR_YOUTUBE_SLOTS', '4'))
+FAIR_TENANT_SLOTS = int(os.getenv('FAIR_TENANT_SLOTS', '3'))
+FAIR_BACKGROUND_SLOTS = int(os.getenv('FAIR_BACKGROUND_SLOTS', '2'))
+FAIR_TENANT_WEIGHTS = os.getenv('FAIR_TENANT_WEIGHTS', '')
+
+# Admission control per route: requests in flight, requests queued behind them, and the longest
+# a request may queue before it is shed with 503; per-route overrides as JSON, e.g.
+# ADMISSION_ROUTE_LIMITS='{"/generate_plan": {"max_in_flight": 4, "max_queue": 8}}'
+ADMISSION_MAX_IN_FLIGHT = int(os.getenv('ADMISSION_MAX_IN_FLIGHT', '16'))
+ADMISSION_MAX_QUEUE = int(os.getenv('ADMISSION_MAX_QUEUE', '32'))
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv('ADMISSION_QUEUE_TIMEOUT', '5'))
+ADMISSION_ROUTE_LIMITS = os.getenv('ADMISSION_ROUTE_LIMITS', '')
+
+# Work distribution: "http" calls services directly, "events" fans out per-day tasks over a broker
+PLAN_DISPATCH_MODE = os.getenv('PLAN_DISPATCH_MODE', 'http').lower()
+BROKER_BACKEND = os.getenv('BROKER_BACKEND', 'kafka').lower()  # "kafka" or "memory"
+BROKER_PARTITIONS = int(os.getenv('BROKER_PARTITIONS', '8'))
+WORKER_THREADS = int(os.getenv('WORKER_THREADS', '2'))
+# Longest an MCP node waits for its results partitions to be assigned before dispatching a plan
+BROKER_ASSIGN_TIMEOUT = float(os.getenv('BROKER_ASSIGN_TIMEOUT', '30'))
+WORKER_ONLY = os.getenv('WORKER_ONLY', 'false').lower() == 'true'
+
+# Video assembly: "fit" picks videos and segments per day to fill daily_hours from one candidate
+# pool (topic search plus at most VIDEO_ASSEMBLY_MAX_SEARCHES - 1 targeted searches); "single"
+# keeps one topic video split across days, or one search per day. The topic search is paged
+# (VIDEO_POOL_SIZE results per page, up to VIDEO_POOL_MAX_PAGES pages) until the pool's watch
+# time covers the plan's total study hours; days still without a video get a search of their own.
+VIDEO_ASSEMBLY = os.getenv('VIDEO_ASSEMBLY', 'fit').lower()
+VIDEO_ASSEMBLY_MAX_SEARCHES = int(os.getenv('VIDEO_ASSEMBLY_MAX_SEARCHES', '4'))
+VIDEO_POOL_SIZE = int(os.getenv('VIDEO_POOL_SIZE', '50'))
+VIDEO_POOL_MAX_PAGES = int(os.getenv('VIDEO_POOL_MAX_PAGES', '4'))
+VIDEO_MIN_RELEVANCE = float(os.getenv('VIDEO_MIN_RELEVANCE', '0.3'))
+VIDEO_MIN_SEGMENT_MINUTES = float(os.getenv('VIDEO_MIN_SEGMENT_MINUTES', '5'))
+
+# Sectioned study material (Material Generator): one section per MATERIAL_SECTION_MINUTES of study,
+# generated MATERIAL_SECTION_WORKERS at a time; at most MATERIAL_SECTIONS_PER_MINUTE start per minute
+# (0: no rate budget), up to MATERIAL_SECTION_BURST back to back. Finished documents are stored in
+# GridFS in MATERIAL_CHUNK_BYTES chunks
+MATERIAL_SECTION_MINUTES = float(os.getenv('MATERIAL_SECTION_MINUTES', '20'))
+MATERIAL_MAX_SECTIONS = int(os.getenv('MATERIAL_MAX_SECTIONS', '12'))
+# Words per MATERIAL_SECTION_MINUTES of study; longer sections (capped section count) ask for more
+MATERIAL_SECTION_WORDS = int(os.getenv('MATERIAL_SECTION_WORDS', '400'))
+MATERIAL_SECTION_WORKERS = int(os.getenv('MATERIAL_SECTION_WORKERS', '6'))
+MATERIAL_SECTIONS_PER_MINUTE = float(os.getenv('MATERIAL_SECTIONS_PER_MINUTE', '60'))
+MATERIAL_SECTION_BURST = int(os.getenv('MATERIAL_SECTION_BURST', '6'))
+MATERIAL_CHUNK_BYTES = int(os.getenv('MATERIAL_CHUNK_BYTES', str(255 * 1024)))
+MATERIAL_JOB_TTL = float(os.getenv('MATERIAL_JOB_TTL', '3600'))
+
+# Local caches (similarity index files etc.)
+CACHE_DIR = os.getenv('CACHE_DIR', 'cache')
+# Write-behind buffer for plan documents: operations held in memory and per bulk write
+WRITE_BEHIND_MAX_QUEUE = int(os.getenv('WRITE_BEHIND_MAX_QUEUE', '1000'))
+WRITE_BEHIND_BATCH_SIZE = int(os.getenv('WRITE_BEHIND_BATCH_SIZE', '100'))
+# Plan storage codec: template references plus compression of text fields of at least
+# STORAGE_COMPRESS_MIN_BYTES, with zstd when the zstandard package is installed, else zlib
+STORAGE_CODEC_ENABLED = os.getenv('STORAGE_CODEC_ENABLED', 'true').lower() == 'true'
+STORAGE_CODEC = os.getenv('STORAGE_CODEC', 'zstd').lower()
+STORAGE_COMPRESS_MIN_BYTES = int(os.getenv('STORAGE_COMPRESS_MIN_BYTES', '256'))
+STORAGE_COMPRESS_LEVEL = int(os.getenv('STORAGE_COMPRESS_LEVEL', '3'))
+# Plan read API: days per page of GET /plans/<id>/days, and JSON response compression
+PLAN_READ_PAGE_DAYS = int(os.getenv('PLAN_READ_PAGE_DAYS', '7'))
+PLAN_READ_MAX_PAGE_DAYS = int(os.getenv('PLAN_READ_MAX_PAGE_DAYS', '31'))
+RESPONSE_COMPRESS_MIN_BYTES = int(os.getenv('RESPONSE_COMPRESS_MIN_BYTES', '1024'))
+RESPONSE_GZIP_LEVEL = int(os.getenv('RESPONSE_GZIP_LEVEL', '6'))
+RESPONSE_BROTLI_QUALITY = int(os.getenv('RESPONSE_BROTLI_QUALITY', '5'))
+# Minimum Jaccard similarity for two subtopic names (of the same topic) to share cached
+# notes/quizzes or be merged as one subtopic
+SIMILARITY_THRESHOLD = float(os.getenv('SIMILARITY_THRESHOLD', '0.85'))
+
+# Quiz question bank: questions generated per LLM top-up call
+QUESTION_BANK_TOP_UP = int(os.getenv('QUESTION_BANK_TOP_UP', '10'))
+
+# Plan curriculum cache and the popularity-driven cache warmer
+PLAN_CACHE_TTL = float(os.getenv('PLAN_CACHE_TTL', '86400'))
+# Plans longer than this are generated as an outline of phases plus one curriculum per phase
+PLAN_CHUNK_THRESHOLD_DAYS = int(os.getenv('PLAN_CHUNK_THRESHOLD_DAYS', '30'))
+PLAN_CHUNK_DAYS = int(os.getenv('PLAN_CHUNK_DAYS', '14'))
+PLAN_CHUNK_WORKERS = int(os.getenv('PLAN_CHUNK_WORKERS', '4'))
+WARMER_ENABLED = os.getenv('WARMER_ENABLED', 'false').lower() == 'true'
+WARMER_TOP_N = int(os.getenv('WARMER_TOP_N', '20'))
+WARMER_MAX_PLANS_PER_RUN = int(os.getenv('WARMER_MAX_PLANS_PER_RUN', '5'))
+WARMER_TOKEN_BUDGET = int(os.getenv('WARMER_TOKEN_BUDGET', '200000'))
+WARMER_OFF_PEAK_HOURS = os.getenv('WARMER_OFF_PEAK_HOURS', '1-6')
+WARMER_INTERVAL = float(os.getenv('WARMER_INTERVAL', '900'))
+WARMER_LOOKBACK_DAYS = int(os.getenv('WARMER_LOOKBACK_DAYS', '30'))
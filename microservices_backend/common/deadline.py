@@ -0,0 +1,163 @@
+"""
+Per-request deadlines and a shared retry budget.
+
+A deadline is opened once at the edge (e.g. /generate_plan) and stored in a
+context variable, so call_ai, the internal service clients and the YouTube
+calls can all size their timeouts from what is left. It crosses service
+boundaries as the remaining milliseconds in the X-Deadline-Ms header. The
+retry budget caps the total number of retries for the whole request, so
+nested retry loops cannot multiply each other.
+"""
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Mapping, Optional
+
+DEADLINE_HEADER = 'X-Deadline-Ms'
+
+
+class DeadlineExceeded(Exception):
+    """Raised when there is no time left in the current request's deadline."""
+
+
+class RetryBudget:
+    def __init__(self, max_retries: int):
+        """
+        Shared pool of retries for one request.
+
+        Args:
+            max_retries: Total retries allowed across every call made for the request
+        """
+        self.max_retries = max_retries
+        self.used = 0
+        self._lock = threading.Lock()
+
+    def try_acquire(self) -> bool:
+        with self._lock:
+            if self.used >= self.max_retries:
+                return False
+            self.used += 1
+            return True
+
+
+class Deadline:
+    def __init__(self, seconds: float, retry_budget: Optional[RetryBudget] = None):
+        self.expires_at = time.monotonic() + seconds
+        self.retry_budget = retry_budget
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def timeout(self, default: float) -> float:
+        """Clamp a timeout to the time left. Raises DeadlineExceeded when nothing is left."""
+        remaining = self.remaining()
+        if remaining <= 0:
+            raise DeadlineExceeded("Request deadline exceeded")
+        return min(default, remaining)
+
+
+_current: ContextVar[Optional[Deadline]] = ContextVar('deadline', default=None)
+
+
+def current_deadline() -> Optional[Deadline]:
+    return _current.get()
+
+
+@contextmanager
+def deadline_scope(seconds: Optional[float], max_retries: Optional[int] = None):
+    """
+    Run a block under a deadline. An outer deadline that expires sooner wins, and an
+    outer retry budget is shared rather than replaced.
+    """
+    outer = _current.get()
+    if seconds is None:
+        yield outer
+        return
+    budget = outer.retry_budget if outer and outer.retry_budget else (
+        RetryBudget(max_retries) if max_retries is not None else None
+    )
+    deadline = Deadline(seconds, budget)
+    if outer is not None and outer.expires_at < deadline.expires_at:
+        deadline.expires_at = outer.expires_at
+    token = _current.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current.reset(token)
+
+
+def request_timeout(default: float) -> float:
+    """Timeout for one outbound call: the default, clamped to the current deadline if any."""
+    deadline = _current.get()
+    return deadline.timeout(default) if deadline else default
+
+
+def consume_retry() -> bool:
+    """Take one retry from the current budget. False if the deadline or budget is exhausted."""
+    deadline = _current.get()
+    if deadline is None:
+        return True
+    if deadline.expired:
+        return False
+    return deadline.retry_budget.try_acquire() if deadline.retry_budget else True
+
+
+def deadline_headers() -> dict:
+    """Headers that carry the current deadline to a downstream service."""
+    deadline = _current.get()
+    if deadline is None:
+        return {}
+    return {DEADLINE_HEADER: str(int(deadline.remaining() * 1000))}
+
+
+def deadline_from_headers(headers: Mapping[str, str]) -> Optional[float]:
+    """Seconds left according to an incoming X-Deadline-Ms header, or None."""
+    value = headers.get(DEADLINE_HEADER)
+    try:
+        return max(0.0, int(value) / 1000.0) if value is not None else None
+    except ValueError:
+        return None
+
+
+# Tenacity hooks so existing @retry decorators respect the deadline and budget
+def stop_on_deadline(retry_state) -> bool:
+    return not consume_retry()
+
+
+def wait_within_deadline(base_wait):
+    def _wait(retry_state):
+        delay = base_wait(retry_state)
+        deadline = _current.get()
+        return min(delay, deadline.remaining()) if deadline else delay
+    return _wait
+
+
+class LatencyTracker:
+    def __init__(self, window: int = 50):
+        """Rolling window of observed latencies for one upstream, used to size its timeout."""
+        self.latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, latency: float):
+        with self._lock:
+            self.latencies.append(latency)
+
+    def p95(self) -> Optional[float]:
+        with self._lock:
+            if not self.latencies:
+                return None
+            ordered = sorted(self.latencies)
+            return ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))]
+
+    def timeout(self, default: float, floor: float = 5.0, multiplier: float = 3.0) -> float:
+        """A few multiples of observed p95, bounded by floor and default."""
+        p95 = self.p95()
+        if p95 is None:
+            return default
+        return min(default, max(floor, p95 * multiplier))
@@ -0,0 +1,215 @@
+"""
+Weighted fair queuing of outbound calls across tenants.
+
+Each process has a fixed number of slots for LLM calls and for YouTube calls.
+A call takes a slot for the duration of the HTTP request. When slots are
+scarce, waiting calls are granted in this order:
+
+1. Interactive requests before background work (cache warming, bulk catalog
+   generation). Background work may also hold at most a few slots, so a
+   warming run never fills the process.
+2. Within a class, by weighted fair queuing: every tenant has a virtual
+   finish time that advances by cost / weight per call. The waiting call
+   with the earliest finish time goes first. A tenant with a 180-day plan
+   queued therefore alternates with a tenant asking for 5 days instead of
+   going ahead of it.
+
+A tenant may hold at most `tenant_slots` slots at once, so one tenant's
+burst cannot occupy the whole pool even when nobody else is waiting yet.
+Waiting honours the request deadline.
+"""
+import json
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+from . import config
+from .deadline import DeadlineExceeded, current_deadline
+from .tenancy import PRIORITIES, current_priority, current_tenant
+
+logger = logging.getLogger(__name__)
+
+
+class _TenantStats:
+    def __init__(self, window: int = 100):
+        self.granted = 0
+        self.timeouts = 0
+        self.in_flight = 0
+        self.queued = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.waits = deque(maxlen=window)
+
+    def record_wait(self, seconds: float):
+        self.granted += 1
+        self.wait_total += seconds
+        self.wait_max = max(self.wait_max, seconds)
+        self.waits.append(seconds)
+
+    def snapshot(self) -> Dict[str, Any]:
+        ordered = sorted(self.waits)
+        return {
+            'granted': self.granted,
+            'timeouts': self.timeouts,
+            'in_flight': self.in_flight,
+            'queued': self.queued,
+            'avg_wait_ms': round(self.wait_total / self.granted * 1000, 1) if self.granted else None,
+            'p95_wait_ms': round(ordered[int(0.95 * (len(ordered) - 1))] * 1000, 1) if ordered else None,
+            'max_wait_ms': round(self.wait_max * 1000, 1),
+        }
+
+
+class FairScheduler:
+    def __init__(self, name: str, slots: int, tenant_slots: int, background_slots: int,
+                 weights: Optional[Dict[str, float]] = None):
+        """
+        Args:
+            name: Resource name used in logs and stats ("llm", "youtube")
+            slots: Calls allowed in flight at once
+            tenant_slots: Calls one tenant may have in flight at once
+            background_slots: Calls background work may have in flight at once
+            weights: Per-tenant weights (default 1); a tenant with weight 2 gets twice
+                the share of a contended pool
+        """
+        self.name = name
+        self.slots = max(1, slots)
+        self.tenant_slots = max(1, min(tenant_slots, self.slots))
+        self.background_slots = max(1, min(background_slots, self.slots))
+        self.weights = weights or {}
+        self._cond = threading.Condition()
+        self._waiting = []
+        self._in_flight = 0
+        self._background_in_flight = 0
+        self._tenant_in_flight: Dict[str, int] = {}
+        self._finish: Dict[str, float] = {}
+        self._vtime = 0.0
+        self._seq = 0
+        self._stats: Dict[str, _TenantStats] = {}
+
+    def _tenant_stats(self, tenant: str) -> _TenantStats:
+        stats = self._stats.get(tenant)
+        if stats is None:
+            stats = self._stats[tenant] = _TenantStats()
+        return stats
+
+    def _eligible(self, waiter: Dict[str, Any]) -> bool:
+        if self._tenant_in_flight.get(waiter['tenant'], 0) >= self.tenant_slots:
+            return False
+        return waiter['priority'] != 'background' or self._background_in_flight < self.background_slots
+
+    def _grant(self):
+        """Hand free slots to the best eligible waiters. Caller holds the lock."""
+        granted = False
+        while self._in_flight < self.slots:
+            eligible = [w for w in self._waiting if self._eligible(w)]
+            if not eligible:
+                break
+            waiter = min(eligible, key=lambda w: (PRIORITIES.index(w['priority']), w['finish'], w['seq']))
+            self._waiting.remove(waiter)
+            waiter['granted'] = True
+            self._vtime = max(self._vtime, waiter['start'])
+            self._in_flight += 1
+            self._tenant_in_flight[waiter['tenant']] = self._tenant_in_flight.get(waiter['tenant'], 0) + 1
+            if waiter['priority'] == 'background':
+                self._background_in_flight += 1
+            granted = True
+        if granted:
+            self._cond.notify_all()
+
+    def acquire(self, tenant: Optional[str] = None, priority: Optional[str] = None,
+                cost: float = 1.0) -> Dict[str, Any]:
+        """
+        Block until a slot is granted. Use `slot()` rather than pairing acquire/release.
+
+        Raises:
+            DeadlineExceeded: If the request deadline passes while waiting.
+        """
+        tenant = tenant or current_tenant()
+        priority = priority if priority in PRIORITIES else current_priority()
+        deadline = current_deadline()
+        enqueued = time.monotonic()
+        with self._cond:
+            start = max(self._vtime, self._finish.get(tenant, 0.0))
+            finish = start + max(cost, 0.01) / self.weights.get(tenant, 1.0)
+            self._finish[tenant] = finish
+            self._seq += 1
+            waiter = {'tenant': tenant, 'priority': priority, 'start': start, 'finish': finish,
+                      'seq': self._seq, 'granted': False}
+            stats = self._tenant_stats(tenant)
+            self._waiting.append(waiter)
+            stats.queued += 1
+            try:
+                self._grant()
+                while not waiter['granted']:
+                    timeout = deadline.remaining() if deadline is not None else None
+                    if timeout is not None and timeout <= 0:
+                        self._waiting.remove(waiter)
+                        stats.timeouts += 1
+                        raise DeadlineExceeded(f"Request deadline passed waiting for a {self.name} slot")
+                    self._cond.wait(timeout)
+            finally:
+                stats.queued -= 1
+            stats.in_flight += 1
+            stats.record_wait(time.monotonic() - enqueued)
+        return waiter
+
+    def release(self, waiter: Dict[str, Any]):
+        with self._cond:
+            tenant = waiter['tenant']
+            self._in_flight -= 1
+            self._tenant_in_flight[tenant] -= 1
+            if not self._tenant_in_flight[tenant]:
+                del self._tenant_in_flight[tenant]
+            if waiter['priority'] == 'background':
+                self._background_in_flight -= 1
+            self._tenant_stats(tenant).in_flight -= 1
+            # Idle tenants start over at the current virtual time
+            if tenant not in self._tenant_in_flight and self._finish.get(tenant, 0.0) <= self._vtime \
+                    and not any(w['tenant'] == tenant for w in self._waiting):
+                self._finish.pop(tenant, None)
+            self._grant()
+
+    @contextmanager
+    def slot(self, tenant: Optional[str] = None, priority: Optional[str] = None, cost: float = 1.0):
+        """
+        Hold one slot for the block, on behalf of `tenant` (default: the current tenant)
+        in `priority` (default: the current priority class). `cost` is the call's relative
+        size; larger calls advance the tenant's virtual time further.
+        """
+        waiter = self.acquire(tenant, priority, cost)
+        try:
+            yield
+        finally:
+            self.release(waiter)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                'slots': self.slots,
+                'tenant_slots': self.tenant_slots,
+                'background_slots': self.background_slots,
+                'in_flight': self._in_flight,
+                'queued': len(self._waiting),
+                'tenants': {tenant: stats.snapshot() for tenant, stats in self._stats.items()},
+            }
+
+
+def _parse_weights(value: str) -> Dict[str, float]:
+    if not value:
+        return {}
+    try:
+        return {str(tenant).lower(): float(weight) for tenant, weight in json.loads(value).items()}
+    except (ValueError, TypeError, AttributeError):
+        logger.warning("Ignoring malformed FAIR_TENANT_WEIGHTS")
+        return {}
+
+
+_weights = _parse_weights(config.FAIR_TENANT_WEIGHTS)
+
+llm_slots = FairScheduler('llm', config.FAIR_LLM_SLOTS, config.FAIR_TENANT_SLOTS,
+                          config.FAIR_BACKGROUND_SLOTS, weights=_weights)
+youtube_slots = FairScheduler('youtube', config.FAIR_YOUTUBE_SLOTS, config.FAIR_TENANT_SLOTS,
+                              config.FAIR_BACKGROUND_SLOTS, weights=_weights)
@@ -1,18 +1,26 @@
 import requests
 import time
 import os
-from tenacity import retry, stop_after_attempt, wait_exponential
+from tenacity import retry, retry_if_not_exception_type, stop_after_attempt, wait_exponential
+from .deadline import DeadlineExceeded, current_deadline, request_timeout, stop_on_deadline, wait_within_deadline
+from .ai_utils import model_for, reported_usage, token_ledger
 
-# Retry logic with exponential backoff
-@retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
-def call_gemini(prompt, model="gemini-1.5-pro-latest", api_key=None):
+# Retry logic with exponential backoff, bounded by the request deadline and its shared retry budget
+@retry(
+    stop=stop_after_attempt(3) | stop_on_deadline,
+    wait=wait_within_deadline(wait_exponential(multiplier=1, min=4, max=10)),
+    retry=retry_if_not_exception_type(DeadlineExceeded)
+)
+def call_gemini(prompt, model=None, api_key=None, task=None):
     """
     Calls the Gemini API to generate content based on the provided prompt.
 
     Args:
         prompt (str): The input prompt for the Gemini API.
-        model (str): The Gemini model to use (default: "gemini-1.5-pro-latest").
+        model (str, optional): The Gemini model to use. Defaults to the Gemini model on the
+            task's tier in ai_utils.TASK_ROUTES.
         api_key (str, optional): The API key to use. If not provided, falls back to GEMINI_API_KEY environment variable.
+        task (str, optional): Task type the call's tokens and latency are accounted under.
 
     Returns:
         str: The generated content from the Gemini API.
@@ -20,6 +28,7 @@ def call_gemini(prompt, model="gemini-1.5-pro-latest", api_key=None):
     Raises:
         Exception: If the API call fails or returns an error.
     """
+    model = model or model_for(task, 'gemini')
     url = f"https://generativelanguage.googleapis.com/v1beta/models/{model}:generateContent"
     
     # Use provided API key or fall back to environment variable
@@ -43,17 +52,25 @@ def call_gemini(prompt, model="gemini-1.5-pro-latest", api_key=None):
     print("Payload:", payload)
     print("Params:", params)
 
+    start = time.monotonic()
     try:
-        response = requests.post(url, params=params, headers=headers, json=payload, timeout=60)
+        response = requests.post(url, params=params, headers=headers, json=payload, timeout=request_timeout(60))
         response.raise_for_status()  # Raise an HTTPError for bad responses (4xx and 5xx)
         print("[DEBUG] Gemini API response:", response.json())
-        return response.json()['candidates'][0]['content']['parts'][0]['text']
+        text = response.json()['candidates'][0]['content']['parts'][0]['text']
+        token_ledger.record(task, prompt, text, latency=time.monotonic() - start,
+                            usage=reported_usage('gemini', response.json()), model=model)
+        return text
     except requests.exceptions.HTTPError as e:
+        token_ledger.record(task, prompt, ok=False, model=model)
         print("[ERROR] HTTPError in call_gemini:", e)
         if e.response is not None:
             print("[ERROR] Response content:", e.response.text)
             if e.response.status_code == 429:  # Too Many Requests
                 retry_after = int(e.response.headers.get('Retry-After', 5))
+                deadline = current_deadline()
+                if deadline is not None:
+                    retry_after = min(retry_after, deadline.remaining())
                 print(f"[ERROR] Rate limited. Retrying after {retry_after} seconds...")
                 time.sleep(retry_after)
         raise
@@ -0,0 +1,148 @@
+"""
+Cacheable, compressed JSON responses for Flask routes.
+
+`json_response` serializes a payload once, tags it with a strong ETag,
+answers a matching If-None-Match with 304 Not Modified, and compresses the
+body with brotli (when the `brotli` package is installed) or gzip according
+to the request's Accept-Encoding. Each content coding gets its own strong
+ETag (`"<tag>-br"`, `"<tag>-gzip"`), since the bytes differ.
+
+Routes that can name a version of their data without building the payload
+(e.g. from a document's updated_at) pass that as `etag` and call
+`not_modified` first, so an unchanged resource costs no serialization at all.
+"""
+import gzip
+import hashlib
+import json
+import threading
+from typing import Any, Dict, Optional
+
+from flask import Response, request
+
+from . import config
+
+try:
+    import brotli
+except ImportError:  # optional; gzip is always available
+    brotli = None
+
+ENCODINGS = ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+class ResponseStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.responses = 0
+        self.not_modified = 0
+        self.compressed = 0
+        self.bytes_raw = 0
+        self.bytes_sent = 0
+
+    def record(self, raw: int = 0, sent: int = 0, compressed: bool = False, not_modified: bool = False):
+        with self._lock:
+            self.responses += 1
+            self.not_modified += not_modified
+            self.compressed += compressed
+            self.bytes_raw += raw
+            self.bytes_sent += sent
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'responses': self.responses,
+                'not_modified': self.not_modified,
+                'compressed': self.compressed,
+                'bytes_raw': self.bytes_raw,
+                'bytes_sent': self.bytes_sent,
+                'compression_ratio': round(self.bytes_raw / self.bytes_sent, 2) if self.bytes_sent else None,
+                'encodings': list(ENCODINGS),
+            }
+
+
+stats = ResponseStats()
+
+
+def make_etag(*parts: Any) -> str:
+    """Opaque tag for a resource version identified by `parts`."""
+    return hashlib.sha1('|'.join(str(part) for part in parts).encode('utf-8')).hexdigest()[:32]
+
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """The preferred supported content coding allowed by an Accept-Encoding header, if any."""
+    accepted = {}
+    for item in (accept_encoding or '').split(','):
+        name, _, params = item.strip().partition(';')
+        quality = 1.0
+        for param in params.split(';'):
+            key, _, value = param.strip().partition('=')
+            if key == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if name:
+            accepted[name.strip().lower()] = quality
+    wildcard = accepted.get('*', 0.0)
+    candidates = [(accepted.get(name, wildcard), -rank, name) for rank, name in enumerate(ENCODINGS)]
+    quality, _, name = max(candidates)
+    return name if quality > 0 else None
+
+
+def _encoded_etag(etag: str, encoding: Optional[str]) -> str:
+    return f"{etag}-{encoding}" if encoding else etag
+
+
+def _compress(body: bytes, encoding: str) -> bytes:
+    if encoding == 'br':
+        return brotli.compress(body, quality=config.RESPONSE_BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=config.RESPONSE_GZIP_LEVEL)
+
+
+def _finish(response: Response, etag: str) -> Response:
+    response.set_etag(etag)
+    response.headers['Vary'] = 'Accept-Encoding'
+    # Clients may keep the body but must revalidate it before reuse
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def not_modified(etag: str) -> Optional[Response]:
+    """
+    A 304 response if the request's If-None-Match already holds `etag` in the coding
+    this request would get, otherwise None.
+    """
+    encoding = negotiate_encoding(request.headers.get('Accept-Encoding'))
+    # Bodies below the compression threshold go out uncompressed under the bare tag
+    for tag in (_encoded_etag(etag, encoding), etag):
+        if request.if_none_match.contains_weak(tag):
+            stats.record(not_modified=True)
+            return _finish(Response(status=304), tag)
+    return None
+
+
+def json_response(payload: Any, status: int = 200, etag: Optional[str] = None) -> Response:
+    """
+    Serialize `payload` as a conditional, content-negotiated JSON response.
+
+    Args:
+        payload: JSON-serializable data; other values (ObjectId, datetime) are stringified
+        status: HTTP status for a full response
+        etag: Version tag of the payload; defaults to a hash of the serialized body
+    """
+    body = json.dumps(payload, separators=(',', ':'), ensure_ascii=False, default=str).encode('utf-8')
+    etag = etag or hashlib.sha1(body).hexdigest()[:32]
+    cached = not_modified(etag) if status == 200 else None
+    if cached is not None:
+        return cached
+
+    encoding = negotiate_encoding(request.headers.get('Accept-Encoding'))
+    if encoding is None or len(body) < config.RESPONSE_COMPRESS_MIN_BYTES:
+        encoding = None
+        sent = body
+    else:
+        sent = _compress(body, encoding)
+    response = Response(sent, status=status, mimetype='application/json')
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    stats.record(raw=len(body), sent=len(sent), compressed=bool(encoding))
+    return _finish(response, _encoded_etag(etag, encoding))
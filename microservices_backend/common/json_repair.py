@@ -0,0 +1,438 @@
+"""
+Tolerant extraction and repair of JSON from LLM responses.
+
+Models wrap JSON in prose or code fences, leave trailing commas, use single
+quotes or Python literals, and get cut off mid-object at their output limit.
+Each of those used to cost a full regeneration. `parse_llm_json` finds the
+outermost JSON value in the response, repairs what it can locally, validates
+the result against a small per-use schema, and only then falls back to a
+targeted follow-up prompt that asks the model to fix just the broken part.
+
+Schemas are plain dicts supporting a small subset of JSON Schema:
+'type' (name or list of names), 'required', 'properties', 'items',
+'minItems', 'minLength', plus 'check', a callable returning an error
+message (or None) for cross-field rules.
+"""
+import json
+import logging
+import re
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Follow-up prompts spent per document before giving up on the remaining invalid items
+MAX_FOLLOWUPS = 3
+
+_FENCE = re.compile(r'```(?:json)?\s*(.*?)(?:```|$)', re.IGNORECASE | re.DOTALL)
+_LITERALS = {'True': 'true', 'False': 'false', 'None': 'null', 'NaN': 'null', 'undefined': 'null',
+             'true': 'true', 'false': 'false', 'null': 'null'}
+_CLOSERS = {'{': '}', '[': ']'}
+
+
+class JSONRepairError(ValueError):
+    """Raised when a response cannot be turned into JSON that satisfies its schema."""
+
+    def __init__(self, message: str, text: str = '', errors: Optional[List[str]] = None):
+        super().__init__(message)
+        self.text = text
+        self.errors = errors or []
+
+
+class RepairStats:
+    def __init__(self):
+        """Process-wide counters of how LLM JSON responses were recovered."""
+        self._lock = threading.Lock()
+        self.clean = 0
+        self.repaired = 0
+        self.followups = 0
+        self.fixed_by_followup = 0
+        self.failed = 0
+
+    def record(self, outcome: str, followups: int = 0):
+        with self._lock:
+            setattr(self, outcome, getattr(self, outcome) + 1)
+            self.followups += followups
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            malformed = self.repaired + self.fixed_by_followup + self.failed
+            total = self.clean + malformed
+            return {
+                'parsed': total,
+                'clean': self.clean,
+                'repaired_locally': self.repaired,
+                'fixed_by_followup': self.fixed_by_followup,
+                'failed': self.failed,
+                'followup_prompts': self.followups,
+                # Share of malformed responses recovered without another LLM round trip
+                'repair_rate': round(self.repaired / malformed, 3) if malformed else None,
+                'malformed_rate': round(malformed / total, 3) if total else None,
+            }
+
+
+stats = RepairStats()
+
+
+def _balanced_span(text: str, start: int) -> Tuple[str, bool]:
+    """The JSON value starting at text[start], and whether its brackets closed."""
+    stack, quote, escaped = [], None, False
+    for i in range(start, len(text)):
+        ch = text[i]
+        if quote:
+            if escaped:
+                escaped = False
+            elif ch == '\\':
+                escaped = True
+            elif ch == quote:
+                quote = None
+        elif ch in '"\'':
+            quote = ch
+        elif ch in '{[':
+            stack.append(ch)
+        elif ch in '}]':
+            if stack:
+                stack.pop()
+            if not stack:
+                return text[start:i + 1], True
+    return text[start:], False
+
+
+def extract_candidates(text: str, limit: int = 5) -> List[Tuple[str, bool]]:
+    """
+    Outermost JSON-looking spans in a response, best first: fenced blocks, then each
+    '{' or '[' that opens a balanced (or truncated) value, in order of appearance.
+    """
+    text = text or ''
+    sources = [m.group(1) for m in _FENCE.finditer(text) if m.group(1).strip()] + [text]
+    candidates, seen = [], set()
+    for source in sources:
+        pos = 0
+        while len(candidates) < limit:
+            match = re.search(r'[{\[]', source[pos:])
+            if not match:
+                break
+            start = pos + match.start()
+            span, closed = _balanced_span(source, start)
+            if span not in seen:
+                seen.add(span)
+                candidates.append((span, closed))
+            # A closed span is a whole value; look for another after it, else step past this bracket
+            pos = start + (len(span) if closed else 1)
+    return candidates
+
+
+def repair(fragment: str) -> str:
+    """
+    Rewrite near-JSON into JSON: strips comments, converts single-quoted strings,
+    quotes bare keys, maps Python/JS literals, drops trailing commas, escapes raw
+    newlines in strings and closes whatever a truncated response left open. An item
+    cut off mid-string is dropped rather than kept with half a value.
+    """
+    out: List[str] = []
+    stack: List[str] = []
+    # Index in `out` where the current element of each open bracket starts
+    starts: List[int] = []
+    quote = None
+    i, n = 0, len(fragment)
+    while i < n:
+        ch = fragment[i]
+        if quote:
+            if ch == '\\' and i + 1 < n:
+                # \' is only an escape in single-quoted strings; JSON wants a bare quote
+                out.append("'" if fragment[i + 1] == "'" else fragment[i:i + 2])
+                i += 2
+                continue
+            if ch == quote:
+                out.append('"')
+                quote = None
+            elif ch == '"':
+                out.append('\\"')
+            elif ch == '\n':
+                out.append('\\n')
+            elif ch == '\t':
+                out.append('\\t')
+            else:
+                out.append(ch)
+            i += 1
+            continue
+
+        if ch == '/' and fragment[i + 1:i + 2] == '/':
+            end = fragment.find('\n', i)
+            i = n if end < 0 else end
+            continue
+        if ch == '/' and fragment[i + 1:i + 2] == '*':
+            end = fragment.find('*/', i + 2)
+            i = n if end < 0 else end + 2
+            continue
+        if ch in '"\'':
+            quote = ch
+            out.append('"')
+        elif ch in '{[':
+            stack.append(ch)
+            out.append(ch)
+            starts.append(len(out))
+        elif ch in '}]':
+            _drop_trailing_comma(out)
+            if ch in (_CLOSERS[b] for b in stack):
+                # Close anything the model forgot to close inside this bracket
+                while _CLOSERS[stack[-1]] != ch:
+                    _drop_trailing_comma(out)
+                    out.append(_CLOSERS[stack.pop()])
+                    starts.pop()
+                out.append(_CLOSERS[stack.pop()])
+                starts.pop()
+            # Otherwise a stray closer; skip it
+        elif ch.isalpha() or ch in '_$':
+            match = re.match(r'[A-Za-z_$][\w$-]*', fragment[i:])
+            word = match.group(0)
+            i += len(word)
+            rest = fragment[i:].lstrip()
+            if rest.startswith(':') and stack and stack[-1] == '{':
+                out.append(json.dumps(word))
+            else:
+                out.append(_LITERALS.get(word, json.dumps(word)))
+            continue
+        else:
+            out.append(ch)
+            if ch == ',' and stack:
+                starts[-1] = len(out)
+        i += 1
+
+    # Truncated response: drop the element a cut-off string belongs to (the innermost array
+    # item, else the object member), then a dangling key or comma, and close brackets
+    if quote:
+        level = max((k for k, bracket in enumerate(stack) if bracket == '['), default=len(stack) - 1)
+        if level >= 0:
+            del out[starts[level]:]
+            del stack[level + 1:]
+        else:
+            out.append('"')
+    text = ''.join(out).rstrip()
+    while stack:
+        text = re.sub(r',\s*$', '', text)
+        if stack[-1] == '{':
+            text = re.sub(r'([{,])\s*"(?:[^"\\]|\\.)*"\s*$', r'\1', text)
+            text = re.sub(r',\s*$', '', text)
+        text = re.sub(r':\s*$', ': null', text)
+        text += _CLOSERS[stack.pop()]
+    return text
+
+
+def _drop_trailing_comma(out: List[str]):
+    j = len(out) - 1
+    while j >= 0 and out[j].isspace():
+        j -= 1
+    if j >= 0 and out[j] == ',':
+        del out[j]
+
+
+def validate(value: Any, schema: Optional[Dict[str, Any]], path: Tuple = ()) -> List[Tuple[Tuple, str]]:
+    """
+    Check a value against a schema.
+
+    Returns:
+        list: (path, message) for every violation; empty when the value is valid
+    """
+    if not schema:
+        return []
+    where = '$' + ''.join(f'[{p}]' if isinstance(p, int) else f'.{p}' for p in path)
+    types = schema.get('type')
+    if types:
+        types = [types] if isinstance(types, str) else types
+        if not any(_is_type(value, t) for t in types):
+            return [(path, f"{where} must be {' or '.join(types)}")]
+    errors = []
+    if isinstance(value, dict):
+        for key in schema.get('required', ()):
+            if key not in value:
+                errors.append((path, f"{where} is missing '{key}'"))
+        for key, sub in schema.get('properties', {}).items():
+            if key in value:
+                errors.extend(validate(value[key], sub, path + (key,)))
+    if isinstance(value, list):
+        if len(value) < schema.get('minItems', 0):
+            errors.append((path, f"{where} needs at least {schema['minItems']} items"))
+        if 'items' in schema:
+            for index, item in enumerate(value):
+                errors.extend(validate(item, schema['items'], path + (index,)))
+    if isinstance(value, str) and len(value.strip()) < schema.get('minLength', 0):
+        errors.append((path, f"{where} is too short"))
+    check = schema.get('check')
+    if check and not errors:
+        message = check(value)
+        if message:
+            errors.append((path, f"{where} {message}"))
+    return errors
+
+
+def _is_type(value: Any, name: str) -> bool:
+    if name == 'integer':
+        return isinstance(value, int) and not isinstance(value, bool)
+    if name == 'number':
+        return isinstance(value, (int, float)) and not isinstance(value, bool)
+    return isinstance(value, {'object': dict, 'array': list, 'string': str,
+                              'boolean': bool, 'null': type(None)}[name])
+
+
+def _decode(text: str, schema: Optional[Dict[str, Any]] = None) -> Tuple[Any, bool]:
+    """
+    Parse the best JSON value in a response. Values that satisfy the schema win, then
+    outermost spans over the values nested inside them (a truncated document repairs
+    to its outer object, not to its last complete inner one), then candidates that
+    parse as-is over repaired ones, then the longest span, so a bracketed aside in the
+    prose does not shadow the real payload.
+
+    Returns:
+        tuple: (value, repaired) where repaired says whether local repair was needed
+
+    Raises:
+        JSONRepairError: If no candidate parses even after repair.
+    """
+    stripped = (text or '').strip()
+    try:
+        return json.loads(stripped), False
+    except ValueError:
+        pass
+    parsed, errors = [], []
+    for span, _ in extract_candidates(stripped):
+        try:
+            parsed.append((json.loads(span), False, span))
+            continue
+        except ValueError:
+            pass
+        try:
+            parsed.append((json.loads(repair(span)), True, span))
+        except ValueError as e:
+            errors.append(str(e))
+    if not parsed:
+        raise JSONRepairError("No parseable JSON in response", text=stripped, errors=errors)
+    spans = [span for _, _, span in parsed]
+
+    def rank(candidate):
+        value, repaired, span = candidate
+        nested = any(span != other and span in other for other in spans)
+        return bool(validate(value, schema)), nested, repaired, -len(span)
+
+    value, repaired, _ = min(parsed, key=rank)
+    return value, repaired
+
+
+def _schema_at(schema: Dict[str, Any], path: Tuple) -> Optional[Dict[str, Any]]:
+    for part in path:
+        if schema is None:
+            return None
+        schema = schema.get('items') if isinstance(part, int) else schema.get('properties', {}).get(part)
+    return schema
+
+
+def _get(value: Any, path: Tuple) -> Any:
+    for part in path:
+        value = value[part]
+    return value
+
+
+def _item_path(path: Tuple) -> Optional[Tuple]:
+    """The path of the array element an error belongs to, if any."""
+    for i in range(len(path) - 1, -1, -1):
+        if isinstance(path[i], int):
+            return path[:i + 1]
+    return None
+
+
+def is_usable_json(text: str, schema: Optional[Dict[str, Any]] = None) -> bool:
+    """True if the response yields schema-valid JSON with local repair alone (no follow-ups, no stats)."""
+    try:
+        value, _ = _decode(text, schema)
+    except JSONRepairError:
+        return False
+    return not validate(value, schema)
+
+
+def parse_llm_json(text: str, schema: Optional[Dict[str, Any]] = None,
+                   fix: Optional[Callable[[str], str]] = None, name: str = 'response') -> Any:
+    """
+    Extract, repair and validate the JSON in an LLM response.
+
+    Array elements that fail validation are sent back through `fix` one by one
+    ("fix only this value"); elements that still fail are dropped if the rest of
+    the document is then valid. A response that cannot be parsed at all costs one
+    syntax-only follow-up.
+
+    Args:
+        text: Raw model output
+        schema: Expected shape (see module docstring); None accepts any JSON
+        fix: Sends a follow-up prompt to the model and returns its raw answer;
+            None disables follow-ups
+        name: What the JSON is, for logs and prompts
+
+    Raises:
+        JSONRepairError: If the response cannot be turned into valid JSON.
+    """
+    followups = 0
+    try:
+        value, repaired = _decode(text, schema)
+    except JSONRepairError as e:
+        if fix is None:
+            stats.record('failed')
+            raise
+        logger.info(f"Asking for a syntax-only fix of the {name} JSON")
+        followups += 1
+        try:
+            value, _ = _decode(fix(
+                f"The following {name} should be a single JSON value but it does not parse "
+                f"({e.errors[-1] if e.errors else 'no JSON found'}). Fix only the JSON syntax without "
+                f"changing the content, and respond ONLY with the corrected JSON.\n\n{e.text}"
+            ), schema)
+        except Exception as fix_error:
+            stats.record('failed', followups)
+            raise JSONRepairError(f"Could not repair {name} JSON: {str(fix_error)}", text=e.text,
+                                  errors=e.errors) from fix_error
+        repaired = None
+
+    errors = validate(value, schema)
+    if errors:
+        value, errors, used = _fix_items(value, schema, errors, fix, name)
+        followups += used
+        if errors:
+            stats.record('failed', followups)
+            raise JSONRepairError(f"Invalid {name}: {errors[0][1]}", text=text,
+                                  errors=[message for _, message in errors])
+        if used:
+            repaired = None
+
+    stats.record('clean' if repaired is False else 'repaired' if repaired else 'fixed_by_followup', followups)
+    return value
+
+
+def _fix_items(value, schema, errors, fix, name):
+    """Re-ask for invalid array elements one at a time, then drop any that are still invalid."""
+    followups = 0
+    bad_items = []
+    for path, _ in errors:
+        item = _item_path(path)
+        if item is not None and item not in bad_items:
+            bad_items.append(item)
+
+    invalid = []
+    for item in bad_items:
+        item_schema = _schema_at(schema, item)
+        if fix is not None and followups < MAX_FOLLOWUPS:
+            followups += 1
+            problems = '; '.join(message for path, message in errors if path[:len(item)] == item)
+            try:
+                fixed, _ = _decode(fix(
+                    f"This element of a {name} is invalid: {problems}. Fix only this element and respond "
+                    f"ONLY with the corrected JSON value.\n\n{json.dumps(_get(value, item))}"
+                ), item_schema)
+                if not validate(fixed, item_schema):
+                    _get(value, item[:-1])[item[-1]] = fixed
+                    continue
+            except Exception as e:
+                logger.info(f"Follow-up fix for {name} element failed: {str(e)}")
+        invalid.append(item)
+
+    # Delete from the end so earlier indexes stay valid
+    for item in sorted(invalid, reverse=True):
+        del _get(value, item[:-1])[item[-1]]
+    return value, validate(value, schema), followups
@@ -4,11 +4,14 @@ from .config import KAFKA_BOOTSTRAP_SERVERS
 def get_kafka_producer():
     return Producer({'bootstrap.servers': KAFKA_BOOTSTRAP_SERVERS})
 
-def get_kafka_consumer(group_id, topics):
+def get_kafka_consumer(group_id, topics, offset_reset='earliest', on_assign=None):
     consumer = Consumer({
         'bootstrap.servers': KAFKA_BOOTSTRAP_SERVERS,
         'group.id': group_id,
-        'auto.offset.reset': 'earliest',
+        'auto.offset.reset': offset_reset,
     })
-    consumer.subscribe(topics)
+    if on_assign is not None:
+        consumer.subscribe(topics, on_assign=on_assign)
+    else:
+        consumer.subscribe(topics)
     return consumer
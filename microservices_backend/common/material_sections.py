@@ -0,0 +1,163 @@
+"""
+Sectioned long-form study material for one plan day.
+
+A day's study time is split into sections of about MATERIAL_SECTION_MINUTES
+each: an overview of the day, then for every subtopic of the day label its
+key concepts, a worked example, practice and (for long days) a deeper dive,
+and a closing summary. When the section count is capped, sections stand for
+more study time and ask for proportionally more words. Each section is an independent LLM prompt that knows
+the titles of its siblings, so sections can be generated in parallel without
+repeating each other.
+
+Finished sections are rendered into one Markdown document in outline order.
+The byte offset and length of every section are recorded next to it, so a
+single section can be read back as a byte range of the stored document.
+"""
+import hashlib
+from typing import Any, Dict, List, Optional
+
+from common.scheduler import label_subtopics
+
+# Section kinds per subtopic, in the order they are added as the day gets longer
+SUBTOPIC_KINDS = [
+    ('concepts', 'Key concepts'),
+    ('example', 'Worked example'),
+    ('practice', 'Practice'),
+    ('deep_dive', 'Going further'),
+]
+
+KIND_INSTRUCTIONS = {
+    'overview': "Introduce what the day covers, why it matters and how its parts connect.",
+    'concepts': "Explain the core ideas, definitions and how they relate, with short illustrations.",
+    'example': "Work through one realistic example step by step, explaining each step.",
+    'practice': "Give 3-5 practice exercises of increasing difficulty, each with a brief hint.",
+    'deep_dive': "Cover edge cases, common mistakes and more advanced uses.",
+    'summary': "Summarize the day's key takeaways as a short checklist and suggest what to review.",
+}
+
+SECTION_SCHEMA = {
+    'type': 'object',
+    'required': ['content'],
+    'properties': {'title': {'type': 'string'}, 'content': {'type': 'string', 'minLength': 1}},
+}
+
+SECTION_PROMPT = (
+    "You are writing one section of the study material for a day of a \"{topic}\" course on: {label}.\n"
+    "The day's sections are:\n{outline}\n"
+    "Write only section {number}: \"{title}\". {instruction} "
+    "Do not repeat material that belongs to the other sections. About {words} words of Markdown, "
+    "without a top-level heading. "
+    "Respond ONLY as a JSON object of the form {{\"title\": \"...\", \"content\": \"...\"}}."
+)
+
+
+def day_segments(label: str, daily_hours: float, hours: Optional[List[Dict[str, Any]]] = None) -> List[Dict[str, Any]]:
+    """
+    [{'subtopic', 'hours'}] for a day: the schedule's split when given (see
+    scheduler.schedule_curriculum), else daily_hours shared evenly by the label's subtopics.
+    """
+    if hours:
+        return [{'subtopic': h['subtopic'], 'hours': float(h.get('hours') or 0)} for h in hours if h.get('subtopic')]
+    names = label_subtopics(label) or [label]
+    return [{'subtopic': name, 'hours': float(daily_hours) / len(names)} for name in names]
+
+
+def plan_sections(label: str, daily_hours: float, hours: Optional[List[Dict[str, Any]]] = None,
+                  section_minutes: float = 20, max_sections: int = 12,
+                  section_words: int = 400) -> List[Dict[str, Any]]:
+    """
+    Outline of a day's material.
+
+    Args:
+        label: Day label, e.g. "Lists (Part 2/3) & Tuples"
+        daily_hours: Study time of the day
+        hours: Optional per-subtopic split of daily_hours
+        section_minutes: Study time one section stands for
+        max_sections: Upper bound on sections per day, overview and summary included
+        section_words: Words of a section standing for `section_minutes`; each section's
+            'words' scale with its actual minutes
+
+    Returns:
+        list: [{'index', 'kind', 'subtopic', 'title', 'minutes', 'words'}] in reading order
+    """
+    segments = day_segments(label, daily_hours, hours)
+    total_minutes = max(float(daily_hours) * 60, section_minutes)
+    budget = max(len(segments), min(max_sections, round(total_minutes / section_minutes)))
+    framed = budget >= len(segments) + 2
+    body_budget = budget - 2 if framed else budget
+
+    # Each subtopic gets sections in proportion to its hours, at least one
+    weights = [max(s['hours'], 0.01) for s in segments]
+    counts = [1] * len(segments)
+    while sum(counts) < body_budget:
+        i = max(range(len(segments)), key=lambda j: weights[j] / counts[j])
+        if counts[i] >= len(SUBTOPIC_KINDS):
+            weights[i] = 0
+            if not any(weights):
+                break
+            continue
+        counts[i] += 1
+
+    outline = []
+    if framed:
+        outline.append({'kind': 'overview', 'subtopic': None, 'title': 'Overview'})
+    for segment, count in zip(segments, counts):
+        for kind, heading in SUBTOPIC_KINDS[:count]:
+            outline.append({'kind': kind, 'subtopic': segment['subtopic'],
+                            'title': f"{segment['subtopic']}: {heading}"})
+    if framed:
+        outline.append({'kind': 'summary', 'subtopic': None, 'title': 'Summary'})
+    minutes = round(total_minutes / len(outline), 1)
+    words = max(1, round(section_words * minutes / section_minutes))
+    for index, section in enumerate(outline):
+        section.update(index=index, minutes=minutes, words=words)
+    return outline
+
+
+def section_prompt(topic: str, label: str, outline: List[Dict[str, Any]], section: Dict[str, Any],
+                   words: Optional[int] = None) -> str:
+    """Prompt for one section; `words` defaults to the section's own 'words'."""
+    return SECTION_PROMPT.format(
+        topic=topic,
+        label=label,
+        outline='\n'.join(f"{s['index'] + 1}. {s['title']}" for s in outline),
+        number=section['index'] + 1,
+        title=section['title'],
+        instruction=KIND_INSTRUCTIONS[section['kind']],
+        words=words or section.get('words') or 400,
+    )
+
+
+def material_key(topic: str, label: str, daily_hours: float, outline: List[Dict[str, Any]]) -> str:
+    """Identity of a day's material: same topic, label, hours and outline give the same key."""
+    parts = [' '.join(str(topic).lower().split()), str(label).strip().lower(), f"{float(daily_hours):g}"]
+    parts += [s['title'] for s in outline]
+    return hashlib.sha1('|'.join(parts).encode('utf-8')).hexdigest()
+
+
+def render_section(section: Dict[str, Any]) -> str:
+    return f"## {section['title']}\n\n{section['content'].strip()}\n\n"
+
+
+def render_document(sections: List[Dict[str, Any]]):
+    """
+    Markdown document of the finished sections in outline order.
+
+    Returns:
+        tuple: (body bytes, index) where index is [{'index', 'kind', 'subtopic', 'title',
+            'offset', 'length'}] locating each section in the body
+    """
+    body, index, offset = [], [], 0
+    for section in sorted(sections, key=lambda s: s['index']):
+        data = render_section(section).encode('utf-8')
+        index.append({
+            'index': section['index'],
+            'kind': section['kind'],
+            'subtopic': section['subtopic'],
+            'title': section['title'],
+            'offset': offset,
+            'length': len(data),
+        })
+        body.append(data)
+        offset += len(data)
+    return b''.join(body), index
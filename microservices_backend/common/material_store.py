@@ -0,0 +1,154 @@
+"""
+Chunked storage of generated study material in MongoDB GridFS.
+
+A material document (rendered Markdown, see common.material_sections) is one
+GridFS file split into MATERIAL_CHUNK_BYTES chunks. The file's metadata
+holds the material key, its request (topic, label, hours) and the byte
+offset and length of every section. A partial material (some sections
+failed) lists the missing section indexes under `missing`, so a later
+request only generates those. Reads are byte ranges: only the chunks
+overlapping the range are fetched, so serving one section or one HTTP Range
+of a long document never loads the whole file.
+"""
+import logging
+from typing import Any, Dict, Iterator, List, Optional
+
+import gridfs
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import ASCENDING, DESCENDING, MongoClient
+
+logger = logging.getLogger(__name__)
+
+BUCKET = 'materials'
+
+
+class MaterialNotFound(KeyError):
+    """Raised for an unknown or malformed material id."""
+
+
+class MaterialStore:
+    def __init__(self, db, chunk_size: int = 255 * 1024, bucket: str = BUCKET):
+        """
+        Args:
+            db: Mongo database holding the `<bucket>.files` / `<bucket>.chunks` collections
+            chunk_size: GridFS chunk size in bytes for new files
+            bucket: GridFS bucket (collection prefix)
+        """
+        self.fs = gridfs.GridFS(db, collection=bucket)
+        self.files = db[f'{bucket}.files']
+        self.chunk_size = chunk_size
+        self.files.create_index([('metadata.key', ASCENDING), ('uploadDate', DESCENDING)])
+
+    @classmethod
+    def connect(cls, uri: str, db_name: str, chunk_size: int = 255 * 1024, timeout_ms: int = 5000) -> 'MaterialStore':
+        """
+        Raises:
+            pymongo.errors.PyMongoError: If MongoDB is unreachable.
+        """
+        client = MongoClient(uri, serverSelectionTimeoutMS=timeout_ms)
+        client.admin.command('ping')
+        return cls(client[db_name], chunk_size=chunk_size)
+
+    def save(self, key: str, body: bytes, sections: List[Dict[str, Any]], **metadata) -> str:
+        """Store a rendered material under `key`; returns its material id."""
+        file_id = self.fs.put(
+            body,
+            filename=f"{key}.md",
+            content_type='text/markdown; charset=utf-8',
+            chunk_size=self.chunk_size,
+            metadata={'key': key, 'sections': sections, **metadata},
+        )
+        return str(file_id)
+
+    def delete(self, material_id: str):
+        """Remove a material, e.g. a partial one superseded by its completed version."""
+        self.fs.delete(self._object_id(material_id))
+
+    def find(self, key: str) -> Optional[Dict[str, Any]]:
+        """Info of the newest material stored under `key`, or None."""
+        doc = self.files.find_one({'metadata.key': key}, sort=[('uploadDate', DESCENDING)])
+        return self._info(doc) if doc else None
+
+    def info(self, material_id: str) -> Dict[str, Any]:
+        """
+        Raises:
+            MaterialNotFound: If there is no such material.
+        """
+        doc = self.files.find_one({'_id': self._object_id(material_id)})
+        if doc is None:
+            raise MaterialNotFound(material_id)
+        return self._info(doc)
+
+    def read(self, material_id: str, start: int = 0, end: Optional[int] = None) -> bytes:
+        """
+        Bytes [start, end) of a material; end defaults to its length.
+
+        Raises:
+            MaterialNotFound: If there is no such material.
+        """
+        return b''.join(self.iter_range(material_id, start, end))
+
+    def iter_range(self, material_id: str, start: int = 0, end: Optional[int] = None,
+                   block_size: Optional[int] = None) -> Iterator[bytes]:
+        """
+        Bytes [start, end) of a material in blocks of at most one chunk, for streaming
+        responses. The file is opened (and a missing id raised) before the first block.
+
+        Raises:
+            MaterialNotFound: If there is no such material.
+        """
+        try:
+            grid_out = self.fs.get(self._object_id(material_id))
+        except gridfs.NoFile:
+            raise MaterialNotFound(material_id)
+        end = grid_out.length if end is None else min(end, grid_out.length)
+        block_size = block_size or grid_out.chunk_size
+
+        def blocks():
+            try:
+                grid_out.seek(start)
+                remaining = end - start
+                while remaining > 0:
+                    data = grid_out.read(min(block_size, remaining))
+                    if not data:
+                        break
+                    remaining -= len(data)
+                    yield data
+            finally:
+                grid_out.close()
+        return blocks()
+
+    def read_section(self, material_id: str, index: int) -> bytes:
+        """
+        One section of a material, read as its byte range.
+
+        Raises:
+            MaterialNotFound: If there is no such material or section.
+        """
+        info = self.info(material_id)
+        section = next((s for s in info['sections'] if s['index'] == index), None)
+        if section is None:
+            raise MaterialNotFound(f"{material_id} section {index}")
+        return self.read(material_id, section['offset'], section['offset'] + section['length'])
+
+    def stats(self) -> Dict[str, Any]:
+        return {'materials': self.files.estimated_document_count(), 'chunk_size': self.chunk_size}
+
+    @staticmethod
+    def _object_id(material_id: str) -> ObjectId:
+        try:
+            return ObjectId(material_id)
+        except (InvalidId, TypeError):
+            raise MaterialNotFound(material_id)
+
+    @staticmethod
+    def _info(doc: Dict[str, Any]) -> Dict[str, Any]:
+        metadata = dict(doc.get('metadata') or {})
+        return {
+            'material_id': str(doc['_id']),
+            'length': doc['length'],
+            'chunk_size': doc['chunkSize'],
+            'uploaded_at': doc['uploadDate'].isoformat() if doc.get('uploadDate') else None,
+            **metadata,
+        }
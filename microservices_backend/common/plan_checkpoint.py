@@ -0,0 +1,173 @@
+"""
+Per-day checkpoints for plan generation in `learning_paths`.
+
+A plan document is inserted with status 'in_progress' before any day is
+enriched, and every finished day is written to it (plan.<date>) as soon as it
+completes. The document carries the request's idempotency key, so a retry
+after a timeout or crash finds it, reuses the stored schedule and finished
+days, and only generates the days that are still missing.
+
+A lease keeps two requests from working on the same plan: the generating
+request renews it with every checkpoint, and a retry can only take the plan
+over once the lease has lapsed.
+
+Claims read and write MongoDB directly; checkpoint writes can go through a
+write-behind buffer so requests do not wait on them. Completing a plan is
+written synchronously, after the checkpoints queued before it, so the plan
+can be read and edited as soon as the request answers. Days are stored
+through the plan codec and returned decoded.
+"""
+import hashlib
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional, Tuple
+
+from pymongo import ASCENDING, ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from .plan_codec import decode_document, encode_day, encode_document
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+
+
+def request_fingerprint(topic_name, no_of_days, start_date, daily_hours) -> str:
+    """Identity of a plan request's inputs; a key reused with different inputs is rejected."""
+    content = f"{' '.join(str(topic_name).lower().split())}|{int(no_of_days)}|{start_date}|{float(daily_hours)}"
+    return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+
+class IdempotencyConflict(Exception):
+    """Raised when an idempotency key is reused for a different request."""
+
+
+class PlanCheckpoints:
+    def __init__(self, collection, lease_seconds: float = 210, writer=None):
+        """
+        Args:
+            collection: The `learning_paths` Mongo collection
+            lease_seconds: How long a claim on an in-progress plan lasts without a checkpoint
+            writer: WriteBehindBuffer for checkpoint writes; None writes synchronously
+        """
+        self.collection = collection
+        self.writer = writer
+        self.lease_seconds = lease_seconds
+        self._lock = threading.Lock()
+        self.started = 0
+        self.resumed = 0
+        self.replayed = 0
+        self.days_saved = 0
+        self.days_reused = 0
+        self.ensure_indexes()
+
+    def ensure_indexes(self):
+        # Sparse: catalog and older documents have no idempotency key
+        self.collection.create_index([('idempotency_key', ASCENDING)], unique=True, sparse=True)
+
+    def _update(self, doc_id, update: Dict[str, Any], sync: bool = False, keys=()) -> bool:
+        if self.writer is not None:
+            return self.writer.update({'_id': doc_id}, update, sync=sync, keys=keys)
+        self.collection.update_one({'_id': doc_id}, update)
+        return True
+
+    def _lease(self) -> str:
+        return (datetime.now() + timedelta(seconds=self.lease_seconds)).isoformat()
+
+    def claim(self, key: str, doc: Dict[str, Any]) -> Tuple[Optional[Dict[str, Any]], str]:
+        """
+        Start or resume the plan for an idempotency key.
+
+        Args:
+            key: Idempotency key of the request
+            doc: The in-progress document to insert when the key is new; must carry
+                'request_fingerprint'
+
+        Returns:
+            tuple: (document, state) where state is 'new', 'resumed' (a lapsed in-progress
+            plan, now claimed by the caller), 'done' (already finished) or 'busy' (another
+            request holds the lease; document is None)
+
+        Raises:
+            IdempotencyConflict: If the key belongs to a request with different inputs.
+        """
+        now = datetime.now().isoformat()
+        doc = {**doc, 'idempotency_key': key, 'status': 'in_progress', 'plan': doc.get('plan') or {},
+               'lease_expires_at': self._lease(), 'created_at': now, 'updated_at': now}
+        try:
+            doc['_id'] = self.collection.insert_one(doc).inserted_id
+            with self._lock:
+                self.started += 1
+            return doc, 'new'
+        except DuplicateKeyError:
+            pass
+
+        existing = self.collection.find_one({'idempotency_key': key})
+        if existing is None:
+            raise IdempotencyConflict(f"Plan for idempotency key {key} disappeared while claiming it")
+        if existing.get('request_fingerprint') != doc.get('request_fingerprint'):
+            raise IdempotencyConflict(f"Idempotency key {key} was already used for a different plan request")
+        if existing.get('status') != 'in_progress':
+            with self._lock:
+                self.replayed += 1
+            return decode_document(existing), 'done'
+
+        claimed = self.collection.find_one_and_update(
+            {'_id': existing['_id'], 'status': 'in_progress', 'lease_expires_at': {'$lt': now}},
+            {'$set': {'lease_expires_at': self._lease(), 'updated_at': now}},
+            return_document=ReturnDocument.AFTER
+        )
+        if claimed is None:
+            return None, 'busy'
+        with self._lock:
+            self.resumed += 1
+            self.days_reused += len(claimed.get('plan') or {})
+        return decode_document(claimed), 'resumed'
+
+    def save_schedule(self, doc_id, schedule: Dict[str, str], hours: Optional[Dict[str, Any]] = None):
+        """Store the date->subtopic schedule and its per-day hours, so a resumed request does not ask the LLM again."""
+        self._update(doc_id, {'$set': {
+            'schedule': schedule, 'schedule_hours': hours or {}, 'lease_expires_at': self._lease(),
+            'updated_at': datetime.now().isoformat()
+        }})
+
+    def save_day(self, doc_id, date: str, entry: Dict[str, Any]):
+        """Checkpoint one finished day and renew the lease. Failures are logged, not raised."""
+        try:
+            self._update(doc_id, {'$set': {
+                f'plan.{date}': encode_day(entry), 'lease_expires_at': self._lease(), 'updated_at': datetime.now().isoformat()
+            }})
+        except Exception as e:
+            logger.warning(f"Could not checkpoint {date} of plan {doc_id}: {str(e)}")
+            return
+        with self._lock:
+            self.days_saved += 1
+
+    def complete(self, doc_id, fields: Dict[str, Any]) -> bool:
+        """
+        Mark the plan finished with its final fields and drop the lease. With a writer
+        the update is queued, tagged with the plan's `_id` and request_id, so readers can
+        check `writer.pending(...)` until it lands.
+
+        Returns:
+            bool: True if MongoDB has the finished plan; False if the update was queued
+        """
+        return self._update(doc_id, {
+            '$set': {**encode_document(fields), 'status': 'success', 'updated_at': datetime.now().isoformat()},
+            '$unset': {'lease_expires_at': ''}
+        }, keys=(str(doc_id), fields.get('request_id')))
+
+    def release(self, doc_id):
+        """Let a retry resume immediately, e.g. after the request failed before finishing."""
+        self._update(doc_id, {'$set': {'lease_expires_at': datetime.now().isoformat()}})
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'started': self.started,
+                'resumed': self.resumed,
+                'replayed': self.replayed,
+                'days_checkpointed': self.days_saved,
+                'days_reused': self.days_reused,
+            }
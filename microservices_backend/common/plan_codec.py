@@ -0,0 +1,170 @@
+"""
+Storage codec for plan documents in `learning_paths`.
+
+Two kinds of bulk dominate a stored plan:
+
+- Template content. Fallback quizzes and the standard assignments are the same
+  boilerplate for every day of every plan, differing only in the subtopic name.
+  A day whose quizzes or assignments equal the template for its subtopic stores
+  a reference ({"_template": "assignments"}) and the template is re-rendered on read.
+- Large text. Notes and generated quiz JSON longer than STORAGE_COMPRESS_MIN_BYTES
+  are stored compressed ({"_codec": "zstd", "type": "text", "data": <binary>}), with
+  zstd when the `zstandard` package is installed and zlib otherwise. Either is
+  readable regardless of which is configured for writing.
+
+Encoded documents carry `storage_codec`; documents written before the codec
+existed decode unchanged. Reads decode lazily: `decode_plan` returns a mapping
+that decodes a day the first time it is accessed.
+"""
+import json
+import zlib
+from collections.abc import Mapping
+from typing import Any, Dict, Iterator
+
+from bson import Binary
+
+from . import config
+from .quiz_templates import assignment_templates, fallback_quizzes
+
+try:
+    import zstandard
+except ImportError:  # optional; zlib is always available
+    zstandard = None
+
+CODEC_VERSION = 1
+
+# Fields of a day entry that may be replaced by a template reference, and their templates
+TEMPLATES = {
+    'assignments': assignment_templates,
+    'fallback_quizzes': fallback_quizzes,
+}
+TEMPLATE_FIELDS = {'assignments': 'assignments', 'quizzes': 'fallback_quizzes'}
+COMPRESSED_FIELDS = ('notes', 'quizzes', 'assignments')
+
+
+def _compressor(name: str):
+    if name == 'zstd':
+        if zstandard is None:
+            raise ValueError("zstd codec requires the zstandard package")
+        return zstandard.ZstdCompressor(level=config.STORAGE_COMPRESS_LEVEL).compress
+    return lambda data: zlib.compress(data, config.STORAGE_COMPRESS_LEVEL)
+
+
+def _decompressor(name: str):
+    if name == 'zstd':
+        if zstandard is None:
+            raise ValueError("Document was stored with zstd; install the zstandard package to read it")
+        return zstandard.ZstdDecompressor().decompress
+    return zlib.decompress
+
+
+def default_codec() -> str:
+    if config.STORAGE_CODEC == 'zstd' and zstandard is not None:
+        return 'zstd'
+    return 'zlib'
+
+
+def compress_value(value: Any, codec: str = None, min_bytes: int = None) -> Any:
+    """A compressed envelope for a large string or JSON value; smaller values are returned as they are."""
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    kind, data = ('text', value.encode('utf-8')) if isinstance(value, str) else \
+        ('json', json.dumps(value, separators=(',', ':'), ensure_ascii=False).encode('utf-8'))
+    if len(data) < (config.STORAGE_COMPRESS_MIN_BYTES if min_bytes is None else min_bytes):
+        return value
+    codec = codec or default_codec()
+    packed = _compressor(codec)(data)
+    if len(packed) >= len(data):
+        return value
+    return {'_codec': codec, 'type': kind, 'data': Binary(packed)}
+
+
+def is_encoded(value: Any) -> bool:
+    return isinstance(value, dict) and ('_codec' in value or '_template' in value)
+
+
+def decompress_value(value: Any, subtopic: str = '') -> Any:
+    """Inverse of compress_value and of template references; other values pass through."""
+    if not isinstance(value, dict):
+        return value
+    if '_template' in value:
+        return TEMPLATES[value['_template']](subtopic)
+    if '_codec' in value:
+        data = _decompressor(value['_codec'])(bytes(value['data'])).decode('utf-8')
+        return data if value.get('type') == 'text' else json.loads(data)
+    return value
+
+
+def encode_day(entry: Dict[str, Any], codec: str = None) -> Dict[str, Any]:
+    """Storage form of one day entry: template references first, then compression."""
+    if not isinstance(entry, dict) or not config.STORAGE_CODEC_ENABLED:
+        return entry
+    subtopic = entry.get('subtopic') or ''
+    encoded = dict(entry)
+    for field, template in TEMPLATE_FIELDS.items():
+        if encoded.get(field) and encoded[field] == TEMPLATES[template](subtopic):
+            encoded[field] = {'_template': template}
+    for field in COMPRESSED_FIELDS:
+        if field in encoded and not is_encoded(encoded[field]):
+            encoded[field] = compress_value(encoded[field], codec)
+    return encoded
+
+
+def decode_day(entry: Dict[str, Any]) -> Dict[str, Any]:
+    if not isinstance(entry, dict):
+        return entry
+    subtopic = entry.get('subtopic') or ''
+    return {key: decompress_value(value, subtopic) if key in COMPRESSED_FIELDS else value
+            for key, value in entry.items()}
+
+
+def encode_plan(plan: Dict[str, Any], codec: str = None) -> Dict[str, Any]:
+    return {date: encode_day(entry, codec) for date, entry in (plan or {}).items()}
+
+
+class LazyPlan(Mapping):
+    """Read-only date -> day mapping over a stored plan that decodes each day on first access."""
+
+    def __init__(self, stored: Dict[str, Any]):
+        self._stored = stored or {}
+        self._decoded: Dict[str, Any] = {}
+
+    def __getitem__(self, date: str) -> Dict[str, Any]:
+        if date not in self._decoded:
+            self._decoded[date] = decode_day(self._stored[date])
+        return self._decoded[date]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._stored)
+
+    def __len__(self) -> int:
+        return len(self._stored)
+
+    def stored(self, date: str) -> Dict[str, Any]:
+        """The day as stored, without decoding (e.g. to read just the subtopic)."""
+        return self._stored[date]
+
+
+def decode_plan(plan: Dict[str, Any]) -> LazyPlan:
+    return LazyPlan(plan)
+
+
+def encode_document(doc: Dict[str, Any], codec: str = None) -> Dict[str, Any]:
+    """Copy of a learning path document with its plan in storage form."""
+    if not config.STORAGE_CODEC_ENABLED:
+        return doc
+    encoded = dict(doc)
+    if isinstance(doc.get('plan'), dict):
+        encoded['plan'] = encode_plan(doc['plan'], codec)
+    encoded['storage_codec'] = CODEC_VERSION
+    return encoded
+
+
+def decode_document(doc: Dict[str, Any]) -> Dict[str, Any]:
+    """Copy of a stored learning path document with a fully decoded plan, ready to serialize."""
+    if doc is None:
+        return None
+    decoded = {key: value for key, value in doc.items() if key != 'storage_codec'}
+    if isinstance(doc.get('plan'), dict):
+        decoded['plan'] = dict(decode_plan(doc['plan']))
+    return decoded
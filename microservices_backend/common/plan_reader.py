@@ -0,0 +1,143 @@
+"""
+Partial reads of stored learning paths in `learning_paths`.
+
+A plan document holds every day under `plan.<date>`, so reading it whole
+pulls all notes and quizzes even when a client needs one week of subtopics.
+Reads here take two small round trips instead:
+
+1. `outline` fetches the plan's metadata and the list of its dates, without
+   any day content.
+2. `days` fetches only the requested dates, with unwanted day fields
+   (e.g. notes, quizzes) dropped on the server, and decodes them through the
+   plan codec.
+
+The days are read only if the document still has the outline's `updated_at`,
+so a plan edited between the two round trips is not served as a mix of old
+metadata (and ETag) and new days; the caller re-reads the outline instead.
+
+Both use aggregation operators available since MongoDB 3.4.
+"""
+from typing import Any, Dict, Iterable, List, Optional
+
+from bson import ObjectId
+from bson.errors import InvalidId
+
+from .plan_codec import decode_day
+
+# Stored bookkeeping that is never returned to readers
+INTERNAL_FIELDS = ('idempotency_key', 'request_fingerprint', 'lease_expires_at', 'schedule', 'schedule_hours',
+                   'storage_codec')
+# Day fields a projection may select; the subtopic is always kept because template
+# references in the other fields are rendered from it
+DAY_FIELDS = ('subtopic', 'hours', 'youtube_link', 'timestamp', 'videos', 'notes', 'quizzes', 'assignments')
+
+
+class PlanChanged(Exception):
+    """Raised when a plan was updated after its outline was read."""
+
+
+def plan_query(plan_id: str) -> Dict[str, Any]:
+    """Mongo filter matching a plan by request_id, or by _id when `plan_id` is an ObjectId."""
+    query = {'request_id': plan_id}
+    try:
+        return {'$or': [query, {'_id': ObjectId(plan_id)}]}
+    except (InvalidId, TypeError):
+        return query
+
+
+def day_fields(fields: Optional[Iterable[str]] = None,
+               exclude: Optional[Iterable[str]] = None) -> Optional[List[str]]:
+    """
+    The day fields to return for a projection.
+
+    Returns:
+        list or None: Field names, or None when the projection selects every field
+
+    Raises:
+        ValueError: If a field name is unknown.
+    """
+    fields = [f for f in (fields or ()) if f]
+    exclude = [f for f in (exclude or ()) if f]
+    unknown = sorted((set(fields) | set(exclude)) - set(DAY_FIELDS))
+    if unknown:
+        raise ValueError(f"Unknown day field(s): {', '.join(unknown)}; expected {', '.join(DAY_FIELDS)}")
+    if not fields and not exclude:
+        return None
+    selected = [f for f in DAY_FIELDS if (not fields or f in fields) and f not in exclude]
+    return ['subtopic'] + [f for f in selected if f != 'subtopic']
+
+
+class PlanReader:
+    def __init__(self, collection):
+        """
+        Args:
+            collection: The `learning_paths` Mongo collection
+        """
+        self.collection = collection
+
+    def outline(self, plan_id: str) -> Optional[Dict[str, Any]]:
+        """
+        A plan's metadata with its dates in order (`plan_dates`) and no day content.
+
+        Returns:
+            dict or None: The outline, or None if there is no such plan
+        """
+        docs = list(self.collection.aggregate([
+            {'$match': plan_query(plan_id)},
+            {'$limit': 1},
+            {'$addFields': {'plan_dates': {
+                '$map': {'input': {'$objectToArray': {'$ifNull': ['$plan', {}]}}, 'as': 'day', 'in': '$$day.k'}
+            }}},
+            {'$project': {'plan': 0, **{field: 0 for field in INTERNAL_FIELDS}}}
+        ]))
+        if not docs:
+            return None
+        doc = docs[0]
+        doc['plan_dates'] = sorted(doc.get('plan_dates') or [])
+        return doc
+
+    def days_of(self, outline: Dict[str, Any], dates: List[str],
+                fields: Optional[List[str]] = None) -> Dict[str, Dict[str, Any]]:
+        """
+        `days` of the plan version an outline describes.
+
+        Raises:
+            PlanChanged: If the plan was updated since the outline was read.
+        """
+        return self.days(outline['_id'], dates, fields, expect={'updated_at': outline.get('updated_at')})
+
+    def days(self, doc_id, dates: List[str], fields: Optional[List[str]] = None,
+             expect: Optional[Dict[str, Any]] = None) -> Dict[str, Dict[str, Any]]:
+        """
+        Decoded day entries for `dates` of one plan, in date order.
+
+        Args:
+            doc_id: The plan's Mongo _id (from `outline`)
+            dates: Dates to read; dates the plan does not have are left out
+            fields: Day fields to return (see `day_fields`); None returns every field
+            expect: Field values the document must still have, e.g. the outline's updated_at
+
+        Raises:
+            PlanChanged: If `expect` is given and the document no longer matches it.
+        """
+        if not dates:
+            return {}
+        day = '$$day.v'
+        if fields is not None:
+            day = {'$arrayToObject': {'$filter': {
+                'input': {'$objectToArray': '$$day.v'}, 'as': 'field', 'cond': {'$in': ['$$field.k', list(fields)]}
+            }}}
+        docs = list(self.collection.aggregate([
+            {'$match': {'_id': doc_id, **(expect or {})}},
+            {'$project': {'_id': 0, 'plan': {'$arrayToObject': {'$map': {
+                'input': {'$filter': {
+                    'input': {'$objectToArray': {'$ifNull': ['$plan', {}]}},
+                    'as': 'day', 'cond': {'$in': ['$$day.k', list(dates)]}
+                }},
+                'as': 'day', 'in': {'k': '$$day.k', 'v': day}
+            }}}}}
+        ]))
+        if expect is not None and not docs:
+            raise PlanChanged(f"Plan {doc_id} changed while it was being read")
+        stored = (docs[0].get('plan') or {}) if docs else {}
+        return {date: decode_day(stored[date]) for date in sorted(stored)}
@@ -0,0 +1,259 @@
+"""
+Persistent quiz question bank in MongoDB.
+
+Every generated question is stored once under its bank key (the normalized
+course topic plus the normalized subtopic) and difficulty, so a generic
+subtopic such as "Introduction" never serves another course's questions.
+Requests are served a random selection from the bank, least served questions
+first, so repeated subtopics rotate through their questions instead of
+repeating the same few. The LLM is only called to top the bank up when it
+holds too few unseen questions.
+
+Near-duplicate subtopic names of the same topic ("Intro to ML", "Machine
+learning basics") are mapped onto one bank key. The mapping lives in MongoDB
+next to the bank, so every quiz generator process resolves a name to the same
+key; the first process to map a name wins.
+"""
+import hashlib
+import logging
+import random
+import re
+import threading
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from pymongo import ASCENDING, MongoClient, ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError, PyMongoError
+
+from .scheduler import has_part_marker
+from .similarity_index import band_hashes, features, jaccard, minhash, normalize_tokens, scope_key
+
+logger = logging.getLogger(__name__)
+
+QUESTION_FIELDS = ('question', 'options', 'correct_answer', 'explanation')
+
+
+def subtopic_key(subtopic: str) -> str:
+    """Order-insensitive normalized form of a subtopic name."""
+    return ' '.join(sorted(normalize_tokens(subtopic))) or str(subtopic or '').strip().lower()
+
+
+def bank_key(subtopic: str, topic_name: str = '') -> str:
+    """Normalized subtopic key qualified by the normalized course topic, if there is one."""
+    topic = scope_key(topic_name)
+    return f"{topic}::{subtopic_key(subtopic)}" if topic else subtopic_key(subtopic)
+
+
+def question_hash(question: Dict[str, Any]) -> str:
+    text = re.sub(r'\s+', ' ', str(question.get('question', '')).strip().lower())
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+class QuestionBank:
+    def __init__(self, collection, keys=None, threshold: float = 0.85):
+        """
+        Args:
+            collection: The `question_bank` Mongo collection
+            keys: The `question_bank_keys` Mongo collection mapping subtopic names to the
+                bank key of a near-duplicate of the same topic; None matches exact
+                normalized names only
+            threshold: Minimum Jaccard similarity of two names to share a bank key
+        """
+        self.collection = collection
+        self.keys = keys
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.hits = 0
+        self.partial_hits = 0
+        self.misses = 0
+        self.top_ups = 0
+        self.generated = 0
+        self.stored = 0
+        self.ensure_indexes()
+
+    @classmethod
+    def connect(cls, uri: str, db_name: str, threshold: float = 0.85, timeout_ms: int = 5000) -> 'QuestionBank':
+        """
+        Raises:
+            pymongo.errors.PyMongoError: If MongoDB is unreachable.
+        """
+        client = MongoClient(uri, serverSelectionTimeoutMS=timeout_ms)
+        client.admin.command('ping')
+        db = client[db_name]
+        return cls(db['question_bank'], keys=db['question_bank_keys'], threshold=threshold)
+
+    def ensure_indexes(self):
+        self.collection.create_index([('key', ASCENDING), ('difficulty', ASCENDING), ('served', ASCENDING)])
+        self.collection.create_index([('key', ASCENDING), ('difficulty', ASCENDING), ('hash', ASCENDING)],
+                                     unique=True)
+        if self.keys is not None:
+            self.keys.create_index([('topic', ASCENDING), ('bands', ASCENDING)])
+
+    def resolve_key(self, subtopic: str, topic_name: str = '') -> str:
+        """Bank key for a subtopic of `topic_name`, reusing the key of a near-duplicate name of that topic."""
+        topic = scope_key(topic_name)
+        key = bank_key(subtopic, topic)
+        if self.keys is None:
+            return key
+        stored = self.keys.find_one({'_id': key}, {'bank_key': 1})
+        if stored:
+            return stored['bank_key']
+
+        feats = features(subtopic)
+        bands = band_hashes(minhash(feats))
+        mapped = key
+        # Part labels differ only by their part number; each part keeps its own questions
+        if feats and not has_part_marker(subtopic):
+            best_score = 0.0
+            candidates = self.keys.find({'topic': topic, 'bands': {'$in': bands}}, {'bank_key': 1, 'features': 1})
+            for candidate in candidates.limit(50):
+                score = jaccard(feats, set(candidate.get('features') or ()))
+                if score >= self.threshold and score > best_score:
+                    mapped, best_score = candidate['bank_key'], score
+        try:
+            stored = self.keys.find_one_and_update(
+                {'_id': key},
+                {'$setOnInsert': {'bank_key': mapped, 'topic': topic, 'subtopic': subtopic, 'features': sorted(feats),
+                                  'bands': bands, 'created_at': datetime.now().isoformat()}},
+                upsert=True, return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            # Another process mapped the name first; its mapping wins
+            stored = self.keys.find_one({'_id': key}, {'bank_key': 1})
+        return stored['bank_key']
+
+    def count(self, key: str, difficulty: str, exclude: Iterable[str] = ()) -> int:
+        query = {'key': key, 'difficulty': difficulty}
+        exclude = list(exclude)
+        if exclude:
+            query['hash'] = {'$nin': exclude}
+        return self.collection.count_documents(query)
+
+    def select(self, key: str, difficulty: str, count: int, exclude: Iterable[str] = ()) -> List[Dict[str, Any]]:
+        """
+        Random selection of up to `count` questions, drawn from the least served ones
+        and skipping hashes in `exclude` (questions this caller has already seen).
+        Selected questions have their served counter bumped so the next request rotates.
+        """
+        if count <= 0:
+            return []
+        query = {'key': key, 'difficulty': difficulty}
+        exclude = list(exclude)
+        if exclude:
+            query['hash'] = {'$nin': exclude}
+        # Least served first; randomize only among questions tied at the cut-off
+        pool = list(self.collection.find(query, {'_id': 0}).sort('served', ASCENDING).limit(count * 3))
+        if len(pool) > count:
+            cutoff = pool[count - 1]['served']
+            chosen = [q for q in pool if q['served'] < cutoff]
+            ties = [q for q in pool if q['served'] == cutoff]
+            chosen += random.sample(ties, count - len(chosen))
+        else:
+            chosen = pool
+        random.shuffle(chosen)
+        if chosen:
+            self.collection.update_many(
+                {'key': key, 'difficulty': difficulty, 'hash': {'$in': [q['hash'] for q in chosen]}},
+                {'$inc': {'served': 1}, '$set': {'last_served_at': datetime.now().isoformat()}}
+            )
+        return [self.public(q) for q in chosen]
+
+    def add(self, key: str, subtopic: str, difficulty: str, questions: List[Dict[str, Any]]) -> int:
+        """Store new questions; duplicates of questions already in the bank are skipped. Returns how many were stored."""
+        now = datetime.now().isoformat()
+        docs, seen = [], set()
+        for question in questions:
+            digest = question_hash(question)
+            if digest in seen:
+                continue
+            seen.add(digest)
+            docs.append({
+                **{field: question.get(field) for field in QUESTION_FIELDS},
+                'key': key,
+                'subtopic': subtopic,
+                'difficulty': difficulty,
+                'hash': digest,
+                'served': 0,
+                'created_at': now,
+            })
+        if not docs:
+            return 0
+        try:
+            inserted = len(self.collection.insert_many(docs, ordered=False).inserted_ids)
+        except BulkWriteError as e:
+            inserted = e.details.get('nInserted', 0)
+        with self._lock:
+            self.stored += inserted
+        return inserted
+
+    @staticmethod
+    def public(question: Dict[str, Any]) -> Dict[str, Any]:
+        """The fields returned to clients; `id` lets a client exclude it next time."""
+        return {**{field: question.get(field) for field in QUESTION_FIELDS}, 'id': question.get('hash')}
+
+    def record(self, outcome: str, generated: int = 0):
+        """Count a request as 'hit', 'partial_hit' or 'miss', with the questions the LLM generated for it."""
+        with self._lock:
+            self.requests += 1
+            attr = {'hit': 'hits', 'partial_hit': 'partial_hits', 'miss': 'misses'}[outcome]
+            setattr(self, attr, getattr(self, attr) + 1)
+            if generated:
+                self.top_ups += 1
+                self.generated += generated
+
+    def stats(self) -> Dict[str, Any]:
+        try:
+            size = self.collection.estimated_document_count()
+        except PyMongoError:
+            size = None
+        with self._lock:
+            return {
+                'questions': size,
+                'requests': self.requests,
+                'hits': self.hits,
+                'partial_hits': self.partial_hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / self.requests, 3) if self.requests else None,
+                'llm_top_ups': self.top_ups,
+                'questions_generated': self.generated,
+                'questions_stored': self.stored,
+            }
+
+    def serve(self, subtopic: str, difficulty: str, count: int, generate,
+              exclude: Iterable[str] = (), top_up: int = 10, topic_name: str = '') -> Tuple[List[Dict[str, Any]], str]:
+        """
+        Serve `count` questions for a subtopic, topping the bank up through `generate`
+        when it has fewer than `count` unseen questions.
+
+        Args:
+            subtopic: Subtopic name as requested
+            difficulty: Quiz difficulty
+            count: Questions wanted
+            generate: Callable(n) -> list of new questions from the LLM, or None when no
+                LLM is available
+            exclude: Question ids (hashes) the caller has already seen
+            top_up: Minimum number of questions to ask the LLM for per top-up
+            topic_name: Course the subtopic belongs to; only that course's questions are served
+
+        Returns:
+            tuple: (questions, source) where source is 'bank', 'bank+llm' or 'llm'
+        """
+        key = self.resolve_key(subtopic, topic_name)
+        exclude = list(exclude)
+        available = self.count(key, difficulty, exclude)
+        generated = 0
+        if available < count and generate is not None:
+            new_questions = generate(max(count - available, top_up)) or []
+            generated = len(new_questions)
+            self.add(key, subtopic, difficulty, new_questions)
+        questions = self.select(key, difficulty, count, exclude)
+
+        if available >= count:
+            outcome, source = 'hit', 'bank'
+        elif available:
+            outcome, source = 'partial_hit', 'bank+llm' if generated else 'bank'
+        else:
+            outcome, source = 'miss', 'llm'
+        self.record(outcome, generated)
+        return questions, source
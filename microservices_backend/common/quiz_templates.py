@@ -0,0 +1,35 @@
+"""
+Template quizzes and assignments used when AI generation is unavailable.
+
+Shared by the quiz generator (no API key) and the MCP server (quiz generator
+unreachable) so both fall back to the same content.
+"""
+from typing import Any, Dict, List
+
+
+def fallback_quizzes(subtopic: str) -> List[Dict[str, Any]]:
+    """Return a minimal template quiz for a subtopic."""
+    return [
+        {
+            "question": f"Briefly explain: {subtopic}?",
+            "options": ["Definition", "Example", "Both", "Neither"],
+            "correct_answer": 2,
+            "explanation": f"Covers basics of {subtopic}."
+        }
+    ]
+
+
+def assignment_templates(subtopic: str) -> List[Dict[str, Any]]:
+    """Return the standard written and practical assignments for a subtopic."""
+    return [
+        {
+            "title": f"Summarize {subtopic}",
+            "description": "Write a 1-2 paragraph summary and 3 key takeaways.",
+            "type": "written",
+        },
+        {
+            "title": f"Practical Task: {subtopic}",
+            "description": "Create a small example or mini-project demonstrating the concept.",
+            "type": "practical",
+        }
+    ]
@@ -0,0 +1,30 @@
+"""
+Start-rate budgets for batches of outbound work (catalog plans, material sections).
+"""
+import threading
+import time
+
+
+class RateLimiter:
+    def __init__(self, per_minute: float, burst: int = 1):
+        """
+        Token bucket that lets `per_minute` calls start per minute (0 disables it), up to
+        `burst` of them back to back after an idle spell.
+        """
+        self.interval = 60.0 / per_minute if per_minute > 0 else 0.0
+        self.burst = max(1, burst)
+        self._next = time.monotonic() - (self.burst - 1) * self.interval
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until the caller may start its next unit of work."""
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            # Unused starts accumulate while idle, up to the burst size
+            self._next = max(self._next, now - (self.burst - 1) * self.interval)
+            wait = self._next - now
+            self._next += self.interval
+        if wait > 0:
+            time.sleep(wait)
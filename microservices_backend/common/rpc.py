@@ -0,0 +1,398 @@
+"""
+Transports for internal service-to-service calls other than HTTP.
+
+Internal hops (MCP -> Video Fetcher, MCP -> Quiz Generator) can use this
+instead of JSON over HTTP. Every message is a 4-byte big-endian length
+followed by a msgpack map. A client keeps a few persistent TCP connections
+to a service and multiplexes calls over them: each request carries an id,
+any number of requests may be in flight (pipelined) on one connection, and
+responses come back as they complete and are matched to their caller by id.
+
+The server dispatches every call through the service's own Flask app in a
+request context, so admission control, deadline and tenant propagation and
+the route code are the same as over HTTP, which stays available on the
+service's usual port for external callers.
+
+In monolith mode the services share one process and `LocalClient` replaces
+the network entirely: registered handlers are plain function calls, and
+other routes are dispatched through the co-hosted Flask app.
+
+Failures surface as the `requests` exceptions ServiceClient callers already
+handle: ConnectionError, Timeout and HTTPError for error statuses.
+"""
+import copy
+import itertools
+import logging
+import socket
+import socketserver
+import struct
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import requests
+
+try:
+    import msgpack
+except ImportError:  # optional; without it internal calls stay on HTTP
+    msgpack = None
+
+logger = logging.getLogger(__name__)
+
+FRAME_HEADER = struct.Struct('>I')
+MAX_FRAME_BYTES = 64 * 1024 * 1024
+
+
+def available() -> bool:
+    """True if the msgpack package needed by the RPC transport is installed."""
+    return msgpack is not None
+
+
+def parse_address(address: str) -> Tuple[str, int]:
+    """'host:port' -> (host, port)."""
+    host, _, port = address.rpartition(':')
+    return host or 'localhost', int(port)
+
+
+def encode_frame(message: Dict[str, Any]) -> bytes:
+    # Values msgpack has no type for (ObjectId, datetime) travel as strings, as with jsonify
+    body = msgpack.packb(message, use_bin_type=True, default=str)
+    return FRAME_HEADER.pack(len(body)) + body
+
+
+def read_frame(reader) -> Dict[str, Any]:
+    """
+    Read one message from a buffered socket reader.
+
+    Raises:
+        ConnectionError: If the peer closed the connection or sent an oversized frame.
+    """
+    header = reader.read(FRAME_HEADER.size)
+    if len(header) < FRAME_HEADER.size:
+        raise ConnectionError("connection closed")
+    (size,) = FRAME_HEADER.unpack(header)
+    if size > MAX_FRAME_BYTES:
+        raise ConnectionError(f"frame of {size} bytes exceeds the {MAX_FRAME_BYTES} byte limit")
+    body = reader.read(size)
+    if len(body) < size:
+        raise ConnectionError("connection closed mid-frame")
+    return msgpack.unpackb(body, raw=False)
+
+
+def dispatch_request(app, path: str, body: Any = None, headers: Optional[Dict[str, str]] = None,
+                     method: str = 'POST') -> Tuple[int, Any, Dict[str, str]]:
+    """
+    Run one request through a Flask app in a request context, with its before/after
+    request hooks (e.g. admission control), without a network round trip.
+
+    Returns:
+        tuple: (status code, decoded JSON body or text, headers worth forwarding)
+    """
+    with app.test_request_context(path, method=method, json=body, headers=headers or {}):
+        try:
+            response = app.full_dispatch_request()
+        except Exception as e:
+            response = app.handle_exception(e)
+        data = response.get_json(silent=True)
+        forwarded = {'Retry-After': response.headers['Retry-After']} if 'Retry-After' in response.headers else {}
+        return response.status_code, data if data is not None else response.get_data(as_text=True), forwarded
+
+
+def raise_for_status(status: int, body: Any, target: str, headers: Optional[Dict[str, str]] = None):
+    """Raise HTTPError for an error status, with a response carrying the status and forwarded headers."""
+    if status >= 400:
+        response = requests.Response()
+        response.status_code = status
+        response.headers.update(headers or {})
+        raise requests.exceptions.HTTPError(f"{status} error from {target}: {body}", response=response)
+
+
+# --- Server ------------------------------------------------------------------
+
+class _ConnectionHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        self.server.rpc.serve_connection(self.request)
+
+
+class _ThreadingServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class RPCServer:
+    def __init__(self, app, host: str = '0.0.0.0', port: int = 0, threads: int = 16):
+        """
+        Serve a Flask app's routes over the binary RPC transport.
+
+        Args:
+            app: Flask application whose routes are called
+            host: Interface to listen on
+            port: Port to listen on; 0 picks a free one (see `port`)
+            threads: Calls executed concurrently across all connections
+        """
+        self.app = app
+        self._executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='rpc-call')
+        self._server = _ThreadingServer((host, port), _ConnectionHandler, bind_and_activate=True)
+        self._server.rpc = self
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.connections = 0
+        self.calls = 0
+        self.errors = 0
+
+    @property
+    def port(self) -> int:
+        return self._server.server_address[1]
+
+    def start(self) -> 'RPCServer':
+        self._thread = threading.Thread(target=self._server.serve_forever, name=f'rpc-server-{self.port}',
+                                        daemon=True)
+        self._thread.start()
+        logger.info(f"RPC transport listening on port {self.port}")
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self._executor.shutdown(wait=False)
+
+    def serve_connection(self, sock: socket.socket):
+        """Read requests off one connection and answer each as soon as it completes."""
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        reader = sock.makefile('rb')
+        write_lock = threading.Lock()
+        with self._lock:
+            self.connections += 1
+        try:
+            while True:
+                try:
+                    message = read_frame(reader)
+                except (ConnectionError, OSError, ValueError):
+                    return
+                self._executor.submit(self._answer, sock, write_lock, message)
+        finally:
+            with self._lock:
+                self.connections -= 1
+
+    def _answer(self, sock: socket.socket, write_lock: threading.Lock, message: Dict[str, Any]):
+        frame = encode_frame(self.dispatch(message))
+        with write_lock:
+            try:
+                sock.sendall(frame)
+            except OSError:
+                pass  # the client went away; its reader fails the pending call
+
+    def dispatch(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        """Run one call through the Flask app and build its response message."""
+        reply = {'id': message.get('id')}
+        try:
+            status, body, headers = dispatch_request(self.app, message['path'], message.get('body'),
+                                                     message.get('headers'), message.get('method', 'POST'))
+            reply.update(status=status, body=body)
+            if headers:
+                reply['headers'] = headers
+        except Exception as e:
+            logger.exception(f"RPC call to {message.get('path')} failed")
+            reply.update(status=500, body={'error': str(e)})
+        with self._lock:
+            self.calls += 1
+            self.errors += reply['status'] >= 500
+        return reply
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'port': self.port, 'connections': self.connections, 'calls': self.calls, 'errors': self.errors}
+
+
+# --- Client ------------------------------------------------------------------
+
+class _Connection:
+    def __init__(self, address: Tuple[str, int], connect_timeout: float):
+        self.sock = socket.create_connection(address, timeout=connect_timeout)
+        self.sock.settimeout(None)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.reader = self.sock.makefile('rb')
+        self.pending: Dict[int, Future] = {}
+        self.closed = False
+        self._pending_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        threading.Thread(target=self._read_loop, name=f'rpc-reader-{address[1]}', daemon=True).start()
+
+    def send(self, message: Dict[str, Any]) -> Future:
+        future = Future()
+        with self._pending_lock:
+            if self.closed:
+                raise requests.exceptions.ConnectionError("RPC connection is closed")
+            self.pending[message['id']] = future
+        frame = encode_frame(message)
+        try:
+            with self._write_lock:
+                self.sock.sendall(frame)
+        except OSError as e:
+            self._fail(e)
+            raise requests.exceptions.ConnectionError(f"RPC send failed: {str(e)}")
+        return future
+
+    def forget(self, call_id: int):
+        """Drop a call the caller stopped waiting for; its late response is discarded."""
+        with self._pending_lock:
+            self.pending.pop(call_id, None)
+
+    def in_flight(self) -> int:
+        with self._pending_lock:
+            return len(self.pending)
+
+    def _read_loop(self):
+        try:
+            while True:
+                message = read_frame(self.reader)
+                with self._pending_lock:
+                    future = self.pending.pop(message.get('id'), None)
+                if future is not None:
+                    future.set_result(message)
+        except Exception as e:
+            self._fail(e)
+
+    def _fail(self, error: Exception):
+        with self._pending_lock:
+            if self.closed:
+                return
+            self.closed = True
+            pending, self.pending = self.pending, {}
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+        for future in pending.values():
+            if not future.done():
+                future.set_exception(requests.exceptions.ConnectionError(f"RPC connection lost: {str(error)}"))
+
+    def close(self):
+        self._fail(ConnectionError("closed by client"))
+
+
+class RPCClient:
+    kind = 'rpc'
+
+    def __init__(self, address: str, connections: int = 2, connect_timeout: float = 2.0):
+        """
+        Multiplexing client for one service's RPC endpoint.
+
+        Args:
+            address: 'host:port' of the service's RPC listener
+            connections: Persistent connections calls are spread over
+            connect_timeout: Seconds to wait when (re)connecting
+        """
+        self.address = address
+        self._address = parse_address(address)
+        self.connect_timeout = connect_timeout
+        self._connections = [None] * max(1, connections)
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._next = itertools.count()
+        self.calls = 0
+        self.connects = 0
+
+    def _connection(self) -> _Connection:
+        index = next(self._next) % len(self._connections)
+        with self._lock:
+            connection = self._connections[index]
+            if connection is None or connection.closed:
+                try:
+                    connection = self._connections[index] = _Connection(self._address, self.connect_timeout)
+                except OSError as e:
+                    raise requests.exceptions.ConnectionError(f"Could not connect to RPC endpoint {self.address}: {str(e)}")
+                self.connects += 1
+            self.calls += 1
+        return connection
+
+    def call(self, path: str, body: Any, headers: Optional[Dict[str, str]] = None, timeout: float = 30.0) -> Any:
+        """
+        Call a route of the remote service and return its decoded response body.
+
+        Raises:
+            requests.exceptions.ConnectionError: If the service cannot be reached or the connection drops.
+            requests.exceptions.Timeout: If no response arrived within `timeout`.
+            requests.exceptions.HTTPError: If the route answered with an error status.
+        """
+        message = {'id': next(self._ids), 'method': 'POST', 'path': path, 'headers': headers or {}, 'body': body}
+        connection = self._connection()
+        future = connection.send(message)
+        try:
+            reply = future.result(timeout)
+        except FutureTimeout:
+            connection.forget(message['id'])
+            raise requests.exceptions.Timeout(f"RPC call {path} to {self.address} timed out after {timeout:.1f}s")
+        raise_for_status(reply.get('status', 500), reply.get('body'), f"{self.address}{path}", reply.get('headers'))
+        return reply.get('body')
+
+    def close(self):
+        with self._lock:
+            for connection in self._connections:
+                if connection is not None:
+                    connection.close()
+            self._connections = [None] * len(self._connections)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            open_connections = [c for c in self._connections if c is not None and not c.closed]
+        return {
+            'address': self.address,
+            'connections': len(open_connections),
+            'in_flight': sum(c.in_flight() for c in open_connections),
+            'calls': self.calls,
+            'connects': self.connects,
+        }
+
+
+# --- In process --------------------------------------------------------------
+
+class LocalClient:
+    kind = 'local'
+    # The service lives in this process; there is nothing to health-probe
+    in_process = True
+
+    def __init__(self, name: str, app=None, handlers: Optional[Dict[str, Callable[[Any], Any]]] = None):
+        """
+        Call a service hosted in this process (monolith mode).
+
+        Args:
+            name: Name of the service, for errors and stats
+            app: The service's Flask app, for routes without a direct handler
+            handlers: Route path -> function(payload) -> response body, called directly.
+                The caller's deadline, tenant and priority are contextvars and so apply
+                unchanged; payload and result are copied, as they would be over the wire.
+        """
+        self.name = name
+        self.app = app
+        self.handlers = dict(handlers or {})
+        self._lock = threading.Lock()
+        self.direct_calls = 0
+        self.dispatched_calls = 0
+
+    def call(self, path: str, body: Any, headers: Optional[Dict[str, str]] = None, timeout: float = None) -> Any:
+        """
+        Call a route of the co-hosted service and return its response body. Runs in the
+        caller's thread, so `timeout` is not enforced; the caller's deadline still applies.
+
+        Raises:
+            requests.exceptions.HTTPError: If a dispatched route answered with an error status.
+            requests.exceptions.ConnectionError: If the service has no such route here.
+        """
+        handler = self.handlers.get(path)
+        if handler is not None:
+            with self._lock:
+                self.direct_calls += 1
+            return copy.deepcopy(handler(copy.deepcopy(body)))
+        if self.app is None:
+            raise requests.exceptions.ConnectionError(f"{self.name} has no in-process handler for {path}")
+        with self._lock:
+            self.dispatched_calls += 1
+        status, data, forwarded = dispatch_request(self.app, path, body, headers)
+        raise_for_status(status, data, f"{self.name}{path}", forwarded)
+        return data
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'direct_calls': self.direct_calls, 'dispatched_calls': self.dispatched_calls,
+                    'handlers': sorted(self.handlers)}
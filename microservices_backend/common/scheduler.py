@@ -0,0 +1,342 @@
+"""
+Deterministic, local study-plan scheduling.
+
+The LLM is only asked for an ordered curriculum: subtopics with relative
+effort weights. Everything date-related is done here. The curriculum is laid
+on a continuous effort axis, and each day takes an equal slice of it. Heavy
+subtopics therefore span several days ("Part 1/3"), light neighbours share a
+day, and every day carries the same study load. Because the curriculum does
+not depend on start date or daily hours, it can be cached by (topic, days).
+
+Long plans are generated in chunks: an outline of phases first, then one
+curriculum per phase (in parallel, with the neighbouring phases as overlap
+context), merged back into a single curriculum with near-duplicates folded.
+"""
+import math
+import re
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from common.similarity_index import features, jaccard
+
+# A subtopic must fill at least this share of a day to be named in that day's label
+MIN_DAY_SHARE = 0.15
+
+CURRICULUM_PROMPT = (
+    "You are a study planner assistant. Given a topic and a number of study days, list the key subtopics "
+    "to study, in the order they should be learned. Give each subtopic a weight: its relative study effort "
+    "(1 = a typical day's work, 2 = twice that, 0.5 = half). "
+    "Respond ONLY as a JSON object of the form {\"subtopics\": [{\"name\": \"...\", \"weight\": 1}]}. "
+    "Do not include dates, explanations or extra text."
+)
+
+
+OUTLINE_PROMPT = (
+    "You are a study planner assistant. Split the study of the topic into consecutive phases, in the order "
+    "they should be learned. For each phase give a short name, a one-sentence focus and its number of days; "
+    "the days must add up to the total. "
+    "Respond ONLY as a JSON object of the form {\"phases\": [{\"name\": \"...\", \"focus\": \"...\", \"days\": 7}]}. "
+    "Do not include dates, explanations or extra text."
+)
+
+# Shapes accepted from the model, for common.json_repair (parse_curriculum/parse_outline normalize further)
+# An object curriculum must carry 'subtopics', so one inner item of a truncated response never passes for it
+_NAMED_ITEM = {'type': ['object', 'string']}
+CURRICULUM_SCHEMA = {
+    'type': ['object', 'array'],
+    'items': _NAMED_ITEM,
+    'required': ['subtopics'],
+    'properties': {'subtopics': {'type': 'array', 'minItems': 1, 'items': _NAMED_ITEM}},
+}
+OUTLINE_SCHEMA = {
+    'type': 'object',
+    'required': ['phases'],
+    'properties': {'phases': {'type': 'array', 'minItems': 1, 'items': {'type': 'object', 'required': ['name']}}},
+}
+
+
+def target_subtopic_count(no_of_days: int) -> int:
+    """How many subtopics to ask for: one per day for short plans, tapering off for long ones."""
+    days = max(1, int(no_of_days))
+    if days <= 14:
+        return days
+    return min(days, 14 + math.ceil((days - 14) / 2))
+
+
+def curriculum_prompt(topic_name: str, no_of_days: int) -> str:
+    return (
+        f"Topic: {topic_name}. Number of days: {no_of_days}. "
+        f"List about {target_subtopic_count(no_of_days)} subtopics. " + CURRICULUM_PROMPT
+    )
+
+
+def phase_count(no_of_days: int, chunk_days: int) -> int:
+    return max(1, math.ceil(int(no_of_days) / max(1, int(chunk_days))))
+
+
+def outline_prompt(topic_name: str, no_of_days: int, phases: int) -> str:
+    return (
+        f"Topic: {topic_name}. Total number of days: {no_of_days}. "
+        f"Use about {phases} phases. " + OUTLINE_PROMPT
+    )
+
+
+def parse_outline(data: Any, no_of_days: int) -> List[Dict[str, Any]]:
+    """
+    Normalize an outline into [{'name', 'focus', 'days'}] whose integer days add up to no_of_days.
+    Phase lengths the model got wrong are rescaled proportionally (largest remainder).
+
+    Raises:
+        ValueError: If no phases can be extracted or there are more phases than days.
+    """
+    items = data.get('phases') if isinstance(data, dict) else data
+    if not isinstance(items, list):
+        raise ValueError("Outline must be a list of phases")
+    phases = []
+    for item in items:
+        if isinstance(item, dict):
+            name = item.get('name') or item.get('phase') or item.get('title')
+            focus = item.get('focus') or ''
+            try:
+                days = float(item.get('days', 1))
+            except (TypeError, ValueError):
+                days = 1.0
+        else:
+            name, focus, days = item, '', 1.0
+        if name and str(name).strip():
+            phases.append({'name': str(name).strip(), 'focus': str(focus).strip(), 'days': max(days, 0.1)})
+    total_days = int(no_of_days)
+    if not phases:
+        raise ValueError("Outline contains no phases")
+    if len(phases) > total_days:
+        raise ValueError(f"Outline has {len(phases)} phases for {total_days} days")
+
+    # Every phase keeps at least one day; the rest is shared by largest remainder
+    spare = total_days - len(phases)
+    total = sum(p['days'] for p in phases)
+    exact = [spare * p['days'] / total for p in phases]
+    alloc = [int(x) for x in exact]
+    by_remainder = sorted(range(len(phases)), key=lambda i: exact[i] - alloc[i], reverse=True)
+    for i in by_remainder[:spare - sum(alloc)]:
+        alloc[i] += 1
+    for phase, extra in zip(phases, alloc):
+        phase['days'] = 1 + extra
+    return phases
+
+
+def chunk_prompt(topic_name: str, phases: List[Dict[str, Any]], index: int) -> str:
+    """Curriculum prompt for one phase, with its neighbours as overlap context so chunks join up."""
+    phase = phases[index]
+    context = []
+    if index > 0:
+        previous = phases[index - 1]
+        context.append(f"The previous phase, \"{previous['name']}\", covered: {previous['focus'] or previous['name']}.")
+    if index + 1 < len(phases):
+        following = phases[index + 1]
+        context.append(f"The next phase, \"{following['name']}\", will cover: {following['focus'] or following['name']}.")
+    return (
+        f"Topic: {topic_name}. This is phase {index + 1} of {len(phases)}: \"{phase['name']}\""
+        + (f" ({phase['focus']})" if phase['focus'] else '') + f". Number of days: {phase['days']}. "
+        + ' '.join(context)
+        + (" Do not repeat subtopics that belong to the neighbouring phases. " if context else ' ')
+        + f"List about {target_subtopic_count(phase['days'])} subtopics for this phase only. " + CURRICULUM_PROMPT
+    )
+
+
+def merge_chunks(chunks: List[Tuple[int, List[Tuple[str, float]]]],
+                 threshold: float = 0.85) -> List[Tuple[str, float]]:
+    """
+    Concatenate per-phase curricula into one, in phase order.
+
+    Each chunk's weights are rescaled to its phase's share of days, so phases keep their
+    planned length. A subtopic that near-duplicates one already kept (Jaccard similarity
+    of normalized names at or above `threshold`) is dropped and its weight folded into the
+    earlier entry, so the total effort is unchanged.
+
+    Args:
+        chunks: (phase_days, curriculum) per phase, in order
+        threshold: Minimum similarity for two subtopics to count as the same
+    """
+    merged: List[List[Any]] = []
+    kept_features = []
+    for phase_days, curriculum in chunks:
+        total = sum(weight for _, weight in curriculum) or 1.0
+        for name, weight in curriculum:
+            weight = weight * phase_days / total
+            feats = features(name)
+            duplicate = next((i for i, other in enumerate(kept_features) if jaccard(feats, other) >= threshold), None)
+            if duplicate is not None:
+                merged[duplicate][1] += weight
+                continue
+            merged.append([name, weight])
+            kept_features.append(feats)
+    return [(name, weight) for name, weight in merged]
+
+
+PART_MARKER = re.compile(r'\(Part \d+/\d+\)')
+
+
+def has_part_marker(label: str) -> bool:
+    """Whether a day label covers only part of a subtopic ("A (Part 2/3)"); each part has its own content."""
+    return bool(PART_MARKER.search(str(label or '')))
+
+
+def label_subtopics(label: str) -> List[str]:
+    """Subtopic names in a day label built by day_label: "A (Part 1/2) & B" -> ["A", "B"]."""
+    names = []
+    for part in str(label or '').split(' & '):
+        name = re.sub(r'\s*\(Part \d+/\d+\)$', '', part).strip()
+        if name:
+            names.append(name)
+    return names
+
+
+def continuation_prompt(topic_name: str, covered: List[str], no_of_days: int) -> str:
+    """Curriculum prompt for N more days that continues after the subtopics already covered."""
+    return (
+        f"Topic: {topic_name}. The learner has already covered, in order: {'; '.join(covered[-40:])}. "
+        f"Continue the curriculum for {no_of_days} more days with the next subtopics, without repeating "
+        f"those. List about {target_subtopic_count(no_of_days)} subtopics. " + CURRICULUM_PROMPT
+    )
+
+
+def drop_covered(curriculum: List[Tuple[str, float]], covered: List[str],
+                 threshold: float = 0.85) -> List[Tuple[str, float]]:
+    """Remove subtopics that near-duplicate one already covered, e.g. when a continuation repeats itself."""
+    covered_features = [features(name) for name in covered]
+    return [
+        (name, weight) for name, weight in curriculum
+        if not any(jaccard(features(name), other) >= threshold for other in covered_features)
+    ]
+
+
+def parse_curriculum(data: Any) -> List[Tuple[str, float]]:
+    """
+    Accept the shapes models actually return: {"subtopics": [...]}, a bare list, items
+    as strings or {"name"/"subtopic", "weight"} objects, or a legacy date->subtopic map.
+
+    Raises:
+        ValueError: If no subtopics can be extracted.
+    """
+    if isinstance(data, dict):
+        items = data.get('subtopics') or data.get('curriculum')
+        if items is None:
+            # Legacy date->subtopic map: keep the order, equal weights
+            items = [data[k] for k in sorted(data)]
+    else:
+        items = data
+    if not isinstance(items, list):
+        raise ValueError("Curriculum must be a list of subtopics")
+
+    curriculum = []
+    for item in items:
+        if isinstance(item, dict):
+            name = item.get('name') or item.get('subtopic') or item.get('title')
+            try:
+                weight = float(item.get('weight', 1))
+            except (TypeError, ValueError):
+                weight = 1.0
+        else:
+            name, weight = item, 1.0
+        if name and str(name).strip():
+            curriculum.append((str(name).strip(), weight if weight > 0 else 1.0))
+    if not curriculum:
+        raise ValueError("Curriculum contains no subtopics")
+    return curriculum
+
+
+def schedule_days(curriculum: List[Tuple[str, float]], no_of_days: int) -> List[List[Dict[str, Any]]]:
+    """
+    Split the curriculum into `no_of_days` equal-effort days.
+
+    Returns:
+        list: For each day, the subtopic segments it covers as
+            {'subtopic', 'share', 'part', 'parts'}, where share is the fraction of the day.
+    """
+    days = max(1, int(no_of_days))
+    total = sum(weight for _, weight in curriculum)
+    per_day = total / days
+
+    # Effort interval of each subtopic on the continuous axis
+    bounds, cursor = [], 0.0
+    for name, weight in curriculum:
+        bounds.append((name, cursor, cursor + weight))
+        cursor += weight
+
+    # How many days each subtopic meaningfully touches, for "Part k/m" labels
+    def touched_days(start, end):
+        first = int(start / per_day + 1e-9)
+        last = int(math.ceil(end / per_day - 1e-9)) - 1
+        return [d for d in range(first, max(first, last) + 1)
+                if min(end, (d + 1) * per_day) - max(start, d * per_day) >= MIN_DAY_SHARE * per_day]
+
+    parts = {i: touched_days(start, end) for i, (_, start, end) in enumerate(bounds)}
+
+    schedule = []
+    for day in range(days):
+        day_start, day_end = day * per_day, (day + 1) * per_day
+        segments = []
+        for i, (name, start, end) in enumerate(bounds):
+            overlap = min(end, day_end) - max(start, day_start)
+            if overlap <= 1e-9:
+                continue
+            share = overlap / per_day
+            if share < MIN_DAY_SHARE and day not in parts[i]:
+                continue
+            touched = parts[i] or [day]
+            segments.append({
+                'subtopic': name,
+                'share': share,
+                'part': touched.index(day) + 1 if day in touched else 1,
+                'parts': len(touched),
+            })
+        if not segments:
+            # Slivers only: name the subtopic with the largest overlap
+            best = max(bounds, key=lambda b: min(b[2], day_end) - max(b[1], day_start))
+            segments.append({'subtopic': best[0], 'share': 1.0, 'part': 1, 'parts': 1})
+        # Renormalize so the named segments fill the whole day
+        scale = sum(s['share'] for s in segments)
+        for s in segments:
+            s['share'] = s['share'] / scale
+        schedule.append(segments)
+    return schedule
+
+
+def day_label(segments: List[Dict[str, Any]]) -> str:
+    labels = []
+    for s in segments:
+        label = s['subtopic']
+        if s['parts'] > 1:
+            label += f" (Part {s['part']}/{s['parts']})"
+        labels.append(label)
+    return ' & '.join(labels)
+
+
+def schedule_curriculum(curriculum: List[Tuple[str, float]], no_of_days: int, start_date: str,
+                        daily_hours: Optional[float] = None) -> Optional[Tuple[Dict[str, str], Dict[str, Any]]]:
+    """
+    Assign the curriculum to consecutive dates from start_date (YYYY-MM-DD).
+
+    Returns:
+        tuple: (plan, hours) where plan maps date -> subtopic label and hours maps
+            date -> [{'subtopic', 'hours'}] splitting daily_hours across the day's
+            segments; or None if start_date cannot be parsed.
+    """
+    try:
+        start = datetime.strptime(str(start_date), '%Y-%m-%d')
+    except ValueError:
+        return None
+    try:
+        hours_per_day = float(daily_hours) if daily_hours is not None else 1.0
+    except (TypeError, ValueError):
+        hours_per_day = 1.0
+
+    plan, hours = {}, {}
+    for offset, segments in enumerate(schedule_days(curriculum, no_of_days)):
+        date = (start + timedelta(days=offset)).strftime('%Y-%m-%d')
+        plan[date] = day_label(segments)
+        hours[date] = [
+            {'subtopic': s['subtopic'], 'hours': round(s['share'] * hours_per_day, 2)}
+            for s in segments
+        ]
+    return plan, hours
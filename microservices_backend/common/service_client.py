@@ -0,0 +1,320 @@
+"""
+Shared client layer for internal service-to-service calls.
+
+Each downstream service gets a ServiceClient with its own circuit breaker. A
+HealthMonitor thread refreshes health state in the background so request
+handlers never pay for a /health round trip, and an unhealthy or tripped
+service fails fast with CircuitOpenError instead of waiting on a timeout.
+"""
+import logging
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import requests
+
+from . import rpc
+from .deadline import LatencyTracker, deadline_headers, request_timeout
+from .cache_warmer import warm_headers
+from .tenancy import tenant_headers
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(Exception):
+    """Raised when a call is rejected because the target's breaker is open."""
+
+
+def counts_against_breaker(error: Exception) -> bool:
+    """
+    Whether a failed call says the service is unhealthy: no answer at all, or a 5xx it did
+    not qualify with Retry-After. A 4xx is the caller's fault and a 503 with Retry-After is
+    a service shedding load as designed; both still raise, but leave the breaker alone.
+    """
+    response = getattr(error, 'response', None)
+    if not isinstance(error, requests.exceptions.HTTPError) or response is None:
+        return True
+    return response.status_code >= 500 and 'Retry-After' not in response.headers
+
+
+class CircuitBreaker:
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name: str, failure_threshold: int = 3, reset_timeout: float = 30.0):
+        """
+        Track consecutive failures for a dependency and short-circuit calls once it looks dead.
+
+        Args:
+            name: Name of the protected dependency (used in logs and status)
+            failure_threshold: Consecutive failures before the breaker opens
+            reset_timeout: Seconds to stay open before letting a trial call through
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self) -> str:
+        if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self._state = self.HALF_OPEN
+            self._trial_in_flight = False
+        return self._state
+
+    def allow_request(self) -> bool:
+        """Return True if a call may proceed. In half-open state only one trial call is let through."""
+        with self._lock:
+            state = self._current_state()
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self._state != self.CLOSED:
+                logger.info(f"Circuit '{self.name}' closed")
+            self._state = self.CLOSED
+            self._failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self._open()
+
+    def force_open(self):
+        """Open the breaker immediately, e.g. when a background health probe fails."""
+        with self._lock:
+            if self._state != self.OPEN:
+                self._open()
+
+    def half_open(self):
+        """Let the next call through as a trial, e.g. when a health probe succeeds again."""
+        with self._lock:
+            if self._state == self.OPEN:
+                self._state = self.HALF_OPEN
+                self._trial_in_flight = False
+
+    def _open(self):
+        if self._state != self.OPEN:
+            logger.warning(f"Circuit '{self.name}' opened after {self._failures} failure(s)")
+        self._state = self.OPEN
+        self._opened_at = time.monotonic()
+        self._trial_in_flight = False
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            state = self._current_state()
+            retry_in = 0.0
+            if state == self.OPEN:
+                retry_in = max(0.0, self.reset_timeout - (time.monotonic() - self._opened_at))
+            return {
+                'state': state,
+                'consecutive_failures': self._failures,
+                'retry_in_seconds': round(retry_in, 1),
+            }
+
+
+class ServiceClient:
+    def __init__(self, name: str, base_url: str, timeout: float = 30.0,
+                 failure_threshold: int = 3, reset_timeout: float = 30.0,
+                 health_path: str = '/health', rpc_address: Optional[str] = None,
+                 rpc_connections: int = 2):
+        """
+        Client for one internal service, guarded by a circuit breaker. Calls go over HTTP,
+        or over the binary RPC transport when `rpc_address` is set and msgpack is installed,
+        or in process after `use_local` (monolith mode); health probes use HTTP unless the
+        service is in process.
+
+        Args:
+            name: Name of the downstream service
+            base_url: Base URL, e.g. http://localhost:5103
+            timeout: Default request timeout in seconds
+            failure_threshold: Consecutive failures before the breaker opens
+            reset_timeout: Seconds the breaker stays open before a trial call
+            health_path: Path probed by the HealthMonitor
+            rpc_address: 'host:port' of the service's RPC listener, or None for HTTP
+            rpc_connections: Persistent RPC connections calls are multiplexed over
+        """
+        self.name = name
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.health_path = health_path
+        self.breaker = CircuitBreaker(name, failure_threshold, reset_timeout)
+        self.latency = LatencyTracker()
+        self.session = requests.Session()
+        # None: HTTP via the session; otherwise an rpc.RPCClient or rpc.LocalClient
+        self.transport = None
+        if rpc_address:
+            if rpc.available():
+                self.transport = rpc.RPCClient(rpc_address, connections=rpc_connections)
+            else:
+                logger.warning(f"RPC transport for {name} needs the msgpack package; using HTTP")
+        self.healthy: Optional[bool] = None
+        self.last_checked: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+    def post(self, path: str, payload: Dict[str, Any], timeout: Optional[float] = None) -> Dict[str, Any]:
+        """
+        POST a JSON payload (or send it over RPC) and return the decoded JSON response.
+
+        The timeout adapts to the service's observed latency and is clamped to the
+        current request deadline, which is also forwarded in the X-Deadline-Ms header
+        (with the current tenant in X-Tenant-Id and, during cache warming, the run's
+        remaining token allowance in X-Warm-Token-Allowance).
+
+        Only transport errors and 5xx answers without Retry-After count against the
+        breaker (see counts_against_breaker).
+
+        Raises:
+            DeadlineExceeded: If the current request deadline has no time left.
+            CircuitOpenError: If the breaker is open and the call was not attempted.
+            requests.exceptions.RequestException: If the call was attempted and failed.
+        """
+        timeout = request_timeout(timeout or self.latency.timeout(self.timeout))
+        if not self.breaker.allow_request():
+            raise CircuitOpenError(f"{self.name} is unavailable (circuit open)")
+        start = time.monotonic()
+        headers = {**deadline_headers(), **tenant_headers(), **warm_headers()}
+        try:
+            if self.transport is not None:
+                data = self.transport.call(path, payload, headers=headers, timeout=timeout)
+            else:
+                resp = self.session.post(
+                    f"{self.base_url}{path}",
+                    json=payload,
+                    timeout=timeout,
+                    headers={'Content-Type': 'application/json', **headers}
+                )
+                resp.raise_for_status()
+                data = resp.json()
+        except Exception as e:
+            self.last_error = str(e)
+            if counts_against_breaker(e):
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+            raise
+        self.latency.record(time.monotonic() - start)
+        self.breaker.record_success()
+        return data
+
+    def relay(self, path: str, payload: Dict[str, Any], headers: Optional[Dict[str, str]] = None,
+              timeout: Optional[float] = None) -> requests.Response:
+        """
+        POST a JSON payload over HTTP and return the response whatever its status, to hand
+        a request on to a peer and pass its answer back unchanged. Only failures to get an
+        answer (connection errors, timeouts, 502-504 from a proxy) count against the breaker.
+
+        Raises:
+            DeadlineExceeded: If the current request deadline has no time left.
+            CircuitOpenError: If the breaker is open and the call was not attempted.
+            requests.exceptions.RequestException: If no answer was received.
+        """
+        timeout = request_timeout(timeout or self.timeout)
+        if not self.breaker.allow_request():
+            raise CircuitOpenError(f"{self.name} is unavailable (circuit open)")
+        start = time.monotonic()
+        try:
+            resp = self.session.post(
+                f"{self.base_url}{path}",
+                json=payload,
+                timeout=timeout,
+                headers={'Content-Type': 'application/json', **(headers or {}), **deadline_headers(),
+                         **tenant_headers()}
+            )
+            if resp.status_code in (502, 503, 504) and 'Retry-After' not in resp.headers:
+                raise requests.exceptions.HTTPError(f"{self.name} answered HTTP {resp.status_code}",
+                                                    response=resp)
+        except Exception as e:
+            self.breaker.record_failure()
+            self.last_error = str(e)
+            raise
+        self.latency.record(time.monotonic() - start)
+        self.breaker.record_success()
+        return resp
+
+    def use_local(self, client: 'rpc.LocalClient'):
+        """Route calls to a service hosted in this process (monolith mode)."""
+        self.transport = client
+        self.base_url = f"local://{client.name}"
+
+    def check_health(self, timeout: float = 2.0) -> bool:
+        """Probe the service's health endpoint and feed the result into the breaker."""
+        if getattr(self.transport, 'in_process', False):
+            self.healthy = True
+            self.last_checked = time.time()
+            return True
+        try:
+            resp = self.session.get(f"{self.base_url}{self.health_path}", timeout=timeout)
+            ok = resp.status_code == 200
+            if not ok:
+                self.last_error = f"health check returned HTTP {resp.status_code}"
+        except requests.exceptions.RequestException as e:
+            ok = False
+            self.last_error = str(e)
+
+        if ok and self.healthy is False:
+            self.breaker.half_open()
+        elif not ok:
+            self.breaker.force_open()
+        self.healthy = ok
+        self.last_checked = time.time()
+        return ok
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            'url': self.base_url,
+            'transport': self.transport.kind if self.transport is not None else 'http',
+            'transport_stats': self.transport.stats() if self.transport is not None else None,
+            'healthy': self.healthy,
+            'last_checked': self.last_checked,
+            'last_error': self.last_error,
+            'p95_latency': self.latency.p95(),
+            'circuit': self.breaker.snapshot(),
+        }
+
+
+class HealthMonitor:
+    def __init__(self, clients: List[ServiceClient], interval: float = 10.0):
+        """
+        Background thread that keeps each client's health state fresh.
+
+        Args:
+            clients: Clients to probe
+            interval: Seconds between probe rounds
+        """
+        self.clients = clients
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='health-monitor', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            for client in self.clients:
+                client.check_health()
+            self._stop.wait(self.interval)
@@ -0,0 +1,248 @@
+"""
+Local near-duplicate index for LLM-generated subtopic names.
+
+"Intro to ML", "Introduction to Machine Learning" and "ML basics" should all
+hit the same cached notes and quizzes. Names are normalized (case, punctuation,
+common abbreviations, filler words, plurals) into a feature set of word tokens
+and character 4-grams. MinHash signatures bucketed with LSH find candidates,
+and the exact Jaccard similarity of their feature sets decides the match.
+Entries belong to a scope (e.g. the normalized course topic) and only match
+lookups in the same scope, so generic names like "Introduction" never reuse
+another course's payload.
+
+Everything runs on CPU with the standard library. The index is an append-only
+JSONL file, so inserts are incremental and a load is one sequential read. Lines
+superseded by a newer payload for the same name are counted, and once they
+outnumber the live entries the file is rewritten with one line per entry.
+"""
+import json
+import logging
+import os
+import random
+import re
+import threading
+import zlib
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+NUM_PERM = 64
+BANDS = 32
+ROWS = NUM_PERM // BANDS
+_PRIME = (1 << 61) - 1
+_rng = random.Random(1729)
+_PERMS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_PERM)]
+
+ABBREVIATIONS = {
+    'ml': 'machine learning',
+    'ai': 'artificial intelligence',
+    'dl': 'deep learning',
+    'nlp': 'natural language processing',
+    'cv': 'computer vision',
+    'nn': 'neural network',
+    'nns': 'neural network',
+    'js': 'javascript',
+    'ts': 'typescript',
+    'db': 'database',
+    'dbs': 'database',
+    'oop': 'object oriented programming',
+    'ds': 'data structure',
+    'algo': 'algorithm',
+    'algos': 'algorithm',
+    'os': 'operating system',
+    'api': 'application programming interface',
+    'apis': 'application programming interface',
+}
+
+# Words that say "this is the beginner lesson" without changing the subject
+INTRO_WORDS = {'intro', 'introduction', 'basics', 'basic', 'fundamentals', 'fundamental',
+               'overview', 'beginner', 'beginners', 'primer', 'getting', 'started'}
+
+STOPWORDS = {'a', 'an', 'the', 'to', 'of', 'and', 'in', 'for', 'on', 'with', 'into', 'vs', 'part'}
+
+
+def _singular(token: str) -> str:
+    if len(token) > 3 and token.endswith('ies'):
+        return token[:-3] + 'y'
+    if len(token) > 3 and token.endswith('s') and not token.endswith('ss'):
+        return token[:-1]
+    return token
+
+
+def normalize_tokens(text: str) -> List[str]:
+    """Lowercase, strip punctuation, expand abbreviations, fold intro words and plurals."""
+    tokens = []
+    for raw in re.findall(r'[a-z0-9+#]+', (text or '').lower()):
+        expanded = ABBREVIATIONS.get(raw, raw)
+        for token in expanded.split():
+            if token in INTRO_WORDS:
+                token = 'intro'
+            elif token in STOPWORDS:
+                continue
+            tokens.append(_singular(token))
+    return tokens
+
+
+def features(text: str) -> Set[str]:
+    """Word tokens plus character 4-grams, so small spelling differences still overlap."""
+    tokens = normalize_tokens(text)
+    feats = {f"w:{t}" for t in tokens}
+    for t in tokens:
+        padded = f"^{t}$"
+        feats.update(f"c:{padded[i:i + 4]}" for i in range(max(1, len(padded) - 3)))
+    return feats
+
+
+def minhash(feats: Set[str]) -> List[int]:
+    hashes = [zlib.crc32(f.encode('utf-8')) for f in feats] or [0]
+    return [min((a * h + b) % _PRIME for h in hashes) for a, b in _PERMS]
+
+
+def band_hashes(sig: List[int]) -> List[int]:
+    """Stable per-band LSH keys of a signature, for indexes kept outside this process (e.g. in MongoDB)."""
+    return [zlib.crc32(f"{band}:{sig[band * ROWS:(band + 1) * ROWS]}".encode('utf-8')) for band in range(BANDS)]
+
+
+def jaccard(a: Set[str], b: Set[str]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def scope_key(scope: Optional[str]) -> str:
+    return ' '.join(str(scope or '').lower().split())
+
+
+class SimilarityIndex:
+    def __init__(self, path: Optional[str] = None, threshold: float = 0.85, compact_after: int = 1000):
+        """
+        Near-duplicate lookup from subtopic text to a stored payload.
+
+        Args:
+            path: JSONL file backing the index; None keeps it in memory only
+            threshold: Minimum Jaccard similarity (0-1) for a lookup to count as a hit.
+                At 0.85 renamings ("Intro to ML" / "ML basics") still match but a name
+                that adds a word ("Binary Search" / "Binary Search Trees", 0.75) does not
+            compact_after: Superseded lines tolerated in the file before it is rewritten,
+                as long as they do not outnumber the live entries
+        """
+        self.path = path
+        self.threshold = threshold
+        self.compact_after = compact_after
+        self._stale = 0
+        self._entries: List[Dict[str, Any]] = []
+        self._by_key: Dict[Tuple[str, str], int] = {}
+        self._buckets: Dict[Tuple[int, int], List[int]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if path:
+            self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # A torn final line from a crash mid-append; skip it
+                    continue
+                self._add(record['text'], record['payload'], record.get('sig'), record.get('scope', ''))
+        logger.info(f"Loaded {len(self._entries)} entries from {self.path}")
+        self._maybe_compact()
+
+    def _maybe_compact(self):
+        """Rewrite the file with one line per live entry once superseded lines dominate it."""
+        if self._stale <= max(self.compact_after, len(self._entries)):
+            return
+        tmp = f"{self.path}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            for entry in self._entries:
+                f.write(json.dumps({'text': entry['text'], 'payload': entry['payload'], 'sig': entry['sig'],
+                                    'scope': entry['scope']}) + '\n')
+        os.replace(tmp, self.path)
+        logger.info(f"Compacted {self.path}: dropped {self._stale} superseded lines")
+        self._stale = 0
+
+    @staticmethod
+    def _bucket(band: int, sig: List[int], scope: str) -> Tuple[int, int]:
+        # The scope is part of every bucket, so other scopes' entries are never candidates
+        return band, hash((scope, tuple(sig[band * ROWS:(band + 1) * ROWS])))
+
+    def _add(self, text: str, payload: Any, sig: Optional[List[int]] = None, scope: str = '') -> List[int]:
+        feats = features(text)
+        key = (scope, ' '.join(sorted(normalize_tokens(text))))
+        sig = sig or minhash(feats)
+        if key in self._by_key:
+            # Same normalized text: newest payload wins, buckets already point at it
+            self._entries[self._by_key[key]]['payload'] = payload
+            self._stale += 1
+            return sig
+        idx = len(self._entries)
+        self._entries.append({'text': text, 'features': feats, 'payload': payload, 'sig': sig, 'scope': scope})
+        self._by_key[key] = idx
+        for band in range(BANDS):
+            self._buckets.setdefault(self._bucket(band, sig, scope), []).append(idx)
+        return sig
+
+    def lookup(self, text: str, scope: str = '', exact: bool = False) -> Optional[Tuple[Any, float, str]]:
+        """
+        Find the most similar stored entry of `scope` at or above the threshold, or with
+        `exact` only an entry whose normalized text is the same (e.g. for labels that
+        differ just by a part number, which near-duplicate matching would conflate).
+
+        Returns:
+            tuple: (payload, similarity, matched_text), or None on a miss
+        """
+        feats = features(text)
+        if not feats:
+            return None
+        sig = minhash(feats)
+        scope = scope_key(scope)
+        with self._lock:
+            if exact:
+                idx = self._by_key.get((scope, ' '.join(sorted(normalize_tokens(text)))))
+                if idx is None:
+                    self.misses += 1
+                    return None
+                self.hits += 1
+                return self._entries[idx]['payload'], 1.0, self._entries[idx]['text']
+            candidates = set()
+            for band in range(BANDS):
+                candidates.update(self._buckets.get(self._bucket(band, sig, scope), ()))
+            best, best_score = None, 0.0
+            for idx in candidates:
+                score = jaccard(feats, self._entries[idx]['features'])
+                if score > best_score:
+                    best, best_score = self._entries[idx], score
+            if best is None or best_score < self.threshold:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return best['payload'], best_score, best['text']
+
+    def insert(self, text: str, payload: Any, scope: str = ''):
+        """Add or replace an entry of `scope` and append it to the backing file, compacting it when due."""
+        if not normalize_tokens(text):
+            return
+        scope = scope_key(scope)
+        with self._lock:
+            sig = self._add(text, payload, scope=scope)
+            if self.path:
+                os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps({'text': text, 'payload': payload, 'sig': sig, 'scope': scope}) + '\n')
+                self._maybe_compact()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 3) if total else None,
+                'threshold': self.threshold,
+            }
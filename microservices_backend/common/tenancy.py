@@ -0,0 +1,103 @@
+"""
+Tenant identity for a request.
+
+The MCP server resolves the tenant from the X-Tenant-Id header (or the
+request body) and runs the request in a tenant scope. The scope is carried
+to downstream services in the same header, the way deadlines are, so
+per-tenant policies (model routing overrides etc.) apply end to end.
+
+Requests without an explicit tenant id are attributed to their user id or,
+failing that, to a hash of the API key they bring, so users sharing no id
+still get separate fair-scheduling queues. The request's priority class
+("interactive" or "background") travels alongside the tenant.
+"""
+import hashlib
+import re
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Mapping, Optional
+
+TENANT_HEADER = 'X-Tenant-Id'
+PRIORITY_HEADER = 'X-Priority'
+DEFAULT_TENANT = 'default'
+PRIORITIES = ('interactive', 'background')
+
+_current: ContextVar[Optional[str]] = ContextVar('tenant', default=None)
+_priority: ContextVar[Optional[str]] = ContextVar('priority', default=None)
+
+
+def normalize_tenant(tenant: Optional[str]) -> Optional[str]:
+    """Lowercased tenant id limited to [a-z0-9_.-], or None when empty."""
+    if tenant is None:
+        return None
+    tenant = re.sub(r'[^a-z0-9_.-]', '', str(tenant).strip().lower())[:64]
+    return tenant or None
+
+
+def current_tenant() -> str:
+    return _current.get() or DEFAULT_TENANT
+
+
+@contextmanager
+def tenant_scope(tenant: Optional[str]):
+    """Run a block on behalf of a tenant. None keeps the outer tenant."""
+    tenant = normalize_tenant(tenant)
+    if tenant is None:
+        yield current_tenant()
+        return
+    token = _current.set(tenant)
+    try:
+        yield tenant
+    finally:
+        _current.reset(token)
+
+
+def tenant_for_api_key(api_key: Optional[str]) -> Optional[str]:
+    """Stable tenant id for a bring-your-own API key, without exposing the key."""
+    if not api_key:
+        return None
+    return 'key-' + hashlib.sha256(str(api_key).encode('utf-8')).hexdigest()[:12]
+
+
+def request_tenant(headers: Mapping[str, str], body: Optional[Mapping] = None) -> Optional[str]:
+    """Tenant of an incoming request: X-Tenant-Id, else the body's tenant_id or user_id, else its api_key."""
+    body = body if isinstance(body, Mapping) else {}
+    return (tenant_from_headers(headers) or normalize_tenant(body.get('tenant_id'))
+            or normalize_tenant(body.get('user_id')) or tenant_for_api_key(body.get('api_key')))
+
+
+def current_priority() -> str:
+    return _priority.get() or PRIORITIES[0]
+
+
+@contextmanager
+def priority_scope(priority: Optional[str]):
+    """Run a block in a priority class ("interactive" or "background"). None keeps the outer class."""
+    if priority not in PRIORITIES:
+        yield current_priority()
+        return
+    token = _priority.set(priority)
+    try:
+        yield priority
+    finally:
+        _priority.reset(token)
+
+
+def tenant_headers() -> dict:
+    """Headers that carry the current tenant and priority class to a downstream service."""
+    headers = {}
+    tenant = _current.get()
+    if tenant:
+        headers[TENANT_HEADER] = tenant
+    if _priority.get():
+        headers[PRIORITY_HEADER] = _priority.get()
+    return headers
+
+
+def tenant_from_headers(headers: Mapping[str, str]) -> Optional[str]:
+    return normalize_tenant(headers.get(TENANT_HEADER))
+
+
+def priority_from_headers(headers: Mapping[str, str]) -> Optional[str]:
+    priority = str(headers.get(PRIORITY_HEADER) or '').strip().lower()
+    return priority if priority in PRIORITIES else None
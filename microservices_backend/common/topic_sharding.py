@@ -0,0 +1,339 @@
+"""
+Topic-affinity sharding across MCP nodes.
+
+Behind a plain load balancer, requests for one topic land on random MCP
+nodes, so every node keeps its own cold copy of that topic's curriculum and
+notes caches and the fleet repeats the same LLM work. Instead, every node
+places the same members (its own URL plus its peers) on a consistent hash
+ring and hashes the normalized topic onto it. A request for a topic the
+node does not own is relayed to the owner, which then sees all of that
+topic's traffic and keeps its caches warm. A relayed request carries a
+marker header and is always served by the node that receives it, so
+nodes whose views of the ring differ briefly cannot relay in a loop.
+
+Membership changes move as little as possible: each member owns SHARD_VNODES
+points on the ring, so a joining or leaving node takes over or hands back
+about 1/N of the topics while every other topic keeps its owner. Peers
+leave the ring when their health checks fail or a relay cannot connect to
+them, and rejoin when they answer again. A relay that times out waiting for
+the owner's answer is not served again locally (the owner may still be
+working on it); the caller gets a 504 and retries.
+
+A starting node announces itself to its configured peers (POST
+/cluster/join), so a new node needs only one peer in MCP_PEERS. Relayed
+requests carry the caller's api_key, so only authenticated peers may join:
+with SHARD_CLUSTER_TOKEN set, announcements must carry it; without it, only
+peers listed in MCP_PEERS are accepted.
+"""
+import bisect
+import hashlib
+import hmac
+import logging
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+import requests
+
+from .service_client import CircuitOpenError, ServiceClient
+
+logger = logging.getLogger(__name__)
+
+FORWARDED_HEADER = 'X-Shard-Forwarded'
+SERVED_BY_HEADER = 'X-Served-By'
+CLUSTER_TOKEN_HEADER = 'X-Cluster-Token'
+
+RING_SIZE = 1 << 64
+
+
+class RelayTimeout(Exception):
+    """Raised when the owning node took the request but did not answer in time."""
+
+    def __init__(self, owner: str):
+        super().__init__(f"{owner} did not answer in time")
+        self.owner = owner
+
+
+def ring_hash(value: str) -> int:
+    """Stable 64-bit position on the ring; the same on every node and Python process."""
+    return int.from_bytes(hashlib.md5(value.encode('utf-8')).digest()[:8], 'big')
+
+
+def normalize_node(url: str) -> str:
+    return str(url).strip().rstrip('/')
+
+
+class HashRing:
+    def __init__(self, nodes: Iterable[str] = (), vnodes: int = 128):
+        """
+        Args:
+            nodes: Member ids (MCP node URLs)
+            vnodes: Ring points per member; more points spread topics more evenly
+        """
+        self.vnodes = vnodes
+        self._nodes = set(nodes)
+        self._points: List[int] = []
+        self._owners: List[str] = []
+        self._build()
+
+    def _build(self):
+        points = sorted((ring_hash(f"{node}#{i}"), node) for node in self._nodes for i in range(self.vnodes))
+        self._points = [point for point, _ in points]
+        self._owners = [node for _, node in points]
+
+    @property
+    def nodes(self) -> List[str]:
+        return sorted(self._nodes)
+
+    def __len__(self) -> int:
+        return len(self._nodes)
+
+    def __contains__(self, node: str) -> bool:
+        return node in self._nodes
+
+    def with_node(self, node: str) -> 'HashRing':
+        return HashRing(self._nodes | {node}, self.vnodes)
+
+    def without_node(self, node: str) -> 'HashRing':
+        return HashRing(self._nodes - {node}, self.vnodes)
+
+    def owner_of_hash(self, position: int) -> Optional[str]:
+        if not self._points:
+            return None
+        i = bisect.bisect_left(self._points, position)
+        return self._owners[i % len(self._owners)]
+
+    def owner(self, key: str) -> Optional[str]:
+        """The member owning `key`: the first ring point at or after its hash."""
+        return self.owner_of_hash(ring_hash(key))
+
+    def shares(self) -> Dict[str, float]:
+        """Share of the key space each member owns."""
+        if not self._points:
+            return {}
+        shares = dict.fromkeys(self._nodes, 0.0)
+        previous = self._points[-1] - RING_SIZE
+        for point, node in zip(self._points, self._owners):
+            shares[node] += (point - previous) / RING_SIZE
+            previous = point
+        return {node: round(share, 4) for node, share in sorted(shares.items())}
+
+    def moved_fraction(self, other: 'HashRing') -> float:
+        """Share of the key space whose owner differs between this ring and `other`."""
+        bounds = sorted(set(self._points) | set(other._points))
+        if not bounds:
+            return 0.0
+        moved = 0
+        previous = bounds[-1] - RING_SIZE
+        for point in bounds:
+            # Every key in (previous, point] has the same owner as `point` on both rings
+            if self.owner_of_hash(point) != other.owner_of_hash(point):
+                moved += point - previous
+            previous = point
+        return round(moved / RING_SIZE, 4)
+
+
+class ShardRouter:
+    def __init__(self, node_url: str, peers: Iterable[str] = (), vnodes: int = 128, enabled: bool = True,
+                 health_interval: float = 5.0, relay_timeout: float = 180.0, cluster_token: str = ''):
+        """
+        Args:
+            node_url: This node's URL as its peers reach it; it is also its ring id
+            peers: URLs of the other MCP nodes
+            vnodes: Ring points per node; must be the same on every node
+            enabled: False serves every request locally (the ring is still reported)
+            health_interval: Seconds between peer health checks
+            relay_timeout: Longest a relayed request may take (capped by the request deadline)
+            cluster_token: Shared secret for join/leave announcements, or '' to accept
+                announcements only from the configured `peers`
+        """
+        self.node = normalize_node(node_url)
+        self.vnodes = vnodes
+        self.enabled = enabled
+        self.health_interval = health_interval
+        self.relay_timeout = relay_timeout
+        self.cluster_token = cluster_token
+        self._lock = threading.Lock()
+        self._peers: Dict[str, ServiceClient] = {}
+        self._stats_lock = threading.Lock()
+        self.requests = 0
+        self.owned = 0
+        self.relayed: Dict[str, int] = {}
+        self.received = 0
+        self.relay_failures = 0
+        self.rebalances: List[Dict[str, Any]] = []
+        # Configured and joined peers are members until they fail; the ring is replaced, never mutated
+        self.ring = HashRing([self.node], vnodes)
+        self.configured = {normalize_node(peer) for peer in peers} - {self.node}
+        for peer in sorted(self.configured):
+            self.add_peer(peer, reason='configured')
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _client(self, peer: str) -> ServiceClient:
+        return ServiceClient(f"mcp@{peer}", peer, timeout=self.relay_timeout, failure_threshold=1,
+                             reset_timeout=self.health_interval, health_path='/cluster')
+
+    def _set_ring(self, ring: HashRing, reason: str):
+        """Swap in a new ring (caller holds the lock) and record how much of the key space moved."""
+        moved = self.ring.moved_fraction(ring)
+        self.ring = ring
+        event = {'at': time.time(), 'reason': reason, 'members': len(ring), 'moved': moved}
+        self.rebalances = (self.rebalances + [event])[-20:]
+        logger.info(f"Shard ring rebalanced ({reason}): {len(ring)} members, {moved:.1%} of topics moved")
+
+    def add_peer(self, peer: str, reason: str = 'join') -> bool:
+        """Add a peer to the membership and the ring; False if it is this node or already a member."""
+        peer = normalize_node(peer)
+        with self._lock:
+            if peer == self.node:
+                return False
+            if peer not in self._peers:
+                self._peers[peer] = self._client(peer)
+            if peer in self.ring:
+                return False
+            self._set_ring(self.ring.with_node(peer), f"{reason} {peer}")
+        return True
+
+    def remove_peer(self, peer: str, reason: str = 'leave', forget: bool = True) -> bool:
+        """
+        Take a peer off the ring; its topics move to their next owners. forget=False keeps
+        health-checking it, so it rejoins once it recovers; configured peers are never
+        forgotten.
+        """
+        peer = normalize_node(peer)
+        with self._lock:
+            if forget and peer not in self.configured:
+                self._peers.pop(peer, None)
+            if peer not in self.ring:
+                return False
+            self._set_ring(self.ring.without_node(peer), f"{reason} {peer}")
+        return True
+
+    def owner(self, topic_key: str) -> str:
+        return self.ring.owner(topic_key) or self.node
+
+    def relay_target(self, topic_key: str, headers) -> Optional[str]:
+        """The peer a request for `topic_key` would be relayed to, or None to serve it here."""
+        owner = self.owner(topic_key)
+        if not self.enabled or headers.get(FORWARDED_HEADER) or owner == self.node:
+            return None
+        return owner
+
+    def relay(self, topic_key: str, path: str, payload: Dict[str, Any],
+              headers: Dict[str, str], timeout: Optional[float] = None) -> Optional[requests.Response]:
+        """
+        Relay a request to the node owning `topic_key`. Returns the owner's response, or
+        None when this node should serve the request itself: it owns the topic, routing
+        is off, the request was already relayed once, or the owner could not be reached.
+        An owner that refuses connections is taken off the ring, so the topic's next owner
+        is tried from now on; other failures leave membership to the health checks.
+        `timeout` overrides relay_timeout, e.g. for requests whose deadline depends on their size.
+
+        Raises:
+            RelayTimeout: If the owner took the request but did not answer in time.
+        """
+        forwarded = headers.get(FORWARDED_HEADER)
+        with self._stats_lock:
+            self.requests += 1
+            self.received += bool(forwarded)
+        owner = self.relay_target(topic_key, headers)
+        if owner is None:
+            with self._stats_lock:
+                self.owned += self.owner(topic_key) == self.node
+            return None
+        client = self._peers.get(owner)
+        if client is None:
+            return None
+        try:
+            resp = client.relay(path, payload, headers={**headers, FORWARDED_HEADER: self.node}, timeout=timeout)
+        except requests.exceptions.ReadTimeout as e:
+            # The owner may still be generating the plan; serving it here too would do it twice
+            logger.warning(f"Relaying topic '{topic_key}' to {owner} timed out: {str(e)}")
+            with self._stats_lock:
+                self.relay_failures += 1
+            raise RelayTimeout(owner) from e
+        except (CircuitOpenError, requests.exceptions.RequestException) as e:
+            logger.warning(f"Relaying topic '{topic_key}' to {owner} failed, serving it here: {str(e)}")
+            with self._stats_lock:
+                self.relay_failures += 1
+            # Nothing reached the owner; error answers and open breakers are left to the health checks
+            if isinstance(e, requests.exceptions.ConnectionError):
+                self.remove_peer(owner, reason='unreachable', forget=False)
+            return None
+        with self._stats_lock:
+            self.relayed[owner] = self.relayed.get(owner, 0) + 1
+        return resp
+
+    def check_peers(self):
+        """Probe every peer; failed peers leave the ring and recovered peers rejoin it."""
+        with self._lock:
+            peers = dict(self._peers)
+        for peer, client in peers.items():
+            if client.check_health():
+                self.add_peer(peer, reason='recovered')
+            else:
+                self.remove_peer(peer, reason='unhealthy', forget=False)
+
+    def _announce(self, path: str):
+        headers = {CLUSTER_TOKEN_HEADER: self.cluster_token} if self.cluster_token else {}
+        with self._lock:
+            peers = list(self._peers.items())
+        for peer, client in peers:
+            try:
+                client.session.post(f"{peer}{path}", json={'url': self.node}, headers=headers, timeout=2)
+            except requests.exceptions.RequestException as e:
+                logger.info(f"Could not announce {path} to {peer}: {str(e)}")
+
+    def join(self):
+        """Tell the configured peers this node is a member, so they add it to their rings."""
+        self._announce('/cluster/join')
+
+    def leave(self):
+        """Tell the peers this node is going away, so they rebalance before it stops answering."""
+        self._announce('/cluster/leave')
+
+    def authorized(self, token: Optional[str], peer: str) -> bool:
+        """
+        Whether a join/leave announcement for `peer` may change the ring: it carries the
+        cluster token or, with no token configured, names one of the configured peers.
+        """
+        if self.cluster_token:
+            return hmac.compare_digest(str(token or ''), self.cluster_token)
+        return normalize_node(peer) in self.configured
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='shard-router', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        self.join()
+        while not self._stop.wait(self.health_interval):
+            self.check_peers()
+
+    def stats(self) -> Dict[str, Any]:
+        ring = self.ring
+        with self._lock:
+            peers = {peer: {'in_ring': peer in ring, 'healthy': client.healthy,
+                            'last_error': client.last_error, 'p95_latency': client.latency.p95()}
+                     for peer, client in self._peers.items()}
+        with self._stats_lock:
+            return {
+                'node': self.node,
+                'enabled': self.enabled,
+                'members': ring.nodes,
+                'ring_share': ring.shares(),
+                'peers': peers,
+                'requests': self.requests,
+                'owned': self.owned,
+                'relayed': dict(self.relayed),
+                'received': self.received,
+                'relay_failures': self.relay_failures,
+                'rebalances': list(self.rebalances),
+            }
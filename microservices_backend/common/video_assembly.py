@@ -0,0 +1,209 @@
+"""
+Duration-fitting assembly of study videos into plan days.
+
+Given a pool of candidate videos (title and duration known) and the plan's
+days, each day gets a set of videos whose watch time fits its study budget
+(daily_hours):
+
+1. Whole videos are chosen by a 0/1 knapsack over the day's budget, solved by
+   dynamic programming at minute granularity, maximizing relevance-weighted
+   minutes (relevance: how much of the day's subtopic the title covers).
+2. Time left over is filled with the next unwatched segment of the most
+   relevant longer video. Segments continue where the previous day stopped,
+   so a long course is worked through across consecutive days.
+
+A video is assigned once, whole or segment by segment, so days do not repeat
+material. Days the pool cannot fill can be given one video found for their
+subtopic alone (`fill_empty_days`). Everything here is local; the Video
+Fetcher supplies the pool and the per-subtopic videos.
+"""
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from common.scheduler import label_subtopics
+from common.similarity_index import features
+
+# Knapsack items considered per day, most relevant first, to bound the DP
+MAX_ITEMS_PER_DAY = 40
+
+
+def sec_to_timestamp(seconds: int) -> str:
+    h, m, s = seconds // 3600, (seconds % 3600) // 60, seconds % 60
+    return f"{h:02d}:{m:02d}:{s:02d}"
+
+
+def video_features(video: Dict[str, Any]) -> Set[str]:
+    return features(f"{video.get('title', '')} {video.get('description', '')[:200]}")
+
+
+def relevance(names: Iterable[str], feats: Set[str], floor: float = 0.0) -> float:
+    """Share of the best-covered subtopic name's features found in the video text, at least `floor`."""
+    best = floor
+    for name in names:
+        wanted = features(name)
+        if wanted:
+            best = max(best, len(wanted & feats) / len(wanted))
+    return best
+
+
+def day_names(label: str) -> List[str]:
+    return label_subtopics(label) or [label]
+
+
+def weakly_covered(plan: Dict[str, str], candidates: List[Dict[str, Any]], threshold: float) -> List[str]:
+    """
+    Subtopic names no candidate covers to at least `threshold`, least covered first,
+    for targeted searches.
+    """
+    feats = [video_features(v) for v in candidates]
+    scores = {}
+    for label in plan.values():
+        for name in day_names(label):
+            if name not in scores:
+                scores[name] = max((relevance([name], f) for f in feats), default=0.0)
+    return [name for name, score in sorted(scores.items(), key=lambda item: item[1]) if score < threshold]
+
+
+def knapsack(items: List[Dict[str, Any]], capacity: int) -> List[Dict[str, Any]]:
+    """
+    0/1 knapsack over items with integer 'weight' and numeric 'value'; returns the chosen
+    items. O(len(items) * capacity).
+    """
+    if capacity <= 0 or not items:
+        return []
+    best = [0.0] * (capacity + 1)
+    keep = [[False] * (capacity + 1) for _ in items]
+    for i, item in enumerate(items):
+        weight, value = item['weight'], item['value']
+        for c in range(capacity, weight - 1, -1):
+            if best[c - weight] + value > best[c]:
+                best[c] = best[c - weight] + value
+                keep[i][c] = True
+    chosen, c = [], capacity
+    for i in range(len(items) - 1, -1, -1):
+        if keep[i][c]:
+            chosen.append(items[i])
+            c -= items[i]['weight']
+    return chosen[::-1]
+
+
+def assemble_plan(plan: Dict[str, str], candidates: List[Dict[str, Any]], budget_sec: int,
+                  min_relevance: float = 0.3, min_segment_sec: int = 300,
+                  min_video_sec: int = 120) -> Dict[str, Dict[str, Any]]:
+    """
+    Pick videos and segments for every day of a plan.
+
+    Args:
+        plan: date -> subtopic label, in date order
+        candidates: Videos with 'video_id', 'title', 'duration_sec' and optional
+            'description' and 'relevance_floor' (e.g. for results of the topic-wide search,
+            which are on topic even when their title names no subtopic)
+        budget_sec: Study time per day
+        min_relevance: Below this a video is not used for a day
+        min_segment_sec: Shortest leftover worth filling with a segment
+        min_video_sec: Shorter videos (clips, shorts) are ignored
+
+    Returns:
+        dict: date -> {'subtopic', 'youtube_link', 'timestamp', 'videos', 'watch_minutes',
+            'source'}; youtube_link/timestamp name the day's first video, for consumers of
+            the single-video format
+    """
+    pool = [v for v in candidates if (v.get('duration_sec') or 0) >= min_video_sec]
+    feats = {v['video_id']: video_features(v) for v in pool}
+    watched = {v['video_id']: 0 for v in pool}
+    result = {}
+
+    for date, label in plan.items():
+        names = day_names(label)
+        scored = []
+        for v in pool:
+            left = v['duration_sec'] - watched[v['video_id']]
+            score = relevance(names, feats[v['video_id']], v.get('relevance_floor', 0.0))
+            if left > 0 and score >= min_relevance:
+                scored.append((score, left, v))
+        scored.sort(key=lambda item: -item[0])
+
+        # Whole (remaining parts of) videos that fit the day, weighted by relevance
+        items = [{'weight': max(1, round(left / 60)), 'value': score * left / 60, 'left': left, 'video': v}
+                 for score, left, v in scored[:MAX_ITEMS_PER_DAY] if left <= budget_sec]
+        chosen = knapsack(items, budget_sec // 60)
+        picks = [(item['video'], item['left']) for item in chosen]
+
+        # Fill what is left with the next segment of the most relevant video still available
+        remaining = budget_sec - sum(left for _, left in picks)
+        if remaining >= min_segment_sec:
+            chosen_ids = {v['video_id'] for v, _ in picks}
+            for score, left, v in scored:
+                if v['video_id'] not in chosen_ids and left > remaining:
+                    picks.append((v, remaining))
+                    break
+
+        videos = []
+        for v, length in picks:
+            start = watched[v['video_id']]
+            watched[v['video_id']] = start + length
+            videos.append(video_entry(v, start, start + length))
+        result[date] = day_entry(label, videos, 'assembled')
+    return result
+
+
+def video_entry(video: Dict[str, Any], start: int, end: int) -> Dict[str, Any]:
+    """One video (or the start-end segment of it) of a day."""
+    return {
+        'video_id': video['video_id'],
+        'title': video.get('title'),
+        'link': f"https://youtube.com/watch?v={video['video_id']}",
+        'timestamp': ('00:00:00-full' if start == 0 and end >= video['duration_sec']
+                      else f"{sec_to_timestamp(start)}-{sec_to_timestamp(end)}"),
+        'seconds': end - start,
+    }
+
+
+def day_entry(label: str, videos: List[Dict[str, Any]], source: str) -> Dict[str, Any]:
+    return {
+        'subtopic': label,
+        'youtube_link': videos[0]['link'] if videos else None,
+        'timestamp': videos[0]['timestamp'] if videos else None,
+        'videos': videos,
+        'watch_minutes': round(sum(v['seconds'] for v in videos) / 60, 1),
+        'source': source if videos else None,
+    }
+
+
+def fill_empty_days(assembled: Dict[str, Dict[str, Any]], videos: Dict[str, Dict[str, Any]],
+                    budget_sec: int) -> int:
+    """
+    Give each day the assembly left without videos the video found for it alone, up to
+    the day's budget. Days sharing a video (the parts of a split subtopic) continue it
+    where the previous one stopped.
+
+    Args:
+        assembled: Output of `assemble_plan`, updated in place
+        videos: date -> video with 'video_id', 'title' and 'duration_sec', for empty days
+            a per-subtopic search found one for
+        budget_sec: Study time per day
+
+    Returns:
+        int: Number of days filled
+    """
+    watched: Dict[str, int] = {}
+    filled = 0
+    for date, day in assembled.items():
+        video = videos.get(date)
+        if day['videos'] or not video or not video.get('duration_sec'):
+            continue
+        start = watched.get(video['video_id'], 0)
+        if start >= video['duration_sec']:
+            continue
+        end = min(video['duration_sec'], start + budget_sec)
+        watched[video['video_id']] = end
+        assembled[date] = day_entry(day['subtopic'], [video_entry(video, start, end)], 'individual_video')
+        filled += 1
+    return filled
+
+
+def fill_ratio(assembled: Dict[str, Dict[str, Any]], budget_sec: int) -> Optional[float]:
+    """Average share of the daily budget covered by the assembled videos."""
+    if not assembled or budget_sec <= 0:
+        return None
+    return round(sum(min(1.0, day['watch_minutes'] * 60 / budget_sec) for day in assembled.values())
+                 / len(assembled), 3)
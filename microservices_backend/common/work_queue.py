@@ -0,0 +1,408 @@
+"""
+Event-driven work distribution for plan generation.
+
+The MCP server publishes one task per plan day to a topic, keyed (and so
+partitioned) by plan id. Worker consumer groups in the video fetcher, quiz
+generator and MCP notes workers process tasks and publish results back to
+PLAN_RESULTS, and a PlanDispatcher chains each day through the
+video -> notes -> quiz stages. Adding worker processes to a group spreads
+the partitions across them.
+
+Two broker backends share one interface: KafkaBroker for deployments and
+InMemoryBroker for tests and single-process runs without a Kafka cluster.
+
+Tasks are persisted by the broker, so they never carry caller credentials:
+workers call the LLM with their own service's keys.
+"""
+import json
+import logging
+import re
+import threading
+import time
+import uuid
+import zlib
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from . import config
+from .tenancy import current_priority, current_tenant, priority_scope, tenant_scope
+
+logger = logging.getLogger(__name__)
+
+VIDEO_TASKS = 'plan.video.tasks'
+NOTES_TASKS = 'plan.notes.tasks'
+QUIZ_TASKS = 'plan.quiz.tasks'
+PLAN_RESULTS = 'plan.results'
+
+# Stage order for one plan day
+STAGES = [('video', VIDEO_TASKS), ('notes', NOTES_TASKS), ('quiz', QUIZ_TASKS)]
+
+# Request fields that must not be published in a task
+SECRET_FIELDS = ('api_key',)
+
+
+class InMemoryConsumer:
+    def __init__(self, broker: 'InMemoryBroker', group_id: str, topics: List[str]):
+        self.broker = broker
+        self.group_id = group_id
+        self.topics = topics
+        self.member_id = uuid.uuid4().hex
+
+    def poll(self, timeout: float = 1.0) -> Optional[Tuple[str, Dict[str, Any]]]:
+        return self.broker._poll(self, timeout)
+
+    def wait_assigned(self, timeout: Optional[float] = None) -> bool:
+        """Partitions are assigned when the consumer joins, so there is nothing to wait for."""
+        return True
+
+    def close(self):
+        self.broker._leave(self)
+
+
+class InMemoryBroker:
+    def __init__(self, num_partitions: int = 8, retention: int = 10000):
+        """
+        Thread-safe, single-process stand-in for Kafka with keyed partitions and consumer groups.
+
+        Partitions of each topic are spread round-robin across the live members of a
+        group, and each group keeps its own offsets, like Kafka's group coordinator.
+        Messages every subscribed group has consumed are dropped, and a partition never
+        holds more than `retention` messages, so a group that stopped reading cannot
+        hold on to everything published after it.
+
+        Args:
+            num_partitions: Partitions per topic
+            retention: Most messages kept per partition
+        """
+        self.num_partitions = num_partitions
+        self.retention = retention
+        self._partitions: Dict[str, List[List[Tuple[str, Dict[str, Any]]]]] = {}
+        # Offset of the first message still held, per (topic, partition); offsets are absolute
+        self._base: Dict[Tuple[str, int], int] = {}
+        self._offsets: Dict[Tuple[str, str, int], int] = {}
+        self._groups: Dict[str, set] = {}
+        self._members: Dict[str, List[str]] = {}
+        self._cond = threading.Condition()
+
+    def _topic(self, topic: str):
+        if topic not in self._partitions:
+            self._partitions[topic] = [[] for _ in range(self.num_partitions)]
+        return self._partitions[topic]
+
+    def _end(self, topic: str, partition: int) -> int:
+        return self._base.get((topic, partition), 0) + len(self._topic(topic)[partition])
+
+    def _trim(self, topic: str, partition: int):
+        """Drop messages every group subscribed to `topic` has read, and any beyond the retention."""
+        base, end = self._base.get((topic, partition), 0), self._end(topic, partition)
+        groups = self._groups.get(topic, ())
+        consumed = min((self._offsets.get((group, topic, partition), base) for group in groups), default=base)
+        new_base = min(end, max(consumed, end - self.retention))
+        if new_base > base:
+            del self._topic(topic)[partition][:new_base - base]
+            self._base[(topic, partition)] = new_base
+
+    def publish(self, topic: str, key: str, value: Dict[str, Any]):
+        partition = zlib.crc32(key.encode('utf-8')) % self.num_partitions
+        with self._cond:
+            self._topic(topic)[partition].append((key, value))
+            if len(self._topic(topic)[partition]) > self.retention:
+                self._trim(topic, partition)
+            self._cond.notify_all()
+
+    def flush(self):
+        pass
+
+    def subscribe(self, group_id: str, topics: List[str], from_latest: bool = False) -> InMemoryConsumer:
+        """
+        Join `group_id`. A group reading for the first time starts at the oldest message
+        still held, or with `from_latest` at the end of each partition.
+        """
+        consumer = InMemoryConsumer(self, group_id, topics)
+        with self._cond:
+            self._members.setdefault(group_id, []).append(consumer.member_id)
+            for topic in topics:
+                self._groups.setdefault(topic, set()).add(group_id)
+                for partition in range(self.num_partitions):
+                    offset_key = (group_id, topic, partition)
+                    if offset_key not in self._offsets:
+                        self._offsets[offset_key] = (self._end(topic, partition) if from_latest
+                                                     else self._base.get((topic, partition), 0))
+        return consumer
+
+    def _leave(self, consumer: InMemoryConsumer):
+        with self._cond:
+            members = self._members.get(consumer.group_id, [])
+            if consumer.member_id in members:
+                members.remove(consumer.member_id)
+
+    def _poll(self, consumer: InMemoryConsumer, timeout: float):
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                members = self._members.get(consumer.group_id, [])
+                if consumer.member_id in members:
+                    index, count = members.index(consumer.member_id), len(members)
+                    for topic in consumer.topics:
+                        for partition, messages in enumerate(self._topic(topic)):
+                            if partition % count != index:
+                                continue
+                            offset_key = (consumer.group_id, topic, partition)
+                            base = self._base.get((topic, partition), 0)
+                            # Messages dropped by the retention limit are skipped
+                            offset = max(self._offsets.get(offset_key, base), base)
+                            if offset - base < len(messages):
+                                message = messages[offset - base]
+                                self._offsets[offset_key] = offset + 1
+                                self._trim(topic, partition)
+                                return message
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {topic: sum(len(messages) for messages in partitions)
+                    for topic, partitions in self._partitions.items()}
+
+
+class KafkaConsumerAdapter:
+    def __init__(self, group_id: str, topics: List[str], from_latest: bool = False):
+        """
+        Kafka consumer in `group_id`. Partitions are assigned lazily, once polling has
+        joined the group; `wait_assigned` blocks until then.
+        """
+        from .kafka_utils import get_kafka_consumer
+        self.from_latest = from_latest
+        self._assigned = threading.Event()
+        self.consumer = get_kafka_consumer(group_id, topics, offset_reset='latest' if from_latest else 'earliest',
+                                           on_assign=self._on_assign)
+
+    def _on_assign(self, consumer, partitions):
+        if self.from_latest:
+            # Pin partitions the group has no offset for to their end now rather than when fetching
+            # starts, so nothing published once the assignment is reported can be skipped
+            for partition, committed in zip(partitions, consumer.committed(partitions, timeout=10)):
+                if committed.offset < 0:
+                    partition.offset = consumer.get_watermark_offsets(partition, timeout=10)[1]
+            consumer.assign(partitions)
+        self._assigned.set()
+
+    def wait_assigned(self, timeout: Optional[float] = None) -> bool:
+        """Block until the group has assigned this consumer its partitions. False on timeout."""
+        return self._assigned.wait(timeout)
+
+    def poll(self, timeout: float = 1.0) -> Optional[Tuple[str, Dict[str, Any]]]:
+        msg = self.consumer.poll(timeout)
+        if msg is None:
+            return None
+        if msg.error():
+            logger.error(f"Kafka consumer error: {msg.error()}")
+            return None
+        key = msg.key().decode('utf-8') if msg.key() else ''
+        return key, json.loads(msg.value())
+
+    def close(self):
+        self.consumer.close()
+
+
+class KafkaBroker:
+    def __init__(self):
+        """Broker backed by the Kafka cluster at config.KAFKA_BOOTSTRAP_SERVERS."""
+        from .kafka_utils import get_kafka_producer
+        self.producer = get_kafka_producer()
+
+    def publish(self, topic: str, key: str, value: Dict[str, Any]):
+        self.producer.produce(topic, key=key.encode('utf-8'), value=json.dumps(value).encode('utf-8'))
+        self.producer.poll(0)
+
+    def flush(self):
+        self.producer.flush()
+
+    def subscribe(self, group_id: str, topics: List[str], from_latest: bool = False) -> KafkaConsumerAdapter:
+        return KafkaConsumerAdapter(group_id, topics, from_latest=from_latest)
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    """Process-wide broker for config.BROKER_BACKEND ('kafka' or 'memory')."""
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            if config.BROKER_BACKEND == 'memory':
+                _broker = InMemoryBroker(config.BROKER_PARTITIONS)
+            else:
+                _broker = KafkaBroker()
+        return _broker
+
+
+def run_worker(broker, group_id: str, topic: str, handler: Callable[[Dict[str, Any]], Dict[str, Any]],
+               stop: threading.Event, result_topic: str = PLAN_RESULTS):
+    """
+    Consume tasks from `topic` as a member of `group_id` until `stop` is set.
+
+    The handler's return value (or its error) is published to `result_topic`
+    under the same key, together with the original task.
+    """
+    consumer = broker.subscribe(group_id, [topic])
+    try:
+        while not stop.is_set():
+            message = consumer.poll(1.0)
+            if message is None:
+                continue
+            key, task = message
+            try:
+                with tenant_scope(task.get('tenant')), priority_scope(task.get('priority')):
+                    result, error = handler(task), None
+            except Exception as e:
+                logger.exception(f"Worker {group_id} failed task for plan {task.get('plan_id')}")
+                result, error = None, str(e)
+            broker.publish(result_topic, key, {
+                'plan_id': task.get('plan_id'),
+                'date': task.get('date'),
+                'stage': task.get('stage'),
+                'task': task,
+                'result': result,
+                'error': error,
+            })
+    finally:
+        consumer.close()
+
+
+def start_workers(group_id: str, topic: str, handler: Callable[[Dict[str, Any]], Dict[str, Any]],
+                  count: Optional[int] = None, broker=None) -> threading.Event:
+    """Start `count` daemon worker threads in one consumer group. Returns an event that stops them."""
+    broker = broker or get_broker()
+    stop = threading.Event()
+    for i in range(count or config.WORKER_THREADS):
+        threading.Thread(
+            target=run_worker, args=(broker, group_id, topic, handler, stop),
+            name=f'{group_id}-{i}', daemon=True
+        ).start()
+    return stop
+
+
+class PlanDispatcher:
+    def __init__(self, broker=None, node_id: Optional[str] = None):
+        """
+        Fan a plan out as per-day tasks and collect the results.
+
+        Every MCP node reads PLAN_RESULTS in its own consumer group, named after the node
+        (`node_id`, by default derived from MCP_NODE_URL) so a restart rejoins the same group
+        instead of leaving an orphaned one behind. A new group starts at the newest result
+        (earlier ones belong to plans no one on this node waits for). Only results for plans
+        the node is waiting on are kept, so several nodes can share one cluster.
+        """
+        self.broker = broker or get_broker()
+        self.node_id = node_id or re.sub(r'[^A-Za-z0-9]+', '-', config.MCP_NODE_URL).strip('-')
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._consumer = None
+
+    def start(self, timeout: Optional[float] = None) -> bool:
+        """
+        Start reading results and wait, up to `timeout` (default BROKER_ASSIGN_TIMEOUT), until
+        the results partitions are assigned: results published before that could be skipped.
+
+        Returns:
+            bool: True once the partitions are assigned
+        """
+        with self._lock:
+            if not (self._thread and self._thread.is_alive()):
+                self._consumer = self.broker.subscribe(f'mcp-results-{self.node_id}', [PLAN_RESULTS],
+                                                       from_latest=True)
+                self._thread = threading.Thread(target=self._consume_results, args=(self._consumer,),
+                                                name='plan-results', daemon=True)
+                self._thread.start()
+            consumer = self._consumer
+        return consumer.wait_assigned(config.BROKER_ASSIGN_TIMEOUT if timeout is None else timeout)
+
+    def stop(self):
+        self._stop.set()
+
+    def run_plan(self, plan_id: str, plan: Dict[str, str], context: Dict[str, Any],
+                 timeout: float, on_day: Optional[Callable[[str, Dict[str, Any]], None]] = None
+                 ) -> Dict[str, Dict[str, Any]]:
+        """
+        Publish a video task for every day and block until all days finish the quiz
+        stage or `timeout` expires. Days that did not finish keep whatever stages
+        completed; callers fill in fallbacks. SECRET_FIELDS of `context` are not published.
+
+        `on_day(date, day)` is called from the results thread as each day finishes
+        its last stage, e.g. to checkpoint it.
+
+        Returns:
+            dict: date -> {'subtopic', 'youtube_link', 'timestamp', 'notes', 'quizzes', 'assignments'}
+        """
+        # Nothing is dispatched until this node is sure to receive the results
+        started = time.monotonic()
+        if not self.start(timeout):
+            logger.warning(f"Plan {plan_id}: results partitions not assigned after {timeout:.0f}s; not dispatching")
+            return {date: {'subtopic': subtopic} for date, subtopic in plan.items()}
+        done = threading.Event()
+        days = {date: {'subtopic': subtopic} for date, subtopic in plan.items()}
+        with self._lock:
+            self._pending[plan_id] = {'days': days, 'remaining': set(days), 'done': done, 'on_day': on_day}
+        if not days:
+            done.set()
+        # Later stages copy the task, so the tenant and priority travel with every stage
+        context = {**{k: v for k, v in context.items() if k not in SECRET_FIELDS},
+                   'tenant': current_tenant(), 'priority': current_priority()}
+        for date, subtopic in plan.items():
+            self._publish_stage(0, plan_id, date, {**context, 'subtopic': subtopic})
+        self.broker.flush()
+
+        done.wait(max(0.0, timeout - (time.monotonic() - started)))
+        with self._lock:
+            state = self._pending.pop(plan_id, None)
+        if state and state['remaining']:
+            logger.warning(f"Plan {plan_id}: {len(state['remaining'])} day(s) did not finish in time")
+        return days
+
+    def _publish_stage(self, index: int, plan_id: str, date: str, payload: Dict[str, Any]):
+        stage, topic = STAGES[index]
+        self.broker.publish(topic, plan_id, {**payload, 'plan_id': plan_id, 'date': date, 'stage': stage})
+
+    def _consume_results(self, consumer):
+        try:
+            while not self._stop.is_set():
+                message = consumer.poll(1.0)
+                if message is not None:
+                    self._handle_result(message[1])
+        finally:
+            consumer.close()
+
+    def _handle_result(self, message: Dict[str, Any]):
+        plan_id, date, stage = message.get('plan_id'), message.get('date'), message.get('stage')
+        with self._lock:
+            state = self._pending.get(plan_id)
+            if state is None or date not in state['days']:
+                return
+            if message.get('error'):
+                logger.warning(f"Plan {plan_id} {date}: {stage} stage failed: {message['error']}")
+            day = state['days'][date]
+            day.update(message.get('result') or {})
+
+        # Carry the day forward to the next stage even if this one failed
+        index = [name for name, _ in STAGES].index(stage)
+        if index + 1 < len(STAGES):
+            task = {k: v for k, v in message.get('task', {}).items() if k not in ('plan_id', 'date', 'stage')}
+            self._publish_stage(index + 1, plan_id, date, {**task, **(message.get('result') or {})})
+            self.broker.flush()
+            return
+
+        with self._lock:
+            finished = date in state['remaining']
+            state['remaining'].discard(date)
+            if not state['remaining']:
+                state['done'].set()
+        if finished and state['on_day'] is not None:
+            try:
+                state['on_day'](date, dict(day))
+            except Exception as e:
+                logger.warning(f"Plan {plan_id} {date}: on_day callback failed: {str(e)}")
@@ -0,0 +1,380 @@
+"""
+Write-behind persistence for one MongoDB collection.
+
+Requests hand their inserts and updates to a bounded in-memory queue and
+return without waiting for the database. A background thread flushes the
+queue in ordered `bulk_write` batches. When MongoDB is slow or unreachable,
+or the queue is full, operations are appended to a local spool file
+(JSON lines, fsynced) instead of being dropped. The spool is replayed, in
+order, once MongoDB answers again, including after a process restart.
+Writes a reader must see before the request answers can be made with
+`sync=True`, which writes them directly once everything queued before them
+has been written. Alternatively operations can be tagged with `keys` (e.g.
+the ids of the document they write); `pending(key)` is True until every
+operation tagged with it has been written, so a reader can tell "not written
+yet" from "does not exist".
+
+Spooled operations survive a crash; operations still in the in-memory queue
+are spooled at interpreter exit but are lost if the process is killed.
+Operations MongoDB rejects (other than duplicate replays) are moved to a
+dead-letter file next to the spool for inspection.
+
+Replays must be safe to repeat, so inserts carry a client-side `_id`
+(a replayed insert that already landed is a duplicate key and is skipped)
+and updates should be idempotent (`$set`/`$unset`).
+"""
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from bson import ObjectId, json_util
+from pymongo import InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError, PyMongoError
+
+logger = logging.getLogger(__name__)
+
+DUPLICATE_KEY = 11000
+
+
+def _to_request(op: Dict[str, Any]):
+    if op['op'] == 'insert':
+        return InsertOne(op['doc'])
+    return UpdateOne(op['filter'], op['update'], upsert=op.get('upsert', False))
+
+
+class WriteBehindBuffer:
+    def __init__(self, name: str, connect: Callable[[], Any], spool_path: str,
+                 max_queue: int = 1000, batch_size: int = 100, flush_interval: float = 0.5,
+                 retry_interval: float = 5.0, sync_timeout: float = 5.0):
+        """
+        Args:
+            name: Collection name, for logs and stats
+            connect: Returns the Mongo collection; raises PyMongoError when unreachable.
+                Called again after failures, so MongoDB may come up after the service.
+            spool_path: Local file that holds operations while MongoDB is unavailable
+            max_queue: Operations held in memory before new ones go straight to the spool
+            batch_size: Operations per bulk_write
+            flush_interval: Longest an operation waits in memory before a flush
+            retry_interval: Seconds between reconnect attempts while MongoDB is down
+            sync_timeout: Longest a `sync=True` write waits for the operations queued
+                before it; after that it is queued behind them instead
+        """
+        self.name = name
+        self.connect = connect
+        self.spool_path = spool_path
+        self.dead_letter_path = spool_path + '.dead'
+        self.sync_timeout = sync_timeout
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retry_interval = retry_interval
+        self._queue: 'queue.Queue[Dict[str, Any]]' = queue.Queue(maxsize=max_queue)
+        self._collection = None
+        self._retry_at = 0.0
+        self._spool_lock = threading.Lock()
+        self._replay_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._atexit_registered = False
+        self._stop = threading.Event()
+        # Tag -> operations carrying it that are queued or spooled
+        self._pending: Dict[str, int] = {}
+        self._pending_lock = threading.Lock()
+        self.written = 0
+        self.batches = 0
+        self.spooled = 0
+        self.replayed = 0
+        self.skipped_duplicates = 0
+        self.failed = 0
+        self.last_error: Optional[str] = None
+        os.makedirs(os.path.dirname(os.path.abspath(spool_path)), exist_ok=True)
+        # Spooled operations from before a restart are still pending
+        for path in (spool_path + '.replaying', spool_path):
+            if os.path.exists(path):
+                with open(path, 'r', encoding='utf-8') as f:
+                    self._track([json_util.loads(line) for line in f if line.strip()], 1)
+
+    # --- Producer side -------------------------------------------------------
+
+    def insert(self, doc: Dict[str, Any], sync: bool = False, keys: Iterable[str] = ()) -> ObjectId:
+        """
+        Queue an insert; the document gets its `_id` now, so it is returned immediately.
+        With `sync`, write it before returning if MongoDB is reachable. `keys` are
+        reported by `pending` until it is written.
+        """
+        doc.setdefault('_id', ObjectId())
+        self._submit({'op': 'insert', 'doc': doc}, sync, keys)
+        return doc['_id']
+
+    def update(self, filter: Dict[str, Any], update: Dict[str, Any], upsert: bool = False,
+               sync: bool = False, keys: Iterable[str] = ()) -> bool:
+        """
+        Queue an update. Updates of one document are applied in submission order.
+
+        Args:
+            sync: Write it before returning, after everything queued before it
+            keys: Tags reported by `pending` until the update is written
+
+        Returns:
+            bool: True if the update was written to MongoDB before returning
+        """
+        return self._submit({'op': 'update', 'filter': filter, 'update': update, 'upsert': upsert}, sync, keys)
+
+    def pending(self, key: str) -> bool:
+        """True while an operation tagged with `key` is queued or spooled."""
+        with self._pending_lock:
+            return key in self._pending
+
+    def _track(self, ops: List[Dict[str, Any]], delta: int):
+        with self._pending_lock:
+            for op in ops:
+                for key in op.get('keys') or ():
+                    count = self._pending.get(key, 0) + delta
+                    if count > 0:
+                        self._pending[key] = count
+                    else:
+                        self._pending.pop(key, None)
+
+    def _submit(self, op: Dict[str, Any], sync: bool = False, keys: Iterable[str] = ()) -> bool:
+        self.start()
+        keys = [str(key) for key in keys if key]
+        if keys:
+            op['keys'] = keys
+            self._track([op], 1)
+        if sync and self._write_through(op):
+            return True
+        # Once anything is spooled, later operations follow it so the order is kept
+        if os.path.exists(self.spool_path):
+            self._spool([op])
+            return False
+        try:
+            self._queue.put_nowait(op)
+        except queue.Full:
+            self._spool([op])
+        return False
+
+    def _write_through(self, op: Dict[str, Any]) -> bool:
+        """Write one operation directly once the queue has drained. False if it has to be queued instead."""
+        if not self.drain(self.sync_timeout) or self.pending_spool():
+            return False
+        collection = self._get_collection()
+        return collection is not None and self._write(collection, [op])
+
+    def drain(self, timeout: Optional[float] = None) -> bool:
+        """Wait until every queued operation has been written or spooled. False on timeout."""
+        end = time.monotonic() + (timeout if timeout is not None else self.sync_timeout)
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = end - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._queue.all_tasks_done.wait(remaining)
+        return True
+
+    # --- Spool ---------------------------------------------------------------
+
+    def _spool(self, ops: List[Dict[str, Any]]):
+        """Append operations to the spool file durably."""
+        if not ops:
+            return
+        with self._spool_lock:
+            with open(self.spool_path, 'a', encoding='utf-8') as f:
+                for op in ops:
+                    f.write(json_util.dumps(op) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+        with self._stats_lock:
+            self.spooled += len(ops)
+
+    def _dead_letter(self, op: Dict[str, Any], error: Optional[str]):
+        """Keep an operation MongoDB rejected, with the reason, instead of dropping it."""
+        with self._spool_lock:
+            with open(self.dead_letter_path, 'a', encoding='utf-8') as f:
+                f.write(json_util.dumps({'op': op, 'error': error, 'at': datetime.now().isoformat()}) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+
+    def _replay_spool(self, collection) -> bool:
+        """Write the spooled operations to MongoDB. Returns False if MongoDB failed midway."""
+        # One replay at a time: a sync write and the flusher may both find the spool pending
+        with self._replay_lock:
+            return self._replay(collection)
+
+    def _replay(self, collection) -> bool:
+        replay_path = self.spool_path + '.replaying'
+        with self._spool_lock:
+            # A crash during an earlier replay leaves a .replaying file; finish it first
+            if not os.path.exists(replay_path):
+                if not os.path.exists(self.spool_path):
+                    return True
+                os.replace(self.spool_path, replay_path)
+        with open(replay_path, 'r', encoding='utf-8') as f:
+            ops = [json_util.loads(line) for line in f if line.strip()]
+        for start in range(0, len(ops), self.batch_size):
+            batch = ops[start:start + self.batch_size]
+            if not self._write(collection, batch):
+                # Keep what is left for the next attempt, ahead of anything spooled since
+                with self._spool_lock:
+                    newer = []
+                    if os.path.exists(self.spool_path):
+                        with open(self.spool_path, 'r', encoding='utf-8') as f:
+                            newer = [line for line in f if line.strip()]
+                    with open(self.spool_path + '.tmp', 'w', encoding='utf-8') as f:
+                        for op in ops[start:]:
+                            f.write(json_util.dumps(op) + '\n')
+                        f.writelines(newer)
+                        f.flush()
+                        os.fsync(f.fileno())
+                    os.replace(self.spool_path + '.tmp', self.spool_path)
+                    os.remove(replay_path)
+                return False
+            with self._stats_lock:
+                self.replayed += len(batch)
+        os.remove(replay_path)
+        logger.info(f"{self.name}: replayed {len(ops)} spooled write(s)")
+        return True
+
+    def pending_spool(self) -> bool:
+        return os.path.exists(self.spool_path) or os.path.exists(self.spool_path + '.replaying')
+
+    # --- Flushing ------------------------------------------------------------
+
+    def _get_collection(self):
+        if self._collection is None and time.monotonic() >= self._retry_at:
+            try:
+                self._collection = self.connect()
+            except PyMongoError as e:
+                self._mark_down(e)
+        return self._collection
+
+    def _mark_down(self, error: Exception):
+        self._collection = None
+        self._retry_at = time.monotonic() + self.retry_interval
+        self.last_error = str(error)
+        logger.warning(f"{self.name}: MongoDB unavailable, spooling writes: {str(error)}")
+
+    def _write(self, collection, ops: List[Dict[str, Any]]) -> bool:
+        """
+        Ordered bulk write of `ops`. Duplicate inserts (replays of writes that already
+        landed) are skipped and other rejected operations go to the dead-letter file;
+        connection failures return False and the caller spools `ops`.
+        """
+        submitted = ops
+        while ops:
+            try:
+                result = collection.bulk_write([_to_request(op) for op in ops], ordered=True)
+                with self._stats_lock:
+                    self.written += result.inserted_count + result.modified_count + result.upserted_count
+                    self.batches += 1
+                self._track(submitted, -1)
+                return True
+            except BulkWriteError as e:
+                error = e.details['writeErrors'][0]
+                index = error['index']
+                with self._stats_lock:
+                    self.written += index
+                    if error.get('code') == DUPLICATE_KEY:
+                        self.skipped_duplicates += 1
+                    else:
+                        self.failed += 1
+                        self.last_error = error.get('errmsg')
+                if error.get('code') != DUPLICATE_KEY:
+                    self._dead_letter(ops[index], error.get('errmsg'))
+                    logger.error(f"{self.name}: MongoDB rejected a write, moved to {self.dead_letter_path}: "
+                                 f"{error.get('errmsg')}")
+                # Everything before the failed operation was applied; continue after it
+                ops = ops[index + 1:]
+            except PyMongoError as e:
+                self._mark_down(e)
+                return False
+        self._track(submitted, -1)
+        return True
+
+    def flush(self, timeout: Optional[float] = None) -> int:
+        """
+        Write everything queued (and the spool, if MongoDB is up) now. Operations that
+        cannot be written go to the spool. Returns the number of operations taken from
+        the queue.
+        """
+        ops = []
+        deadline = time.monotonic() + (timeout if timeout is not None else self.flush_interval)
+        while len(ops) < self.batch_size:
+            try:
+                wait = max(0.0, deadline - time.monotonic()) if not ops else 0
+                ops.append(self._queue.get(timeout=wait) if wait else self._queue.get_nowait())
+            except queue.Empty:
+                break
+
+        try:
+            collection = self._get_collection()
+            if collection is not None and self.pending_spool():
+                if not self._replay_spool(collection):
+                    collection = None
+            written = bool(ops) and collection is not None and self._write(collection, ops)
+        except Exception:
+            # Operations already taken off the queue go to the spool rather than being dropped
+            self._spool(ops)
+            self._done(ops)
+            raise
+        if ops and not written:
+            self._spool(ops)
+        self._done(ops)
+        return len(ops)
+
+    def _done(self, ops: List[Dict[str, Any]]):
+        for _ in ops:
+            self._queue.task_done()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.flush()
+            except Exception:
+                logger.exception(f"{self.name}: write-behind flush failed")
+                time.sleep(self.flush_interval)
+
+    def start(self):
+        with self._start_lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name=f'write-behind-{self.name}', daemon=True)
+            self._thread.start()
+            if not self._atexit_registered:
+                atexit.register(self.close)
+                self._atexit_registered = True
+
+    def close(self):
+        """Stop the flusher and spool whatever is still in memory."""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+        remaining = []
+        while True:
+            try:
+                remaining.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        self._spool(remaining)
+        self._done(remaining)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            return {
+                'mongodb_up': self._collection is not None,
+                'queued': self._queue.qsize(),
+                'spool_pending': self.pending_spool(),
+                'written': self.written,
+                'batches': self.batches,
+                'spooled': self.spooled,
+                'replayed': self.replayed,
+                'skipped_duplicates': self.skipped_duplicates,
+                'failed': self.failed,
+                'dead_letter_pending': os.path.exists(self.dead_letter_path),
+                'last_error': self.last_error,
+            }
@@ -0,0 +1,183 @@
+"""
+Bulk offline catalog generation.
+
+Reads a CSV or JSONL of (topic, days, daily_hours[, start_date]) rows and runs
+the MCP plan pipeline in-process for each row, with bounded parallelism and a
+plans-per-minute rate budget. Finished plans are written to `learning_paths`
+with unordered bulk writes. A checkpoint file records every row that has been
+written, by content, so an interrupted (Ctrl-C) or edited and reordered catalog
+resumes without regenerating finished rows.
+
+Usage:
+    PYTHONPATH=. python generate_catalog.py catalog.csv --parallelism 4 --rate-per-minute 20
+"""
+import argparse
+import hashlib
+import json
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+
+import pandas as pd
+from pymongo import InsertOne
+
+from common import config
+from common.deadline import deadline_scope
+from common.plan_codec import encode_document
+from common.rate_limit import RateLimiter
+from common.tenancy import priority_scope
+
+COLUMN_ALIASES = {
+    'topic_name': 'topic',
+    'no_of_days': 'days',
+    'hours': 'daily_hours',
+}
+
+
+def load_rows(path):
+    """Read catalog rows from CSV or JSONL into a list of dicts with topic, days, daily_hours, start_date."""
+    if path.endswith('.jsonl') or path.endswith('.json'):
+        frame = pd.read_json(path, lines=True)
+    else:
+        frame = pd.read_csv(path)
+    frame = frame.rename(columns=COLUMN_ALIASES)
+    missing = {'topic', 'days', 'daily_hours'} - set(frame.columns)
+    if missing:
+        raise ValueError(f"Catalog is missing columns: {', '.join(sorted(missing))}")
+    if 'start_date' not in frame.columns:
+        frame['start_date'] = datetime.now().strftime('%Y-%m-%d')
+    frame['start_date'] = frame['start_date'].fillna(datetime.now().strftime('%Y-%m-%d')).astype(str)
+    frame['days'] = frame['days'].astype(int)
+    frame['daily_hours'] = frame['daily_hours'].astype(float)
+    return frame[['topic', 'days', 'daily_hours', 'start_date']].to_dict('records')
+
+
+def row_key(row):
+    """Stable identity of a catalog row: a hash of its content, wherever it sits in the file."""
+    content = f"{row['topic']}|{row['days']}|{row['daily_hours']}|{row['start_date']}"
+    return hashlib.sha1(content.encode('utf-8')).hexdigest()[:12]
+
+
+def load_checkpoint(path):
+    if not os.path.exists(path):
+        return set()
+    done = set()
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                # Older checkpoints prefixed the key with the row's position
+                done.add(json.loads(line)['key'].rsplit(':', 1)[-1])
+    return done
+
+
+def append_checkpoint(path, keys):
+    with open(path, 'a', encoding='utf-8') as f:
+        for key in keys:
+            f.write(json.dumps({'key': key, 'at': datetime.now().isoformat()}) + '\n')
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def generate_row(mcp, row, limiter, api_key=None):
+    """Run the full MCP pipeline for one row and return the learning path document."""
+    limiter.acquire()
+    # Background priority: catalog runs queue behind live requests for LLM and YouTube slots
+    with deadline_scope(mcp.plan_deadline(row['days']), max_retries=config.PLAN_RETRY_BUDGET), \
+            priority_scope('background'):
+        plan, hours = mcp.build_plan(row['topic'], row['days'], row['start_date'], row['daily_hours'],
+                                     api_key=api_key)
+        plan_with_videos = mcp.fetch_plan_videos(row['topic'], plan, row['daily_hours'], row['days'])
+        enriched_plan = mcp.enrich_plan(plan_with_videos, topic_name=row['topic'])
+        enriched_plan = {date: mcp.with_hours(entry, hours.get(date)) for date, entry in enriched_plan.items()}
+    doc = mcp.plan_document(str(uuid.uuid4())[:8], row['topic'], row['days'], row['start_date'],
+                            row['daily_hours'], enriched_plan)
+    doc['source'] = 'catalog'
+    doc['created_at'] = doc['updated_at'] = datetime.now().isoformat()
+    return doc
+
+
+def flush(collection, batch, checkpoint_path):
+    """Bulk-insert a batch of (key, doc) pairs, then checkpoint the rows that were written."""
+    if not batch:
+        return 0
+    collection.bulk_write([InsertOne(encode_document(doc)) for _, doc in batch], ordered=False)
+    append_checkpoint(checkpoint_path, [key for key, _ in batch])
+    return len(batch)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate learning paths for a catalog of topics")
+    parser.add_argument('catalog', help="CSV or JSONL with topic, days, daily_hours[, start_date]")
+    parser.add_argument('--parallelism', type=int, default=4, help="Rows generated concurrently")
+    parser.add_argument('--rate-per-minute', type=float, default=30, help="Max plans started per minute (0 = unlimited)")
+    parser.add_argument('--batch-size', type=int, default=20, help="Documents per Mongo bulk write")
+    parser.add_argument('--checkpoint', help="Checkpoint file (default: <catalog>.checkpoint.jsonl)")
+    parser.add_argument('--api-key', default=os.getenv('GEMINI_API_KEY'), help="LLM API key for plan generation")
+    args = parser.parse_args()
+
+    # Imported here so --help works without a MongoDB connection
+    import mcp_server.app as mcp
+    mcp.LIVE_DISPLAY = False
+    if mcp.learning_paths_collection is None:
+        raise SystemExit("MongoDB is not reachable; nothing would be saved")
+
+    checkpoint_path = args.checkpoint or f"{args.catalog}.checkpoint.jsonl"
+    rows = load_rows(args.catalog)
+    done = load_checkpoint(checkpoint_path)
+    # Identical rows describe the same plan; it is generated once
+    pending = {}
+    for row in rows:
+        key = row_key(row)
+        if key not in done:
+            pending.setdefault(key, row)
+    print(f"{len(rows)} rows, {len(rows) - len(pending)} already done or duplicates, {len(pending)} to generate")
+
+    limiter = RateLimiter(args.rate_per_minute)
+    batch, written, failed = [], 0, 0
+    started = time.time()
+
+    def collect(futures, future):
+        nonlocal batch, written, failed
+        key, row = futures[future]
+        try:
+            batch.append((key, future.result()))
+        except Exception as e:
+            failed += 1
+            print(f"✗ {row['topic']} ({row['days']} days): {str(e)}")
+            return
+        if len(batch) >= args.batch_size:
+            written += flush(mcp.learning_paths_collection, batch, checkpoint_path)
+            batch = []
+            print(f"… {written}/{len(pending)} written")
+
+    executor = ThreadPoolExecutor(max_workers=args.parallelism)
+    futures = {}
+    try:
+        futures = {executor.submit(generate_row, mcp, row, limiter, args.api_key): (key, row)
+                   for key, row in pending.items()}
+        for future in as_completed(futures):
+            collect(futures, future)
+    except KeyboardInterrupt:
+        # Queued rows are cancelled; rows already generating finish and are saved
+        executor.shutdown(wait=False, cancel_futures=True)
+        running = [future for future in futures if not future.done()]
+        print(f"Interrupted; waiting for {len(running)} running row(s) (Ctrl-C again to drop them)")
+        try:
+            for future in as_completed(running):
+                if not future.cancelled():
+                    collect(futures, future)
+        except KeyboardInterrupt:
+            pass
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+        written += flush(mcp.learning_paths_collection, batch, checkpoint_path)
+
+    print(f"Done in {time.time() - started:.1f}s: {written} written, {failed} failed "
+          f"(re-run to retry failed or unfinished rows)")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,37 +1,323 @@
 """
-Material Generator Service: HTTP microservice to generate study material/notes for each topic using Gemini.
+Material Generator Service: HTTP microservice to generate study plans and long-form study material.
+
+- POST /generate_material schedules a study plan; the LLM only supplies the curriculum.
+- POST /materials generates one plan day's material as independent sections (see
+  common.material_sections), several at a time within a sections-per-minute budget,
+  and streams every section to the client as NDJSON the moment it is finished.
+  Generation runs in a background job: a client that disconnects, or asks for
+  `"stream": false` and polls /materials/jobs/<job_id>, does not hold a worker.
+- Finished materials are stored in GridFS (common.material_store) and served with
+  byte-range reads: GET /materials/<id>/content honours Range headers, and
+  ?section=N reads just that section's bytes.
 """
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
-from common.ai_utils import call_ai
+from common import config
+from common.ai_utils import call_ai, call_task, model_for
+from common.json_repair import is_usable_json, parse_llm_json
+from common.material_sections import (
+    SECTION_SCHEMA, material_key, plan_sections, render_document, section_prompt
+)
+from common.material_store import MaterialNotFound, MaterialStore
+from common.rate_limit import RateLimiter
+from common.scheduler import CURRICULUM_SCHEMA, curriculum_prompt, parse_curriculum, schedule_curriculum
+from common.tenancy import priority_from_headers, priority_scope, request_tenant, tenant_scope
+from common.ttl_cache import TTLCache
+from concurrent.futures import ThreadPoolExecutor
+from pymongo.errors import PyMongoError
+import contextvars
 import json
-import re
+import logging
+import threading
+import time
+import uuid
 from datetime import datetime
 
+logger = logging.getLogger(__name__)
+
 app = Flask(__name__)
-CORS(app, resources={r"/*": {"origins": "*"}})  # Allow all origins for development
+CORS(app, resources={r"/*": {"origins": "*"}}, expose_headers=['Content-Range', 'Accept-Ranges'])
+
+# Sections of all jobs share one pool and one start-rate budget, so concurrent days interleave
+section_executor = ThreadPoolExecutor(max_workers=config.MATERIAL_SECTION_WORKERS,
+                                      thread_name_prefix='material-section')
+section_limiter = RateLimiter(config.MATERIAL_SECTIONS_PER_MINUTE, burst=config.MATERIAL_SECTION_BURST)
+
+# Generation jobs by id (finished ones stay readable for MATERIAL_JOB_TTL) and running jobs by
+# material key, so a second request for the same day joins the running job
+jobs = TTLCache(maxsize=1024, ttl=config.MATERIAL_JOB_TTL)
+running_jobs = {}
+running_lock = threading.Lock()
+material_totals = {'jobs': 0, 'joined': 0, 'stored_hits': 0, 'sections': 0, 'sections_failed': 0}
+material_totals_lock = threading.Lock()
+
+
+def connect_material_store():
+    try:
+        store = MaterialStore.connect(config.MONGO_URI, config.MONGO_DB, chunk_size=config.MATERIAL_CHUNK_BYTES,
+                                      timeout_ms=2000)
+        logger.info("Material store connected")
+        return store
+    except PyMongoError as e:
+        logger.warning(f"Material store unavailable; materials are streamed but not stored: {str(e)}")
+        return None
+
+
+material_store = connect_material_store()
+
+
+def count_material(counter):
+    with material_totals_lock:
+        material_totals[counter] += 1
+
+
+def run_llm_task(task, prompt, api_key=None, provider=None, validate=None):
+    """A task on its routed model tier, or on `provider`'s model for that task when the caller pins one."""
+    if provider:
+        return call_ai(prompt, model=model_for(task, provider.lower()), provider=provider, api_key=api_key, task=task)
+    return call_task(task, prompt, api_keys={'gemini': api_key} if api_key else None, validate=validate)
+
+
+class MaterialJob:
+    """One day's material being generated; finished sections are published to readers as they arrive."""
+
+    def __init__(self, key, topic_name, label, daily_hours, outline, date=None, sections=None, replaces=None):
+        """
+        Args:
+            sections: Sections already finished (from a stored partial material); only the
+                rest of the outline is generated
+            replaces: Material id of that partial material, deleted once this one is stored
+        """
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.topic_name = topic_name
+        self.label = label
+        self.daily_hours = daily_hours
+        self.date = date
+        self.outline = outline
+        self.sections = list(sections or [])  # finished sections, in completion order
+        self.replaces = replaces
+        self.failed = []
+        self.status = 'running'
+        self.material_id = None
+        self.error = None
+        self.started = time.monotonic()
+        self.elapsed_ms = None
+        self._cond = threading.Condition()
+
+    def publish(self, section=None, failure=None):
+        with self._cond:
+            if section is not None:
+                self.sections.append(section)
+            if failure is not None:
+                self.failed.append(failure)
+            self._cond.notify_all()
+            return len(self.sections) + len(self.failed) == len(self.outline)
+
+    def finish(self, material_id=None, error=None):
+        with self._cond:
+            self.material_id = material_id
+            self.error = error
+            self.status = 'failed' if self.failed and not self.sections else 'partial' if self.failed else 'done'
+            self.elapsed_ms = round((time.monotonic() - self.started) * 1000, 1)
+            self._cond.notify_all()
+
+    def events(self, poll_seconds=15.0):
+        """
+        Stream events for a reader: every finished or failed section (including ones
+        finished before the reader arrived), then 'done'. A None event is yielded when
+        nothing happened for `poll_seconds`, so the caller can send a keep-alive.
+        """
+        sent_sections = sent_failed = 0
+        while True:
+            with self._cond:
+                if (sent_sections == len(self.sections) and sent_failed == len(self.failed)
+                        and self.status == 'running'):
+                    self._cond.wait(poll_seconds)
+                new_sections = self.sections[sent_sections:]
+                new_failed = self.failed[sent_failed:]
+                finished = self.status != 'running'
+            sent_sections += len(new_sections)
+            sent_failed += len(new_failed)
+            for section in new_sections:
+                yield {'event': 'section', **section}
+            for failure in new_failed:
+                yield {'event': 'failed', **failure}
+            if finished and sent_sections == len(self.sections) and sent_failed == len(self.failed):
+                yield {'event': 'done', **self.snapshot()}
+                return
+            if not new_sections and not new_failed and not finished:
+                yield None
+
+    def snapshot(self):
+        with self._cond:
+            return {
+                'job_id': self.id,
+                'status': self.status,
+                'material_id': self.material_id,
+                'sections_total': len(self.outline),
+                'sections_done': len(self.sections),
+                'sections_failed': [f['index'] for f in self.failed],
+                'elapsed_ms': self.elapsed_ms if self.elapsed_ms is not None
+                else round((time.monotonic() - self.started) * 1000, 1),
+                'error': self.error,
+            }
+
+
+def outline_event(job_id, key, outline, stored=False):
+    return {
+        'event': 'outline',
+        'job_id': job_id,
+        'key': key,
+        'stored': stored,
+        'sections': [{k: s[k] for k in ('index', 'kind', 'subtopic', 'title')} for s in outline],
+    }
+
+
+def generate_section(job, section, api_key=None, provider=None):
+    """Generate one section of a job's material; waits for the shared start-rate budget first."""
+    section_limiter.acquire()
+    prompt = section_prompt(job.topic_name, job.label, job.outline, section)
+    response = run_llm_task('material_section', prompt, api_key=api_key, provider=provider,
+                            validate=lambda text: is_usable_json(text, SECTION_SCHEMA))
+    data = parse_llm_json(response, SECTION_SCHEMA, name=f"section '{section['title']}'",
+                          fix=lambda fix_prompt: run_llm_task('json_fix', fix_prompt, api_key=api_key, provider=provider))
+    return {**section, 'content': data['content'].strip()}
+
+
+def section_finished(job, section, future):
+    try:
+        result, outcome = future.result(), 'sections'
+    except Exception as e:
+        logger.warning(f"Section {section['index']} ('{section['title']}') of job {job.id} failed: {str(e)}")
+        result, outcome = None, 'sections_failed'
+        failure = {'index': section['index'], 'title': section['title'], 'error': str(e)}
+    count_material(outcome)
+    done = job.publish(section=result) if result is not None else job.publish(failure=failure)
+    if done:
+        complete_job(job)
+
+
+def complete_job(job):
+    """
+    Store the generated material in GridFS. With failed sections it is stored as partial,
+    listing the missing ones, so the next request for the day only generates those.
+    """
+    material_id, error = None, None
+    if material_store is not None and job.sections:
+        body, index = render_document(job.sections)
+        try:
+            material_id = material_store.save(job.key, body, index, topic_name=job.topic_name, label=job.label,
+                                              daily_hours=job.daily_hours, date=job.date,
+                                              missing=sorted(f['index'] for f in job.failed),
+                                              generated_at=datetime.now().isoformat())
+            if job.replaces:
+                material_store.delete(job.replaces)
+        except PyMongoError as e:
+            error = f"Material could not be stored: {str(e)}"
+            logger.error(error)
+    job.finish(material_id, error)
+    with running_lock:
+        if running_jobs.get(job.key) is job:
+            del running_jobs[job.key]
+    logger.info(f"Material job {job.id} {job.status}: {len(job.sections)}/{len(job.outline)} sections "
+                f"in {job.elapsed_ms:.0f} ms")
+
+
+def start_job(topic_name, label, daily_hours, outline, key, date=None, api_key=None, provider=None, partial=None):
+    """
+    The running job for `key`, or a new one with every section submitted to the section
+    pool, except those a stored `partial` material (its info) already has.
+    """
+    done = []
+    if partial:
+        try:
+            done = list(stored_sections(partial))
+        except (MaterialNotFound, PyMongoError) as e:
+            logger.warning(f"Partial material {partial['material_id']} could not be read, regenerating it: {str(e)}")
+            partial = None
+    with running_lock:
+        job = running_jobs.get(key)
+        if job is not None:
+            count_material('joined')
+            return job
+        job = MaterialJob(key, topic_name, label, daily_hours, outline, date=date, sections=done,
+                          replaces=partial['material_id'] if partial else None)
+        running_jobs[key] = job
+        jobs.set(job.id, job)
+    count_material('jobs')
+    finished = {s['index'] for s in done}
+    pending = [section for section in outline if section['index'] not in finished]
+    if not pending:
+        complete_job(job)
+    for section in pending:
+        # Sections run as the requesting tenant and priority class in the fair LLM scheduler
+        future = section_executor.submit(contextvars.copy_context().run, generate_section, job, section,
+                                         api_key, provider)
+        future.add_done_callback(lambda f, s=section: section_finished(job, s, f))
+    return job
+
+
+def ndjson(events):
+    def lines():
+        for event in events:
+            # Blank keep-alive lines let proxies see a live stream while sections are pending
+            yield '\n' if event is None else json.dumps(event, ensure_ascii=False) + '\n'
+    return Response(lines(), mimetype='application/x-ndjson',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+def stored_sections(info):
+    """A stored material's sections with their content, one section range read at a time."""
+    for section in info['sections']:
+        text = material_store.read(info['material_id'], section['offset'], section['offset'] + section['length'])
+        _, _, content = text.decode('utf-8').partition('\n\n')
+        yield {**{k: section[k] for k in ('index', 'kind', 'subtopic', 'title')}, 'content': content.strip()}
+
+
+def stored_events(info):
+    """Replay a stored material as a stream."""
+    yield outline_event(None, info['key'], info['sections'], stored=True)
+    for section in stored_sections(info):
+        yield {'event': 'section', **section}
+    yield {'event': 'done', 'status': 'done', 'material_id': info['material_id'], 'stored': True,
+           'sections_total': len(info['sections']), 'sections_done': len(info['sections'])}
+
+
+def material_error(message, status):
+    return jsonify({'error': message}), status
+
 
 # Health check endpoint
 @app.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint for the Material Generator service"""
+    with running_lock:
+        running = len(running_jobs)
+    with material_totals_lock:
+        totals = dict(material_totals)
     return jsonify({
         'service': 'Material Generator',
         'status': 'running',
         'timestamp': datetime.now().isoformat(),
+        'materials': {
+            **totals,
+            'running_jobs': running,
+            'section_workers': config.MATERIAL_SECTION_WORKERS,
+            'sections_per_minute': config.MATERIAL_SECTIONS_PER_MINUTE,
+            'store': material_store.stats() if material_store is not None else None,
+        },
         'endpoints': {
-            'POST /generate_material': 'Generate study material',
+            'POST /generate_material': 'Generate a study plan',
+            'POST /materials': 'Generate (and stream) sectioned study material for one day',
+            'GET /materials/jobs/<job_id>': 'Progress of a material generation job',
+            'GET /materials/<material_id>': 'Stored material metadata and section index',
+            'GET /materials/<material_id>/content': 'Stored material (Range requests, ?section=N)',
             'GET /health': 'Service health check'
         }
     }), 200
 
-STUDY_PLAN_PROMPT = (
-    "You are a study planner assistant. Given a topic, number of days, start date, and daily hours, "
-    "distribute the key subtopics to study for the topic, assigning each day a subtopic. "
-    "Respond ONLY as a JSON object mapping dates (YYYY-MM-DD) to the subtopic(s) to study on that day. "
-    "Do not include any explanation or extra text. Example: {\"2025-04-27\": \"Intro to ML\", \"2025-04-28\": \"Supervised Learning\"}"
-)
-
 @app.route('/generate_material', methods=['POST'])
 def generate_material():
     data = request.json
@@ -45,25 +331,17 @@ def generate_material():
     if not all([topic_name, no_of_days, start_date, daily_hours]):
         return jsonify({'error': 'Missing required fields'}), 400
 
-    prompt = (
-        f"Topic: {topic_name}. Number of days: {no_of_days}. Start date: {start_date}. Daily hours: {daily_hours}. "
-        + STUDY_PLAN_PROMPT
-    )
+    # The LLM only supplies the ordered curriculum; dates are assigned locally
+    prompt = curriculum_prompt(topic_name, no_of_days)
+    provider = data.get('provider')
     try:
-        # For testing, return a mock response instead of calling the AI
-        mock_plan = {
-            "2025-08-05": "Introduction to Python Programming",
-            "2025-08-06": "Python Data Types and Variables",
-            "2025-08-07": "Control Flow and Functions in Python"
-        }
-        
-        # Uncomment this to use the real AI call
-        # plan_str = call_ai(prompt, api_key=api_key, provider=request.json.get('provider', 'openai'))
-        # cleaned = re.sub(r'^```(?:json)?\s*|\s*```$', '', plan_str.strip(), flags=re.IGNORECASE | re.MULTILINE).strip()
-        # plan = json.loads(cleaned)
-        
-        plan = mock_plan  # Using mock response for now
-        
+        plan_str = run_llm_task('curriculum', prompt, api_key=api_key, provider=provider,
+                                validate=lambda text: is_usable_json(text, CURRICULUM_SCHEMA))
+        curriculum = parse_curriculum(parse_llm_json(
+            plan_str, CURRICULUM_SCHEMA, name='curriculum',
+            fix=lambda fix_prompt: run_llm_task('json_fix', fix_prompt, api_key=api_key, provider=provider)
+        ))
+        scheduled = schedule_curriculum(curriculum, int(no_of_days), start_date, daily_hours)
     except Exception as e:
         return jsonify({
             'error': 'Failed to generate study material',
@@ -75,6 +353,9 @@ def generate_material():
                 'daily_hours': daily_hours
             }
         }), 500
+    if scheduled is None:
+        return jsonify({'error': 'start_date must be YYYY-MM-DD'}), 400
+    plan, hours = scheduled
 
     response = {
         "daily_hours": daily_hours,
@@ -82,10 +363,126 @@ def generate_material():
         "start_date": start_date,
         "topic_name": topic_name,
         "plan": plan,
-        "status": "Gemini study plan generated"
+        "hours": hours,
+        "status": "Study plan generated"
     }
     return jsonify(response)
 
+@app.route('/materials', methods=['POST'])
+def generate_day_material():
+    """
+    Generate the study material of one plan day.
+
+    Body: topic_name, subtopic (the day label), daily_hours; optional date, hours (the
+    day's [{'subtopic', 'hours'}] split from /generate_material), api_key, provider,
+    stream (default true) and fresh (ignore a stored material for the same day).
+
+    Streams NDJSON events: 'outline', then 'section' (or 'failed') per section as each
+    finishes, then 'done' with the stored material_id. With "stream": false, answers
+    202 with the job id at once (200 with the material when it is already stored).
+    """
+    data = request.get_json(silent=True) or {}
+    topic_name, label = data.get('topic_name'), data.get('subtopic')
+    try:
+        daily_hours = float(data.get('daily_hours'))
+    except (TypeError, ValueError):
+        daily_hours = 0
+    if not topic_name or not label or daily_hours <= 0:
+        return material_error('topic_name, subtopic and a positive daily_hours are required', 400)
+
+    outline = plan_sections(label, daily_hours, data.get('hours'), section_minutes=config.MATERIAL_SECTION_MINUTES,
+                            max_sections=config.MATERIAL_MAX_SECTIONS, section_words=config.MATERIAL_SECTION_WORDS)
+    key = material_key(topic_name, label, daily_hours, outline)
+    stream = data.get('stream', True)
+
+    stored = None
+    if material_store is not None and not data.get('fresh'):
+        try:
+            stored = material_store.find(key)
+        except PyMongoError as e:
+            logger.warning(f"Material lookup failed, generating: {str(e)}")
+    if stored is not None and not stored.get('missing'):
+        count_material('stored_hits')
+        return ndjson(stored_events(stored)) if stream else jsonify(stored)
+
+    # A stored partial material keeps its finished sections; only the missing ones are generated
+    with tenant_scope(request_tenant(request.headers, data)), priority_scope(priority_from_headers(request.headers)):
+        job = start_job(topic_name, label, daily_hours, outline, key, date=data.get('date'),
+                        api_key=data.get('api_key'), provider=data.get('provider'), partial=stored)
+    if not stream:
+        return jsonify({**job.snapshot(), 'status_url': f"/materials/jobs/{job.id}"}), 202
+
+    def events():
+        yield outline_event(job.id, key, outline)
+        yield from job.events()
+    return ndjson(events())
+
+@app.route('/materials/jobs/<job_id>', methods=['GET'])
+def material_job(job_id):
+    """Progress of a generation job; ?sections=true includes the sections finished so far."""
+    job = jobs.get(job_id)
+    if job is None:
+        return material_error(f"Unknown or expired material job {job_id}", 404)
+    body = job.snapshot()
+    if request.args.get('sections', '').lower() in ('1', 'true', 'yes'):
+        body['sections'] = sorted(list(job.sections), key=lambda s: s['index'])
+    return jsonify(body)
+
+@app.route('/materials/<material_id>', methods=['GET'])
+def material_info(material_id):
+    if material_store is None:
+        return material_error('Material storage unavailable', 503)
+    try:
+        return jsonify(material_store.info(material_id))
+    except MaterialNotFound:
+        return material_error(f"Unknown material {material_id}", 404)
+
+@app.route('/materials/<material_id>/content', methods=['GET'])
+def material_content(material_id):
+    """
+    A stored material's Markdown. Stored materials never change, so the id is the ETag.
+    A single-range Range header gets 206 with only the chunks that range covers;
+    ?section=N returns section N the same way.
+    """
+    if material_store is None:
+        return material_error('Material storage unavailable', 503)
+    try:
+        info = material_store.info(material_id)
+    except MaterialNotFound:
+        return material_error(f"Unknown material {material_id}", 404)
+    if request.if_none_match.contains(material_id):
+        response = Response(status=304)
+        response.set_etag(material_id)
+        return response
+
+    length = info['length']
+    start, end, status = 0, length, 200
+    section = request.args.get('section', type=int)
+    if section is not None:
+        located = next((s for s in info['sections'] if s['index'] == section), None)
+        if located is None:
+            return material_error(f"Material {material_id} has no section {section}", 404)
+        start, end = located['offset'], located['offset'] + located['length']
+    elif request.range is not None:
+        span = request.range.range_for_length(length)
+        if span is None and len(request.range.ranges) == 1:
+            response = Response(status=416)
+            response.headers['Content-Range'] = f"bytes */{length}"
+            return response
+        if span is not None:
+            (start, end), status = span, 206
+
+    response = Response(material_store.iter_range(material_id, start, end), status=status,
+                        mimetype='text/markdown')
+    response.headers['Content-Length'] = str(end - start)
+    response.headers['Accept-Ranges'] = 'bytes'
+    if status == 206:
+        response.headers['Content-Range'] = f"bytes {start}-{end - 1}/{length}"
+    response.headers['Cache-Control'] = 'public, max-age=86400, immutable'
+    response.set_etag(material_id)
+    return response
+
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
     print("Starting Material Generator on port 5102...")
-    app.run(host="0.0.0.0", port=5102, debug=False)
+    app.run(host="0.0.0.0", port=5102, debug=False, threaded=True)
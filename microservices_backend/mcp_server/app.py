@@ -2,18 +2,47 @@
 MCP Server: Handles incoming study plan requests, uses Gemini to generate topics, and triggers video fetching via Kafka.
 Enhanced with rich terminal output, robust error handling, and improved database operations.
 """
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 import json
 import time
 import re
 import requests
 from flask_cors import CORS
-from common.gemini_utils import call_gemini
+from common.ai_utils import call_task, fit_prompt, router as ai_router, routing_table, token_ledger
+from common.service_client import ServiceClient, HealthMonitor, CircuitOpenError
+from common.deadline import DeadlineExceeded, consume_retry, current_deadline, deadline_from_headers, deadline_scope
+from common.tenancy import priority_scope, request_tenant, tenant_scope
+from common.fair_scheduler import llm_slots
+from common.admission import EXEMPT_PATHS, Admission
+from common.base_service import reloader_parent
+from common.write_behind import WriteBehindBuffer
+from common.plan_codec import encode_day, encode_document
+from common.plan_reader import PlanChanged, PlanReader, day_fields, plan_query
+from common.http_responses import json_response, make_etag, not_modified, stats as response_stats
+from common.similarity_index import SimilarityIndex
+from common.topic_sharding import CLUSTER_TOKEN_HEADER, FORWARDED_HEADER, SERVED_BY_HEADER, RelayTimeout, ShardRouter
+from common.work_queue import NOTES_TASKS, PlanDispatcher, start_workers
+from common.quiz_templates import fallback_quizzes, assignment_templates
+from common.ttl_cache import TTLCache
+from common.json_repair import JSONRepairError, is_usable_json, parse_llm_json, stats as json_repair_stats
+from common.scheduler import (
+    CURRICULUM_SCHEMA, OUTLINE_SCHEMA, chunk_prompt, continuation_prompt, curriculum_prompt, drop_covered, label_subtopics,
+    has_part_marker, merge_chunks, outline_prompt, parse_curriculum, parse_outline, phase_count, schedule_curriculum
+)
+from common.cache_warmer import CacheWarmer, charge_reported_usage, check_warm_budget, record_tokens
+from common.plan_checkpoint import IDEMPOTENCY_HEADER, IdempotencyConflict, PlanCheckpoints, request_fingerprint
+from common import config
+from bson import ObjectId
 from pymongo import MongoClient
-from pymongo.errors import ConnectionFailure, OperationFailure
+from pymongo.errors import ConnectionFailure, PyMongoError
 from dotenv import load_dotenv
+import atexit
 import os
-from datetime import datetime
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from datetime import datetime, timedelta
 import uuid
 from rich.console import Console
 from rich.panel import Panel
@@ -28,6 +57,13 @@ install(show_locals=True)
 # Initialize Rich console
 console = Console()
 
+# Spinners and progress bars use rich's Live display, which allows one at a time per
+# process; in-process batch callers (generate_catalog.py) switch them off
+LIVE_DISPLAY = True
+
+def console_status(message):
+    return console.status(message, spinner="dots") if LIVE_DISPLAY else nullcontext()
+
 # Create banner
 def print_banner():
     console.print(Panel.fit(
@@ -69,121 +105,244 @@ except Exception as e:
     # or fallback to a local storage option
     learning_paths_collection = None
 
+_writer_client = None
+
+def connect_learning_paths():
+    """learning_paths for the write-behind buffer; raises PyMongoError while MongoDB is down."""
+    global _writer_client
+    if learning_paths_collection is not None:
+        mongo_client.admin.command('ping')
+        return learning_paths_collection
+    if _writer_client is None:
+        _writer_client = MongoClient(config.MONGO_URI, serverSelectionTimeoutMS=2000)
+    _writer_client.admin.command('ping')
+    return _writer_client[config.MONGO_DB]['learning_paths']
+
+# Plan writes are queued and flushed in batches off the request path, spooled locally
+# while MongoDB is unreachable (including when it was down at startup)
+plan_writer = WriteBehindBuffer(
+    'learning_paths', connect_learning_paths,
+    spool_path=os.path.join(config.CACHE_DIR, 'learning_paths.spool.jsonl'),
+    max_queue=config.WRITE_BEHIND_MAX_QUEUE,
+    batch_size=config.WRITE_BEHIND_BATCH_SIZE
+)
+
+# Per-day checkpoints let a retried /generate_plan resume instead of starting over
+plan_checkpoints = PlanCheckpoints(
+    learning_paths_collection, lease_seconds=config.PLAN_CHECKPOINT_LEASE_SECONDS, writer=plan_writer
+) if learning_paths_collection is not None else None
+
+# Partial, decoded reads of stored plans for GET /plans/<id>
+plan_reader = PlanReader(learning_paths_collection) if learning_paths_collection is not None else None
+
 app = Flask(__name__)
-CORS(app, resources={r"/*": {"origins": "*"}})  # Allow all origins for development
+CORS(app, resources={r"/*": {"origins": "*"}}, expose_headers=['ETag', 'X-Served-By'])  # Allow all origins for development
+
+# Bound in-flight and queued requests per route; excess is shed with 503 + Retry-After.
+# Cluster membership calls and peer health probes are exempt, like /health. Plan requests relayed
+# to their topic's owner are admitted there, not here
+admission = Admission(exempt=EXEMPT_PATHS + ('/cluster', '/cluster/join', '/cluster/leave'))
+admission.install(app, defer=lambda: request.path == '/generate_plan' and plan_relay_target() is not None)
 console.print("[bold green]✓[/bold green] Flask app initialized with CORS (allowing all origins)")
 
-# Improved Gemini prompt for a full study plan distributed by date
-STUDY_PLAN_PROMPT = (
-    "You are a study planner assistant. Given a topic, number of days, start date, and daily hours, "
-    "distribute the key subtopics to study for the topic, assigning each day a subtopic. "
-    "Respond ONLY as a JSON object mapping dates (YYYY-MM-DD) to the subtopic(s) to study on that day. "
-    "Do not include any explanation or extra text. Example: {\"2025-04-27\": \"Intro to ML\", \"2025-04-28\": \"Supervised Learning\"}"
+# Internal service clients; health is refreshed in the background instead of probed per request
+# (over the binary RPC transport when INTERNAL_TRANSPORT=rpc)
+use_rpc = config.INTERNAL_TRANSPORT == 'rpc'
+video_fetcher = ServiceClient(
+    'video_fetcher', config.VIDEO_FETCHER_URL, timeout=30,
+    failure_threshold=config.SERVICE_FAILURE_THRESHOLD, reset_timeout=config.SERVICE_RESET_TIMEOUT,
+    rpc_address=config.VIDEO_FETCHER_RPC if use_rpc else None, rpc_connections=config.RPC_CONNECTIONS
+)
+quiz_generator = ServiceClient(
+    'quiz_generator', config.QUIZ_GENERATOR_URL, timeout=30,
+    failure_threshold=config.SERVICE_FAILURE_THRESHOLD, reset_timeout=config.SERVICE_RESET_TIMEOUT,
+    rpc_address=config.QUIZ_GENERATOR_RPC if use_rpc else None, rpc_connections=config.RPC_CONNECTIONS
 )
+health_monitor = HealthMonitor([video_fetcher, quiz_generator], interval=config.HEALTH_CHECK_INTERVAL)
 
-@app.route('/health', methods=['GET'])
-def health_check():
-    """Health check endpoint for the MCP Server"""
-    status = {
-        "service": "MCP Server",
-        "status": "healthy",
-        "timestamp": datetime.now().isoformat(),
-        "mongodb_connected": learning_paths_collection is not None
-    }
-    return jsonify(status)
+# Near-duplicate subtopics of one topic ("Intro to ML" / "ML basics") share generated notes
+notes_index = SimilarityIndex(
+    os.path.join(config.CACHE_DIR, 'notes_index.jsonl'), threshold=config.SIMILARITY_THRESHOLD
+)
 
-@app.route('/generate_plan', methods=['POST'])
-def generate_plan():
+# Ordered, weighted subtopics per (topic, days); scheduled locally for each request
+curriculum_cache = TTLCache(maxsize=1024, ttl=config.PLAN_CACHE_TTL)
+
+# Event-driven mode: per-day tasks fan out over the broker instead of direct HTTP calls
+plan_dispatcher = PlanDispatcher() if config.PLAN_DISPATCH_MODE == 'events' else None
+
+# Multi-node deployments: each topic is served by the node owning it on the consistent hash ring
+shard_router = ShardRouter(
+    config.MCP_NODE_URL, config.MCP_PEERS, vnodes=config.SHARD_VNODES, enabled=config.SHARD_ROUTING,
+    health_interval=config.SHARD_HEALTH_INTERVAL, relay_timeout=config.PLAN_DEADLINE_SECONDS + 10,
+    cluster_token=config.SHARD_CLUSTER_TOKEN
+)
+
+def generate_with_llm(prompt, api_key=None, latency_critical=False, task=None, validate=None):
     """
-    Main endpoint to generate learning plans with advanced error handling
-    and rich visual feedback
+    Run a prompt on the model tier the routing table assigns to `task` (see
+    ai_utils.TASK_ROUTES). With AI_ROUTING=fixed only Gemini models are used; with
+    AI_ROUTING=auto any provider in the tier may serve it, and latency-critical prompts
+    are hedged across the two fastest healthy routes. Responses that fail `validate`
+    escalate to a larger tier. Tokens, latency and cost are accounted under `task`.
+    A cache-warming run is stopped here once it has spent its token budget.
     """
-    # Generate a unique request ID
-    request_id = str(uuid.uuid4())[:8]
-    console.print(f"\n[bold blue]╔══════════════════════════════════════════════════════════════╗[/bold blue]")
-    console.print(f"[bold blue]║[/bold blue] [bold yellow]⚡ New Request[/bold yellow] [ID: {request_id}] - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} [bold blue]║[/bold blue]")
-    console.print(f"[bold blue]╚══════════════════════════════════════════════════════════════╝[/bold blue]")
-    
-    # Extract and validate request data
-    try:
-        data = request.json
-        required_fields = ['topic_name', 'no_of_days', 'start_date', 'daily_hours']
-        
-        # Log incoming request
-        console.print(Panel.fit(
-            f"[bold cyan]Request Data:[/bold cyan]\n" +
-            "\n".join([f"[yellow]{k}:[/yellow] {v}" for k, v in data.items()]),
-            title=f"Request {request_id}",
-            border_style="blue"
-        ))
-        
-        # Validate required fields
-        missing_fields = [field for field in required_fields if field not in data]
-        if missing_fields:
-            error_msg = f"Missing required fields: {', '.join(missing_fields)}"
-            console.print(f"[bold red]✗ Validation Error:[/bold red] {error_msg}")
-            return jsonify({"error": error_msg, "request_id": request_id}), 400
-        
-        # Extract fields
-        topic_name = data.get('topic_name')
-        no_of_days = data.get('no_of_days')
-        start_date = data.get('start_date')
-        daily_hours = data.get('daily_hours')
-        
-    except Exception as e:
-        console.print(f"[bold red]✗ Request Parsing Error:[/bold red] {str(e)}")
-        return jsonify({"error": f"Failed to parse request: {str(e)}", "request_id": request_id}), 400
+    check_warm_budget()
+    response = call_task(
+        task,
+        prompt,
+        api_keys={'gemini': api_key} if api_key else None,
+        providers=None if config.AI_ROUTING == 'auto' else ['gemini'],
+        hedge=latency_critical and config.AI_ROUTING == 'auto',
+        validate=validate
+    )
+    return response
 
-    # 1. Generate study plan with Gemini
-    with console.status(f"[bold green]Generating study plan with Gemini for {topic_name}...", spinner="dots") as status:
-        prompt = (
-            f"Topic: {topic_name}. Number of days: {no_of_days}. Start date: {start_date}. Daily hours: {daily_hours}. "
-            + STUDY_PLAN_PROMPT
-        )
-        
-        console.print(f"[dim]API Key configured: {'YES' if os.getenv('GEMINI_API_KEY') else 'NO'}[/dim]")
-        console.print(f"[dim cyan]Gemini Prompt:[/dim cyan] {prompt}")
-        
-        start = time.time()
+def compact_video_url(youtube_link):
+    """youtu.be/<id> instead of a full watch URL with tracking parameters."""
+    match = re.search(r'(?:v=|youtu\.be/|embed/)([\w-]{11})', youtube_link or '')
+    return f"youtu.be/{match.group(1)}" if match else youtube_link
+
+def notes_look_complete(notes):
+    """Notes worth keeping: not a refusal and long enough to be ~150 words of content."""
+    return bool(notes) and 'no notes available' not in notes.lower() and len(notes.split()) >= 60
+
+def split_day_value(value):
+    """Normalize a plan entry (plain subtopic or Video Fetcher dict) into (subtopic, youtube_link, timestamp)."""
+    if isinstance(value, dict):
+        subtopic = value.get('subtopic') or value.get('name') or ''
+        youtube_link = value.get('youtube_link', 'No video found')
+        timestamp = value.get('timestamp', 'No timestamp')
+    else:
+        subtopic = value
+        youtube_link = 'No video found'
+        timestamp = 'No timestamp'
+    return subtopic, youtube_link, timestamp
+
+def generate_notes(subtopic, youtube_link, timestamp, date='', use_cache=True, topic_name=''):
+    """
+    Generate ~150 words of study notes for a subtopic, optionally anchored to a video segment.
+    Notes are reused for near-duplicate subtopics of the same topic only, and for one part
+    of a split subtopic ("X (Part 2/3)") only that same part; use_cache=False skips that
+    lookup, for explicit regeneration.
+    """
+    if not subtopic:
+        return None
+
+    scope = normalize_topic(topic_name)
+    cached = notes_index.lookup(subtopic, scope=scope, exact=has_part_marker(subtopic)) if use_cache else None
+    if cached is not None:
+        cached_notes, score, matched = cached
+        console.print(f"[dim]Reusing notes for '{matched}' ({score:.2f} similar) for {subtopic}[/dim]")
+        return cached_notes
+
+    # Short instructions and a compact video reference keep this high-volume prompt small
+    segment = ''
+    if youtube_link and timestamp and youtube_link != 'No video found':
+        segment = f" Focus only on segment [{timestamp}] of {compact_video_url(youtube_link)}."
+    notes_prompt = fit_prompt(
+        'notes',
+        "Concise study notes (about 150 words) on: {context}." + segment + " Plain text only, no preamble.",
+        subtopic
+    )
+
+    notes = None
+    # call_ai already retries transport errors; this loop only re-asks
+    # for empty answers, and every extra attempt draws from the shared retry budget
+    for attempt in range(3):
+        if attempt and not consume_retry():
+            break
         try:
-            # Allow per-request API key override from backend proxy
-            plan_str = call_gemini(prompt, api_key=request.json.get('api_key'))
-            elapsed = time.time() - start
-            
-            # Clean and parse the response
-            cleaned = re.sub(r'^```(?:json)?\s*|\s*```$', '', plan_str.strip(), flags=re.IGNORECASE | re.MULTILINE).strip()
-            console.print(f"[green]✓ Gemini API response received[/green] [dim]({elapsed:.2f}s)[/dim]")
-            
-            try:
-                plan = json.loads(cleaned)
-                # Display the plan in a table
-                plan_table = Table(title=f"Study Plan for {topic_name}")
-                plan_table.add_column("Date", style="cyan")
-                plan_table.add_column("Subtopic", style="green")
-                
-                for date, subtopic in plan.items():
-                    plan_table.add_row(date, subtopic)
-                
-                console.print(plan_table)
-                
-            except json.JSONDecodeError as e:
-                console.print(f"[bold red]✗ JSON Parse Error:[/bold red] {str(e)}")
-                console.print(f"[bold red]Raw response:[/bold red] {cleaned}")
-                return jsonify({"error": f"Failed to parse Gemini response: {str(e)}", 
-                               "gemini_response": cleaned, 
-                               "request_id": request_id}), 500
-                
+            notes_response = generate_with_llm(notes_prompt, task='notes', validate=notes_look_complete)
+            if notes_response and notes_response.strip() and 'no notes available' not in notes_response.lower():
+                notes = notes_response.strip()
+                break
+        except DeadlineExceeded:
+            break
         except Exception as e:
-            elapsed = time.time() - start
-            console.print(f"[bold red]✗ Gemini API Error[/bold red] [dim]({elapsed:.2f}s)[/dim]: {str(e)}")
-            return jsonify({"error": f"Gemini API error: {str(e)}", 
-                           "request_id": request_id}), 500
+            console.print(f"[yellow]⚠ Notes generation attempt {attempt+1} failed for {subtopic} ({date}): {str(e)}[/yellow]")
+
+    if not notes:
+        console.print(f"[yellow]⚠ Failed to generate notes for {subtopic} ({date})[/yellow]")
+        return 'No notes available.'
+    notes_index.insert(subtopic, notes, scope=scope)
+    return notes
+
+def generate_quizzes(subtopic, youtube_link, timestamp, notes, date='', topic_name=''):
+    """Get quizzes and assignments from the Quiz Generator, falling back to templates."""
+    try:
+        quiz_data = quiz_generator.post('/generate_quiz_and_assignments', {
+            'topic_name': topic_name,
+            'subtopic': subtopic,
+            'timestamp': timestamp,
+            'youtube_link': youtube_link,
+            'study_notes': notes
+        })
+        # The Quiz Generator wraps its payload in BaseService's {'success', 'data'} envelope
+        quiz_data = quiz_data.get('data', quiz_data)
+        # Quizzes for a warming run are generated under its allowance; charge what was spent
+        charge_reported_usage(quiz_data.get('warm_usage'))
+        return quiz_data.get('quizzes', []), quiz_data.get('assignments', [])
+    except CircuitOpenError:
+        pass
+    except Exception as e:
+        console.print(f"[yellow]⚠ Quiz generation failed for {subtopic} ({date}): {str(e)}[/yellow]")
+    return fallback_quizzes(subtopic), assignment_templates(subtopic)
+
+def handle_notes_task(task):
+    """Event-driven worker handler for NOTES_TASKS: notes for one plan day."""
+    notes = generate_notes(task.get('subtopic'), task.get('youtube_link', 'No video found'),
+                           task.get('timestamp', 'No timestamp'), task.get('date', ''),
+                           topic_name=task.get('topic_name', ''))
+    return {'notes': notes}
+
+def build_day_entry(date, value):
+    """Shape one day of the stored plan, filling in fallbacks for anything missing."""
+    subtopic, youtube_link, timestamp = split_day_value(value)
+    entry = value if isinstance(value, dict) else {}
+    day = {
+        'subtopic': subtopic,
+        'youtube_link': youtube_link,
+        'timestamp': timestamp,
+        'notes': entry.get('notes') or ('No notes available.' if subtopic else None),
+        'quizzes': entry.get('quizzes') or fallback_quizzes(subtopic),
+        'assignments': entry.get('assignments') or assignment_templates(subtopic)
+    }
+    # Days assembled from several videos list them all; youtube_link/timestamp is the first
+    if entry.get('videos'):
+        day['videos'] = entry['videos']
+    return day
+
+def enrich_day(date, value, fresh=False, topic_name=''):
+    """Generate notes, then quizzes and assignments, for a single day of the plan (fresh: bypass the notes cache)."""
+    subtopic, youtube_link, timestamp = split_day_value(value)
+    notes = generate_notes(subtopic, youtube_link, timestamp, date, use_cache=not fresh, topic_name=topic_name)
+    quizzes, assignments = generate_quizzes(subtopic, youtube_link, timestamp, notes, date, topic_name=topic_name)
+    day = {
+        'subtopic': subtopic,
+        'youtube_link': youtube_link,
+        'timestamp': timestamp,
+        'notes': notes,
+        'quizzes': quizzes if quizzes else [],
+        'assignments': assignments if assignments else []
+    }
+    if isinstance(value, dict) and value.get('videos'):
+        day['videos'] = value['videos']
+    return day
 
+def fetch_plan_videos(topic_name, plan, daily_hours, no_of_days):
+    """
+    Attach videos to a date->subtopic plan via the Video Fetcher. Falls back to a
+    skeleton plan without videos when the service is down or slow.
+    """
     # 2. Call video fetcher service with proper error handling and visual feedback
-    plan_with_videos = plan.copy()  # Default fallback if video fetcher fails
+    # Skeleton fallback: every day keeps its subtopic, without a video
+    plan_with_videos = {
+        date: {'subtopic': subtopic, 'youtube_link': 'No video found', 'timestamp': 'No timestamp'}
+        for date, subtopic in plan.items()
+    }
     
-    with console.status("[bold yellow]Connecting to Video Fetcher service...", spinner="dots") as status:
-        video_fetcher_url = 'http://localhost:5103/fetch_videos'
+    with console_status("[bold yellow]Connecting to Video Fetcher service..."):
         request_payload = {
             'topic_name': topic_name,
             'plan': plan,
@@ -191,33 +350,19 @@ def generate_plan():
             'target_days': no_of_days
         }
 
-        console.print(f"[dim]Video Fetcher URL:[/dim] {video_fetcher_url}")
+        console.print(f"[dim]Video Fetcher URL:[/dim] {video_fetcher.base_url}/fetch_videos")
 
-        # First try a health check
-        try:
-            health_check = requests.get('http://localhost:5103/health', timeout=5)
-            if health_check.status_code == 200:
-                console.print("[green]✓ Video Fetcher service is healthy[/green]")
-            else:
-                console.print(f"[yellow]⚠ Video Fetcher health check returned status {health_check.status_code}[/yellow]")
-        except Exception as health_err:
-            console.print(f"[yellow]⚠ Video Fetcher health check failed: {str(health_err)}[/yellow]")
-
-        # Now make the actual request
         try:
             start = time.time()
-            video_resp = requests.post(
-                video_fetcher_url,
-                json=request_payload,
-                timeout=30,
-                headers={'Content-Type': 'application/json'}
-            )
+            video_data = video_fetcher.post('/fetch_videos', request_payload)
             elapsed = time.time() - start
 
-            video_resp.raise_for_status()
-            video_data = video_resp.json()
-
             console.print(f"[green]✓ Video Fetcher response received[/green] [dim]({elapsed:.2f}s)[/dim]")
+            assembly = video_data.get('assembly')
+            if assembly:
+                console.print(f"[dim]Videos for {assembly['days_with_video']}/{assembly['days']} days, "
+                              f"{assembly['quota_units']} YouTube quota units, "
+                              f"average fill {assembly['avg_fill']}[/dim]")
 
             # Display video results in a table
             video_table = Table(title="Videos Retrieved")
@@ -225,7 +370,7 @@ def generate_plan():
             video_table.add_column("Subtopic", style="green")
             video_table.add_column("Video Link", style="blue")
 
-            plan_with_videos = video_data.get('plan', plan)
+            plan_with_videos = video_data.get('plan', plan_with_videos)
 
             for date, value in plan_with_videos.items():
                 if isinstance(value, dict):
@@ -235,9 +380,12 @@ def generate_plan():
                     subtopic = value
                     youtube_link = 'No video found'
 
-                video_table.add_row(date, subtopic, youtube_link)
+                video_table.add_row(date, subtopic, youtube_link or 'No video found')
 
             console.print(video_table)
+
+        except CircuitOpenError as e:
+            console.print(f"[yellow]⚠ {str(e)}; continuing with skeleton plan without videos[/yellow]")
             
         except requests.exceptions.ConnectionError as e:
             console.print(Panel(
@@ -255,7 +403,7 @@ def generate_plan():
             console.print(Panel(
                 f"[bold red]Video Fetcher Timeout[/bold red]\n"
                 f"[yellow]Error:[/yellow] {str(e)}\n\n"
-                "[white]The request timed out after 30 seconds[/white]",
+                f"[white]The request timed out after {video_fetcher.timeout:.0f} seconds[/white]",
                 title="Timeout Error",
                 border_style="red"
             ))
@@ -265,6 +413,10 @@ def generate_plan():
             if hasattr(e, 'response') and e.response:
                 console.print(f"[dim]Response content:[/dim] {e.response.text[:200]}")
 
+    return plan_with_videos
+
+def enrich_plan(plan_with_videos, on_day=None, topic_name=''):
+    """Generate notes, quizzes and assignments for every day of a plan, passing each finished day to on_day(date, entry)."""
     # 3. Process each day's content
     enriched_plan = {}
     
@@ -272,6 +424,7 @@ def generate_plan():
         SpinnerColumn(),
         TextColumn("[bold blue]{task.description}"),
         TimeElapsedColumn(),
+        disable=not LIVE_DISPLAY,
     ) as progress:
         
         task = progress.add_task(f"[green]Enriching study plan with notes and quizzes...", total=len(plan_with_videos))
@@ -280,80 +433,198 @@ def generate_plan():
             # Update progress description
             progress.update(task, description=f"[green]Processing day: {date}")
             
-            # Extract values
-            if isinstance(value, dict):
-                subtopic = value.get('subtopic') or value.get('name') or ''
-                youtube_link = value.get('youtube_link', 'No video found')
-                timestamp = value.get('timestamp', 'No timestamp')
-            else:
-                subtopic = value
-                youtube_link = 'No video found'
-                timestamp = 'No timestamp'
-            
-            # Generate notes for the subtopic
-            notes = None
-            if subtopic:
-                prompt_parts = [
-                    "Generate concise study notes (about 150 words) for the following subtopic, focusing ONLY on the segment",
-                ]
-                if youtube_link and timestamp and youtube_link != 'No video found':
-                    prompt_parts.append(f"[{timestamp}] of this YouTube video: {youtube_link}. ")
-                prompt_parts.append(f"Subtopic: {subtopic}. Respond ONLY with the notes as a string, no extra explanation.")
-                notes_prompt = " ".join(prompt_parts)
-                
-                for attempt in range(3):
-                    try:
-                        notes_response = call_gemini(notes_prompt)
-                        if notes_response and notes_response.strip() and 'no notes available' not in notes_response.lower():
-                            notes = notes_response.strip()
-                            break
-                    except Exception as e:
-                        console.print(f"[yellow]⚠ Notes generation attempt {attempt+1} failed for {subtopic} ({date}): {str(e)}[/yellow]")
-                        time.sleep(1)  # Small delay before retry
-                
-                if not notes:
-                    console.print(f"[yellow]⚠ Failed to generate notes for {subtopic} ({date})[/yellow]")
-                    notes = 'No notes available.'
-            
-            # 4. Generate quizzes and assignments
-            quizzes = []
-            assignments = []
-            
-            try:
-                quiz_resp = requests.post(
-                    'http://localhost:5104/generate_quiz_and_assignments',
-                    json={
-                        'subtopic': subtopic,
-                        'timestamp': timestamp,
-                        'youtube_link': youtube_link,
-                        'study_notes': notes
-                    },
-                    timeout=30,
-                    headers={'Content-Type': 'application/json'}
-                )
-                
-                quiz_data = quiz_resp.json()
-                quizzes = quiz_data.get('quizzes', [])
-                assignments = quiz_data.get('assignments', [])
-                
-            except Exception as e:
-                console.print(f"[yellow]⚠ Quiz generation failed for {subtopic} ({date}): {str(e)}[/yellow]")
-            
-            # Build enriched entry
-            enriched_plan[date] = {
-                'subtopic': subtopic,
-                'youtube_link': youtube_link,
-                'timestamp': timestamp,
-                'notes': notes,
-                'quizzes': quizzes if quizzes else [],
-                'assignments': assignments if assignments else []
-            }
+            # Each day has its own share of the plan deadline, so earlier days cannot use up later ones'
+            with deadline_scope(config.PLAN_DAY_DEADLINE_SECONDS):
+                enriched_plan[date] = enrich_day(date, value, topic_name=topic_name)
+                if on_day is not None:
+                    on_day(date, enriched_plan[date])
             
             # Update progress
             progress.update(task, advance=1)
 
-    # Format the final response
-    response = {
+    return enriched_plan
+
+class PlanGenerationError(Exception):
+    """Raised when the LLM call for a study plan fails or returns unparseable output."""
+
+    def __init__(self, message, **details):
+        super().__init__(message)
+        self.details = details
+
+def normalize_topic(topic_name):
+    return ' '.join(str(topic_name).lower().split())
+
+def parse_no_of_days(value):
+    """
+    Raises:
+        ValueError: If value is not a whole number of at least 1.
+    """
+    if isinstance(value, bool):
+        raise ValueError("'no_of_days' must be a positive integer")
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    try:
+        days = int(str(value).strip())
+    except (TypeError, ValueError):
+        raise ValueError("'no_of_days' must be a positive integer") from None
+    if days < 1:
+        raise ValueError("'no_of_days' must be a positive integer")
+    return days
+
+def plan_deadline(no_of_days):
+    """Seconds a plan may take: PLAN_DEADLINE_SECONDS plus PLAN_DAY_DEADLINE_SECONDS per day."""
+    try:
+        days = max(1, int(no_of_days))
+    except (TypeError, ValueError):
+        days = 1
+    return config.PLAN_DEADLINE_SECONDS + days * config.PLAN_DAY_DEADLINE_SECONDS
+
+def request_llm_json(prompt, api_key=None, what='curriculum', schema=None, latency_critical=True, task='curriculum'):
+    """
+    Run a prompt that must answer with JSON. Wrapped, slightly malformed or truncated
+    responses are repaired locally; only what cannot be repaired is sent back to the
+    model as a targeted "fix only this part" follow-up.
+
+    Raises:
+        PlanGenerationError: If the LLM call fails or the response cannot be repaired.
+    """
+    console.print(f"[dim cyan]Gemini Prompt ({what}):[/dim cyan] {prompt}")
+    start = time.time()
+    try:
+        # Allow per-request API key override from backend proxy
+        response = generate_with_llm(prompt, api_key=api_key, latency_critical=latency_critical, task=task,
+                                     validate=lambda text: is_usable_json(text, schema))
+    except Exception as e:
+        elapsed = time.time() - start
+        console.print(f"[bold red]✗ Gemini API Error[/bold red] [dim]({elapsed:.2f}s)[/dim]: {str(e)}")
+        raise PlanGenerationError(f"Gemini API error: {str(e)}")
+    elapsed = time.time() - start
+    console.print(f"[green]✓ Gemini API response received[/green] [dim]({what}, {elapsed:.2f}s)[/dim]")
+
+    try:
+        return parse_llm_json(response, schema, fix=lambda fix_prompt: generate_with_llm(fix_prompt, api_key=api_key, task='json_fix'),
+                              name=what)
+    except JSONRepairError as e:
+        console.print(f"[bold red]✗ JSON Parse Error:[/bold red] {str(e)}")
+        console.print(f"[bold red]Raw response:[/bold red] {response}")
+        raise PlanGenerationError(f"Failed to parse Gemini response: {str(e)}", gemini_response=response)
+
+def generate_phase_curriculum(topic_name, phases, index, api_key=None):
+    """Curriculum for one outline phase; falls back to the phase itself as a single subtopic."""
+    phase = phases[index]
+    try:
+        curriculum = parse_curriculum(request_llm_json(
+            chunk_prompt(topic_name, phases, index), api_key=api_key,
+            what=f"phase {index + 1}/{len(phases)} curriculum", schema=CURRICULUM_SCHEMA, latency_critical=False
+        ))
+    except (PlanGenerationError, ValueError) as e:
+        deadline = current_deadline()
+        if deadline is not None and deadline.expired:
+            raise
+        console.print(f"[yellow]⚠ Phase {index + 1} curriculum failed, using the phase outline:[/yellow] {str(e)}")
+        curriculum = [(phase['name'], float(phase['days']))]
+    return phase['days'], curriculum
+
+def generate_chunked_curriculum(topic_name, no_of_days, api_key=None):
+    """
+    Long plans: an outline of phases first, then each phase's subtopics in parallel (with the
+    neighbouring phases as overlap context), merged in order with near-duplicates folded.
+    No single LLM response has to cover the whole plan, so its size is bounded by the chunk.
+
+    Raises:
+        PlanGenerationError: If the outline cannot be generated.
+    """
+    phases_wanted = phase_count(no_of_days, config.PLAN_CHUNK_DAYS)
+    try:
+        phases = parse_outline(request_llm_json(
+            outline_prompt(topic_name, no_of_days, phases_wanted), api_key=api_key, what='outline',
+            schema=OUTLINE_SCHEMA, task='plan_outline'
+        ), no_of_days)
+    except ValueError as e:
+        raise PlanGenerationError(f"Gemini returned an unusable outline: {str(e)}")
+    console.print(f"[green]✓ Outline ready[/green] [dim]({len(phases)} phases: "
+                  f"{', '.join(p['name'] for p in phases)})[/dim]")
+
+    # Each worker runs in a copy of this context so the request deadline and retry budget apply
+    with ThreadPoolExecutor(max_workers=config.PLAN_CHUNK_WORKERS, thread_name_prefix='plan-chunk') as executor:
+        futures = [
+            executor.submit(contextvars.copy_context().run, generate_phase_curriculum, topic_name, phases, i, api_key)
+            for i in range(len(phases))
+        ]
+        chunks = [future.result() for future in futures]
+
+    curriculum = merge_chunks(chunks, threshold=config.SIMILARITY_THRESHOLD)
+    console.print(f"[green]✓ Merged {sum(len(c) for _, c in chunks)} phase subtopics into {len(curriculum)}[/green]")
+    return curriculum
+
+def get_curriculum(topic_name, no_of_days, api_key=None, use_cache=True):
+    """
+    Ordered, weighted subtopics for a topic from the LLM. The curriculum does not depend
+    on start date or daily hours, so it is cached per (topic, days). Plans longer than
+    PLAN_CHUNK_THRESHOLD_DAYS are generated in chunks.
+
+    Raises:
+        PlanGenerationError: If the LLM call fails or its response is not a usable curriculum.
+    """
+    cache_key = (normalize_topic(topic_name), str(no_of_days))
+    if use_cache:
+        curriculum = curriculum_cache.get(cache_key)
+        if curriculum:
+            console.print(f"[green]✓ Curriculum served from cache[/green] [dim]({len(curriculum)} subtopics)[/dim]")
+            return curriculum
+
+    console.print(f"[dim]API Key configured: {'YES' if os.getenv('GEMINI_API_KEY') else 'NO'}[/dim]")
+    with console_status(f"[bold green]Generating curriculum with Gemini for {topic_name}..."):
+        if int(no_of_days) > config.PLAN_CHUNK_THRESHOLD_DAYS:
+            curriculum = generate_chunked_curriculum(topic_name, no_of_days, api_key=api_key)
+        else:
+            data = request_llm_json(curriculum_prompt(topic_name, no_of_days), api_key=api_key,
+                                    schema=CURRICULUM_SCHEMA)
+            try:
+                curriculum = parse_curriculum(data)
+            except ValueError as e:
+                raise PlanGenerationError(f"Gemini returned an unusable curriculum: {str(e)}", gemini_response=data)
+
+    curriculum_cache.set(cache_key, curriculum)
+    return curriculum
+
+def build_plan(topic_name, no_of_days, start_date, daily_hours, api_key=None, use_cache=True):
+    """
+    Build the date->subtopic plan: the LLM supplies only the ordered curriculum, and
+    dates, multi-day splits and daily-hour balancing are assigned locally.
+
+    Returns:
+        tuple: (plan, hours) with plan mapping date -> subtopic label and hours mapping
+            date -> [{'subtopic', 'hours'}], the day's study hours per subtopic
+
+    Raises:
+        PlanGenerationError: If the curriculum cannot be generated.
+        ValueError: If start_date is not YYYY-MM-DD.
+    """
+    curriculum = get_curriculum(topic_name, no_of_days, api_key=api_key, use_cache=use_cache)
+    scheduled = schedule_curriculum(curriculum, no_of_days, start_date, daily_hours)
+    if scheduled is None:
+        raise ValueError("start_date must be in YYYY-MM-DD format")
+    plan, hours = scheduled
+
+    # Display the plan in a table
+    plan_table = Table(title=f"Study Plan for {topic_name}")
+    plan_table.add_column("Date", style="cyan")
+    plan_table.add_column("Subtopic", style="green")
+    
+    for date, subtopic in plan.items():
+        plan_table.add_row(date, subtopic)
+    
+    console.print(plan_table)
+    return plan, hours
+
+def with_hours(entry, day_hours):
+    """A day entry carrying its per-subtopic study hours (consumers such as /materials size content by them)."""
+    return {**entry, 'hours': day_hours} if day_hours else entry
+
+def plan_document(request_id, topic_name, no_of_days, start_date, daily_hours, enriched_plan):
+    """The learning path document returned to clients and stored in `learning_paths`."""
+    return {
         'status': 'success',
         'topic_name': topic_name,
         'no_of_days': no_of_days,
@@ -364,32 +635,326 @@ def generate_plan():
         'generated_at': datetime.now().isoformat()
     }
 
-    # Save to MongoDB with proper error handling
-    if learning_paths_collection is not None:
-        console.print(f"[yellow]Saving learning path to MongoDB...[/yellow]")
-        response['created_at'] = datetime.now().isoformat()
-        response['updated_at'] = datetime.now().isoformat()
-        response['request_id'] = request_id
-        response['topic_name'] = topic_name
-        response['no_of_days'] = no_of_days
-        response['start_date'] = start_date
-        response['daily_hours'] = daily_hours
-        response['plan'] = enriched_plan
-        response['status'] = 'success'
-        response['request_id'] = request_id
+def warm_plan(topic_name, no_of_days, daily_hours):
+    """Regenerate one popular combination into the plan, notes, quiz and video caches without storing it."""
+    with deadline_scope(plan_deadline(no_of_days), max_retries=config.PLAN_RETRY_BUDGET), \
+            priority_scope('background'):
+        start_date = datetime.now().strftime('%Y-%m-%d')
+        plan, _ = build_plan(topic_name, no_of_days, start_date, daily_hours, use_cache=False)
+        enrich_plan(fetch_plan_videos(topic_name, plan, daily_hours, no_of_days), topic_name=topic_name)
+
+@app.route('/health', methods=['GET'])
+def health_check():
+    """Health check endpoint for the MCP Server"""
+    status = {
+        "service": "MCP Server",
+        "status": "healthy",
+        "timestamp": datetime.now().isoformat(),
+        "mongodb_connected": learning_paths_collection is not None,
+        "dependencies": {
+            client.name: client.status() for client in (video_fetcher, quiz_generator)
+        },
+        "ai_routes": ai_router.snapshot(),
+        "ai_routing": routing_table(),
+        "caches": {
+            "notes_index": notes_index.stats(),
+            "curriculum_cache": curriculum_cache.stats()
+        },
+        "cache_warmer": cache_warmer.stats() if cache_warmer else None,
+        "json_repair": json_repair_stats.snapshot(),
+        "ai_usage": token_ledger.snapshot(),
+        "fair_scheduling": llm_slots.stats(),
+        "admission": admission.stats(),
+        "write_behind": plan_writer.stats(),
+        "plan_reads": response_stats.snapshot(),
+        "plan_checkpoints": plan_checkpoints.stats() if plan_checkpoints else None,
+        "sharding": shard_router.stats()
+    }
+    return jsonify(status)
+
+@app.after_request
+def tag_serving_node(response):
+    # Relayed responses keep the owner's tag
+    response.headers.setdefault(SERVED_BY_HEADER, shard_router.node)
+    return response
+
+@app.route('/cluster', methods=['GET'])
+def cluster_status():
+    """This node's view of the shard ring, its routing counters and its cache hit rates."""
+    return jsonify({
+        **shard_router.stats(),
+        'caches': {
+            'curriculum_cache': curriculum_cache.stats(),
+            'notes_index': notes_index.stats()
+        },
+        'ai_usage': token_ledger.snapshot()
+    })
+
+@app.route('/cluster/join', methods=['POST'])
+def cluster_join():
+    """A peer announcing itself ({"url": ...}); it is added to the ring."""
+    return cluster_membership(shard_router.add_peer)
+
+@app.route('/cluster/leave', methods=['POST'])
+def cluster_leave():
+    """A peer shutting down ({"url": ...}); its topics move to their next owners."""
+    return cluster_membership(shard_router.remove_peer)
+
+def cluster_membership(change):
+    url = (request.get_json(silent=True) or {}).get('url')
+    if not url:
+        return jsonify({'error': 'url is required'}), 400
+    if not shard_router.authorized(request.headers.get(CLUSTER_TOKEN_HEADER), url):
+        return jsonify({'error': 'Invalid cluster token or unknown peer'}), 403
+    changed = change(url)
+    return jsonify({'changed': changed, 'members': shard_router.ring.nodes})
+
+# Live /generate_plan requests in flight; the cache warmer backs off while this is non-zero
+active_plan_requests = 0
+active_plan_requests_lock = threading.Lock()
+
+# Warming runs are charged what the token ledger records for their LLM calls
+token_ledger.add_listener(record_tokens)
+
+cache_warmer = CacheWarmer(
+    learning_paths_collection,
+    warm_plan,
+    is_busy=lambda: active_plan_requests > 0,
+    top_n=config.WARMER_TOP_N,
+    max_plans_per_run=config.WARMER_MAX_PLANS_PER_RUN,
+    token_budget=config.WARMER_TOKEN_BUDGET,
+    off_peak_hours=config.WARMER_OFF_PEAK_HOURS,
+    interval=config.WARMER_INTERVAL,
+    lookback_days=config.WARMER_LOOKBACK_DAYS,
+    refresh_after=config.PLAN_CACHE_TTL,
+    owns=lambda topic: shard_router.owner(normalize_topic(topic)) == shard_router.node
+) if learning_paths_collection is not None else None
+
+@contextmanager
+def live_request():
+    """
+    Scope for a live plan request: counted in active_plan_requests, bounded by the plan
+    deadline for its number of days (or the shorter X-Deadline-Ms of a relaying peer) and
+    retry budget, and run for
+    the tenant in X-Tenant-Id or the body's tenant_id, user_id or api_key, which its outbound
+    LLM and YouTube calls are fair-queued under.
+    """
+    global active_plan_requests
+    data = request.get_json(silent=True) or {}
+    tenant = request_tenant(request.headers, data)
+    deadline = min(plan_deadline(data.get('no_of_days')), deadline_from_headers(request.headers) or float('inf'))
+    with active_plan_requests_lock:
+        active_plan_requests += 1
+    try:
+        with deadline_scope(deadline, max_retries=config.PLAN_RETRY_BUDGET), \
+                tenant_scope(tenant):
+            yield
+    finally:
+        with active_plan_requests_lock:
+            active_plan_requests -= 1
+
+@app.route('/generate_plan', methods=['POST'])
+def generate_plan():
+    """
+    Main endpoint to generate learning plans. Runs under a per-request deadline and
+    shared retry budget so retries in call_ai, notes and downstream services cannot
+    push the request past its SLO, and on behalf of the tenant named in X-Tenant-Id
+    (or the body's tenant_id, user_id or api_key), whose model routing overrides and
+    fair share of outbound LLM and YouTube slots apply.
+
+    With several MCP nodes, a request for a topic another node owns is relayed there
+    and the owner's response returned as is. Relayed requests skip admission here; one
+    served here after all (its owner could not be reached) is admitted first.
+    """
+    relayed = relay_to_topic_owner()
+    if relayed is not None:
+        return relayed
+    shed = admission.admit()
+    if shed is not None:
+        return shed
+    with live_request():
+        return _generate_plan()
+
+def plan_relay_target():
+    """The node this /generate_plan request would be relayed to, or None if it is served here."""
+    data = request.get_json(silent=True) or {}
+    if not data.get('topic_name') or len(shard_router.ring) < 2:
+        return None
+    return shard_router.relay_target(normalize_topic(data['topic_name']), request.headers)
+
+def relay_to_topic_owner():
+    """The owning node's response to this /generate_plan request, or None to serve it here."""
+    data = request.get_json(silent=True) or {}
+    if not data.get('topic_name') or len(shard_router.ring) < 2:
+        return None
+    headers = {name: request.headers[name] for name in (IDEMPOTENCY_HEADER, FORWARDED_HEADER)
+               if name in request.headers}
+    try:
+        deadline = plan_deadline(data.get('no_of_days'))
+        with deadline_scope(deadline), tenant_scope(request_tenant(request.headers, data)):
+            resp = shard_router.relay(normalize_topic(data['topic_name']), '/generate_plan', data, headers,
+                                      timeout=deadline)
+    except RelayTimeout as e:
+        # The owner may still finish the plan; a retry with the same Idempotency-Key picks it up
+        response = jsonify({'error': f"Topic owner {e.owner} did not answer in time", 'retryable': True})
+        response.headers['Retry-After'] = str(max(1, round(config.SHARD_HEALTH_INTERVAL)))
+        return response, 504
+    if resp is None:
+        return None
+    relayed = Response(resp.content, status=resp.status_code,
+                       content_type=resp.headers.get('Content-Type', 'application/json'))
+    for name in (SERVED_BY_HEADER, 'Retry-After'):
+        if name in resp.headers:
+            relayed.headers[name] = resp.headers[name]
+    return relayed
+
+def _generate_plan():
+    """
+    Generate a learning plan with advanced error handling
+    and rich visual feedback
+    """
+    # Generate a unique request ID
+    request_id = str(uuid.uuid4())[:8]
+    console.print(f"\n[bold blue]╔══════════════════════════════════════════════════════════════╗[/bold blue]")
+    console.print(f"[bold blue]║[/bold blue] [bold yellow]⚡ New Request[/bold yellow] [ID: {request_id}] - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} [bold blue]║[/bold blue]")
+    console.print(f"[bold blue]╚══════════════════════════════════════════════════════════════╝[/bold blue]")
+    
+    # Extract and validate request data
+    try:
+        data = request.json
+        required_fields = ['topic_name', 'no_of_days', 'start_date', 'daily_hours']
+        
+        # Log incoming request
+        console.print(Panel.fit(
+            f"[bold cyan]Request Data:[/bold cyan]\n" +
+            "\n".join([f"[yellow]{k}:[/yellow] {v}" for k, v in data.items()]),
+            title=f"Request {request_id}",
+            border_style="blue"
+        ))
+        
+        # Validate required fields
+        missing_fields = [field for field in required_fields if field not in data]
+        if missing_fields:
+            error_msg = f"Missing required fields: {', '.join(missing_fields)}"
+            console.print(f"[bold red]✗ Validation Error:[/bold red] {error_msg}")
+            return jsonify({"error": error_msg, "request_id": request_id}), 400
+        
+        # Extract fields
+        topic_name = data.get('topic_name')
+        no_of_days = data.get('no_of_days')
+        start_date = data.get('start_date')
+        daily_hours = data.get('daily_hours')
         try:
-            with console.status("[bold green]Saving to MongoDB...", spinner="dots") as status:
-                result = learning_paths_collection.insert_one(response)
-                response['_id'] = str(result.inserted_id)
-                console.print(f"[bold green]✓ Learning path saved to MongoDB[/bold green] [dim](ID: {result.inserted_id})[/dim]")
-        except OperationFailure as e:
-            console.print(f"[bold red]✗ MongoDB Operation Failed:[/bold red] {str(e)}")
-            return jsonify({"error": f"Failed to save to MongoDB: {str(e)}", "request_id": request_id}), 500
-        except Exception as e:
-            console.print(f"[bold red]✗ MongoDB Error:[/bold red] {str(e)}")
-            return jsonify({"error": f"Database error: {str(e)}", "request_id": request_id}), 500
+            no_of_days = parse_no_of_days(no_of_days)
+        except ValueError as e:
+            console.print(f"[bold red]✗ Validation Error:[/bold red] {str(e)}")
+            return jsonify({"error": str(e), "request_id": request_id}), 400
+        datetime.strptime(str(start_date), '%Y-%m-%d')
+        fingerprint = request_fingerprint(topic_name, no_of_days, start_date, daily_hours)
+        idempotency_key = str(request.headers.get(IDEMPOTENCY_HEADER) or data.get('idempotency_key') or request_id)
+        
+    except Exception as e:
+        console.print(f"[bold red]✗ Request Parsing Error:[/bold red] {str(e)}")
+        return jsonify({"error": f"Failed to parse request: {str(e)}", "request_id": request_id}), 400
+
+    # Claim the plan's checkpoint: a retry with the same idempotency key resumes it
+    checkpoint = None
+    if plan_checkpoints is not None:
+        try:
+            checkpoint, state = plan_checkpoints.claim(idempotency_key, {
+                **plan_document(request_id, topic_name, no_of_days, start_date, daily_hours, {}),
+                'request_fingerprint': fingerprint
+            })
+        except IdempotencyConflict as e:
+            return jsonify({"error": str(e), "request_id": request_id}), 422
+        except PyMongoError as e:
+            console.print(f"[yellow]⚠ Could not checkpoint plan, generating without: {str(e)}[/yellow]")
+            state = 'new'
+        if state == 'busy':
+            return jsonify({
+                "error": "A request with this idempotency key is still generating; retry later",
+                "request_id": request_id
+            }), 409
+        if state == 'done':
+            console.print(f"[green]✓ Plan for idempotency key {idempotency_key} already generated; replaying it[/green]")
+            checkpoint['_id'] = str(checkpoint['_id'])
+            for field in ('schedule', 'schedule_hours', 'request_fingerprint'):
+                checkpoint.pop(field, None)
+            return jsonify(checkpoint)
+        if state == 'resumed':
+            request_id = checkpoint['request_id']
+            console.print(f"[bold green]✓ Resuming plan {request_id}[/bold green] "
+                          f"[dim]({len(checkpoint.get('plan') or {})} day(s) already checkpointed)[/dim]")
+
+    # 1. Generate study plan with Gemini (a resumed plan keeps its stored schedule)
+    plan = checkpoint.get('schedule') if checkpoint else None
+    hours = (checkpoint.get('schedule_hours') or {}) if checkpoint else {}
+    if not plan:
+        try:
+            plan, hours = build_plan(topic_name, no_of_days, start_date, daily_hours, api_key=data.get('api_key'))
+        except PlanGenerationError as e:
+            if checkpoint:
+                plan_checkpoints.release(checkpoint['_id'])
+            return jsonify({"error": str(e), **e.details, "request_id": request_id}), 500
+        if checkpoint:
+            plan_checkpoints.save_schedule(checkpoint['_id'], plan, hours)
+
+    # Only days without a checkpoint are generated. A day that finishes after the deadline
+    # has expired may carry fallbacks, so it is not checkpointed and a retry redoes it.
+    finished = dict(checkpoint.get('plan') or {}) if checkpoint else {}
+    pending = {date: subtopic for date, subtopic in plan.items() if date not in finished}
+    deadline = current_deadline()
+    checkpointed = set(finished)
+
+    def checkpoint_day(date, entry):
+        # Checked at call time: a day's own deadline (see enrich_plan) may have expired
+        day_deadline = current_deadline()
+        if checkpoint and not (day_deadline is not None and day_deadline.expired):
+            plan_checkpoints.save_day(checkpoint['_id'], date, with_hours(entry, hours.get(date)))
+            checkpointed.add(date)
+
+    # 2-4. Attach videos, then notes, quizzes and assignments for every day
+    if not pending:
+        generated = {}
+    elif config.PLAN_DISPATCH_MODE == 'events':
+        generated = {
+            date: build_day_entry(date, value)
+            for date, value in plan_dispatcher.run_plan(request_id, pending, {
+                'topic_name': topic_name,
+                'daily_hours': daily_hours
+            }, timeout=deadline.remaining(),
+               on_day=lambda date, day: checkpoint_day(date, build_day_entry(date, day))).items()
+        }
+    else:
+        plan_with_videos = fetch_plan_videos(topic_name, pending, daily_hours, len(pending))
+        generated = enrich_plan(plan_with_videos, on_day=checkpoint_day, topic_name=topic_name)
+    enriched_plan = {date: finished.get(date) or with_hours(generated[date], hours.get(date)) for date in plan}
+
+    # Format the final response
+    response = plan_document(request_id, topic_name, no_of_days, start_date, daily_hours, enriched_plan)
+    response['idempotency_key'] = idempotency_key
+
+    # The finished plan is queued, not awaited; until it lands, GET and edits of the returned
+    # ids answer 202 with Retry-After (see ensure_written). While MongoDB is unreachable it is
+    # spooled to disk and written on reconnect
+    if checkpoint:
+        # Finish the checkpointed document, or leave it resumable if some days are incomplete
+        if checkpointed >= set(plan):
+            plan_checkpoints.complete(checkpoint['_id'], response)
+            console.print(f"[bold green]✓ Learning path queued for MongoDB[/bold green] [dim](ID: {checkpoint['_id']})[/dim]")
+        else:
+            plan_checkpoints.release(checkpoint['_id'])
+            response['resumable'] = True
+            console.print(f"[yellow]⚠ {len(set(plan) - checkpointed)} day(s) incomplete; retry with "
+                          f"idempotency key {idempotency_key} to finish them[/yellow]")
+        response['_id'] = str(checkpoint['_id'])
     else:
-        console.print("[yellow]⚠ MongoDB not available, skipping database save[/yellow]")
+        now = datetime.now().isoformat()
+        document_id = ObjectId()
+        plan_writer.insert(encode_document({**response, '_id': document_id, 'created_at': now, 'updated_at': now}),
+                           keys=(request_id, str(document_id)))
+        response['_id'] = str(document_id)
+        console.print(f"[bold green]✓ Learning path queued for MongoDB[/bold green] [dim](ID: {document_id})[/dim]")
 
     # Print response summary
     console.print(Panel.fit(
@@ -404,7 +969,308 @@ def generate_plan():
 
     return jsonify(response)
 
+class PlanRequestError(Exception):
+    """Raised when a request for a stored plan cannot be served; carries the HTTP status to answer with."""
+
+    def __init__(self, message, status=400, retry_after=None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+def plan_error_response(error):
+    response = jsonify({"error": str(error)})
+    if error.retry_after is not None:
+        response.headers['Retry-After'] = str(error.retry_after)
+    return response, error.status
+
+def ensure_written(plan_id):
+    """
+    Raises:
+        PlanRequestError: 202 with Retry-After while the plan's final write is still queued.
+    """
+    if plan_writer.pending(plan_id):
+        raise PlanRequestError(f"Learning path {plan_id} is being saved; retry shortly", 202,
+                               retry_after=max(1, round(plan_writer.flush_interval)))
+
+def find_plan(plan_id):
+    """
+    Load a stored learning path by request_id or Mongo _id.
+
+    Raises:
+        PlanRequestError: 202 while its final write is queued, 503 without MongoDB, 404 if
+            there is no such plan, 409 while it is still generating.
+    """
+    ensure_written(plan_id)
+    if learning_paths_collection is None:
+        raise PlanRequestError("MongoDB not available; stored plans cannot be edited", 503)
+    doc = learning_paths_collection.find_one(plan_query(plan_id))
+    if doc is None:
+        raise PlanRequestError(f"No learning path with id {plan_id}", 404)
+    if doc.get('status') == 'in_progress':
+        raise PlanRequestError(f"Learning path {plan_id} is still being generated", 409)
+    return doc
+
+def save_plan_days(doc, updated=None, removed=()):
+    """
+    Write only the changed days of a stored plan: `$set` on plan.<date> for each updated
+    day and `$unset` for removed ones, leaving every other day entry untouched. The write
+    is conditional on updated_at, so two concurrent edits of one plan cannot interleave.
+
+    Raises:
+        PlanRequestError: 409 if the plan changed since it was read.
+    """
+    updated = updated or {}
+    days = len(set(doc.get('plan', {})) - set(removed) | set(updated))
+    now = datetime.now().isoformat()
+    update = {'$set': {**{f'plan.{date}': encode_day(entry) for date, entry in updated.items()},
+                       'no_of_days': days, 'updated_at': now}}
+    if removed:
+        update['$unset'] = {f'plan.{date}': '' for date in removed}
+    result = learning_paths_collection.update_one({'_id': doc['_id'], 'updated_at': doc.get('updated_at')}, update)
+    if result.matched_count == 0:
+        raise PlanRequestError("Learning path was modified concurrently; retry the edit", 409)
+    console.print(f"[bold green]✓ Updated {len(updated)} and removed {len(removed)} day(s) of "
+                  f"{doc.get('request_id')}[/bold green]")
+    return {
+        'status': 'success',
+        'request_id': doc.get('request_id'),
+        '_id': str(doc['_id']),
+        'no_of_days': days,
+        'updated': updated,
+        'removed': list(removed),
+        'updated_at': now
+    }
+
+def regenerate_days(doc, plan):
+    """Fetch videos and regenerate notes, quizzes and assignments for a date->subtopic sub-plan."""
+    plan_with_videos = fetch_plan_videos(doc['topic_name'], plan, doc.get('daily_hours'), len(plan))
+    return {date: enrich_day(date, plan_with_videos.get(date, plan[date]), fresh=True, topic_name=doc['topic_name'])
+            for date in plan}
+
+def edit_plan(handler):
+    """Run a plan edit as a live request, turning edit errors into JSON error responses."""
+    with live_request():
+        try:
+            return jsonify(handler())
+        except PlanRequestError as e:
+            console.print(f"[bold red]✗ Plan edit failed:[/bold red] {str(e)}")
+            return plan_error_response(e)
+        except PlanGenerationError as e:
+            return jsonify({"error": str(e), **e.details}), 500
+        except PyMongoError as e:
+            console.print(f"[bold red]✗ MongoDB Error:[/bold red] {str(e)}")
+            return jsonify({"error": f"Database error: {str(e)}"}), 500
+
+def edit_days_count(data):
+    try:
+        days = int((data or {}).get('days'))
+    except (TypeError, ValueError):
+        raise PlanRequestError("'days' must be a positive integer")
+    if days < 1:
+        raise PlanRequestError("'days' must be a positive integer")
+    return days
+
+@app.route('/plans/<plan_id>/days/<date>/regenerate', methods=['POST'])
+def regenerate_plan_day(plan_id, date):
+    """Regenerate one day of a stored plan (new video, notes and quizzes) for its current subtopic."""
+    def handler():
+        doc = find_plan(plan_id)
+        day = doc.get('plan', {}).get(date)
+        if day is None:
+            raise PlanRequestError(f"Plan {plan_id} has no day {date}", 404)
+        subtopic, _, _ = split_day_value(day)
+        regenerated = regenerate_days(doc, {date: subtopic})
+        return save_plan_days(doc, {date: with_hours(regenerated[date], day.get('hours') if isinstance(day, dict) else None)})
+    return edit_plan(handler)
+
+@app.route('/plans/<plan_id>/days/<date>', methods=['PUT'])
+def replace_plan_day(plan_id, date):
+    """Replace the subtopic of one day of a stored plan and generate that day's materials."""
+    def handler():
+        subtopic = str((request.get_json(silent=True) or {}).get('subtopic') or '').strip()
+        if not subtopic:
+            raise PlanRequestError("Missing required field: subtopic")
+        doc = find_plan(plan_id)
+        if date not in doc.get('plan', {}):
+            raise PlanRequestError(f"Plan {plan_id} has no day {date}", 404)
+        regenerated = regenerate_days(doc, {date: subtopic})
+        day_hours = [{'subtopic': subtopic, 'hours': doc['daily_hours']}] if doc.get('daily_hours') else None
+        return save_plan_days(doc, {date: with_hours(regenerated[date], day_hours)})
+    return edit_plan(handler)
+
+@app.route('/plans/<plan_id>/extend', methods=['POST'])
+def extend_plan(plan_id):
+    """
+    Append N days to a stored plan. The LLM continues the curriculum after the subtopics
+    the plan already covers; only the new days are scheduled and generated.
+    """
+    def handler():
+        body = request.get_json(silent=True) or {}
+        days = edit_days_count(body)
+        doc = find_plan(plan_id)
+        dates = sorted(doc.get('plan', {}))
+        if not dates:
+            raise PlanRequestError(f"Plan {plan_id} has no days to extend")
+        covered = []
+        for date in dates:
+            for name in label_subtopics(split_day_value(doc['plan'][date])[0]):
+                if name not in covered:
+                    covered.append(name)
+
+        data = request_llm_json(continuation_prompt(doc['topic_name'], covered, days),
+                                api_key=body.get('api_key'),
+                                schema=CURRICULUM_SCHEMA)
+        try:
+            curriculum = drop_covered(parse_curriculum(data), covered, threshold=config.SIMILARITY_THRESHOLD)
+        except ValueError as e:
+            raise PlanGenerationError(f"Gemini returned an unusable curriculum: {str(e)}", gemini_response=data)
+        if not curriculum:
+            raise PlanGenerationError("Gemini only repeated subtopics the plan already covers", gemini_response=data)
+
+        next_date = (datetime.strptime(dates[-1], '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d')
+        plan, hours = schedule_curriculum(curriculum, days, next_date, doc.get('daily_hours'))
+        regenerated = regenerate_days(doc, plan)
+        return save_plan_days(doc, {date: with_hours(entry, hours.get(date)) for date, entry in regenerated.items()})
+    return edit_plan(handler)
+
+@app.route('/plans/<plan_id>/shorten', methods=['POST'])
+def shorten_plan(plan_id):
+    """Drop the last N days of a stored plan; at least one day is kept."""
+    def handler():
+        days = edit_days_count(request.get_json(silent=True))
+        doc = find_plan(plan_id)
+        dates = sorted(doc.get('plan', {}))
+        if days >= len(dates):
+            raise PlanRequestError(f"Plan has {len(dates)} day(s); shorten by at most {len(dates) - 1}")
+        return save_plan_days(doc, removed=dates[-days:])
+    return edit_plan(handler)
+
+def plan_projection():
+    """Day fields selected by the comma-separated `fields` / `exclude` query parameters."""
+    def names(key):
+        return [name.strip() for name in request.args.get(key, '').split(',') if name.strip()]
+    try:
+        return day_fields(names('fields'), names('exclude'))
+    except ValueError as e:
+        raise PlanRequestError(str(e))
+
+def plan_page_args():
+    """`from`, `to` (YYYY-MM-DD) and `limit` query parameters of a page of days."""
+    bounds = []
+    for key in ('from', 'to'):
+        value = request.args.get(key)
+        if value:
+            try:
+                datetime.strptime(value, '%Y-%m-%d')
+            except ValueError:
+                raise PlanRequestError(f"'{key}' must be a date in YYYY-MM-DD format")
+        bounds.append(value)
+    try:
+        limit = int(request.args.get('limit', config.PLAN_READ_PAGE_DAYS))
+    except ValueError:
+        raise PlanRequestError("'limit' must be a positive integer")
+    if limit < 1:
+        raise PlanRequestError("'limit' must be a positive integer")
+    return bounds[0], bounds[1], min(limit, config.PLAN_READ_MAX_PAGE_DAYS)
+
+# Outline/days reads of a plan that keeps changing underneath before giving up with 503
+PLAN_READ_ATTEMPTS = 3
+
+def read_plan(plan_id, build):
+    """
+    Serve a read of a stored plan (in progress or finished) as a compressed JSON response
+    with a strong ETag. The tag is derived from the plan's updated_at and the query, so a
+    matching If-None-Match is answered with 304 before any day is read or decoded. Days are
+    read from the same version as the outline; a plan updated in between is read again.
+    A plan whose final write is still queued is answered with 202 and Retry-After.
+
+    Args:
+        plan_id: request_id or Mongo _id of the plan
+        build: Callable(outline, fields) -> response payload, where `outline` is the plan's
+            metadata with its sorted `plan_dates` and `fields` the day projection
+    """
+    try:
+        ensure_written(plan_id)
+        if plan_reader is None:
+            raise PlanRequestError("MongoDB not available; stored plans cannot be read", 503)
+        fields = plan_projection()
+        for _ in range(PLAN_READ_ATTEMPTS):
+            outline = plan_reader.outline(plan_id)
+            if outline is None:
+                raise PlanRequestError(f"No learning path with id {plan_id}", 404)
+            version = outline.get('updated_at') or outline.get('generated_at') or outline.get('created_at')
+            etag = None
+            if version:
+                etag = make_etag(outline['_id'], version, sorted(request.args.items(multi=True)))
+                cached = not_modified(etag)
+                if cached is not None:
+                    return cached
+            try:
+                return json_response(build(outline, fields), etag=etag)
+            except PlanChanged:
+                continue
+        response = jsonify({"error": f"Learning path {plan_id} is being updated; retry shortly"})
+        response.headers['Retry-After'] = '1'
+        return response, 503
+    except PlanRequestError as e:
+        return plan_error_response(e)
+    except PyMongoError as e:
+        console.print(f"[bold red]✗ MongoDB Error:[/bold red] {str(e)}")
+        return jsonify({"error": f"Database error: {str(e)}"}), 500
+
+@app.route('/plans/<plan_id>', methods=['GET'])
+def get_plan(plan_id):
+    """
+    A stored learning path with all its days. `fields` or `exclude` (comma-separated day
+    fields, e.g. `?fields=subtopic` for an outline or `?exclude=notes,quizzes`) trim each day.
+    """
+    def build(outline, fields):
+        dates = outline.pop('plan_dates')
+        return {**outline, '_id': str(outline['_id']), 'plan': plan_reader.days_of(outline, dates, fields)}
+    return read_plan(plan_id, build)
+
+@app.route('/plans/<plan_id>/days', methods=['GET'])
+def get_plan_days(plan_id):
+    """
+    One page of a stored learning path's days: dates between `from` and `to` (inclusive,
+    both optional), at most `limit` of them (default PLAN_READ_PAGE_DAYS), trimmed by
+    `fields` / `exclude`. `next_from` is the `from` of the next page, or null on the last.
+    """
+    try:
+        start, end, limit = plan_page_args()
+    except PlanRequestError as e:
+        return jsonify({"error": str(e)}), e.status
+
+    def build(outline, fields):
+        dates = [date for date in outline['plan_dates']
+                 if (not start or date >= start) and (not end or date <= end)]
+        return {
+            'request_id': outline.get('request_id'),
+            '_id': str(outline['_id']),
+            'status': outline.get('status'),
+            'no_of_days': len(outline['plan_dates']),
+            'days': plan_reader.days_of(outline, dates[:limit], fields),
+            'next_from': dates[limit] if len(dates) > limit else None
+        }
+    return read_plan(plan_id, build)
+
+def start_background():
+    """Start the health monitor, shard router, cache warmer and event-driven workers, as configured."""
+    health_monitor.start()
+    shard_router.start()
+    if cache_warmer is not None and config.WARMER_ENABLED:
+        cache_warmer.start()
+    if plan_dispatcher is not None:
+        start_workers('notes-workers', NOTES_TASKS, handle_notes_task)
+        # Joins the results group without holding up startup; the first plan waits for the assignment
+        plan_dispatcher.start(timeout=0)
+
 if __name__ == '__main__':
     print_banner()
-    console.print(f"[bold green]Starting MCP Server on port 5101...[/bold green]")
-    app.run(host='0.0.0.0', port=5101, debug=True)
\ No newline at end of file
+    console.print(f"[bold green]Starting MCP Server on port {config.MCP_PORT}...[/bold green]")
+    # Under the debug reloader only the serving child runs background work and leaves the ring
+    if not reloader_parent(True):
+        start_background()
+        # Peers rebalance as soon as this node stops, instead of after their next failed health check
+        atexit.register(shard_router.leave)
+    app.run(host='0.0.0.0', port=config.MCP_PORT, debug=True)
\ No newline at end of file
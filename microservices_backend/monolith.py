@@ -0,0 +1,71 @@
+"""
+Monolith mode: the MCP server, Video Fetcher, Material Generator and Quiz Generator
+in one process, for single-node deployments that do not need to scale services apart.
+
+The MCP server's ServiceClients are switched to in-process transports, so fetching
+videos and generating quizzes are direct function calls (same client interface,
+circuit breakers and latency tracking) instead of localhost HTTP, and one
+interpreter's worth of memory serves all four services.
+
+Everything is served on the MCP port; the other services' HTTP APIs stay reachable
+under a prefix, e.g. POST /video_fetcher/fetch_videos or GET /quiz_generator/health.
+
+Usage:
+    PYTHONPATH=. python monolith.py [--port 5101]
+"""
+import argparse
+
+from werkzeug.middleware.dispatcher import DispatcherMiddleware
+from werkzeug.serving import run_simple
+
+from common import config
+from common.rpc import LocalClient
+
+# Internal calls are in-process, so per-day tasks are not fanned out over a broker
+config.PLAN_DISPATCH_MODE = 'http'
+config.INTERNAL_TRANSPORT = 'local'
+
+import material_generator.app as material_generator  # noqa: E402
+import mcp_server.app as mcp  # noqa: E402
+import video_fetcher.app as video_fetcher  # noqa: E402
+from quiz_generator.service import QuizGeneratorService  # noqa: E402
+
+SERVICE_PREFIXES = {
+    'video_fetcher': '/video_fetcher',
+    'material_generator': '/material_generator',
+    'quiz_generator': '/quiz_generator',
+}
+
+
+def build_app():
+    """Wire the co-hosted services into the MCP server and return the combined WSGI app."""
+    quiz_generator = QuizGeneratorService()
+    mcp.video_fetcher.use_local(LocalClient(
+        'video_fetcher', video_fetcher.app, {'/fetch_videos': video_fetcher.fetch_videos_for_plan}
+    ))
+    mcp.quiz_generator.use_local(LocalClient(
+        'quiz_generator', quiz_generator.app, quiz_generator.local_handlers()
+    ))
+    return DispatcherMiddleware(mcp.app, {
+        SERVICE_PREFIXES['video_fetcher']: video_fetcher.app,
+        SERVICE_PREFIXES['material_generator']: material_generator.app,
+        SERVICE_PREFIXES['quiz_generator']: quiz_generator.app,
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run all services in one process")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5101)
+    args = parser.parse_args()
+
+    application = build_app()
+    mcp.print_banner()
+    mcp.console.print(f"[bold green]Starting monolith (MCP, Video Fetcher, Material Generator, "
+                      f"Quiz Generator) on port {args.port}...[/bold green]")
+    mcp.start_background()
+    run_simple(args.host, args.port, application, threaded=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -14,6 +14,8 @@ if project_root not in sys.path:
     sys.path.insert(0, project_root)
 
 from quiz_generator.service import QuizGeneratorService
+from common import config
+from common.base_service import reloader_parent
 
 def main():
     """Run the quiz generator service."""
@@ -23,7 +25,14 @@ def main():
     
     # Create and run the service
     service = QuizGeneratorService()
-    service.run(debug=os.getenv('FLASK_DEBUG', 'false').lower() == 'true')
+    debug = os.getenv('FLASK_DEBUG', 'false').lower() == 'true'
+    if config.PLAN_DISPATCH_MODE == 'events' and (config.WORKER_ONLY or not reloader_parent(debug)):
+        stop = service.start_workers()
+        if config.WORKER_ONLY:
+            # Extra worker process: consume tasks without serving HTTP
+            stop.wait()
+            return
+    service.run(debug=debug)
 
 def print_banner():
     # This function is not defined in the original code, 
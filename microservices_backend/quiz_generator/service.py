@@ -1,9 +1,67 @@
 from typing import Dict, Any, Optional
 from flask import request
 from common.base_service import BaseService
-from common.ai_utils import call_ai
+from common.cache_warmer import check_warm_budget, record_tokens, warm_allowance_from_headers, warm_budget_scope
+from common.ai_utils import call_task, fit_prompt, routing_table, token_ledger
+from common.fair_scheduler import llm_slots
+from common.quiz_templates import fallback_quizzes, assignment_templates
+from common.work_queue import QUIZ_TASKS, start_workers
+from common.similarity_index import SimilarityIndex
+from common.json_repair import JSONRepairError, is_usable_json, parse_llm_json, stats as json_repair_stats
+from common.question_bank import QuestionBank
+from common.scheduler import has_part_marker
+from common import config
+from pymongo.errors import PyMongoError
 import os
-import json
+import re
+import threading
+
+# Quizzes generated for an MCP warming run are charged to the allowance it passed along
+token_ledger.add_listener(record_tokens)
+
+
+def parse_num_questions(value: Any) -> int:
+    """
+    Raises:
+        ValueError: If value is not a whole number of at least 1.
+    """
+    try:
+        count = int(value)
+    except (TypeError, ValueError):
+        raise ValueError("'num_questions' must be an integer") from None
+    if count < 1:
+        raise ValueError("'num_questions' must be at least 1")
+    return count
+
+
+def _check_answer_index(question: Dict[str, Any]) -> Optional[str]:
+    answer, options = question.get('correct_answer'), question.get('options') or []
+    if not isinstance(answer, int) or not 0 <= answer < len(options):
+        return "has invalid correct_answer index"
+    return None
+
+
+QUIZ_SCHEMA = {
+    'type': 'object',
+    'required': ['questions'],
+    'properties': {
+        'questions': {
+            'type': 'array',
+            'minItems': 1,
+            'items': {
+                'type': 'object',
+                'required': ['question', 'options', 'correct_answer', 'explanation'],
+                'properties': {
+                    'question': {'type': 'string', 'minLength': 1},
+                    'options': {'type': 'array', 'minItems': 2, 'items': {'type': 'string'}},
+                    'correct_answer': {'type': 'integer'},
+                    'explanation': {'type': 'string'},
+                },
+                'check': _check_answer_index,
+            },
+        },
+    },
+}
 
 class QuizGeneratorService(BaseService):
     def __init__(self):
@@ -13,6 +71,20 @@ class QuizGeneratorService(BaseService):
         )
         self._register_routes()
         self.required_fields = ['topic', 'content']
+        # One near-duplicate index per difficulty, so "ML basics" reuses "Intro to ML" quizzes of
+        # the same topic. Only used when the MongoDB question bank is unavailable.
+        self._quiz_indexes: Dict[str, SimilarityIndex] = {}
+        self._quiz_indexes_lock = threading.Lock()
+        self.question_bank = self._connect_question_bank()
+
+    def _connect_question_bank(self) -> Optional[QuestionBank]:
+        try:
+            bank = QuestionBank.connect(config.MONGO_URI, config.MONGO_DB, threshold=config.SIMILARITY_THRESHOLD)
+            self.logger.info("Question bank connected")
+            return bank
+        except PyMongoError as e:
+            self.logger.warning(f"Question bank unavailable, using the local quiz cache: {str(e)}")
+            return None
     
     def _register_routes(self):
         """Register all API endpoints."""
@@ -20,15 +92,25 @@ class QuizGeneratorService(BaseService):
         def generate_quiz():
             return self._handle_generate_quiz()
         
-        @self.route('/health', methods=['GET'])
-        def health():
-            return self.success_response({"status": "healthy"})
-
         # Compatibility endpoint used by MCP server
         @self.route('/generate_quiz_and_assignments', methods=['POST'])
         def generate_quiz_and_assignments():
             return self._handle_generate_quiz_and_assignments()
     
+    def local_handlers(self) -> Dict[str, Any]:
+        """Routes other services in this process (monolith mode) call as plain functions."""
+        return {'/generate_quiz_and_assignments': self.generate_quiz_and_assignments}
+
+    def health_details(self) -> Dict[str, Any]:
+        return {
+            "question_bank": self.question_bank.stats() if self.question_bank else None,
+            "quiz_indexes": {name: index.stats() for name, index in self._quiz_indexes.items()},
+            "json_repair": json_repair_stats.snapshot(),
+            "ai_usage": token_ledger.snapshot(),
+            "ai_routing": routing_table(),
+            "fair_scheduling": llm_slots.stats()
+        }
+
     def _handle_generate_quiz(self):
         """Handle quiz generation request."""
         try:
@@ -38,30 +120,35 @@ class QuizGeneratorService(BaseService):
             is_valid, error_msg = self.validate_required_fields(data, self.required_fields)
             if not is_valid:
                 return self.error_response(error_msg or "Missing required fields", 400)
+            try:
+                num_questions = parse_num_questions(data.get('num_questions', 5))
+            except ValueError as e:
+                return self.error_response(str(e), 400)
             
             # Get API key and provider from request or environment
             api_key = data.get('api_key') or os.getenv('DEFAULT_AI_API_KEY')
             provider = data.get('provider', 'openai')
             
-            if not api_key:
-                return self.error_response("API key is required", 400)
-            
-            # Generate quiz using AI
-            quiz = self._generate_quiz_ai(
-                topic=data['topic'],
+            # Serve from the question bank; the LLM (and so an API key) is only needed to top it up
+            questions, source = self._select_questions(
+                subtopic=data['topic'],
                 content=data['content'],
                 difficulty=data.get('difficulty', 'medium'),
-                num_questions=data.get('num_questions', 5),
+                num_questions=num_questions,
                 api_key=api_key,
-                provider=provider
+                provider=provider,
+                exclude=data.get('exclude_ids') or []
             )
+            if not questions and not api_key:
+                return self.error_response("API key is required", 400)
             
             return self.success_response({
-                'quiz': quiz,
+                'quiz': {'questions': questions},
                 'metadata': {
                     'topic': data['topic'],
-                    'num_questions': data.get('num_questions', 5),
-                    'difficulty': data.get('difficulty', 'medium')
+                    'num_questions': num_questions,
+                    'difficulty': data.get('difficulty', 'medium'),
+                    'source': source
                 }
             })
             
@@ -73,131 +160,180 @@ class QuizGeneratorService(BaseService):
         """Compatibility handler expected by MCP. Returns quizzes and assignments."""
         try:
             data = request.get_json() or {}
-            subtopic = data.get('subtopic') or data.get('topic')
-            notes = data.get('study_notes') or data.get('content') or ''
-            difficulty = data.get('difficulty', 'medium')
-            num_questions = int(data.get('num_questions', 5))
-
-            if not subtopic:
+            if not (data.get('subtopic') or data.get('topic')):
                 return self.error_response("'subtopic' is required", 400)
-
-            api_key = data.get('api_key') or os.getenv('DEFAULT_AI_API_KEY')
-            provider = data.get('provider', 'openai')
-
-            quizzes: list[Dict[str, Any]] = []
-            assignments: list[Dict[str, Any]] = []
-
-            # Try AI-backed generation; fall back to simple templates if no API key
             try:
-                if api_key:
-                    quiz_data = self._generate_quiz_ai(
-                        topic=subtopic,
-                        content=notes or f"Generate questions about {subtopic}",
-                        difficulty=difficulty,
-                        num_questions=num_questions,
-                        api_key=api_key,
-                        provider=provider
-                    )
-                    quizzes = quiz_data.get('questions', []) if isinstance(quiz_data, dict) else []
-                else:
-                    # Fallback quizzes
-                    quizzes = [
-                        {
-                            "question": f"Briefly explain: {subtopic}?",
-                            "options": ["Definition", "Example", "Both", "Neither"],
-                            "correct_answer": 2,
-                            "explanation": f"Covers basics of {subtopic}."
-                        }
-                    ]
-
-                # Assignments (simple templates using notes if present)
-                assignments = [
-                    {
-                        "title": f"Summarize {subtopic}",
-                        "description": "Write a 1-2 paragraph summary and 3 key takeaways.",
-                        "type": "written",
-                    },
-                    {
-                        "title": f"Practical Task: {subtopic}",
-                        "description": "Create a small example or mini-project demonstrating the concept.",
-                        "type": "practical",
-                    }
-                ]
-
-                return self.success_response({
-                    'quizzes': quizzes,
-                    'assignments': assignments
-                })
-            except Exception as e:
-                self.logger.exception("Error generating quiz/assignments")
-                # Even on failure, return graceful empty lists so MCP can continue
-                return self.success_response({
-                    'quizzes': quizzes,
-                    'assignments': assignments
-                })
+                parse_num_questions(data.get('num_questions', 5))
+            except ValueError as e:
+                return self.error_response(str(e), 400)
+            # During MCP cache warming the LLM calls spend the warming run's allowance, and report it back
+            with warm_budget_scope(warm_allowance_from_headers(request.headers)) as warm_usage:
+                result = self.generate_quiz_and_assignments(data)
+            if warm_usage is not None:
+                result['warm_usage'] = warm_usage
+            return self.success_response(result)
 
         except Exception as e:
             self.logger.exception("Unexpected error in compatibility endpoint")
             return self.error_response("Failed to process request", 500, error=str(e))
+
+    def generate_quiz_and_assignments(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Build quizzes and assignments for one subtopic. Shared by the HTTP endpoint and
+        the event-driven quiz workers.
+
+        Args:
+            data: Request payload with 'subtopic' (or 'topic') and optional 'topic_name' (the
+                course the subtopic belongs to), 'study_notes', 'difficulty', 'num_questions',
+                'api_key', 'provider' and 'exclude_ids' (ids of questions the learner has already seen)
+
+        Returns:
+            dict: {'quizzes': [...], 'assignments': [...]}
+        """
+        subtopic = data.get('subtopic') or data.get('topic')
+        notes = data.get('study_notes') or data.get('content') or ''
+        difficulty = data.get('difficulty', 'medium')
+        num_questions = parse_num_questions(data.get('num_questions', 5))
+
+        api_key = data.get('api_key') or os.getenv('DEFAULT_AI_API_KEY')
+        provider = data.get('provider', 'openai')
+
+        quizzes: list[Dict[str, Any]] = []
+        assignments: list[Dict[str, Any]] = []
+
+        # Bank or AI-backed questions; fall back to simple templates if neither has any
+        try:
+            quizzes, _ = self._select_questions(
+                subtopic=subtopic,
+                content=notes,
+                difficulty=difficulty,
+                num_questions=num_questions,
+                api_key=api_key,
+                provider=provider,
+                exclude=data.get('exclude_ids') or [],
+                topic_name=data.get('topic_name', '')
+            )
+            if not quizzes and not api_key:
+                quizzes = fallback_quizzes(subtopic)
+
+            # Assignments (simple templates using notes if present)
+            assignments = assignment_templates(subtopic)
+        except Exception:
+            self.logger.exception("Error generating quiz/assignments")
+            # Even on failure, return graceful empty lists so MCP can continue
+
+        return {
+            'quizzes': quizzes,
+            'assignments': assignments
+        }
+
+    def _select_questions(self, subtopic: str, content: str, difficulty: str, num_questions: int,
+                          api_key: Optional[str], provider: str, exclude: list, topic_name: str = '') -> tuple:
+        """
+        Pick questions for a subtopic: a randomized, least-served selection from the
+        question bank, topped up by the LLM only when the bank runs short. Both the bank
+        and, without a bank, the local near-duplicate cache are scoped to `topic_name`.
+
+        Returns:
+            tuple: (questions, source) with source 'bank', 'bank+llm', 'llm', 'cache' or 'none'
+        """
+        def generate(count):
+            if not api_key:
+                return None
+            try:
+                quiz_data = self._generate_quiz_ai(
+                    topic=subtopic,
+                    content=content or f"Generate questions about {subtopic}",
+                    difficulty=difficulty,
+                    num_questions=count,
+                    api_key=api_key,
+                    provider=provider
+                )
+            except Exception:
+                self.logger.exception(f"Question generation failed for {subtopic}")
+                return []
+            return quiz_data.get('questions', []) if isinstance(quiz_data, dict) else []
+
+        if self.question_bank is not None:
+            try:
+                return self.question_bank.serve(
+                    subtopic, difficulty, num_questions,
+                    generate=generate if api_key else None,
+                    exclude=exclude,
+                    top_up=config.QUESTION_BANK_TOP_UP,
+                    topic_name=topic_name
+                )
+            except PyMongoError:
+                self.logger.exception("Question bank query failed; falling back to the local quiz cache")
+
+        # Parts of a split subtopic ("X (Part 2/3)") each get their own quiz
+        cached = self._quiz_index(difficulty).lookup(subtopic, scope=topic_name, exact=has_part_marker(subtopic))
+        if cached is not None and len(cached[0]) >= num_questions:
+            self.logger.info(f"Reusing quiz for '{cached[2]}' ({cached[1]:.2f} similar) for {subtopic}")
+            return cached[0][:num_questions], 'cache'
+        questions = generate(num_questions) or []
+        if questions:
+            self._quiz_index(difficulty).insert(subtopic, questions, scope=topic_name)
+            return questions, 'llm'
+        return [], 'none'
+
+    def _quiz_index(self, difficulty: str) -> SimilarityIndex:
+        name = re.sub(r'[^a-z0-9]+', '_', str(difficulty).lower()) or 'medium'
+        with self._quiz_indexes_lock:
+            if name not in self._quiz_indexes:
+                self._quiz_indexes[name] = SimilarityIndex(
+                    os.path.join(config.CACHE_DIR, f'quiz_index_{name}.jsonl'),
+                    threshold=config.SIMILARITY_THRESHOLD
+                )
+            return self._quiz_indexes[name]
+
+    def handle_quiz_task(self, task: Dict[str, Any]) -> Dict[str, Any]:
+        """Event-driven worker handler for QUIZ_TASKS messages published by the MCP server."""
+        return self.generate_quiz_and_assignments({
+            'topic_name': task.get('topic_name', ''),
+            'subtopic': task.get('subtopic'),
+            'study_notes': task.get('notes'),
+        })
+
+    def start_workers(self, count: Optional[int] = None):
+        """Join the quiz-generators consumer group with `count` worker threads."""
+        self.logger.info("Starting quiz task workers")
+        return start_workers('quiz-generators', QUIZ_TASKS, self.handle_quiz_task, count=count)
     
     def _generate_quiz_ai(self, topic: str, content: str, difficulty: str, 
                          num_questions: int, api_key: str, provider: str) -> Dict[str, Any]:
         """Generate quiz questions using AI."""
-        prompt = f"""Generate a {difficulty} difficulty quiz with {num_questions} questions about {topic}.
-        The questions should be based on the following content:
-        
-        {content}
-        
-        Return the quiz in JSON format with the following structure:
-        {{
-            "questions": [
-                {{
-                    "question": "...",
-                    "options": ["...", "...", "...", "..."],
-                    "correct_answer": 0,
-                    "explanation": "..."
-                }}
-            ]
-        }}"""
+        # The notes are the only unbounded part; fit_prompt compresses/trims them to the quiz budget
+        prompt = fit_prompt('quiz', f"""Generate a {difficulty} difficulty quiz with {num_questions} questions about {topic}, based on this content:
+{{context}}
+Return JSON: {{"questions": [{{"question": "...", "options": ["...", "...", "...", "..."], "correct_answer": 0, "explanation": "..."}}]}}""", content)
         
+        check_warm_budget()
         try:
-            response = call_ai(
-                prompt=prompt,
-                model="gpt-3.5-turbo",
-                api_key=api_key,
-                provider=provider
+            # The routing table picks the model tier; invalid quizzes escalate one tier up
+            response = call_task(
+                'quiz',
+                prompt,
+                api_keys={provider: api_key},
+                providers=[provider],
+                validate=lambda text: is_usable_json(text, QUIZ_SCHEMA)
             )
-            
-            # Parse and validate the response
-            quiz_data = json.loads(response)
-            self._validate_quiz_structure(quiz_data)
-            
-            return quiz_data
-            
-        except json.JSONDecodeError:
-            self.logger.error("Failed to parse AI response as JSON")
-            raise ValueError("Invalid response format from AI service")
+
+            # Extract, repair and validate; only unrepairable questions cost a follow-up call
+            return parse_llm_json(
+                response,
+                QUIZ_SCHEMA,
+                fix=lambda fix_prompt: call_task('json_fix', fix_prompt, api_keys={provider: api_key},
+                                                 providers=[provider]),
+                name="quiz"
+            )
+
+        except JSONRepairError as e:
+            self.logger.error(f"Failed to parse AI response as quiz JSON: {str(e)}")
+            raise ValueError("Invalid response format from AI service") from e
         except Exception as e:
             self.logger.error(f"AI service error: {str(e)}")
             raise
-    
-    def _validate_quiz_structure(self, quiz_data: Dict[str, Any]):
-        """Validate the structure of the generated quiz."""
-        if not isinstance(quiz_data, dict):
-            raise ValueError("Quiz data must be a dictionary")
-            
-        if 'questions' not in quiz_data or not isinstance(quiz_data['questions'], list):
-            raise ValueError("Quiz must contain a 'questions' list")
-            
-        for i, question in enumerate(quiz_data['questions']):
-            if not all(field in question for field in ['question', 'options', 'correct_answer', 'explanation']):
-                raise ValueError(f"Question {i+1} is missing required fields")
-                
-            if not isinstance(question['options'], list) or len(question['options']) < 2:
-                raise ValueError(f"Question {i+1} must have at least 2 options")
-                
-            if not 0 <= question['correct_answer'] < len(question['options']):
-                raise ValueError(f"Question {i+1} has invalid correct_answer index")
 
 # Create and run the service
 if __name__ == '__main__':
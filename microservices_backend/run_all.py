@@ -1,5 +1,6 @@
 import subprocess
 import socket
+import sys
 import os
 import time
 import requests
@@ -21,9 +22,36 @@ SERVICES = [
     # Add more if needed
 ]
 
+# Single-process alternative to SERVICES for small deployments (see monolith.py)
+MONOLITH = {"name": "Monolith", "path": "monolith.py", "port": 5101, "log": "logs/monolith.log"}
+
+# With --nodes N, extra MCP nodes listen on 5111, 5121, ... and shard topics among themselves
+MCP_NODE_PORT_STEP = 10
+
 BASEDIR = os.path.dirname(os.path.abspath(__file__))
 
 
+def mcp_nodes(count):
+    """MCP service entries for a local cluster of `count` nodes that all list each other as peers."""
+    mcp = SERVICES[0]
+    ports = [mcp["port"] + i * MCP_NODE_PORT_STEP for i in range(count)]
+    urls = [f"http://localhost:{port}" for port in ports]
+    return [{
+        **mcp,
+        "name": f"MCP Server {i + 1}" if count > 1 else mcp["name"],
+        "port": port,
+        "log": mcp["log"] if i == 0 else f"logs/mcp_server_{port}.log",
+        "env": {"MCP_PORT": str(port), "MCP_NODE_URL": urls[i],
+                "MCP_PEERS": ','.join(u for u in urls if u != urls[i])} if count > 1 else {},
+    } for i, port in enumerate(ports)]
+
+
+def parse_nodes(argv):
+    if '--nodes' in argv:
+        return int(argv[argv.index('--nodes') + 1])
+    return 1
+
+
 def is_port_in_use(port):
     with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
         return s.connect_ex(("localhost", port)) == 0
@@ -40,7 +68,8 @@ def start_service(service):
         # Start the service in the background
         subprocess.Popen([
             "python3", script_path
-        ], stdout=logfile, stderr=subprocess.STDOUT, env={**os.environ, "PYTHONPATH": BASEDIR})
+        ], stdout=logfile, stderr=subprocess.STDOUT,
+            env={**os.environ, "PYTHONPATH": BASEDIR, **service.get("env", {})})
     print(f"Started {service['name']} (port {service['port']})")
 
 
@@ -52,7 +81,11 @@ def wait_for_service(port, retries=30, delay=1):
     return False
 
 def main():
-    for service in SERVICES:
+    if '--monolith' in sys.argv[1:]:
+        services = [MONOLITH]
+    else:
+        services = mcp_nodes(parse_nodes(sys.argv[1:])) + SERVICES[1:]
+    for service in services:
         if is_port_in_use(service["port"]):
             print(f"{service['name']} already running on port {service['port']}.")
         else:
@@ -60,7 +93,7 @@ def main():
     # Wait for all services to be up
     print("Waiting for all services to be up...")
     all_ok = True
-    for service in SERVICES:
+    for service in services:
         if not wait_for_service(service["port"]):
             print(f"Failed to start {service['name']} on port {service['port']}")
             print("Recent log output:\n" + tail(os.path.join(BASEDIR, service["log"])) )
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Tests import the services' packages (common, mcp_server, ...) the way run_all.py runs them
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
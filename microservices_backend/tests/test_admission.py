@@ -0,0 +1,48 @@
+import threading
+import time
+
+import pytest
+
+from common.admission import AdmissionController, Overloaded
+
+
+def test_requests_beyond_the_queue_are_shed_at_once():
+    controller = AdmissionController('/plan', max_in_flight=1, max_queue=0, queue_timeout=5)
+    controller.acquire()
+    start = time.monotonic()
+    with pytest.raises(Overloaded) as shed:
+        controller.acquire()
+    assert time.monotonic() - start < 1
+    assert 1 <= shed.value.retry_after <= 60
+    assert controller.stats()['shed_queue_full'] == 1
+
+
+def test_queued_requests_are_shed_after_the_queue_timeout():
+    controller = AdmissionController('/plan', max_in_flight=1, max_queue=1, queue_timeout=0.05)
+    controller.acquire()
+    with pytest.raises(Overloaded):
+        controller.acquire()
+    assert controller.stats()['shed_queue_timeout'] == 1
+
+
+def test_a_released_slot_goes_to_the_first_queued_request():
+    controller = AdmissionController('/plan', max_in_flight=1, max_queue=2, queue_timeout=5)
+    controller.acquire()
+    order = []
+
+    def wait(name):
+        controller.acquire()
+        order.append(name)
+        controller.release()
+
+    threads = []
+    for name in ('first', 'second'):
+        threads.append(threading.Thread(target=wait, args=(name,)))
+        threads[-1].start()
+        while controller.stats()['queued'] < len(threads):
+            time.sleep(0.001)
+    controller.release()
+    for thread in threads:
+        thread.join(5)
+    assert order == ['first', 'second']
+    assert controller.stats()['in_flight'] == 0
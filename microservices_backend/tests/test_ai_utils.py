@@ -0,0 +1,91 @@
+import time
+
+from common.ai_utils import compress_text
+
+
+def test_compression_keeps_code_and_markdown():
+    text = "Use `__init__`  to set **x**.\n\n```python\nx = a * b  # ok\n```"
+    assert compress_text(text) == "Use `__init__` to set **x**. ```python x = a * b # ok ```"
+
+
+def test_repeated_sentences_are_dropped():
+    assert compress_text("Lists are mutable. Tuples are not. lists are mutable.") == \
+        "Lists are mutable. Tuples are not."
+
+
+def test_escalation_moves_to_a_stronger_model(monkeypatch):
+    from common import ai_utils
+    calls = []
+    monkeypatch.setenv('GEMINI_API_KEY', 'key')
+    monkeypatch.setattr(ai_utils, 'call_ai', lambda prompt, routes, **kwargs: calls.append(routes) or 'bad')
+    ai_utils.call_task('curriculum', 'prompt', providers=['gemini'], validate=lambda text: False)
+    assert [routes[0][1] for routes in calls] == ['gemini-1.5-pro-latest', 'gemini-2.5-pro']
+
+
+def test_a_tier_with_the_same_model_is_skipped(monkeypatch):
+    from common import ai_utils
+    calls = []
+    monkeypatch.setenv('GEMINI_API_KEY', 'key')
+    monkeypatch.setitem(ai_utils.MODEL_TIERS, 'large', [('gemini', 'gemini-1.5-pro-latest')])
+    monkeypatch.setattr(ai_utils, 'call_ai', lambda prompt, routes, **kwargs: calls.append(routes) or 'bad')
+    assert ai_utils.call_task('curriculum', 'prompt', providers=['gemini'], validate=lambda text: False) == 'bad'
+    assert len(calls) == 1
+
+
+def test_timeout_is_sized_after_queueing_for_a_slot(monkeypatch):
+    import time
+    from contextlib import contextmanager
+    from common import ai_utils
+    from common.deadline import deadline_scope
+
+    @contextmanager
+    def slow_slot(cost=1.0):
+        time.sleep(0.5)
+        yield
+
+    class Response:
+        def raise_for_status(self):
+            pass
+
+        def json(self):
+            return {'choices': [{'message': {'content': '{}'}}]}
+
+    sent = []
+    monkeypatch.setattr(ai_utils.llm_slots, 'slot', slow_slot)
+    monkeypatch.setattr(ai_utils.requests, 'post', lambda url, timeout, **kwargs: sent.append(timeout) or Response())
+    with deadline_scope(2):
+        ai_utils.call_ai('prompt', model='gpt-4o-mini', provider='openai', api_key='key')
+    assert sent[0] <= 1.5
+
+
+def test_the_losing_hedge_gives_its_slot_back_when_the_winner_answers(monkeypatch):
+    import threading
+    from common import ai_utils
+    from common.fair_scheduler import FairScheduler
+
+    release_slow = threading.Event()
+    recorded = []
+
+    class Response:
+        def raise_for_status(self):
+            pass
+
+        def json(self):
+            return {'choices': [{'message': {'content': '{"ok": true}'}}]}
+
+    def post(session, url, json, timeout, **kwargs):
+        if json['model'] == 'slow':
+            release_slow.wait(5)
+        return Response()
+
+    slots = FairScheduler('llm', slots=4, tenant_slots=4, background_slots=1)
+    monkeypatch.setattr(ai_utils, 'llm_slots', slots)
+    monkeypatch.setattr(ai_utils.requests.Session, 'post', post)
+    monkeypatch.setattr(ai_utils.router, 'hedge_delay', lambda provider, model: 0.01)
+    monkeypatch.setattr(ai_utils.router, 'record', lambda provider, model, latency, ok: recorded.append(model))
+    text = ai_utils._hedged_call('prompt', ('openai', 'slow'), ('openai', 'fast'), ['key', 'key'])
+    assert text == '{"ok": true}'
+    assert slots.stats()['in_flight'] == 0
+    release_slow.set()
+    time.sleep(0.1)
+    assert recorded == ['fast']
@@ -0,0 +1,106 @@
+from common.base_service import reloader_parent
+import threading
+
+from common.cache_warmer import (
+    CacheWarmer, charge_reported_usage, check_warm_budget, parse_hours, record_tokens, warm_allowance_from_headers,
+    warm_budget_scope, warm_headers
+)
+
+
+class FakePaths:
+    def __init__(self, combos):
+        self.combos = combos
+
+    def aggregate(self, pipeline):
+        return [{'_id': {'topic': topic, 'days': 7, 'hours': 1}, 'count': 10 - i}
+                for i, topic in enumerate(self.combos)]
+
+
+def llm_calls(count, tokens_each):
+    def warm(topic, days, hours):
+        for _ in range(count):
+            try:
+                check_warm_budget()
+            except Exception:
+                continue  # plan code falls back instead of failing
+            record_tokens(tokens_each)
+    return warm
+
+
+def test_budget_is_checked_before_every_llm_call():
+    warmer = CacheWarmer(FakePaths(['python', 'rust']), llm_calls(50, 100), token_budget=1000)
+    assert warmer.run_once(force=True) == 0
+    assert warmer.tokens_spent_today == 1000
+    assert warmer.plans_warmed == 0
+
+
+def test_combinations_within_budget_are_warmed():
+    warmer = CacheWarmer(FakePaths(['python', 'rust', 'go']), llm_calls(5, 100), token_budget=1200)
+    assert warmer.run_once(force=True) == 2
+    assert warmer.tokens_spent_today == 1200
+
+
+def test_other_nodes_topics_are_skipped():
+    warmed = []
+    warmer = CacheWarmer(FakePaths(['python', 'rust']), lambda topic, days, hours: warmed.append(topic),
+                         owns=lambda topic: topic == 'rust')
+    warmer.run_once(force=True)
+    assert warmed == ['rust']
+
+
+def test_llm_calls_outside_warming_are_not_limited():
+    check_warm_budget()
+
+
+def test_parse_hours_wraps_midnight():
+    assert parse_hours('22-2') == {22, 23, 0, 1, 2}
+
+
+def test_reloader_parent(monkeypatch):
+    monkeypatch.delenv('WERKZEUG_RUN_MAIN', raising=False)
+    assert reloader_parent(True) and not reloader_parent(False)
+    monkeypatch.setenv('WERKZEUG_RUN_MAIN', 'true')
+    assert not reloader_parent(True)
+
+
+def test_warming_is_charged_from_the_token_ledger():
+    from common.ai_utils import TokenLedger
+    ledger = TokenLedger({})
+    ledger.add_listener(record_tokens)
+
+    def warm(topic, days, hours):
+        check_warm_budget()
+        ledger.record('notes', 'prompt', 'response', usage=(300, 200))
+        ledger.record('notes', 'prompt', ok=False)
+
+    warmer = CacheWarmer(FakePaths(['python']), warm, token_budget=1000)
+    assert warmer.run_once(force=True) == 1
+    assert warmer.tokens_spent_today == 500
+
+
+def remote_llm_calls(count, tokens_each):
+    """A warming run whose LLM calls happen in another service, reached with warm_headers()."""
+    def serve(headers, reply):
+        with warm_budget_scope(warm_allowance_from_headers(headers)) as usage:
+            llm_calls(count, tokens_each)(None, None, None)
+        reply['warm_usage'] = usage
+
+    def warm(topic, days, hours):
+        reply = {}
+        thread = threading.Thread(target=serve, args=(warm_headers(), reply))
+        thread.start()
+        thread.join()
+        charge_reported_usage(reply['warm_usage'])
+    return warm
+
+
+def test_tokens_spent_by_another_service_count_against_the_budget():
+    warmer = CacheWarmer(FakePaths(['python', 'rust']), remote_llm_calls(3, 100), token_budget=1000)
+    assert warmer.run_once(force=True) == 2
+    assert warmer.tokens_spent_today == 600
+
+
+def test_another_service_stops_at_the_remaining_allowance():
+    warmer = CacheWarmer(FakePaths(['python', 'rust']), remote_llm_calls(8, 100), token_budget=1000)
+    assert warmer.run_once(force=True) == 1
+    assert warmer.tokens_spent_today == 1000
@@ -0,0 +1,37 @@
+import time
+
+import pytest
+
+from common.deadline import (DeadlineExceeded, consume_retry, deadline_from_headers, deadline_headers,
+                             deadline_scope, request_timeout)
+
+
+def test_an_outer_deadline_that_expires_sooner_wins():
+    with deadline_scope(1):
+        with deadline_scope(60) as inner:
+            assert inner.remaining() <= 1
+            assert request_timeout(30) <= 1
+    assert request_timeout(30) == 30
+
+
+def test_nested_scopes_share_the_retry_budget():
+    with deadline_scope(5, max_retries=2):
+        with deadline_scope(5, max_retries=10):
+            assert consume_retry() and consume_retry()
+        assert not consume_retry()
+
+
+def test_an_expired_deadline_stops_calls():
+    with deadline_scope(0.01):
+        time.sleep(0.02)
+        assert not consume_retry()
+        with pytest.raises(DeadlineExceeded):
+            request_timeout(30)
+
+
+def test_the_deadline_travels_in_headers():
+    with deadline_scope(2):
+        headers = deadline_headers()
+    assert 1.5 < deadline_from_headers(headers) <= 2
+    assert deadline_from_headers({}) is None
+    assert deadline_from_headers({next(iter(headers)): 'soon'}) is None
@@ -0,0 +1,52 @@
+import threading
+import time
+
+import pytest
+
+from common.deadline import DeadlineExceeded, deadline_scope
+from common.fair_scheduler import FairScheduler
+
+
+def grant_order(scheduler, requests):
+    """Queue `requests` ((tenant, priority) pairs) behind a held slot and return the grant order."""
+    order, threads = [], []
+    blocker = scheduler.acquire('blocker', 'interactive')
+
+    def call(tenant, priority):
+        with scheduler.slot(tenant, priority):
+            order.append((tenant, priority))
+
+    for tenant, priority in requests:
+        thread = threading.Thread(target=call, args=(tenant, priority))
+        thread.start()
+        threads.append(thread)
+        while scheduler.stats()['queued'] < len(threads):
+            time.sleep(0.001)
+    scheduler.release(blocker)
+    for thread in threads:
+        thread.join(5)
+    return order
+
+
+def test_interactive_calls_go_before_background_work():
+    scheduler = FairScheduler('llm', slots=1, tenant_slots=1, background_slots=1)
+    order = grant_order(scheduler, [('warmer', 'background'), ('alice', 'interactive')])
+    assert order == [('alice', 'interactive'), ('warmer', 'background')]
+
+
+def test_a_burst_from_one_tenant_alternates_with_another():
+    scheduler = FairScheduler('llm', slots=1, tenant_slots=1, background_slots=1)
+    order = grant_order(scheduler, [('bulk', 'interactive')] * 3 + [('small', 'interactive')])
+    assert [tenant for tenant, _ in order][:2] == ['bulk', 'small']
+
+
+def test_one_tenant_holds_at_most_its_slots():
+    scheduler = FairScheduler('llm', slots=4, tenant_slots=2, background_slots=1)
+    first, second = scheduler.acquire('alice'), scheduler.acquire('alice')
+    with deadline_scope(0.05), pytest.raises(DeadlineExceeded):
+        scheduler.acquire('alice')
+    with scheduler.slot('bob'):
+        assert scheduler.stats()['in_flight'] == 3
+    scheduler.release(first)
+    scheduler.release(second)
+    assert scheduler.stats()['tenants']['alice']['timeouts'] == 1
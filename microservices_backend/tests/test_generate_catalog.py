@@ -0,0 +1,20 @@
+import json
+
+from generate_catalog import load_checkpoint, load_rows, row_key
+
+
+def test_rows_are_keyed_by_content_only(tmp_path):
+    first = tmp_path / 'a.csv'
+    first.write_text("topic,days,daily_hours,start_date\nPython,7,1,2024-01-01\nRust,14,2,2024-01-01\n")
+    reordered = tmp_path / 'b.csv'
+    reordered.write_text("topic,days,daily_hours,start_date\nGo,3,1,2024-01-01\nRust,14,2,2024-01-01\n"
+                         "Python,7,1,2024-01-01\n")
+    keys = {row_key(row) for row in load_rows(str(first))}
+    assert keys < {row_key(row) for row in load_rows(str(reordered))}
+
+
+def test_checkpoints_with_positional_keys_still_resume(tmp_path):
+    row = {'topic': 'Python', 'days': 7, 'daily_hours': 1.0, 'start_date': '2024-01-01'}
+    path = tmp_path / 'catalog.checkpoint.jsonl'
+    path.write_text(json.dumps({'key': f"3:{row_key(row)}"}) + '\n')
+    assert row_key(row) in load_checkpoint(str(path))
@@ -0,0 +1,35 @@
+import pytest
+
+from common.json_repair import JSONRepairError, parse_llm_json, repair
+from common.scheduler import CURRICULUM_SCHEMA
+
+
+def test_prose_and_fences_are_stripped():
+    text = 'Sure! Here it is:\n```json\n{"subtopics": [{"name": "Lists", "weight": 1}]}\n```'
+    assert parse_llm_json(text, CURRICULUM_SCHEMA) == {'subtopics': [{'name': 'Lists', 'weight': 1}]}
+
+
+def test_truncated_response_repairs_to_the_outer_object():
+    text = '{"subtopics": [{"name": "Lists", "weight": 1}, {"name": "Tuples", "weight": 1}, {"name": "Dic'
+    value = parse_llm_json(text)
+    assert [item['name'] for item in value['subtopics']] == ['Lists', 'Tuples']
+
+
+def test_a_value_cut_off_mid_string_is_dropped():
+    assert repair('["Lists", "Tuples", "Dic') == '["Lists", "Tuples"]'
+    assert repair('{"title": "Lists", "notes": "Lists are ord') == '{"title": "Lists"}'
+    assert repair('"Lists are ord') == '"Lists are ord"'
+
+
+def test_an_inner_item_is_not_a_curriculum():
+    with pytest.raises(JSONRepairError):
+        parse_llm_json('{"name": "Lists", "weight": 1}', CURRICULUM_SCHEMA)
+
+
+def test_python_literals_and_trailing_commas():
+    assert repair("{'a': True, 'b': None, c: [1, 2,],}") == '{"a": true, "b": null, "c": [1, 2]}'
+
+
+def test_bracketed_aside_does_not_shadow_the_payload():
+    text = 'Note [1]: the plan follows. {"subtopics": ["Lists", "Tuples"]}'
+    assert parse_llm_json(text, CURRICULUM_SCHEMA) == {'subtopics': ['Lists', 'Tuples']}
@@ -0,0 +1,53 @@
+import threading
+
+import mongomock
+import mongomock.gridfs
+import pytest
+
+from common.material_sections import plan_sections, render_document
+from common.material_store import MaterialStore
+from material_generator import app as material_app
+
+
+@pytest.fixture
+def store(monkeypatch):
+    mongomock.gridfs.enable_gridfs_integration()
+    store = MaterialStore(mongomock.MongoClient().db)
+    monkeypatch.setattr(material_app, 'material_store', store)
+    return store
+
+
+def run_job(monkeypatch, outline, partial=None, fail=()):
+    generated = []
+
+    def generate_section(job, section, api_key=None, provider=None):
+        generated.append(section['index'])
+        if section['index'] in fail:
+            raise RuntimeError('LLM unavailable')
+        return {**section, 'content': f"Text of {section['title']}"}
+
+    finished = threading.Event()
+    complete_job = material_app.complete_job
+    monkeypatch.setattr(material_app, 'generate_section', generate_section)
+    monkeypatch.setattr(material_app, 'complete_job', lambda job: (complete_job(job), finished.set()))
+    job = material_app.start_job('Python', 'Lists', 2, outline, 'key-1', partial=partial)
+    assert finished.wait(5)
+    return job, sorted(generated)
+
+
+def test_a_partial_material_is_stored_and_only_its_missing_sections_are_regenerated(monkeypatch, store):
+    outline = plan_sections('Lists', 2)
+    job, generated = run_job(monkeypatch, outline, fail={1})
+    assert job.status == 'partial'
+    partial = store.find('key-1')
+    assert partial['missing'] == [1]
+    assert len(partial['sections']) == len(outline) - 1
+
+    job, generated = run_job(monkeypatch, outline, partial=partial)
+    assert generated == [1]
+    assert job.status == 'done'
+    stored = store.find('key-1')
+    assert stored['missing'] == [] and len(stored['sections']) == len(outline)
+    assert store.files.count_documents({'metadata.key': 'key-1'}) == 1
+    body, _ = render_document(job.sections)
+    assert store.read(stored['material_id']) == body
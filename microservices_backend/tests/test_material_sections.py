@@ -0,0 +1,15 @@
+from common.material_sections import plan_sections, section_prompt
+
+
+def test_section_words_scale_with_minutes_when_the_count_is_capped():
+    short = plan_sections('Lists', 1, section_minutes=20, max_sections=12, section_words=400)
+    long = plan_sections('Lists', 8, section_minutes=20, max_sections=12, section_words=400)
+    assert all(s['words'] == round(400 * s['minutes'] / 20) for s in short + long)
+    assert len(long) <= 6  # one subtopic: overview, four kinds, summary
+    assert long[0]['words'] > short[0]['words']
+    assert sum(s['minutes'] for s in long) >= 8 * 60 - 1
+
+
+def test_section_prompt_asks_for_the_sections_words():
+    outline = plan_sections('Lists', 4, section_words=400)
+    assert f"{outline[1]['words']}" in section_prompt('Python', 'Lists', outline, outline[1])
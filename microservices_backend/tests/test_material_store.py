@@ -0,0 +1,50 @@
+import time
+
+import mongomock
+import mongomock.gridfs
+import pytest
+
+from common.material_sections import render_document
+from common.material_store import MaterialNotFound, MaterialStore
+
+
+@pytest.fixture
+def store():
+    mongomock.gridfs.enable_gridfs_integration()
+    return MaterialStore(mongomock.MongoClient().db, chunk_size=64)
+
+
+def sections():
+    return [{'index': i, 'kind': 'concepts', 'subtopic': 'Lists', 'title': f'Part {i}',
+             'content': f'Section {i} text. ' * 20} for i in range(3)]
+
+
+def test_byte_ranges_span_chunks(store):
+    body = bytes(range(256)) * 2
+    material_id = store.save('key', body, [])
+    assert store.read(material_id, 60, 200) == body[60:200]
+    assert all(len(block) <= 64 for block in store.iter_range(material_id, 10, 300))
+    assert store.read(material_id, 500) == body[500:]
+
+
+def test_sections_are_read_by_their_index(store):
+    body, index = render_document(sections())
+    material_id = store.save('key', body, index, topic_name='Python')
+    assert b'Section 1 text.' in store.read_section(material_id, 1)
+    assert b'Section 2' not in store.read_section(material_id, 1)
+    with pytest.raises(MaterialNotFound):
+        store.read_section(material_id, 9)
+    assert store.info(material_id)['topic_name'] == 'Python'
+
+
+def test_find_returns_the_newest_and_deleted_materials_are_gone(store):
+    older = store.save('key', b'old', [])
+    time.sleep(0.01)
+    newer = store.save('key', b'new', [])
+    assert store.find('key')['material_id'] == newer
+    store.delete(newer)
+    assert store.find('key')['material_id'] == older
+    with pytest.raises(MaterialNotFound):
+        store.info('not-an-id')
+    with pytest.raises(MaterialNotFound):
+        store.read(newer)
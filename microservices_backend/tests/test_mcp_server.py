@@ -0,0 +1,57 @@
+import time
+
+import pytest
+from pymongo.errors import ServerSelectionTimeoutError
+
+from common import config
+from common.deadline import current_deadline, deadline_scope
+from common.write_behind import WriteBehindBuffer
+
+
+@pytest.fixture(scope='module')
+def mcp():
+    from mcp_server import app
+    return app
+
+
+def test_a_long_plan_is_not_cut_short_by_the_deadline(mcp, monkeypatch):
+    monkeypatch.setattr(config, 'PLAN_DEADLINE_SECONDS', 0.2)
+    monkeypatch.setattr(config, 'PLAN_DAY_DEADLINE_SECONDS', 0.1)
+    expired = []
+
+    def enrich_day(date, value, topic_name=''):
+        time.sleep(0.02)
+        expired.append(current_deadline().expired)
+        return {'subtopic': value, 'notes': 'notes'}
+
+    monkeypatch.setattr(mcp, 'enrich_day', enrich_day)
+    plan = {f'2026-01-{day:02d}': 'Lists' for day in range(1, 31)}
+    with deadline_scope(mcp.plan_deadline(len(plan))):
+        enriched = mcp.enrich_plan(plan)
+    assert len(enriched) == 30
+    assert not any(expired)
+
+
+@pytest.mark.parametrize('days', ['abc', 0, -3, 2.5, None, True])
+def test_a_bad_day_count_is_a_client_error(mcp, days):
+    resp = mcp.app.test_client().post('/generate_plan', json={
+        'topic_name': 'Python', 'no_of_days': days, 'start_date': '2026-01-01', 'daily_hours': 1})
+    assert resp.status_code == 400
+    assert 'no_of_days' in resp.get_json()['error']
+
+
+def test_a_plan_still_being_written_is_answered_with_retry_after(mcp, monkeypatch, tmp_path):
+    def down():
+        raise ServerSelectionTimeoutError('down')
+
+    writer = WriteBehindBuffer('learning_paths', down, spool_path=str(tmp_path / 'plans.spool.jsonl'),
+                               flush_interval=0.05, retry_interval=60)
+    monkeypatch.setattr(mcp, 'plan_writer', writer)
+    writer.insert({'request_id': 'abc123', 'plan': {}}, keys=('abc123',))
+    client = mcp.app.test_client()
+    try:
+        for resp in (client.get('/plans/abc123'), client.get('/plans/abc123/days'),
+                     client.put('/plans/abc123/days/2026-01-01', json={'subtopic': 'Lists'})):
+            assert resp.status_code == 202 and resp.headers['Retry-After'] == '1'
+    finally:
+        writer.close()
@@ -0,0 +1,41 @@
+import mongomock
+import pytest
+
+from common.plan_checkpoint import IdempotencyConflict, PlanCheckpoints, request_fingerprint
+
+FINGERPRINT = request_fingerprint('Python', 2, '2026-01-01', 2)
+
+
+@pytest.fixture
+def checkpoints():
+    return PlanCheckpoints(mongomock.MongoClient().db.learning_paths, lease_seconds=60)
+
+
+def test_a_retry_waits_for_the_lease_then_resumes_the_finished_days(checkpoints):
+    doc, state = checkpoints.claim('key', {'request_fingerprint': FINGERPRINT})
+    assert state == 'new'
+    checkpoints.save_schedule(doc['_id'], {'2026-01-01': 'Lists', '2026-01-02': 'Tuples'})
+    checkpoints.save_day(doc['_id'], '2026-01-01', {'subtopic': 'Lists', 'notes': 'n'})
+    assert checkpoints.claim('key', {'request_fingerprint': FINGERPRINT}) == (None, 'busy')
+
+    checkpoints.release(doc['_id'])
+    resumed, state = checkpoints.claim('key', {'request_fingerprint': FINGERPRINT})
+    assert state == 'resumed'
+    assert resumed['plan'] == {'2026-01-01': {'subtopic': 'Lists', 'notes': 'n'}}
+    assert resumed['schedule']['2026-01-02'] == 'Tuples'
+
+
+def test_a_completed_plan_is_replayed(checkpoints):
+    doc, _ = checkpoints.claim('key', {'request_fingerprint': FINGERPRINT})
+    assert checkpoints.complete(doc['_id'], {'plan': {'2026-01-01': {'subtopic': 'Lists'}}})
+    done, state = checkpoints.claim('key', {'request_fingerprint': FINGERPRINT})
+    assert state == 'done' and done['status'] == 'success'
+    assert 'lease_expires_at' not in done
+    assert checkpoints.stats()['replayed'] == 1
+
+
+def test_a_key_reused_for_other_inputs_is_rejected(checkpoints):
+    checkpoints.claim('key', {'request_fingerprint': FINGERPRINT})
+    with pytest.raises(IdempotencyConflict):
+        checkpoints.claim('key', {'request_fingerprint': request_fingerprint('Rust', 2, '2026-01-01', 2)})
+    assert request_fingerprint(' python ', 2, '2026-01-01', 2.0) == FINGERPRINT
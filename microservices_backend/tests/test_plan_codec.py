@@ -0,0 +1,37 @@
+from common import plan_codec
+from common.quiz_templates import assignment_templates, fallback_quizzes
+
+
+def day(subtopic='Lists'):
+    return {'subtopic': subtopic, 'notes': 'Lists hold ordered items. ' * 100,
+            'quizzes': fallback_quizzes(subtopic), 'assignments': assignment_templates(subtopic)}
+
+
+def test_templates_are_referenced_and_large_text_is_compressed():
+    encoded = plan_codec.encode_day(day())
+    assert encoded['assignments'] == {'_template': 'assignments'}
+    assert encoded['quizzes'] == {'_template': 'fallback_quizzes'}
+    assert encoded['notes']['_codec'] in ('zstd', 'zlib')
+    assert plan_codec.decode_day(encoded) == day()
+
+
+def test_documents_round_trip_and_older_ones_decode_unchanged():
+    doc = {'topic_name': 'Python', 'plan': {'2026-01-01': day(), '2026-01-02': day('Tuples')}}
+    encoded = plan_codec.encode_document(doc)
+    assert encoded['storage_codec'] == plan_codec.CODEC_VERSION
+    assert plan_codec.decode_document(encoded) == doc
+    assert plan_codec.decode_document(doc) == doc
+
+
+def test_small_values_and_either_codec_are_readable():
+    assert plan_codec.compress_value('short') == 'short'
+    packed = plan_codec.compress_value(['x'] * 200, codec='zlib')
+    assert packed['type'] == 'json' and plan_codec.decompress_value(packed) == ['x'] * 200
+
+
+def test_lazy_plan_decodes_a_day_on_first_access():
+    plan = plan_codec.decode_plan(plan_codec.encode_plan({'2026-01-01': day()}))
+    assert plan._decoded == {}
+    assert plan.stored('2026-01-01')['subtopic'] == 'Lists'
+    assert plan['2026-01-01'] == day()
+    assert list(plan._decoded) == ['2026-01-01']
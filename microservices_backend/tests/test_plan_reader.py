@@ -0,0 +1,39 @@
+import mongomock
+import pytest
+
+from common.plan_reader import PlanChanged, PlanReader, day_fields
+
+
+@pytest.fixture
+def reader():
+    collection = mongomock.MongoClient()['test']['learning_paths']
+    collection.insert_one({'request_id': 'r1', 'topic_name': 'Python', 'updated_at': 't1', 'schedule': {},
+                           'plan': {'2026-01-02': {'subtopic': 'Tuples', 'notes': 'n2'},
+                                    '2026-01-01': {'subtopic': 'Lists', 'notes': 'n1'}}})
+    return PlanReader(collection)
+
+
+def test_outline_has_sorted_dates_and_no_internal_fields(reader):
+    outline = reader.outline('r1')
+    assert outline['plan_dates'] == ['2026-01-01', '2026-01-02']
+    assert 'plan' not in outline and 'schedule' not in outline
+
+
+def test_days_are_trimmed_to_the_projection(reader):
+    outline = reader.outline('r1')
+    days = reader.days_of(outline, ['2026-01-02'], day_fields(exclude=['notes']))
+    assert days == {'2026-01-02': {'subtopic': 'Tuples'}}
+
+
+def test_days_of_a_changed_plan_are_not_mixed_with_an_old_outline(reader):
+    outline = reader.outline('r1')
+    reader.collection.update_one({'request_id': 'r1'}, {'$set': {'plan.2026-01-01.notes': 'edited',
+                                                                 'updated_at': 't2'}})
+    with pytest.raises(PlanChanged):
+        reader.days_of(outline, outline['plan_dates'])
+    assert reader.days_of(reader.outline('r1'), ['2026-01-01'])['2026-01-01']['notes'] == 'edited'
+
+
+def test_unknown_day_fields_are_rejected():
+    with pytest.raises(ValueError):
+        day_fields(fields=['summary'])
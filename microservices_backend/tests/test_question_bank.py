@@ -0,0 +1,63 @@
+import mongomock
+import pytest
+
+from common.question_bank import QuestionBank
+from quiz_generator.service import parse_num_questions
+
+
+def bank(db):
+    return QuestionBank(db['question_bank'], keys=db['question_bank_keys'])
+
+
+def questions(*texts):
+    return [{'question': t, 'options': ['a', 'b'], 'correct_answer': 0, 'explanation': ''} for t in texts]
+
+
+def test_processes_share_the_near_duplicate_mapping():
+    db = mongomock.MongoClient()['test']
+    first, second = bank(db), bank(db)
+    key = first.resolve_key('Introduction to Machine Learning')
+    assert second.resolve_key('ML basics') == key
+    assert first.resolve_key('ML basics') == key
+
+
+def test_split_parts_get_their_own_keys():
+    db = mongomock.MongoClient()['test']
+    questions_bank = bank(db)
+    assert questions_bank.resolve_key('Recursion (Part 1/2)') != questions_bank.resolve_key('Recursion (Part 2/2)')
+
+
+def test_serving_rotates_and_tops_up():
+    db = mongomock.MongoClient()['test']
+    questions_bank = bank(db)
+    served, source = questions_bank.serve('Lists', 'easy', 2, lambda n: questions('q1', 'q2', 'q3'))
+    assert source == 'llm' and len(served) == 2
+    served_again, source = questions_bank.serve('Lists', 'easy', 1, None, exclude=[q['id'] for q in served])
+    assert source == 'bank' and served_again[0]['id'] not in {q['id'] for q in served}
+
+
+def test_nothing_is_selected_for_zero_questions():
+    db = mongomock.MongoClient()['test']
+    questions_bank = bank(db)
+    questions_bank.add('lists', 'Lists', 'easy', questions('q1'))
+    assert questions_bank.select('lists', 'easy', 0) == []
+
+
+@pytest.mark.parametrize('value', [0, -3, 'five', None])
+def test_num_questions_must_be_positive(value):
+    with pytest.raises(ValueError):
+        parse_num_questions(value)
+
+
+def test_topics_sharing_a_subtopic_name_keep_their_own_questions():
+    db = mongomock.MongoClient()['test']
+    questions_bank = bank(db)
+    assert questions_bank.resolve_key('Introduction', 'Python') != questions_bank.resolve_key('Introduction',
+                                                                                              'Organic Chemistry')
+    questions_bank.serve('Introduction', 'easy', 2, lambda n: questions('What is a list?', 'What is a dict?'),
+                         topic_name='Python')
+    served, source = questions_bank.serve('Intro', 'easy', 2, lambda n: questions('What is an alkane?'),
+                                          topic_name='Organic Chemistry')
+    assert source == 'llm' and [q['question'] for q in served] == ['What is an alkane?']
+    served, source = questions_bank.serve('Introduction', 'easy', 2, None, topic_name='  PYTHON ')
+    assert source == 'bank' and len(served) == 2
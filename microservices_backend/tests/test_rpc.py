@@ -0,0 +1,75 @@
+import threading
+import time
+
+import pytest
+import requests
+from flask import Flask, jsonify, request
+
+from common import rpc
+
+
+@pytest.fixture
+def server():
+    app = Flask(__name__)
+
+    @app.route('/echo', methods=['POST'])
+    def echo():
+        body = request.get_json()
+        time.sleep(body.get('sleep', 0))
+        return jsonify({'echo': body, 'tenant': request.headers.get('X-Tenant-Id')})
+
+    @app.route('/busy', methods=['POST'])
+    def busy():
+        response = jsonify({'error': 'overloaded'})
+        response.headers['Retry-After'] = '3'
+        return response, 503
+
+    server = rpc.RPCServer(app, host='127.0.0.1').start()
+    yield server
+    server.stop()
+
+
+def test_pipelined_calls_are_matched_to_their_callers(server):
+    client = rpc.RPCClient(f'127.0.0.1:{server.port}', connections=1)
+    results = {}
+
+    def call(n):
+        results[n] = client.call('/echo', {'n': n, 'sleep': 0.05 * (3 - n)}, headers={'X-Tenant-Id': 't'})
+
+    threads = [threading.Thread(target=call, args=(n,)) for n in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    assert {n: r['echo']['n'] for n, r in results.items()} == {0: 0, 1: 1, 2: 2}
+    assert results[0]['tenant'] == 't'
+    assert client.stats()['connects'] == 1
+    client.close()
+
+
+def test_errors_surface_as_requests_exceptions(server):
+    client = rpc.RPCClient(f'127.0.0.1:{server.port}')
+    with pytest.raises(requests.exceptions.HTTPError) as shed:
+        client.call('/busy', {})
+    assert shed.value.response.status_code == 503 and shed.value.response.headers['Retry-After'] == '3'
+    with pytest.raises(requests.exceptions.Timeout):
+        client.call('/echo', {'sleep': 0.5}, timeout=0.05)
+    client.close()
+    with pytest.raises(requests.exceptions.ConnectionError):
+        rpc.RPCClient('127.0.0.1:1').call('/echo', {})
+
+
+def test_local_client_copies_payloads_and_dispatches_other_routes():
+    app = Flask(__name__)
+
+    @app.route('/missing', methods=['POST'])
+    def missing():
+        return jsonify({'error': 'no'}), 404
+
+    payload = {'items': [1]}
+    client = rpc.LocalClient('svc', app=app, handlers={'/mutate': lambda body: body['items'].append(2) or body})
+    assert client.call('/mutate', payload) == {'items': [1, 2]}
+    assert payload == {'items': [1]}
+    with pytest.raises(requests.exceptions.HTTPError):
+        client.call('/missing', {})
+    assert client.stats()['dispatched_calls'] == 1
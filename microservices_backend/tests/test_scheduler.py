@@ -0,0 +1,17 @@
+from common.scheduler import has_part_marker, schedule_curriculum
+
+
+def test_part_labels_are_recognized():
+    assert has_part_marker('Recursion (Part 2/3)')
+    assert not has_part_marker('Recursion')
+
+
+def test_split_subtopic_gets_its_hours_per_day():
+    plan, hours = schedule_curriculum([('Recursion', 3.0), ('Sorting', 1.0)], 4, '2026-01-01', 2)
+    assert plan['2026-01-01'] == 'Recursion (Part 1/3)'
+    assert hours['2026-01-01'] == [{'subtopic': 'Recursion', 'hours': 2.0}]
+    assert sum(h['hours'] for day in hours.values() for h in day) == 8.0
+
+
+def test_unparseable_start_date():
+    assert schedule_curriculum([('Recursion', 1.0)], 1, 'tomorrow') is None
@@ -0,0 +1,84 @@
+import pytest
+import requests
+
+from common.service_client import CircuitBreaker, CircuitOpenError, ServiceClient
+
+
+class FakeSession:
+    def __init__(self, status, headers=None, error=None):
+        self.status = status
+        self.headers = headers or {}
+        self.error = error
+
+    def post(self, url, json=None, timeout=None, headers=None):
+        if self.error is not None:
+            raise self.error
+        resp = requests.Response()
+        resp.status_code = self.status
+        resp.headers.update(self.headers)
+        resp._content = b'{"ok": true}'
+        return resp
+
+
+def client_answering(status, headers=None, error=None):
+    client = ServiceClient('svc', 'http://svc', failure_threshold=2)
+    client.session = FakeSession(status, headers, error)
+    return client
+
+
+def call_times(client, n):
+    for _ in range(n):
+        with pytest.raises(requests.exceptions.RequestException):
+            client.post('/x', {})
+
+
+def test_client_errors_do_not_open_the_breaker():
+    client = client_answering(400)
+    call_times(client, 5)
+    assert client.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_load_shedding_with_retry_after_does_not_open_the_breaker():
+    client = client_answering(503, {'Retry-After': '1'})
+    call_times(client, 5)
+    assert client.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_server_errors_open_the_breaker():
+    client = client_answering(500)
+    call_times(client, 2)
+    assert client.breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        client.post('/x', {})
+
+
+def test_transport_errors_open_the_breaker():
+    client = client_answering(200, error=requests.exceptions.ConnectionError('refused'))
+    call_times(client, 2)
+    assert client.breaker.state == CircuitBreaker.OPEN
+
+
+def test_half_open_breaker_lets_one_trial_through():
+    breaker = CircuitBreaker('svc', failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+    assert breaker.allow_request()
+    assert not breaker.allow_request()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_in_process_shedding_keeps_retry_after():
+    from flask import Flask, jsonify
+
+    from common.rpc import LocalClient
+
+    app = Flask(__name__)
+
+    @app.route('/x', methods=['POST'])
+    def shed():
+        return jsonify({'error': 'busy'}), 503, {'Retry-After': '2'}
+
+    client = ServiceClient('svc', 'http://svc', failure_threshold=1)
+    client.use_local(LocalClient('svc', app=app))
+    call_times(client, 3)
+    assert client.breaker.state == CircuitBreaker.CLOSED
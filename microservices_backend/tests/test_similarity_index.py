@@ -0,0 +1,62 @@
+from common.similarity_index import SimilarityIndex
+
+
+def test_renamed_subtopics_match():
+    index = SimilarityIndex()
+    index.insert('Introduction to Machine Learning', 'notes', scope='ml')
+    payload, score, matched = index.lookup('ML basics', scope='ml')
+    assert payload == 'notes' and score == 1.0 and matched == 'Introduction to Machine Learning'
+
+
+def test_lookups_do_not_cross_topics():
+    index = SimilarityIndex()
+    index.insert('Introduction', 'python notes', scope='python')
+    assert index.lookup('Introduction', scope='Organic Chemistry') is None
+    assert index.lookup('Introduction', scope='  PYTHON ')[0] == 'python notes'
+
+
+def test_a_narrower_subtopic_is_not_a_duplicate():
+    index = SimilarityIndex()
+    index.insert('Binary Search', 'notes', scope='algorithms')
+    assert index.lookup('Binary Search Trees', scope='algorithms') is None
+
+
+def test_entries_survive_a_reload(tmp_path):
+    path = str(tmp_path / 'index.jsonl')
+    SimilarityIndex(path).insert('Python Lists', ['q'], scope='python')
+    with open(path, 'a') as f:
+        f.write('{"torn')
+    reloaded = SimilarityIndex(path)
+    assert reloaded.lookup('python list', scope='python')[0] == ['q']
+    assert reloaded.lookup('python list') is None
+
+
+def test_exact_lookup_keeps_split_parts_apart():
+    index = SimilarityIndex()
+    index.insert('Recursion (Part 1/3)', 'part one', scope='python')
+    assert index.lookup('Recursion (Part 2/3)', scope='python', exact=True) is None
+    assert index.lookup('recursion (part 1/3)', scope='python', exact=True)[0] == 'part one'
+
+
+def test_replaced_entries_are_compacted_out_of_the_file(tmp_path):
+    path = str(tmp_path / 'index.jsonl')
+    index = SimilarityIndex(path, compact_after=3)
+    index.insert('Python Lists', 'v0', scope='python')
+    index.insert('Python Dicts', 'd', scope='python')
+    for version in range(1, 5):
+        index.insert('Python Lists', f'v{version}', scope='python')
+    with open(path) as f:
+        assert len(f.readlines()) == 2
+    reloaded = SimilarityIndex(path)
+    assert reloaded.lookup('python list', scope='python')[0] == 'v4'
+    assert reloaded.lookup('python dict', scope='python')[0] == 'd'
+
+
+def test_a_bloated_file_is_compacted_on_load(tmp_path):
+    path = str(tmp_path / 'index.jsonl')
+    index = SimilarityIndex(path, compact_after=100)
+    for version in range(5):
+        index.insert('Python Lists', f'v{version}', scope='python')
+    SimilarityIndex(path, compact_after=2)
+    with open(path) as f:
+        assert len(f.readlines()) == 1
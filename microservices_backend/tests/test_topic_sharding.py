@@ -0,0 +1,95 @@
+import pytest
+import requests
+from flask import Flask, jsonify, request
+
+from common.admission import Admission
+from common.topic_sharding import HashRing, RelayTimeout, ShardRouter
+
+NODE, PEER = 'http://a:5101', 'http://b:5101'
+
+
+def router(**kwargs):
+    return ShardRouter(NODE, [PEER], vnodes=16, **kwargs)
+
+
+def topic_owned_by(shards, node):
+    return next(f"topic {i}" for i in range(1000) if shards.owner(f"topic {i}") == node)
+
+
+def failing_relay(shards, error):
+    def relay(path, payload, headers=None, timeout=None):
+        raise error
+    shards._peers[PEER].relay = relay
+
+
+def test_a_joining_node_takes_about_its_share_and_other_topics_keep_their_owner():
+    ring = HashRing(['a', 'b', 'c'], vnodes=128)
+    grown = ring.with_node('d')
+    assert abs(sum(grown.shares().values()) - 1) < 0.01
+    assert 0.15 < ring.moved_fraction(grown) < 0.35
+    topics = [f"topic {i}" for i in range(500)]
+    assert all(grown.owner(t) in (ring.owner(t), 'd') for t in topics)
+    assert all(grown.without_node('d').owner(t) == ring.owner(t) for t in topics)
+
+
+def test_without_a_token_only_configured_peers_may_join_or_leave():
+    shards = router()
+    assert shards.authorized(None, PEER + '/')
+    assert not shards.authorized(None, 'http://attacker:80')
+
+
+def test_with_a_token_announcements_must_carry_it():
+    shards = router(cluster_token='secret')
+    assert shards.authorized('secret', 'http://c:5101')
+    assert not shards.authorized('wrong', PEER)
+    assert not shards.authorized(None, PEER)
+
+
+def test_a_read_timeout_keeps_the_owner_and_is_not_served_here():
+    shards = router()
+    failing_relay(shards, requests.exceptions.ReadTimeout('slow'))
+    with pytest.raises(RelayTimeout):
+        shards.relay(topic_owned_by(shards, PEER), '/generate_plan', {}, {})
+    assert PEER in shards.ring
+
+
+def test_a_refused_connection_evicts_the_owner():
+    shards = router()
+    failing_relay(shards, requests.exceptions.ConnectionError('refused'))
+    assert shards.relay(topic_owned_by(shards, PEER), '/generate_plan', {}, {}) is None
+    assert PEER not in shards.ring
+
+
+def test_an_error_answer_is_served_here_without_eviction():
+    shards = router()
+    failing_relay(shards, requests.exceptions.HTTPError('502 from proxy'))
+    assert shards.relay(topic_owned_by(shards, PEER), '/generate_plan', {}, {}) is None
+    assert PEER in shards.ring
+
+
+def test_a_leave_does_not_forget_a_configured_peer():
+    shards = router()
+    assert shards.remove_peer(PEER)
+    assert PEER in shards.stats()['peers']
+
+
+def test_deferred_requests_are_only_admitted_when_served_here():
+    app = Flask(__name__)
+    admission = Admission(limits={'/plan': {'max_in_flight': 1, 'max_queue': 0, 'queue_timeout': 0}})
+    admission.install(app, defer=lambda: True)
+    held = admission.controller('/plan')
+    held.acquire()
+
+    @app.route('/plan', methods=['POST'])
+    def plan():
+        if request.args.get('relay'):
+            return jsonify({'relayed': True})
+        return admission.admit() or jsonify({'served': True})
+
+    client = app.test_client()
+    assert client.post('/plan?relay=1').status_code == 200
+    shed = client.post('/plan')
+    assert shed.status_code == 503 and 'Retry-After' in shed.headers
+    held.release()
+    assert client.post('/plan').status_code == 200
+    assert held.stats()['in_flight'] == 0
@@ -0,0 +1,35 @@
+from common import video_assembly
+
+
+def video(n, minutes, title='Python course'):
+    return {'video_id': f'v{n}', 'title': title, 'duration_sec': minutes * 60, 'relevance_floor': 0.3}
+
+
+def test_days_are_filled_to_the_budget_without_repeats():
+    plan = {'2026-01-01': 'Lists', '2026-01-02': 'Tuples'}
+    assembled = video_assembly.assemble_plan(plan, [video(i, 30) for i in range(5)], budget_sec=3600)
+    ids = [v['video_id'] for day in assembled.values() for v in day['videos']]
+    assert len(ids) == len(set(ids)) == 4
+    assert all(day['watch_minutes'] == 60 for day in assembled.values())
+
+
+def test_a_long_course_continues_across_days():
+    plan = {'2026-01-01': 'Lists', '2026-01-02': 'Tuples'}
+    assembled = video_assembly.assemble_plan(plan, [video(1, 150)], budget_sec=3600)
+    assert [day['videos'][0]['timestamp'] for day in assembled.values()] == \
+        ['00:00:00-01:00:00', '01:00:00-02:00:00']
+
+
+def test_empty_days_get_their_own_video_and_split_parts_continue_it():
+    plan = {'2026-01-01': 'Lists', '2026-01-02': 'Recursion (Part 1/2)', '2026-01-03': 'Recursion (Part 2/2)'}
+    assembled = video_assembly.assemble_plan(plan, [video(1, 60)], budget_sec=3600)
+    recursion = {'video_id': 'r', 'title': 'Recursion', 'duration_sec': 5400}
+    filled = video_assembly.fill_empty_days(assembled, {'2026-01-02': recursion, '2026-01-03': recursion}, 3600)
+    assert filled == 2
+    assert assembled['2026-01-02']['source'] == 'individual_video'
+    assert assembled['2026-01-03']['videos'][0]['timestamp'] == '01:00:00-01:30:00'
+
+
+def test_knapsack_prefers_value():
+    items = [{'weight': 3, 'value': 3}, {'weight': 2, 'value': 5}, {'weight': 2, 'value': 4}]
+    assert video_assembly.knapsack(items, 4) == items[1:]
@@ -0,0 +1,64 @@
+import pytest
+
+from common.ttl_cache import TTLCache
+from video_fetcher import app as video_fetcher
+
+
+class FakeYouTube:
+    """search.list pages of 50 one-hour videos, and videos.list durations."""
+
+    def __init__(self, pages):
+        self.pages = pages
+        self.searches = []
+
+    def __call__(self, url, params, timeout):
+        if url.endswith('/search'):
+            self.searches.append(params.get('pageToken'))
+            page = int(params.get('pageToken') or 0)
+            if params['q'].endswith('course tutorial'):
+                items = [{'id': {'videoId': f'p{page}v{i}'}, 'snippet': {'title': f'Python course {i}'}}
+                         for i in range(50)]
+                return Response({'items': items, 'nextPageToken': str(page + 1) if page + 1 < self.pages else None})
+            return Response({'items': [{'id': {'videoId': f"s-{params['q']}"}, 'snippet': {'title': params['q']}}]})
+        return Response({'items': [{'id': vid, 'contentDetails': {'duration': 'PT1H'}}
+                                   for vid in params['id'].split(',')]})
+
+
+class Response:
+    def __init__(self, body):
+        self.body = body
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.body
+
+
+@pytest.fixture
+def youtube(monkeypatch):
+    def install(pages):
+        fake = FakeYouTube(pages)
+        monkeypatch.setattr(video_fetcher.requests, 'get', fake)
+        monkeypatch.setattr(video_fetcher, 'YOUTUBE_API_KEY', 'key')
+        monkeypatch.setattr(video_fetcher, 'search_cache', TTLCache())
+        monkeypatch.setattr(video_fetcher, 'duration_cache', TTLCache())
+        return fake
+    return install
+
+
+def test_pool_grows_with_the_plan_study_hours(youtube):
+    fake = youtube(pages=4)
+    plan = {f'2026-01-{day:02d}': f'Python topic {day}' for day in range(1, 31)}
+    assembled, report = video_fetcher.assemble_videos_for_plan('Python', plan, 2)
+    assert report['days_with_video'] == 30
+    assert fake.searches[:2] == [None, '1'] and '2' not in fake.searches
+
+
+def test_days_the_pool_cannot_fill_get_a_search_of_their_own(youtube, monkeypatch):
+    youtube(pages=1)
+    monkeypatch.setattr(video_fetcher.config, 'VIDEO_POOL_MAX_PAGES', 1)
+    plan = {f'2026-01-{day:02d}': f'Python topic {day}' for day in range(1, 31)}
+    assembled, report = video_fetcher.assemble_videos_for_plan('Python', plan, 2)
+    assert report['days_with_video'] == 30 and report['fallback_days'] == 5
+    assert assembled['2026-01-30']['source'] == 'individual_video'
@@ -0,0 +1,113 @@
+from common.work_queue import (
+    NOTES_TASKS, PLAN_RESULTS, QUIZ_TASKS, VIDEO_TASKS, InMemoryBroker, PlanDispatcher, start_workers
+)
+
+
+def test_consumer_groups_each_read_every_message():
+    broker = InMemoryBroker(num_partitions=2)
+    a, b = broker.subscribe('a', ['t']), broker.subscribe('b', ['t'])
+    broker.publish('t', 'k', {'n': 1})
+    assert a.poll(0.1) == ('k', {'n': 1})
+    assert b.poll(0.1) == ('k', {'n': 1})
+    assert a.poll(0) is None
+
+
+def test_messages_read_by_every_group_are_dropped():
+    broker = InMemoryBroker(num_partitions=1)
+    a, b = broker.subscribe('a', ['t']), broker.subscribe('b', ['t'])
+    for n in range(5):
+        broker.publish('t', 'k', {'n': n})
+    while a.poll(0) is not None:
+        pass
+    assert broker.stats()['t'] == 5
+    while b.poll(0) is not None:
+        pass
+    assert broker.stats()['t'] == 0
+
+
+def test_retention_bounds_a_partition_nobody_reads():
+    broker = InMemoryBroker(num_partitions=1, retention=10)
+    stalled = broker.subscribe('stalled', ['t'])
+    for n in range(100):
+        broker.publish('t', 'k', {'n': n})
+    assert broker.stats()['t'] <= 10
+    assert stalled.poll(0)[1]['n'] == 90
+
+
+def test_from_latest_skips_earlier_messages():
+    broker = InMemoryBroker(num_partitions=1)
+    broker.publish('t', 'k', {'n': 'old'})
+    latest = broker.subscribe('g', ['t'], from_latest=True)
+    assert latest.poll(0) is None
+    broker.publish('t', 'k', {'n': 'new'})
+    assert latest.poll(0.1)[1] == {'n': 'new'}
+
+
+def test_plan_runs_through_every_stage_without_publishing_secrets():
+    broker = InMemoryBroker(num_partitions=4)
+    seen = []
+
+    def stage(result):
+        def handler(task):
+            seen.append(task)
+            return result
+        return handler
+
+    stops = [
+        start_workers('videos', VIDEO_TASKS, stage({'youtube_link': 'v'}), count=1, broker=broker),
+        start_workers('notes', NOTES_TASKS, stage({'notes': 'n'}), count=1, broker=broker),
+        start_workers('quizzes', QUIZ_TASKS, stage({'quizzes': ['q']}), count=1, broker=broker),
+    ]
+    finished = []
+    dispatcher = PlanDispatcher(broker=broker)
+    try:
+        days = dispatcher.run_plan('plan-1', {'2024-01-01': 'A', '2024-01-02': 'B'},
+                                   {'topic_name': 'T', 'api_key': 'secret'}, timeout=5,
+                                   on_day=lambda date, day: finished.append(date))
+    finally:
+        dispatcher.stop()
+        for stop in stops:
+            stop.set()
+    assert days['2024-01-01'] == {'subtopic': 'A', 'youtube_link': 'v', 'notes': 'n', 'quizzes': ['q']}
+    assert sorted(finished) == ['2024-01-01', '2024-01-02']
+    assert len(seen) == 6 and all('api_key' not in task for task in seen)
+
+
+def test_dispatcher_ignores_results_published_before_it_started():
+    broker = InMemoryBroker(num_partitions=1)
+    broker.publish(PLAN_RESULTS, 'p', {'plan_id': 'p', 'date': 'd', 'stage': 'quiz', 'result': {'notes': 'stale'}})
+    finished = []
+    dispatcher = PlanDispatcher(broker=broker)
+    try:
+        days = dispatcher.run_plan('p', {'d': 'A'}, {}, timeout=0.3, on_day=lambda date, day: finished.append(date))
+    finally:
+        dispatcher.stop()
+    assert days == {'d': {'subtopic': 'A'}} and finished == []
+
+
+def test_dispatcher_group_is_stable_across_restarts(monkeypatch):
+    monkeypatch.setattr('common.config.MCP_NODE_URL', 'http://mcp-1:5101')
+    groups = []
+    broker = InMemoryBroker(num_partitions=1)
+    subscribe = broker.subscribe
+    broker.subscribe = lambda group_id, topics, **kwargs: groups.append(group_id) or subscribe(group_id, topics, **kwargs)
+    for _ in range(2):
+        dispatcher = PlanDispatcher(broker=broker)
+        dispatcher.start(timeout=0)
+        dispatcher.stop()
+    assert groups == ['mcp-results-http-mcp-1-5101'] * 2
+
+
+def test_dispatcher_publishes_nothing_before_its_partitions_are_assigned():
+    broker = InMemoryBroker(num_partitions=1)
+    consumer = broker.subscribe('mcp-results-n', [PLAN_RESULTS], from_latest=True)
+    consumer.wait_assigned = lambda timeout=None: False
+    broker.subscribe = lambda *args, **kwargs: consumer
+    tasks = InMemoryBroker.subscribe(broker, 'videos', [VIDEO_TASKS])
+    dispatcher = PlanDispatcher(broker=broker, node_id='n')
+    try:
+        days = dispatcher.run_plan('p', {'d': 'A'}, {}, timeout=0.2)
+    finally:
+        dispatcher.stop()
+    assert days == {'d': {'subtopic': 'A'}}
+    assert tasks.poll(0.1) is None
@@ -0,0 +1,129 @@
+import threading
+
+import mongomock
+from bson import json_util
+from pymongo import InsertOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError, ServerSelectionTimeoutError
+
+from common import write_behind
+from common.write_behind import WriteBehindBuffer
+
+
+class Plans:
+    """mongomock collection whose bulk_write applies InsertOne/UpdateOne one by one (mongomock's
+    bulk_write does not accept the arguments current pymongo passes)."""
+
+    def __init__(self):
+        self.collection = mongomock.MongoClient()['test']['plans']
+
+    def bulk_write(self, requests, ordered=True):
+        for index, request in enumerate(requests):
+            if isinstance(request, InsertOne):
+                try:
+                    self.collection.insert_one(request._doc)
+                except DuplicateKeyError as e:
+                    raise BulkWriteError({'writeErrors': [{'index': index, 'code': 11000, 'errmsg': str(e)}]})
+            else:
+                self.collection.update_one(request._filter, request._doc, upsert=request._upsert)
+        return type('Result', (), {'inserted_count': 0, 'modified_count': len(requests), 'upserted_count': 0})
+
+    def find_one(self, *args):
+        return self.collection.find_one(*args)
+
+
+def buffer(tmp_path, connect, **kwargs):
+    return WriteBehindBuffer('plans', connect, spool_path=str(tmp_path / 'plans.spool.jsonl'),
+                             flush_interval=0.05, retry_interval=0.05, **kwargs)
+
+
+def test_sync_update_lands_after_queued_writes(tmp_path):
+    collection = Plans()
+    writer = buffer(tmp_path, lambda: collection)
+    doc_id = writer.insert({'status': 'in_progress', 'plan': {}})
+    for day in range(20):
+        writer.update({'_id': doc_id}, {'$set': {f'plan.d{day}': day, 'status': 'in_progress'}})
+    assert writer.update({'_id': doc_id}, {'$set': {'status': 'success'}}, sync=True)
+    stored = collection.find_one({'_id': doc_id})
+    assert stored['status'] == 'success' and len(stored['plan']) == 20
+    writer.close()
+
+
+def test_writes_are_spooled_while_mongodb_is_down(tmp_path):
+    collection = Plans()
+    up = threading.Event()
+
+    def connect():
+        if not up.is_set():
+            raise ServerSelectionTimeoutError('down')
+        return collection
+
+    writer = buffer(tmp_path, connect)
+    doc_id = writer.insert({'status': 'in_progress'})
+    assert not writer.update({'_id': doc_id}, {'$set': {'status': 'success'}}, sync=True)
+    assert writer.drain(2) and writer.pending_spool()
+    up.set()
+    for _ in range(100):
+        writer.flush(timeout=0.05)
+        if not writer.pending_spool():
+            break
+    assert collection.find_one({'_id': doc_id})['status'] == 'success'
+    writer.close()
+
+
+def test_rejected_writes_go_to_the_dead_letter_file(tmp_path):
+    class Rejecting:
+        def bulk_write(self, requests, ordered):
+            raise BulkWriteError({'writeErrors': [{'index': 0, 'code': 2, 'errmsg': 'bad update'}]})
+
+    writer = buffer(tmp_path, Rejecting)
+    writer.update({'_id': 1}, {'$set': {'status': 'success'}})
+    assert writer.drain(2)
+    with open(writer.dead_letter_path) as f:
+        record = json_util.loads(f.readline())
+    assert record['error'] == 'bad update' and record['op']['filter'] == {'_id': 1}
+    assert writer.stats()['failed'] == 1
+    writer.close()
+
+
+def test_concurrent_starts_run_one_flusher(tmp_path, monkeypatch):
+    registered = []
+    monkeypatch.setattr(write_behind.atexit, 'register', registered.append)
+    writer = buffer(tmp_path, Plans)
+    flushers = lambda: {t for t in threading.enumerate() if t.name == 'write-behind-plans' and t.is_alive()}
+    before = flushers()
+    threads = [threading.Thread(target=writer.start) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(flushers() - before) == 1
+    writer.close()
+    writer.start()
+    assert len(registered) == 1
+    writer.close()
+
+
+def test_tagged_writes_are_pending_until_written_even_across_a_restart(tmp_path):
+    collection = Plans()
+    up = threading.Event()
+
+    def connect():
+        if not up.is_set():
+            raise ServerSelectionTimeoutError('down')
+        return collection
+
+    writer = buffer(tmp_path, connect)
+    doc_id = writer.insert({'status': 'success'}, keys=('plan-1',))
+    assert writer.pending('plan-1') and not writer.pending('plan-2')
+    writer.close()
+
+    restarted = buffer(tmp_path, connect)
+    assert restarted.pending('plan-1')
+    up.set()
+    for _ in range(100):
+        restarted.flush(timeout=0.05)
+        if not restarted.pending('plan-1'):
+            break
+    assert not restarted.pending('plan-1')
+    assert collection.find_one({'_id': doc_id})['status'] == 'success'
+    restarted.close()
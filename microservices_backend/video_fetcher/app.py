@@ -8,7 +8,18 @@ from dotenv import load_dotenv
 from datetime import datetime
 import isodate
 import logging
+import threading
+import time
 from pathlib import Path
+from common import config
+from common import video_assembly
+from common.work_queue import VIDEO_TASKS, start_workers
+from common.ttl_cache import TTLCache
+from common.deadline import deadline_from_headers, deadline_scope, request_timeout, DeadlineExceeded
+from common.admission import Admission
+from common import rpc
+from common.fair_scheduler import youtube_slots
+from common.tenancy import priority_from_headers, priority_scope, request_tenant, tenant_scope
 
 # Load environment variables
 load_dotenv()
@@ -30,12 +41,23 @@ logger = logging.getLogger(__name__)
 app = Flask(__name__)
 CORS(app, resources={r"/*": {"origins": "*"}})  # Allow all origins for development
 
+# Bound in-flight and queued requests per route; excess is shed with 503 + Retry-After
+admission = Admission()
+admission.install(app)
+
+# Binary RPC listener for internal callers, started in __main__ when INTERNAL_TRANSPORT=rpc
+rpc_server = None
+
 # Get YouTube API key from environment
 YOUTUBE_API_KEY = os.getenv('YOUTUBE_API_KEY')
 if not YOUTUBE_API_KEY:
     # Don't crash the service; log a clear warning and let endpoint return 503 when needed.
     logger.warning("YOUTUBE_API_KEY not found in environment. /fetch_videos will return 503 until it's set.")
 
+# YouTube metadata caches: search results go stale slowly, durations never change
+search_cache = TTLCache(maxsize=4096, ttl=float(os.getenv('VIDEO_SEARCH_CACHE_TTL', '86400')))
+duration_cache = TTLCache(maxsize=16384, ttl=7 * 86400)
+
 def print_banner():
     banner = (
         "\n" \
@@ -67,60 +89,100 @@ def health_check():
     return jsonify({
         'status': 'healthy',
         'timestamp': datetime.now().isoformat(),
-        'youtube_api_configured': bool(YOUTUBE_API_KEY)
+        'youtube_api_configured': bool(YOUTUBE_API_KEY),
+        'caches': {
+            'search': search_cache.stats(),
+            'duration': duration_cache.stats()
+        },
+        'video_assembly': {'mode': config.VIDEO_ASSEMBLY, **assembly_totals},
+        'fair_scheduling': youtube_slots.stats(),
+        'admission': admission.stats(),
+        'rpc': rpc_server.stats() if rpc_server else None
     })
 
 @app.route('/fetch_videos', methods=['POST'])
 def fetch_videos():
+    # Honour the caller's deadline (X-Deadline-Ms) for every YouTube call below, and queue
+    # those calls fairly as the caller's tenant and priority class
+    with deadline_scope(deadline_from_headers(request.headers)), \
+            tenant_scope(request_tenant(request.headers, request.get_json(silent=True))), \
+            priority_scope(priority_from_headers(request.headers)):
+        return _fetch_videos()
+
+class VideoFetchError(Exception):
+    """Raised for a video fetch request that cannot be served; carries the HTTP status."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+def fetch_videos_for_plan(data):
+    """
+    Attach videos to a date->subtopic plan: one topic video segmented across the days if
+    one fits the total study time, otherwise a video per subtopic. Shared by the HTTP
+    endpoint and in-process callers (monolith mode).
+
+    Raises:
+        VideoFetchError: 503 without a YouTube API key, 400 for a malformed request.
+    """
     start_time = datetime.now()
-    logger.info("Received video fetch request")
-    
-    try:
-        # Guard against missing API key
-        if not YOUTUBE_API_KEY:
-            msg = "YouTube API key not configured"
-            logger.error(msg)
-            return jsonify({'error': msg}), 503
-
-        data = request.get_json()
-        if not data:
-            logger.error("No JSON data received")
-            return jsonify({'error': 'Request body must be JSON'}), 400
-
-        required_fields = ['topic_name', 'plan', 'daily_hours', 'target_days']
-        missing = [field for field in required_fields if field not in data]
-        if missing:
-            logger.error(f"Missing required fields: {missing}")
-            return jsonify({'error': f'Missing required fields: {missing}'}), 400
-
-        topic_name = data['topic_name']
-        plan = data['plan']
-        daily_hours = float(data['daily_hours'])
-        target_days = float(data['target_days'])
-        
-        total_study_time_sec = int(daily_hours * target_days * 3600)
-        logger.info(f"Processing topic: {topic_name}, total study time: {total_study_time_sec} seconds")
+    # Guard against missing API key
+    if not YOUTUBE_API_KEY:
+        raise VideoFetchError("YouTube API key not configured", 503)
+    if not data:
+        raise VideoFetchError('Request body must be JSON')
 
-        # Search for topic video
-        topic_video = find_topic_video(topic_name, total_study_time_sec)
-        
-        result_plan = {}
-        if topic_video:
-            logger.info(f"Found topic video: {topic_video['link']}")
-            result_plan = segment_video_for_subtopics(topic_video, plan)
-        else:
-            logger.info("No suitable topic video found, searching per subtopic")
-            result_plan = find_videos_per_subtopic(plan)
+    required_fields = ['topic_name', 'plan', 'daily_hours', 'target_days']
+    missing = [field for field in required_fields if field not in data]
+    if missing:
+        raise VideoFetchError(f'Missing required fields: {missing}')
+
+    topic_name = data['topic_name']
+    plan = data['plan']
+    daily_hours = float(data['daily_hours'])
+    target_days = float(data['target_days'])
 
-        response = {
+    if config.VIDEO_ASSEMBLY == 'fit':
+        result_plan, report = assemble_videos_for_plan(topic_name, plan, daily_hours)
+        return {
             'topic_name': topic_name,
             'plan': result_plan,
+            'assembly': report,
             'processing_time': str(datetime.now() - start_time)
         }
-        
+    
+    total_study_time_sec = int(daily_hours * target_days * 3600)
+    logger.info(f"Processing topic: {topic_name}, total study time: {total_study_time_sec} seconds")
+
+    # Search for topic video
+    topic_video = find_topic_video(topic_name, total_study_time_sec)
+    
+    result_plan = {}
+    if topic_video:
+        logger.info(f"Found topic video: {topic_video['link']}")
+        result_plan = segment_video_for_subtopics(topic_video, plan)
+    else:
+        logger.info("No suitable topic video found, searching per subtopic")
+        result_plan = find_videos_per_subtopic(plan)
+
+    return {
+        'topic_name': topic_name,
+        'plan': result_plan,
+        'processing_time': str(datetime.now() - start_time)
+    }
+
+def _fetch_videos():
+    logger.info("Received video fetch request")
+    
+    try:
+        response = fetch_videos_for_plan(request.get_json(silent=True))
         logger.info("Successfully processed video fetch request")
         return jsonify(response)
 
+    except VideoFetchError as e:
+        logger.error(str(e))
+        return jsonify({'error': str(e)}), e.status
+
     except Exception as e:
         logger.error(f"Error processing request: {str(e)}", exc_info=True)
         return jsonify({'error': 'Internal server error', 'details': str(e)}), 500
@@ -138,9 +200,14 @@ def find_topic_video(topic, target_sec, max_results=5):
     }
     
     try:
-        resp = requests.get(search_url, params=params, timeout=10)
-        resp.raise_for_status()
-        items = resp.json().get("items", [])
+        cache_key = ('topic', topic.lower(), max_results)
+        items = search_cache.get(cache_key)
+        if items is None:
+            with youtube_slots.slot():
+                resp = requests.get(search_url, params=params, timeout=request_timeout(10))
+            resp.raise_for_status()
+            items = resp.json().get("items", [])
+            search_cache.set(cache_key, items)
         
         for item in items:
             video_id = item["id"]["videoId"]
@@ -159,18 +226,26 @@ def find_topic_video(topic, target_sec, max_results=5):
 
 def get_video_duration(video_id):
     """Get duration for a single video"""
+    cached = duration_cache.get(video_id)
+    if cached is not None:
+        return cached
     video_url = "https://www.googleapis.com/youtube/v3/videos"
     params = {
         "part": "contentDetails",
         "id": video_id,
         "key": YOUTUBE_API_KEY
     }
+    timeout = request_timeout(10)
     
     try:
-        resp = requests.get(video_url, params=params, timeout=10)
+        with youtube_slots.slot():
+            resp = requests.get(video_url, params=params, timeout=timeout)
         resp.raise_for_status()
         items = resp.json().get("items", [])
-        return items[0]["contentDetails"]["duration"] if items else None
+        duration = items[0]["contentDetails"]["duration"] if items else None
+        if duration:
+            duration_cache.set(video_id, duration)
+        return duration
     except Exception as e:
         logger.error(f"Error getting video duration: {str(e)}")
         return None
@@ -201,7 +276,11 @@ def find_videos_per_subtopic(plan):
     """Find individual videos for each subtopic"""
     result = {}
     for date, subtopic in plan.items():
-        video = find_best_video_for_subtopic(subtopic)
+        try:
+            video = find_best_video_for_subtopic(subtopic)
+        except DeadlineExceeded:
+            # Out of time: leave the remaining days without a video rather than overrun
+            video = None
         result[date] = {
             'subtopic': subtopic,
             'youtube_link': video['link'] if video else None,
@@ -210,8 +289,14 @@ def find_videos_per_subtopic(plan):
         }
     return result
 
-def find_best_video_for_subtopic(subtopic, max_results=3):
-    """Find the best video for a subtopic"""
+def find_best_video_for_subtopic(subtopic, max_results=3, usage=None):
+    """Find the best video for a subtopic; search calls are counted in `usage` if given"""
+    cache_key = ('subtopic', subtopic.lower(), max_results)
+    cached = search_cache.get(cache_key)
+    if cached is not None:
+        if usage is not None:
+            usage['cache_hits'] += 1
+        return cached
     search_url = "https://www.googleapis.com/youtube/v3/search"
     params = {
         "part": "snippet",
@@ -220,21 +305,219 @@ def find_best_video_for_subtopic(subtopic, max_results=3):
         "maxResults": max_results,
         "key": YOUTUBE_API_KEY
     }
+    timeout = request_timeout(10)
     
     try:
-        resp = requests.get(search_url, params=params, timeout=10)
+        with youtube_slots.slot():
+            resp = requests.get(search_url, params=params, timeout=timeout)
+        if usage is not None:
+            usage['search_calls'] += 1
         resp.raise_for_status()
         items = resp.json().get("items", [])
         if items:
-            return {
+            video = {
                 'link': f"https://youtube.com/watch?v={items[0]['id']['videoId']}",
-                'video_id': items[0]['id']['videoId']
+                'video_id': items[0]['id']['videoId'],
+                'title': items[0].get('snippet', {}).get('title', '')
             }
+            search_cache.set(cache_key, video)
+            return video
     except Exception as e:
         logger.error(f"Error finding video for subtopic {subtopic}: {str(e)}")
     
     return None
 
+# YouTube Data API quota cost of one call
+SEARCH_QUOTA_UNITS = 100
+VIDEOS_QUOTA_UNITS = 1
+# Subtopics the topic-wide pool covers less than this get a targeted search, budget permitting
+TARGETED_SEARCH_BELOW = 0.6
+# The topic-wide search is paged until the pool holds this multiple of the plan's total study time,
+# since not every video is relevant to, or fits, the days it could go to
+POOL_COVERAGE = 1.5
+
+assembly_totals = {'plans': 0, 'search_calls': 0, 'videos_calls': 0, 'cache_hits': 0, 'quota_units': 0}
+assembly_totals_lock = threading.Lock()
+
+def search_videos(query, max_results, usage, order='relevance'):
+    """Search results as [{'video_id', 'title', 'description'}], cached; API calls are counted in `usage`."""
+    return search_page(query, max_results, usage, order)[0]
+
+def search_page(query, max_results, usage, order='relevance', page_token=None):
+    """
+    One page of search results, cached like search_videos.
+
+    Returns:
+        tuple: (results, next_page_token), the token None on the last page
+    """
+    cache_key = ('search', query.lower(), max_results, order) + ((page_token,) if page_token else ())
+    cached = search_cache.get(cache_key)
+    if cached is not None:
+        usage['cache_hits'] += 1
+        # Entries cached before paging hold the bare result list
+        return (cached['items'], cached.get('next')) if isinstance(cached, dict) else (cached, None)
+    params = {
+        "part": "snippet",
+        "q": query,
+        "type": "video",
+        "maxResults": min(max_results, 50),
+        "order": order,
+        "key": YOUTUBE_API_KEY
+    }
+    if page_token:
+        params['pageToken'] = page_token
+    with youtube_slots.slot():
+        resp = requests.get("https://www.googleapis.com/youtube/v3/search", params=params,
+                            timeout=request_timeout(10))
+    usage['search_calls'] += 1
+    resp.raise_for_status()
+    body = resp.json()
+    results = [{
+        'video_id': item['id']['videoId'],
+        'title': item.get('snippet', {}).get('title', ''),
+        'description': item.get('snippet', {}).get('description', '')
+    } for item in body.get('items', []) if item.get('id', {}).get('videoId')]
+    search_cache.set(cache_key, {'items': results, 'next': body.get('nextPageToken')})
+    return results, body.get('nextPageToken')
+
+def video_durations(video_ids, usage):
+    """Durations in seconds, with one videos.list call per 50 ids not in the duration cache."""
+    durations, missing = {}, []
+    for video_id in dict.fromkeys(video_ids):
+        cached = duration_cache.get(video_id)
+        if cached is not None:
+            durations[video_id] = cached
+        else:
+            missing.append(video_id)
+    for start in range(0, len(missing), 50):
+        params = {"part": "contentDetails", "id": ','.join(missing[start:start + 50]), "key": YOUTUBE_API_KEY}
+        with youtube_slots.slot():
+            resp = requests.get("https://www.googleapis.com/youtube/v3/videos", params=params,
+                                timeout=request_timeout(10))
+        usage['videos_calls'] += 1
+        resp.raise_for_status()
+        for item in resp.json().get('items', []):
+            duration = item.get('contentDetails', {}).get('duration')
+            if duration:
+                duration_cache.set(item['id'], duration)
+                durations[item['id']] = duration
+
+    seconds = {}
+    for video_id, duration in durations.items():
+        try:
+            seconds[video_id] = int(isodate.parse_duration(duration).total_seconds())
+        except (isodate.ISO8601Error, ValueError):
+            continue
+    return seconds
+
+def assemble_videos_for_plan(topic_name, plan, daily_hours):
+    """
+    Videos for every day of a plan from one shared candidate pool: a topic-wide search,
+    paged until the pool's watch time covers the plan's total study hours (at most
+    VIDEO_POOL_MAX_PAGES pages), plus targeted searches for the subtopics it covers worst
+    (VIDEO_ASSEMBLY_MAX_SEARCHES - 1) and batched duration lookups. Each day is then filled
+    to daily_hours by video_assembly.assemble_plan, and days left empty get the best video
+    of a search for their own subtopic. If the deadline or YouTube cuts the searches short,
+    the plan is assembled from the videos found so far.
+
+    Returns:
+        tuple: (date -> day entry, report with quota spend and assembly time)
+    """
+    started = time.monotonic()
+    usage = {'search_calls': 0, 'videos_calls': 0, 'cache_hits': 0}
+    labels = {date: value.get('subtopic', '') if isinstance(value, dict) else value for date, value in plan.items()}
+    candidates, durations = {}, {}
+
+    def add(results, floor):
+        for video in results:
+            candidates.setdefault(video['video_id'], {**video, 'relevance_floor': floor})
+
+    budget_sec = int(daily_hours * 3600)
+    wanted_sec = budget_sec * len(labels) * POOL_COVERAGE
+    try:
+        # Anything from the topic-wide search is on topic, even if its title names no subtopic
+        page_token = None
+        for _ in range(max(1, config.VIDEO_POOL_MAX_PAGES)):
+            results, page_token = search_page(f"{topic_name} course tutorial", config.VIDEO_POOL_SIZE, usage,
+                                              page_token=page_token)
+            add(results, config.VIDEO_MIN_RELEVANCE)
+            durations.update(video_durations([vid for vid in candidates if vid not in durations], usage))
+            if not page_token or sum(durations.values()) >= wanted_sec:
+                break
+        pool = [{**video, 'duration_sec': durations[vid]} for vid, video in candidates.items() if vid in durations]
+        weak = video_assembly.weakly_covered(labels, pool, TARGETED_SEARCH_BELOW)
+        for name in weak[:max(0, config.VIDEO_ASSEMBLY_MAX_SEARCHES - 1)]:
+            add(search_videos(f"{topic_name} {name}", 10, usage), 0.0)
+        durations.update(video_durations([vid for vid in candidates if vid not in durations], usage))
+    except DeadlineExceeded:
+        logger.warning(f"Deadline reached while searching videos for {topic_name}; assembling from what was found")
+    except requests.exceptions.RequestException as e:
+        logger.error(f"YouTube request failed while assembling {topic_name}: {str(e)}")
+
+    pool = [{**video, 'duration_sec': durations[vid]} for vid, video in candidates.items() if vid in durations]
+    assembled = video_assembly.assemble_plan(
+        labels, pool, budget_sec,
+        min_relevance=config.VIDEO_MIN_RELEVANCE,
+        min_segment_sec=int(config.VIDEO_MIN_SEGMENT_MINUTES * 60)
+    )
+    fallback_days = fill_empty_days(assembled, budget_sec, usage)
+    quota_units = usage['search_calls'] * SEARCH_QUOTA_UNITS + usage['videos_calls'] * VIDEOS_QUOTA_UNITS
+    report = {
+        'days': len(labels),
+        'days_with_video': sum(1 for day in assembled.values() if day['videos']),
+        'videos_used': len({v['video_id'] for day in assembled.values() for v in day['videos']}),
+        'candidates': len(pool),
+        'fallback_days': fallback_days,
+        **usage,
+        'quota_units': quota_units,
+        'avg_fill': video_assembly.fill_ratio(assembled, budget_sec),
+        'assembly_ms': round((time.monotonic() - started) * 1000, 1)
+    }
+    with assembly_totals_lock:
+        assembly_totals['plans'] += 1
+        for key in ('search_calls', 'videos_calls', 'cache_hits', 'quota_units'):
+            assembly_totals[key] += report[key]
+    logger.info(f"Assembled {report['days_with_video']}/{report['days']} days for {topic_name} from "
+                f"{report['candidates']} candidates: {quota_units} quota units, {report['assembly_ms']} ms")
+    return assembled, report
+
+def fill_empty_days(assembled, budget_sec, usage):
+    """
+    Search per subtopic for the days the pool left without videos (one search per distinct
+    subtopic, cached) and give each day that video. Stops at the deadline.
+
+    Returns:
+        int: Number of days filled
+    """
+    found = {}
+    try:
+        for date, day in assembled.items():
+            if day['videos']:
+                continue
+            # The parts of a split subtopic search for the subtopic itself, once
+            name = video_assembly.day_names(day['subtopic'])[0]
+            video = find_best_video_for_subtopic(name, usage=usage)
+            if video:
+                found[date] = video
+        durations = video_durations([video['video_id'] for video in found.values()], usage) if found else {}
+    except DeadlineExceeded:
+        logger.warning("Deadline reached while searching videos for empty days")
+        return 0
+    except requests.exceptions.RequestException as e:
+        logger.error(f"YouTube request failed while filling empty days: {str(e)}")
+        return 0
+    videos = {date: {**video, 'duration_sec': durations.get(video['video_id'])} for date, video in found.items()}
+    return video_assembly.fill_empty_days(assembled, videos, budget_sec)
+
+def handle_video_task(task):
+    """Event-driven worker handler: find a video for one plan day published by the MCP server."""
+    video = find_best_video_for_subtopic(task['subtopic']) if YOUTUBE_API_KEY else None
+    return {
+        'youtube_link': video['link'] if video else 'No video found',
+        'timestamp': '00:00:00-full' if video else 'No timestamp',
+        'source': 'individual_video' if video else None
+    }
+
 def sec_to_timestamp(seconds):
     """Convert seconds to HH:MM:SS format"""
     h = seconds // 3600
@@ -244,4 +527,18 @@ def sec_to_timestamp(seconds):
 
 if __name__ == "__main__":
     print_banner()
+    if config.PLAN_DISPATCH_MODE == 'events':
+        logger.info("Starting video task workers")
+        stop = start_workers('video-fetchers', VIDEO_TASKS, handle_video_task)
+        if config.WORKER_ONLY:
+            # Extra worker process: consume tasks without serving HTTP
+            stop.wait()
+            raise SystemExit(0)
+    if config.INTERNAL_TRANSPORT == 'rpc':
+        if rpc.available():
+            # Internal callers (the MCP server) reach /fetch_videos over the binary transport too
+            rpc_server = rpc.RPCServer(app, port=5103 + config.RPC_PORT_OFFSET,
+                                       threads=config.RPC_SERVER_THREADS).start()
+        else:
+            logger.warning("INTERNAL_TRANSPORT=rpc needs the msgpack package; serving HTTP only")
     app.run(host="0.0.0.0", port=5103, debug=False)
\ No newline at end of file